@@ -428,6 +428,8 @@ ANVIL_WORKSPACE_ADAPTERS = [
 ANVIL_ACCOUNT_ADAPTER = "primed.primed_anvil.adapters.AccountAdapter"
 ANVIL_MANAGED_GROUP_ADAPTER = "primed.primed_anvil.adapters.ManagedGroupAdapter"
 ANVIL_AUDIT_CACHE = "anvil_audit"
+# Refresh out of date stored audit results in a background thread instead of within the request.
+AUDIT_BACKGROUND_REFRESH = env.bool("AUDIT_BACKGROUND_REFRESH", default=True)
 
 DRUPAL_API_CLIENT_ID = env("DRUPAL_API_CLIENT_ID", default="")
 DRUPAL_API_CLIENT_SECRET = env("DRUPAL_API_CLIENT_SECRET", default="")
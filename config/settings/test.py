@@ -37,6 +37,7 @@ ANVIL_DATA_ACCESS_GROUP_PREFIX = "TEST_PRIMED"
 ANVIL_CDSA_GROUP_NAME = "TEST_PRIMED_CDSA"
 ANVIL_CC_ADMINS_GROUP_NAME = "TEST_PRIMED_CC_ADMINS"
 ANVIL_CC_WRITERS_GROUP_NAME = "TEST_PRIMED_CC_WRITERS"
+AUDIT_BACKGROUND_REFRESH = False
 
 # template tests require debug to be set
 # get the last templates entry and set debug option
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class CdsaConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "primed.cdsa"
+
+    def ready(self):
+        import primed.cdsa.signals  # noqa F401
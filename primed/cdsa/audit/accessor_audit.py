@@ -7,7 +7,7 @@ from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db.models.query import QuerySet
 
-from primed.primed_anvil.audit import PRIMEDAudit, PRIMEDAuditResult
+from primed.primed_anvil.audit import GroupMemberIndex, PRIMEDAudit, PRIMEDAuditResult
 from primed.primed_anvil.tables import BooleanIconColumn
 
 from ..models import SignedAgreement
@@ -130,6 +130,10 @@ class AccessorAudit(PRIMEDAudit):
     ACCOUNT_NOT_LINKED_TO_USER = "Account is not linked to a user."
 
     results_table_class = AccessorAuditTable
+    result_subject_model = SignedAgreement
+    result_subject_field = "signed_agreement"
+    result_subject_queryset_argument = "queryset"
+    stored_result_select_related = {"anvil_consortium_manager.Account": ("user",)}
 
     def __init__(self, queryset=None):
         super().__init__()
@@ -140,30 +144,45 @@ class AccessorAudit(PRIMEDAudit):
         self.queryset = queryset
 
     def _run_audit(self):
-        for signed_agreement in self.queryset:
-            self.audit_agreement(signed_agreement)
+        agreements = self.queryset.prefetch_related("accessors")
+        self._audit_agreements(list(agreements))
 
     def audit_agreement(self, signed_agreement):
         """Audit access for a specific SignedAgreement."""
-        # Get a list of everything to audit.
-        accessors = list(signed_agreement.accessors.all())
-        accounts_with_access = list(
-            Account.objects.filter(
-                # They are members of this group.
-                groupaccountmembership__group=signed_agreement.anvil_access_group
-            ).exclude(
-                # Not accessors; they are handled differently.
-                user__in=accessors
-            )
-        )
-        groups_with_access = list(
-            ManagedGroup.objects.filter(parent_memberships__parent_group=signed_agreement.anvil_access_group)
-        )
+        self._audit_agreements([signed_agreement])
 
-        objs_to_audit = accessors + accounts_with_access + groups_with_access
+    def _audit_agreements(self, agreements):
+        """Audit access for a list of SignedAgreements.
+
+        Accessors, linked accounts, and access group members for all agreements are loaded up front in a
+        fixed number of queries, and then each member is audited in memory."""
+        if not agreements:
+            return
+        accessors_by_agreement = {x.pk: list(x.accessors.all()) for x in agreements}
+        index = GroupMemberIndex(
+            group_pks=[x.anvil_access_group_id for x in agreements],
+            user_pks=[user.pk for users in accessors_by_agreement.values() for user in users],
+        )
 
-        for obj in objs_to_audit:
-            self.audit_agreement_and_object(signed_agreement, obj)
+        for signed_agreement in agreements:
+            group_pk = signed_agreement.anvil_access_group_id
+            accessors = accessors_by_agreement[signed_agreement.pk]
+            accessor_pks = set(user.pk for user in accessors)
+            # Accessors.
+            for user in accessors:
+                account = index.get_account_for_user(user)
+                if account is None:
+                    self._audit_user_without_account(signed_agreement, user, accessor_pks)
+                else:
+                    is_in_access_group = index.is_account_in_group(account, group_pk)
+                    self._audit_account(signed_agreement, account, accessor_pks, is_in_access_group)
+            # Other accounts in the group; accessors are handled above.
+            for account in index.get_member_accounts(group_pk):
+                if account.user_id not in accessor_pks:
+                    self._audit_account(signed_agreement, account, accessor_pks, True)
+            # Groups in the group.
+            for group in index.get_member_groups(group_pk):
+                self._audit_group(signed_agreement, group, True)
 
     def audit_agreement_and_object(self, signed_agreement, obj):
         """Audit access for a specific SignedAgreement and generic object instance.
@@ -197,33 +216,44 @@ class AccessorAudit(PRIMEDAudit):
 
     def _audit_agreement_and_user(self, signed_agreement, user):
         """Audit access for a specific SignedAgreement and a specific user."""
-        is_accessor = user in signed_agreement.accessors.all()
-
+        accessor_pks = set(signed_agreement.accessors.values_list("pk", flat=True))
         # Check if the user has a linked account.
         try:
             account = Account.objects.get(user=user)
         except Account.DoesNotExist:
-            if is_accessor:
-                note = self.ACCESSOR_NO_ACCOUNT
-            else:
-                note = self.NOT_ACCESSOR
-            self.verified.append(
-                VerifiedNoAccess(
-                    signed_agreement=signed_agreement,
-                    user=user,
-                    member=None,
-                    note=note,
-                )
-            )
+            self._audit_user_without_account(signed_agreement, user, accessor_pks)
             return
+        is_in_access_group = GroupAccountMembership.objects.filter(
+            account=account, group=signed_agreement.anvil_access_group
+        ).exists()
+        self._audit_account(signed_agreement, account, accessor_pks, is_in_access_group)
 
-        self._audit_agreement_and_account(signed_agreement, account)
+    def _audit_user_without_account(self, signed_agreement, user, accessor_pks):
+        """Audit access for a user who has not linked an AnVIL account."""
+        if user.pk in accessor_pks:
+            note = self.ACCESSOR_NO_ACCOUNT
+        else:
+            note = self.NOT_ACCESSOR
+        self.verified.append(
+            VerifiedNoAccess(
+                signed_agreement=signed_agreement,
+                user=user,
+                member=None,
+                note=note,
+            )
+        )
 
     def _audit_agreement_and_account(self, signed_agreement, account):
+        """Audit access for a specific SignedAgreement and a specific account."""
+        accessor_pks = set(signed_agreement.accessors.values_list("pk", flat=True))
         # Check if the account is in the access group.
         is_in_access_group = GroupAccountMembership.objects.filter(
             account=account, group=signed_agreement.anvil_access_group
         ).exists()
+        self._audit_account(signed_agreement, account, accessor_pks, is_in_access_group)
+
+    def _audit_account(self, signed_agreement, account, accessor_pks, is_in_access_group):
+        """Audit access for an account given precomputed accessors and group membership."""
         is_active = account.status == account.ACTIVE_STATUS
 
         # Get the user.
@@ -250,7 +280,7 @@ class AccessorAudit(PRIMEDAudit):
                 )
             return
 
-        is_accessor = user in signed_agreement.accessors.all()
+        is_accessor = user.pk in accessor_pks
         if is_in_access_group:
             if is_accessor:
                 if is_active:
@@ -315,6 +345,10 @@ class AccessorAudit(PRIMEDAudit):
         in_access_group = GroupGroupMembership.objects.filter(
             child_group=group, parent_group=signed_agreement.anvil_access_group
         ).exists()
+        self._audit_group(signed_agreement, group, in_access_group)
+
+    def _audit_group(self, signed_agreement, group, in_access_group):
+        """Audit access for a group given precomputed group membership."""
         if group.name == settings.ANVIL_CC_ADMINS_GROUP_NAME:
             pass
         else:
@@ -1,5 +1,7 @@
 # from abc import ABC
+from collections import defaultdict
 from dataclasses import dataclass
+from functools import cached_property
 
 import django_tables2 as tables
 from anvil_consortium_manager.models import ManagedGroup
@@ -8,6 +10,7 @@ from django.db.models import QuerySet
 from django.urls import reverse
 
 from primed.primed_anvil.audit import PRIMEDAudit, PRIMEDAuditResult
+from primed.primed_anvil.membership_closure import get_group_membership_closure
 
 from .. import models
 
@@ -21,8 +24,10 @@ class AccessAuditResult(PRIMEDAuditResult):
     signed_agreement: models.SignedAgreement
     action: str = None
 
-    def __post_init__(self):
-        self.anvil_cdsa_group = ManagedGroup.objects.get(name=settings.ANVIL_CDSA_GROUP_NAME)
+    @cached_property
+    def anvil_cdsa_group(self):
+        # Looked up lazily so that building results does not require a query.
+        return ManagedGroup.objects.get(name=settings.ANVIL_CDSA_GROUP_NAME)
 
     def get_action_url(self):
         """The URL that handles the action needed."""
@@ -101,6 +106,43 @@ class SignedAgreementAccessAuditTable(tables.Table):
         attrs = {"class": "table align-middle"}
 
 
+class SignedAgreementAuditIndex:
+    """Precomputed data needed to audit SignedAgreements.
+
+    This holds the statuses of primary agreements for each study site and study, as well as the
+    SignedAgreements whose access groups are in the CDSA group, so that each agreement can be audited
+    without additional queries.
+    """
+
+    def __init__(self):
+        self.anvil_cdsa_group = ManagedGroup.objects.get(name=settings.ANVIL_CDSA_GROUP_NAME)
+        self.cdsa_group_child_pks = get_group_membership_closure().get_direct_child_pks(self.anvil_cdsa_group)
+        # Statuses of primary agreements, keyed by study site (member) or study (data affiliate).
+        self.member_primary_statuses = defaultdict(set)
+        member_qs = models.MemberAgreement.objects.filter(is_primary=True).values_list(
+            "study_site", "signed_agreement__status"
+        )
+        for study_site_pk, status in member_qs:
+            self.member_primary_statuses[study_site_pk].add(status)
+        self.data_affiliate_primary_statuses = defaultdict(set)
+        data_affiliate_qs = models.DataAffiliateAgreement.objects.filter(is_primary=True).values_list(
+            "study", "signed_agreement__status"
+        )
+        for study_pk, status in data_affiliate_qs:
+            self.data_affiliate_primary_statuses[study_pk].add(status)
+
+    def is_in_cdsa_group(self, signed_agreement):
+        """Check whether the access group for a SignedAgreement is in the CDSA group."""
+        return signed_agreement.anvil_access_group_id in self.cdsa_group_child_pks
+
+    def get_primary_statuses(self, signed_agreement):
+        """Return the set of statuses of primary agreements for the group of a component SignedAgreement."""
+        if hasattr(signed_agreement, "memberagreement"):
+            return self.member_primary_statuses.get(signed_agreement.memberagreement.study_site_id, set())
+        elif hasattr(signed_agreement, "dataaffiliateagreement"):
+            return self.data_affiliate_primary_statuses.get(signed_agreement.dataaffiliateagreement.study_id, set())
+
+
 class SignedAgreementAccessAudit(PRIMEDAudit):
     """Audit for Signed Agreements."""
 
@@ -119,6 +161,9 @@ class SignedAgreementAccessAudit(PRIMEDAudit):
     ERROR_OTHER_CASE = "Signed Agreement did not match any expected situations."
 
     results_table_class = SignedAgreementAccessAuditTable
+    result_subject_model = models.SignedAgreement
+    result_subject_field = "signed_agreement"
+    result_subject_queryset_argument = "signed_agreement_queryset"
 
     def __init__(self, signed_agreement_queryset=None):
         super().__init__()
@@ -132,7 +177,7 @@ class SignedAgreementAccessAudit(PRIMEDAudit):
             raise ValueError("signed_agreement_queryset must be a queryset of SignedAgreement objects.")
         self.signed_agreement_queryset = signed_agreement_queryset
 
-    def _audit_primary_agreement(self, signed_agreement):
+    def _audit_primary_agreement(self, signed_agreement, index):
         """Audit a single component signed agreement.
 
         The following items are checked:
@@ -143,7 +188,7 @@ class SignedAgreementAccessAudit(PRIMEDAudit):
         This audit does *not* check if the AgreementMajorVersion associated with the SignedAgreement is valid.
         """
         is_active = signed_agreement.status == models.SignedAgreement.StatusChoices.ACTIVE
-        in_cdsa_group = signed_agreement.is_in_cdsa_group()
+        in_cdsa_group = index.is_in_cdsa_group(signed_agreement)
 
         if is_active and hasattr(signed_agreement, "memberagreement"):
             representative = signed_agreement.representative
@@ -198,7 +243,7 @@ class SignedAgreementAccessAudit(PRIMEDAudit):
             OtherError(signed_agreement=signed_agreement, note=self.ERROR_OTHER_CASE)  # pragma: no cover
         )  # pragma: no cover
 
-    def _audit_component_agreement(self, signed_agreement):
+    def _audit_component_agreement(self, signed_agreement, index):
         """Audit a single component signed agreement.
 
         The following items are checked:
@@ -212,7 +257,7 @@ class SignedAgreementAccessAudit(PRIMEDAudit):
         SignedAgreement or its component is valid.
         """
 
-        in_cdsa_group = signed_agreement.is_in_cdsa_group()
+        in_cdsa_group = index.is_in_cdsa_group(signed_agreement)
         is_active = signed_agreement.status == models.SignedAgreement.StatusChoices.ACTIVE
 
         if is_active and hasattr(signed_agreement, "memberagreement"):
@@ -227,23 +272,10 @@ class SignedAgreementAccessAudit(PRIMEDAudit):
                 )
                 return
 
-        # Get the set of potential primary agreements for this component.
-        if hasattr(signed_agreement, "memberagreement"):
-            # Member
-            primary_qs = models.SignedAgreement.objects.filter(
-                memberagreement__is_primary=True,
-                memberagreement__study_site=signed_agreement.memberagreement.study_site,
-            )
-        elif hasattr(signed_agreement, "dataaffiliateagreement"):
-            # Data affiliate
-            primary_qs = models.SignedAgreement.objects.filter(
-                dataaffiliateagreement__is_primary=True,
-                dataaffiliateagreement__study=signed_agreement.dataaffiliateagreement.study,
-            )
-        primary_exists = primary_qs.exists()
-        primary_active = primary_qs.filter(
-            status=models.SignedAgreement.StatusChoices.ACTIVE,
-        ).exists()
+        # Get the statuses of potential primary agreements for this component.
+        primary_statuses = index.get_primary_statuses(signed_agreement)
+        primary_exists = len(primary_statuses) > 0
+        primary_active = models.SignedAgreement.StatusChoices.ACTIVE in primary_statuses
 
         if primary_exists:
             if primary_active:
@@ -322,14 +354,28 @@ class SignedAgreementAccessAudit(PRIMEDAudit):
             OtherError(signed_agreement=signed_agreement, note=self.ERROR_OTHER_CASE)  # pragma: no cover
         )  # pragma: no cover
 
-    def _audit_signed_agreement(self, signed_agreement):
+    def _audit_signed_agreement(self, signed_agreement, index=None):
+        if index is None:
+            index = SignedAgreementAuditIndex()
         agreement_type = signed_agreement.get_agreement_type()
         if not hasattr(agreement_type, "is_primary") or agreement_type.is_primary:
-            self._audit_primary_agreement(signed_agreement)
+            self._audit_primary_agreement(signed_agreement, index)
         else:
-            self._audit_component_agreement(signed_agreement)
+            self._audit_component_agreement(signed_agreement, index)
 
     def _run_audit(self):
         """Run an audit on all SignedAgreements."""
-        for signed_agreement in self.signed_agreement_queryset:
-            self._audit_signed_agreement(signed_agreement)
+        signed_agreements = list(
+            self.signed_agreement_queryset.select_related(
+                "memberagreement__study_site",
+                "dataaffiliateagreement__study",
+                "nondataaffiliateagreement",
+                "representative",
+                "version__major_version",
+            ).prefetch_related("representative__study_sites")
+        )
+        if not signed_agreements:
+            return
+        index = SignedAgreementAuditIndex()
+        for signed_agreement in signed_agreements:
+            self._audit_signed_agreement(signed_agreement, index)
@@ -7,7 +7,7 @@ from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db.models.query import QuerySet
 
-from primed.primed_anvil.audit import PRIMEDAudit, PRIMEDAuditResult
+from primed.primed_anvil.audit import GroupMemberIndex, PRIMEDAudit, PRIMEDAuditResult
 from primed.primed_anvil.tables import BooleanIconColumn
 
 from ..models import DataAffiliateAgreement
@@ -137,6 +137,10 @@ class UploaderAudit(PRIMEDAudit):
     ACCOUNT_NOT_LINKED_TO_USER = "Account is not linked to a user."
 
     results_table_class = UploaderAuditTable
+    result_subject_model = DataAffiliateAgreement
+    result_subject_field = "data_affiliate_agreement"
+    result_subject_queryset_argument = "queryset"
+    stored_result_select_related = {"anvil_consortium_manager.Account": ("user",)}
 
     def __init__(self, queryset=None):
         super().__init__()
@@ -147,30 +151,45 @@ class UploaderAudit(PRIMEDAudit):
         self.queryset = queryset
 
     def _run_audit(self):
-        for agreement in self.queryset:
-            self.audit_agreement(agreement)
+        agreements = self.queryset.prefetch_related("uploaders")
+        self._audit_agreements(list(agreements))
 
     def audit_agreement(self, data_affiliate_agreement):
         """Audit access for a specific DataAffiliateAgreement."""
-        # Get a list of everything to audit.
-        uploaders = list(data_affiliate_agreement.uploaders.all())
-        accounts_with_access = list(
-            Account.objects.filter(
-                # They are members of this group.
-                groupaccountmembership__group=data_affiliate_agreement.anvil_upload_group
-            ).exclude(
-                # Not uploaders; they are handled differently.
-                user__in=uploaders
-            )
-        )
-        groups_with_access = list(
-            ManagedGroup.objects.filter(parent_memberships__parent_group=data_affiliate_agreement.anvil_upload_group)
-        )
+        self._audit_agreements([data_affiliate_agreement])
 
-        objs_to_audit = uploaders + accounts_with_access + groups_with_access
+    def _audit_agreements(self, agreements):
+        """Audit access for a list of DataAffiliateAgreements.
+
+        Uploaders, linked accounts, and upload group members for all agreements are loaded up front in a
+        fixed number of queries, and then each member is audited in memory."""
+        if not agreements:
+            return
+        uploaders_by_agreement = {x.pk: list(x.uploaders.all()) for x in agreements}
+        index = GroupMemberIndex(
+            group_pks=[x.anvil_upload_group_id for x in agreements],
+            user_pks=[user.pk for users in uploaders_by_agreement.values() for user in users],
+        )
 
-        for obj in objs_to_audit:
-            self.audit_agreement_and_object(data_affiliate_agreement, obj)
+        for data_affiliate_agreement in agreements:
+            group_pk = data_affiliate_agreement.anvil_upload_group_id
+            uploaders = uploaders_by_agreement[data_affiliate_agreement.pk]
+            uploader_pks = set(user.pk for user in uploaders)
+            # Uploaders.
+            for user in uploaders:
+                account = index.get_account_for_user(user)
+                if account is None:
+                    self._audit_user_without_account(data_affiliate_agreement, user, uploader_pks)
+                else:
+                    is_in_access_group = index.is_account_in_group(account, group_pk)
+                    self._audit_account(data_affiliate_agreement, account, uploader_pks, is_in_access_group)
+            # Other accounts in the group; uploaders are handled above.
+            for account in index.get_member_accounts(group_pk):
+                if account.user_id not in uploader_pks:
+                    self._audit_account(data_affiliate_agreement, account, uploader_pks, True)
+            # Groups in the group.
+            for group in index.get_member_groups(group_pk):
+                self._audit_group(data_affiliate_agreement, group, True)
 
     def audit_agreement_and_object(self, data_affiliate_agreement, obj):
         """Audit access for a specific DataAffiliateAgreement and generic object instance.
@@ -204,34 +223,44 @@ class UploaderAudit(PRIMEDAudit):
 
     def _audit_agreement_and_user(self, data_affiliate_agreement, user):
         """Audit access for a specific DataAffiliateAgreement and a specific user."""
-        is_uploader = user in data_affiliate_agreement.uploaders.all()
-
+        uploader_pks = set(data_affiliate_agreement.uploaders.values_list("pk", flat=True))
         # Check if the user has a linked account.
         try:
             account = Account.objects.get(user=user)
         except Account.DoesNotExist:
-            if is_uploader:
-                note = self.UPLOADER_NO_ACCOUNT
-            else:
-                note = self.NOT_UPLOADER
-            self.verified.append(
-                VerifiedNoAccess(
-                    data_affiliate_agreement=data_affiliate_agreement,
-                    user=user,
-                    member=None,
-                    note=note,
-                )
-            )
+            self._audit_user_without_account(data_affiliate_agreement, user, uploader_pks)
             return
+        is_in_access_group = GroupAccountMembership.objects.filter(
+            account=account, group=data_affiliate_agreement.anvil_upload_group
+        ).exists()
+        self._audit_account(data_affiliate_agreement, account, uploader_pks, is_in_access_group)
 
-        self._audit_agreement_and_account(data_affiliate_agreement, account)
+    def _audit_user_without_account(self, data_affiliate_agreement, user, uploader_pks):
+        """Audit access for a user who has not linked an AnVIL account."""
+        if user.pk in uploader_pks:
+            note = self.UPLOADER_NO_ACCOUNT
+        else:
+            note = self.NOT_UPLOADER
+        self.verified.append(
+            VerifiedNoAccess(
+                data_affiliate_agreement=data_affiliate_agreement,
+                user=user,
+                member=None,
+                note=note,
+            )
+        )
 
     def _audit_agreement_and_account(self, data_affiliate_agreement, account):
+        """Audit access for a specific DataAffiliateAgreement and a specific account."""
+        uploader_pks = set(data_affiliate_agreement.uploaders.values_list("pk", flat=True))
         # Check if the account is in the access group.
         is_in_access_group = GroupAccountMembership.objects.filter(
             account=account, group=data_affiliate_agreement.anvil_upload_group
         ).exists()
+        self._audit_account(data_affiliate_agreement, account, uploader_pks, is_in_access_group)
 
+    def _audit_account(self, data_affiliate_agreement, account, uploader_pks, is_in_access_group):
+        """Audit access for an account given precomputed uploaders and group membership."""
         # Get the user.
         if hasattr(account, "user") and account.user:
             user = account.user
@@ -256,7 +285,7 @@ class UploaderAudit(PRIMEDAudit):
                 )
             return
 
-        is_uploader = user in data_affiliate_agreement.uploaders.all()
+        is_uploader = user.pk in uploader_pks
         is_active = account.status == account.ACTIVE_STATUS
 
         if is_in_access_group:
@@ -323,6 +352,10 @@ class UploaderAudit(PRIMEDAudit):
         in_access_group = GroupGroupMembership.objects.filter(
             child_group=group, parent_group=data_affiliate_agreement.anvil_upload_group
         ).exists()
+        self._audit_group(data_affiliate_agreement, group, in_access_group)
+
+    def _audit_group(self, data_affiliate_agreement, group, in_access_group):
+        """Audit access for a group given precomputed group membership."""
         if group.name == settings.ANVIL_CC_ADMINS_GROUP_NAME:
             pass
         else:
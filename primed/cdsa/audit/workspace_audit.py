@@ -1,12 +1,14 @@
 from dataclasses import dataclass
+from functools import cached_property
 
 import django_tables2 as tables
-from anvil_consortium_manager.models import GroupGroupMembership, ManagedGroup
+from anvil_consortium_manager.models import ManagedGroup
 from django.conf import settings
 from django.db.models import QuerySet
 from django.urls import reverse
 
 from primed.primed_anvil.audit import PRIMEDAudit, PRIMEDAuditResult
+from primed.primed_anvil.membership_closure import get_group_membership_closure
 
 # from . import models
 from .. import models
@@ -21,8 +23,10 @@ class AccessAuditResult(PRIMEDAuditResult):
     data_affiliate_agreement: models.DataAffiliateAgreement = None
     action: str = None
 
-    def __post_init__(self):
-        self.anvil_cdsa_group = ManagedGroup.objects.get(name=settings.ANVIL_CDSA_GROUP_NAME)
+    @cached_property
+    def anvil_cdsa_group(self):
+        # Looked up lazily so that building results does not require a query.
+        return ManagedGroup.objects.get(name=settings.ANVIL_CDSA_GROUP_NAME)
 
     def get_action_url(self):
         """The URL that handles the action needed."""
@@ -102,6 +106,43 @@ class WorkspaceAccessAuditTable(tables.Table):
         attrs = {"class": "table align-middle"}
 
 
+class WorkspaceAuditIndex:
+    """Primary DataAffiliateAgreements for a set of studies and the groups that the CDSA group is in.
+
+    This is built once per audit so that workspaces for the same study do not repeat the same lookups.
+    """
+
+    def __init__(self, study_pks, anvil_cdsa_group):
+        self.cdsa_group_parent_pks = get_group_membership_closure().get_direct_parent_pks(anvil_cdsa_group)
+        primary_qs = models.DataAffiliateAgreement.objects.filter(study__in=study_pks, is_primary=True)
+        self.studies_with_primary = set(primary_qs.values_list("study", flat=True))
+        # Keep the active primary agreement with the most recent version for each study.
+        self.active_primary_agreements = {}
+        active_qs = (
+            primary_qs.filter(signed_agreement__status=models.SignedAgreement.StatusChoices.ACTIVE)
+            .select_related("signed_agreement__version__major_version")
+            .order_by(
+                "study",
+                "-signed_agreement__version__major_version__version",
+                "-signed_agreement__version__minor_version",
+            )
+        )
+        for agreement in active_qs:
+            self.active_primary_agreements.setdefault(agreement.study_id, agreement)
+
+    def is_cdsa_group_in_auth_domain(self, auth_domain):
+        """Check whether the CDSA group is a direct member of an auth domain."""
+        return auth_domain.pk in self.cdsa_group_parent_pks
+
+    def primary_exists(self, study):
+        """Check whether any primary agreement exists for a study."""
+        return study.pk in self.studies_with_primary
+
+    def get_active_primary_agreement(self, study):
+        """Return the active primary agreement with the most recent version for a study, or None."""
+        return self.active_primary_agreements.get(study.pk)
+
+
 class WorkspaceAccessAudit(PRIMEDAudit):
     """Audit for CDSA Workspaces."""
 
@@ -116,6 +157,10 @@ class WorkspaceAccessAudit(PRIMEDAudit):
     ERROR_OTHER_CASE = "Workspace did not match any expected situations."
 
     results_table_class = WorkspaceAccessAuditTable
+    result_subject_model = models.CDSAWorkspace
+    result_subject_field = "workspace"
+    result_subject_queryset_argument = "cdsa_workspace_queryset"
+    stored_result_select_related = {"cdsa.CDSAWorkspace": ("workspace__billing_project",)}
 
     def __init__(self, cdsa_workspace_queryset=None):
         # Store the CDSA group for auditing membership.
@@ -134,27 +179,16 @@ class WorkspaceAccessAudit(PRIMEDAudit):
             raise ValueError("cdsa_workspace_queryset must be a queryset of CDSAWorkspace objects.")
         self.cdsa_workspace_queryset = cdsa_workspace_queryset
 
-    def _audit_workspace(self, workspace):
+    def _audit_workspace(self, workspace, index=None):
+        if index is None:
+            index = WorkspaceAuditIndex([workspace.study_id], self.anvil_cdsa_group)
         # Check if the access group is in the overall CDSA group.
-        auth_domain = workspace.workspace.authorization_domains.get()
-        has_cdsa_group_in_auth_domain = GroupGroupMembership.objects.filter(
-            parent_group=auth_domain,
-            child_group=self.anvil_cdsa_group,
-        ).exists()
-        primary_qs = models.DataAffiliateAgreement.objects.filter(study=workspace.study, is_primary=True)
-        primary_exists = primary_qs.exists()
+        auth_domain = self._get_auth_domain(workspace)
+        has_cdsa_group_in_auth_domain = index.is_cdsa_group_in_auth_domain(auth_domain)
+        primary_exists = index.primary_exists(workspace.study)
 
         if primary_exists:
-            primary_agreement = (
-                primary_qs.filter(
-                    signed_agreement__status=models.SignedAgreement.StatusChoices.ACTIVE,
-                )
-                .order_by(
-                    "-signed_agreement__version__major_version__version",
-                    "-signed_agreement__version__minor_version",
-                )
-                .first()
-            )
+            primary_agreement = index.get_active_primary_agreement(workspace.study)
             if primary_agreement:
                 if has_cdsa_group_in_auth_domain:
                     self.verified.append(
@@ -213,7 +247,24 @@ class WorkspaceAccessAudit(PRIMEDAudit):
                 )
                 return
 
+    @staticmethod
+    def _get_auth_domain(workspace):
+        """Return the single auth domain for a workspace, using prefetched auth domains if available."""
+        auth_domains = list(workspace.workspace.authorization_domains.all())
+        if not auth_domains:
+            raise ManagedGroup.DoesNotExist("Workspace does not have an auth domain.")
+        if len(auth_domains) > 1:
+            raise ManagedGroup.MultipleObjectsReturned("Workspace has more than one auth domain.")
+        return auth_domains[0]
+
     def _run_audit(self):
         """Run an audit on all SignedAgreements."""
-        for workspace in self.cdsa_workspace_queryset:
-            self._audit_workspace(workspace)
+        workspaces = list(
+            self.cdsa_workspace_queryset.select_related(
+                "workspace__billing_project",
+                "study",
+            ).prefetch_related("workspace__authorization_domains")
+        )
+        index = WorkspaceAuditIndex(set(workspace.study_id for workspace in workspaces), self.anvil_cdsa_group)
+        for workspace in workspaces:
+            self._audit_workspace(workspace, index)
@@ -4,6 +4,8 @@ from django.core.management.base import BaseCommand
 from django.template.loader import render_to_string
 from django.urls import reverse
 
+from primed.primed_anvil.audit_results import run_and_store_audit
+
 from ...audit import accessor_audit, signed_agreement_audit, uploader_audit, workspace_audit
 
 
@@ -20,42 +22,42 @@ class Command(BaseCommand):
     def _audit_signed_agreements(self):
         self.stdout.write("Running SignedAgreement access audit... ", ending="")
         data_access_audit = signed_agreement_audit.SignedAgreementAccessAudit()
-        data_access_audit.run_audit()
+        run_and_store_audit(data_access_audit)
 
         # Construct the url for handling errors.
         url = "https://" + Site.objects.get_current().domain + reverse("cdsa:audit:signed_agreements:sag:all")
-        self._report_results(data_access_audit, url)
-        self._send_email(data_access_audit, url)
+        changes = self._report_results(data_access_audit, url)
+        self._send_email(data_access_audit, changes, url)
 
     def _audit_workspaces(self):
         self.stdout.write("Running CDSAWorkspace access audit... ", ending="")
         data_access_audit = workspace_audit.WorkspaceAccessAudit()
-        data_access_audit.run_audit()
+        run_and_store_audit(data_access_audit)
 
         # Construct the url for handling errors.
         url = "https://" + Site.objects.get_current().domain + reverse("cdsa:audit:workspaces:all")
-        self._report_results(data_access_audit, url)
-        self._send_email(data_access_audit, url)
+        changes = self._report_results(data_access_audit, url)
+        self._send_email(data_access_audit, changes, url)
 
     def _audit_accessors(self):
         self.stdout.write("Running Accessor audit... ", ending="")
         data_access_audit = accessor_audit.AccessorAudit()
-        data_access_audit.run_audit()
+        run_and_store_audit(data_access_audit)
 
         # Construct the url for handling errors.
         url = "https://" + Site.objects.get_current().domain + reverse("cdsa:audit:signed_agreements:accessors:all")
-        self._report_results(data_access_audit, url)
-        self._send_email(data_access_audit, url)
+        changes = self._report_results(data_access_audit, url)
+        self._send_email(data_access_audit, changes, url)
 
     def _audit_uploaders(self):
         self.stdout.write("Running Uploader audit... ", ending="")
         data_access_audit = uploader_audit.UploaderAudit()
-        data_access_audit.run_audit()
+        run_and_store_audit(data_access_audit)
 
         # Construct the url for handling errors.
         url = "https://" + Site.objects.get_current().domain + reverse("cdsa:audit:signed_agreements:uploaders:all")
-        self._report_results(data_access_audit, url)
-        self._send_email(data_access_audit, url)
+        changes = self._report_results(data_access_audit, url)
+        self._send_email(data_access_audit, changes, url)
 
     def _report_results(self, data_access_audit, resolve_url):
         # Report errors and needs access.
@@ -69,11 +71,13 @@ class Command(BaseCommand):
         self.stdout.write("* Verified: {}".format(len(data_access_audit.verified)))
         self.stdout.write("* Needs action: {}".format(len(data_access_audit.needs_action)))
         self.stdout.write("* Errors: {}".format(len(data_access_audit.errors)))
+        changes = data_access_audit.report_and_save_run(self.stdout)
 
         if not audit_ok:
             self.stdout.write(self.style.ERROR(f"Please visit {resolve_url} to resolve these issues."))
+        return changes
 
-    def _send_email(self, data_access_audit, url):
+    def _send_email(self, data_access_audit, changes, url):
         # Send email if requested and there are problems.
         if not data_access_audit.ok():
             subject = "CDSA {} errors".format(data_access_audit.__class__.__name__)
@@ -82,6 +86,7 @@ class Command(BaseCommand):
                 context={
                     "title": subject,
                     "data_access_audit": data_access_audit,
+                    "changes": changes,
                     "url": url,
                 },
             )
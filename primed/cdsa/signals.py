@@ -0,0 +1,156 @@
+"""Signal handlers that mark stored CDSA audit results as stale when the data they depend on changes."""
+
+from anvil_consortium_manager.models import Account, GroupAccountMembership, GroupGroupMembership, Workspace
+from django.contrib.auth import get_user_model
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from primed.primed_anvil.audit_results import mark_audit_results_stale
+
+from . import models
+from .audit import accessor_audit, signed_agreement_audit, uploader_audit, workspace_audit
+
+
+def _get_pks(model, *args, **kwargs):
+    return model.objects.filter(*args, **kwargs).values_list("pk", flat=True)
+
+
+def _group_membership_changed(parent_group_pk, child_group_pk):
+    # Agreement access groups are added to the CDSA group, which is in turn added to workspace auth domains.
+    mark_audit_results_stale(
+        signed_agreement_audit.SignedAgreementAccessAudit,
+        _get_pks(models.SignedAgreement, anvil_access_group=child_group_pk),
+    )
+    mark_audit_results_stale(
+        workspace_audit.WorkspaceAccessAudit,
+        _get_pks(models.CDSAWorkspace, workspace__authorization_domains=parent_group_pk),
+    )
+    _group_members_changed(parent_group_pk)
+
+
+def _group_members_changed(group_pk):
+    mark_audit_results_stale(
+        accessor_audit.AccessorAudit, _get_pks(models.SignedAgreement, anvil_access_group=group_pk)
+    )
+    mark_audit_results_stale(
+        uploader_audit.UploaderAudit, _get_pks(models.DataAffiliateAgreement, anvil_upload_group=group_pk)
+    )
+
+
+@receiver(post_save, sender=GroupGroupMembership)
+def group_group_membership_saved(sender, instance, created, **kwargs):
+    if created:
+        _group_membership_changed(instance.parent_group_id, instance.child_group_id)
+
+
+@receiver(post_delete, sender=GroupGroupMembership)
+def group_group_membership_deleted(sender, instance, **kwargs):
+    _group_membership_changed(instance.parent_group_id, instance.child_group_id)
+
+
+@receiver(post_save, sender=GroupAccountMembership)
+def group_account_membership_saved(sender, instance, created, **kwargs):
+    if created:
+        _group_members_changed(instance.group_id)
+
+
+@receiver(post_delete, sender=GroupAccountMembership)
+def group_account_membership_deleted(sender, instance, **kwargs):
+    _group_members_changed(instance.group_id)
+
+
+@receiver(post_save, sender=Account)
+def account_saved(sender, instance, **kwargs):
+    # The account status or linked user may have changed.
+    group_pks = GroupAccountMembership.objects.filter(account=instance).values("group")
+    accessor_query = Q(anvil_access_group__in=group_pks)
+    uploader_query = Q(anvil_upload_group__in=group_pks)
+    if instance.user_id:
+        accessor_query |= Q(accessors=instance.user_id)
+        uploader_query |= Q(uploaders=instance.user_id)
+    mark_audit_results_stale(accessor_audit.AccessorAudit, _get_pks(models.SignedAgreement, accessor_query))
+    mark_audit_results_stale(uploader_audit.UploaderAudit, _get_pks(models.DataAffiliateAgreement, uploader_query))
+
+
+@receiver(post_save, sender=models.SignedAgreement)
+def signed_agreement_saved(sender, instance, **kwargs):
+    # The status or version may have changed.
+    mark_audit_results_stale(signed_agreement_audit.SignedAgreementAccessAudit, [instance.pk])
+    mark_audit_results_stale(accessor_audit.AccessorAudit, [instance.pk])
+    mark_audit_results_stale(uploader_audit.UploaderAudit, [instance.pk])
+    mark_audit_results_stale(
+        workspace_audit.WorkspaceAccessAudit,
+        _get_pks(
+            models.CDSAWorkspace,
+            study__in=models.DataAffiliateAgreement.objects.filter(pk=instance.pk).values("study"),
+        ),
+    )
+
+
+@receiver(post_save, sender=models.MemberAgreement)
+@receiver(post_save, sender=models.NonDataAffiliateAgreement)
+def agreement_type_saved(sender, instance, **kwargs):
+    mark_audit_results_stale(signed_agreement_audit.SignedAgreementAccessAudit, [instance.pk])
+
+
+@receiver(post_save, sender=models.DataAffiliateAgreement)
+def data_affiliate_agreement_saved(sender, instance, **kwargs):
+    mark_audit_results_stale(signed_agreement_audit.SignedAgreementAccessAudit, [instance.pk])
+    mark_audit_results_stale(uploader_audit.UploaderAudit, [instance.pk])
+    mark_audit_results_stale(
+        workspace_audit.WorkspaceAccessAudit, _get_pks(models.CDSAWorkspace, study=instance.study_id)
+    )
+
+
+@receiver(post_save, sender=models.CDSAWorkspace)
+def cdsa_workspace_saved(sender, instance, **kwargs):
+    mark_audit_results_stale(workspace_audit.WorkspaceAccessAudit, [instance.pk])
+
+
+@receiver(m2m_changed, sender=Workspace.authorization_domains.through)
+def workspace_authorization_domains_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        mark_audit_results_stale(
+            workspace_audit.WorkspaceAccessAudit, _get_pks(models.CDSAWorkspace, workspace=instance)
+        )
+    else:
+        mark_audit_results_stale(workspace_audit.WorkspaceAccessAudit)
+
+
+@receiver(m2m_changed, sender=get_user_model().study_sites.through)
+def user_study_sites_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # Member agreements are checked against the study sites of their representative.
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        query = Q(signed_agreement__representative=instance)
+    elif pk_set:
+        query = Q(study_site=instance, signed_agreement__representative__in=pk_set)
+    else:
+        query = Q(study_site=instance)
+    mark_audit_results_stale(signed_agreement_audit.SignedAgreementAccessAudit, _get_pks(models.MemberAgreement, query))
+
+
+def _mark_m2m_changed(audit_class, instance, action, reverse, pk_set):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        mark_audit_results_stale(audit_class, [instance.pk])
+    elif pk_set:
+        mark_audit_results_stale(audit_class, pk_set)
+    else:
+        # The agreements a user was removed from are not known after a reverse clear.
+        mark_audit_results_stale(audit_class)
+
+
+@receiver(m2m_changed, sender=models.SignedAgreement.accessors.through)
+def signed_agreement_accessors_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    _mark_m2m_changed(accessor_audit.AccessorAudit, instance, action, reverse, pk_set)
+
+
+@receiver(m2m_changed, sender=models.DataAffiliateAgreement.uploaders.through)
+def data_affiliate_agreement_uploaders_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    _mark_m2m_changed(uploader_audit.UploaderAudit, instance, action, reverse, pk_set)
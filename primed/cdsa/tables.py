@@ -11,6 +11,7 @@ from django.utils.safestring import mark_safe
 from primed.primed_anvil.tables import (
     BooleanIconColumn,
     WorkspaceSharedWithConsortiumColumn,
+    WorkspaceSharedWithConsortiumTableMixin,
 )
 
 from . import models
@@ -283,7 +284,7 @@ class CDSAWorkspaceRecordsTable(tables.Table):
             return "—"
 
 
-class CDSAWorkspaceUserTable(tables.Table):
+class CDSAWorkspaceUserTable(WorkspaceSharedWithConsortiumTableMixin, tables.Table):
     """A table for the CDSAWorkspace model."""
 
     name = tables.Column(linkify=True)
@@ -7,7 +7,9 @@ from anvil_consortium_manager.tests.factories import (
     ManagedGroupFactory,
 )
 from django.conf import settings
+from django.db import connection
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from primed.primed_anvil.tests.factories import StudyFactory, StudySiteFactory
@@ -1692,6 +1694,44 @@ class SignedAgreementAccessAuditTest(TestCase):
         self.assertEqual(record.signed_agreement, this_agreement.signed_agreement)
         self.assertEqual(record.note, cdsa_audit.INACTIVE_AGREEMENT)
 
+    def test_number_of_queries_does_not_depend_on_number_of_agreements(self):
+        """run_audit uses the same number of queries regardless of the number of agreements."""
+
+        def create_agreements():
+            primary = factories.MemberAgreementFactory.create()
+            GroupGroupMembershipFactory.create(
+                parent_group=self.cdsa_group,
+                child_group=primary.signed_agreement.anvil_access_group,
+            )
+            factories.MemberAgreementFactory.create(
+                is_primary=False,
+                study_site=primary.study_site,
+                signed_agreement__representative__study_sites=[primary.study_site],
+            )
+            factories.DataAffiliateAgreementFactory.create(is_primary=False)
+            factories.NonDataAffiliateAgreementFactory.create()
+
+        create_agreements()
+        # Run once so that the shared group membership closure is cached.
+        signed_agreement_audit.SignedAgreementAccessAudit().run_audit()
+        cdsa_audit = signed_agreement_audit.SignedAgreementAccessAudit()
+        with CaptureQueriesContext(connection) as few_agreement_queries:
+            cdsa_audit.run_audit()
+        self.assertEqual(len(cdsa_audit.get_all_results()), 4)
+        for _ in range(3):
+            create_agreements()
+        cdsa_audit = signed_agreement_audit.SignedAgreementAccessAudit()
+        with CaptureQueriesContext(connection) as many_agreement_queries:
+            cdsa_audit.run_audit()
+        self.assertEqual(len(cdsa_audit.get_all_results()), 16)
+        self.assertEqual(len(many_agreement_queries), len(few_agreement_queries))
+
+    def test_results_do_not_query_cdsa_group(self):
+        """Creating results does not query the database."""
+        signed_agreement = factories.SignedAgreementFactory.create()
+        with self.assertNumQueries(0):
+            signed_agreement_audit.VerifiedAccess(signed_agreement=signed_agreement, note="foo")
+
 
 class SignedAgreementAccessAuditTableTest(TestCase):
     """Tests for the `SignedAgreementAccessAuditTable` table."""
@@ -2443,6 +2483,54 @@ class WorkspaceAccessAuditTest(TestCase):
         self.assertEqual(len(cdsa_audit.needs_action), 0)
         self.assertEqual(len(cdsa_audit.errors), 0)
 
+    def test_two_active_primaries_uses_most_recent_version(self):
+        """The active primary agreement with the most recent version is used."""
+        study = StudyFactory.create()
+        workspace = factories.CDSAWorkspaceFactory.create(study=study)
+        factories.DataAffiliateAgreementFactory.create(
+            study=study,
+            signed_agreement__version__major_version__version=1,
+        )
+        newer_agreement = factories.DataAffiliateAgreementFactory.create(
+            study=study,
+            signed_agreement__version__major_version__version=2,
+        )
+        cdsa_audit = workspace_audit.WorkspaceAccessAudit()
+        cdsa_audit.run_audit()
+        self.assertEqual(len(cdsa_audit.needs_action), 1)
+        record = cdsa_audit.needs_action[0]
+        self.assertEqual(record.workspace, workspace)
+        self.assertEqual(record.data_affiliate_agreement, newer_agreement)
+
+    def test_number_of_queries_does_not_depend_on_number_of_workspaces(self):
+        """run_audit uses the same number of queries regardless of the number of workspaces and studies."""
+
+        def create_workspaces():
+            study = StudyFactory.create()
+            factories.DataAffiliateAgreementFactory.create(study=study)
+            workspace = factories.CDSAWorkspaceFactory.create(study=study)
+            GroupGroupMembershipFactory.create(
+                parent_group=workspace.workspace.authorization_domains.get(),
+                child_group=self.cdsa_group,
+            )
+            factories.CDSAWorkspaceFactory.create(study=study)
+            factories.CDSAWorkspaceFactory.create()
+
+        create_workspaces()
+        # Run once so that the shared group membership closure is cached.
+        workspace_audit.WorkspaceAccessAudit().run_audit()
+        cdsa_audit = workspace_audit.WorkspaceAccessAudit()
+        with CaptureQueriesContext(connection) as few_workspace_queries:
+            cdsa_audit.run_audit()
+        self.assertEqual(len(cdsa_audit.get_all_results()), 3)
+        for _ in range(3):
+            create_workspaces()
+        cdsa_audit = workspace_audit.WorkspaceAccessAudit()
+        with CaptureQueriesContext(connection) as many_workspace_queries:
+            cdsa_audit.run_audit()
+        self.assertEqual(len(cdsa_audit.get_all_results()), 12)
+        self.assertEqual(len(many_workspace_queries), len(few_workspace_queries))
+
     # def test_other_error(self):
     #     signed_agreement = factories.SignedAgreementFactory.create(
     #         is_primary=False, type="MEMBER"
@@ -3321,6 +3409,33 @@ class AccessorAuditTest(TestCase):
         self.assertEqual(record.member, account_1)
         self.assertEqual(record.note, accessor_audit.AccessorAudit.ACCESSOR_LINKED_ACCOUNT)
 
+    def test_number_of_queries_does_not_depend_on_number_of_agreements(self):
+        """run_audit uses the same number of queries regardless of the number of agreements and members."""
+
+        def create_agreement():
+            agreement = factories.SignedAgreementFactory.create()
+            account = AccountFactory.create(verified=True)
+            agreement.accessors.add(account.user)
+            GroupAccountMembershipFactory.create(group=agreement.anvil_access_group, account=account)
+            agreement.accessors.add(UserFactory.create())
+            GroupAccountMembershipFactory.create(group=agreement.anvil_access_group)
+            GroupGroupMembershipFactory.create(parent_group=agreement.anvil_access_group)
+
+        create_agreement()
+        # Run once so that the shared group membership closure is cached.
+        accessor_audit.AccessorAudit().run_audit()
+        audit = accessor_audit.AccessorAudit()
+        with CaptureQueriesContext(connection) as one_agreement_queries:
+            audit.run_audit()
+        self.assertEqual(len(audit.get_all_results()), 4)
+        for _ in range(3):
+            create_agreement()
+        audit = accessor_audit.AccessorAudit()
+        with CaptureQueriesContext(connection) as many_agreement_queries:
+            audit.run_audit()
+        self.assertEqual(len(audit.get_all_results()), 16)
+        self.assertEqual(len(many_agreement_queries), len(one_agreement_queries))
+
     def test_queryset(self):
         """Audit only runs on the specified queryset of SignedAgreements."""
         signed_agreement_1 = factories.SignedAgreementFactory.create()
@@ -3857,6 +3972,33 @@ class DataAffiliateAgreementUploaderAuditTest(TestCase):
         self.assertEqual(record.member, account_1)
         self.assertEqual(record.note, uploader_audit.UploaderAudit.UPLOADER_LINKED_ACCOUNT)
 
+    def test_number_of_queries_does_not_depend_on_number_of_agreements(self):
+        """run_audit uses the same number of queries regardless of the number of agreements and members."""
+
+        def create_agreement():
+            agreement = factories.DataAffiliateAgreementFactory.create()
+            account = AccountFactory.create(verified=True)
+            agreement.uploaders.add(account.user)
+            GroupAccountMembershipFactory.create(group=agreement.anvil_upload_group, account=account)
+            agreement.uploaders.add(UserFactory.create())
+            GroupAccountMembershipFactory.create(group=agreement.anvil_upload_group)
+            GroupGroupMembershipFactory.create(parent_group=agreement.anvil_upload_group)
+
+        create_agreement()
+        # Run once so that the shared group membership closure is cached.
+        uploader_audit.UploaderAudit().run_audit()
+        audit = uploader_audit.UploaderAudit()
+        with CaptureQueriesContext(connection) as one_agreement_queries:
+            audit.run_audit()
+        self.assertEqual(len(audit.get_all_results()), 4)
+        for _ in range(3):
+            create_agreement()
+        audit = uploader_audit.UploaderAudit()
+        with CaptureQueriesContext(connection) as many_agreement_queries:
+            audit.run_audit()
+        self.assertEqual(len(audit.get_all_results()), 16)
+        self.assertEqual(len(many_agreement_queries), len(one_agreement_queries))
+
     def test_queryset(self):
         """Audit only runs on the specified queryset of DataAffiliateAgreements."""
         data_affiliate_agreement_1 = factories.DataAffiliateAgreementFactory.create()
@@ -0,0 +1,88 @@
+"""Tests for the `signals.py` module."""
+
+from anvil_consortium_manager.tests.factories import (
+    GroupAccountMembershipFactory,
+    GroupGroupMembershipFactory,
+    ManagedGroupFactory,
+)
+from django.conf import settings
+from django.test import TestCase
+
+from primed.primed_anvil.audit_results import get_audit_name, get_stored_audit
+from primed.primed_anvil.models import StoredAuditResults
+from primed.users.tests.factories import UserFactory
+
+from .. import models
+from ..audit import accessor_audit, signed_agreement_audit, uploader_audit, workspace_audit
+from . import factories
+
+
+class StoredAuditResultsSignalsTest(TestCase):
+    """Tests that signal handlers mark stored CDSA audit results as stale."""
+
+    def setUp(self):
+        self.cdsa_group = ManagedGroupFactory.create(name=settings.ANVIL_CDSA_GROUP_NAME)
+        self.agreement = factories.DataAffiliateAgreementFactory.create()
+        self.other_agreement = factories.MemberAgreementFactory.create()
+        self.workspace = factories.CDSAWorkspaceFactory.create(study=self.agreement.study)
+        self.other_workspace = factories.CDSAWorkspaceFactory.create()
+        for audit_class in (
+            accessor_audit.AccessorAudit,
+            signed_agreement_audit.SignedAgreementAccessAudit,
+            uploader_audit.UploaderAudit,
+            workspace_audit.WorkspaceAccessAudit,
+        ):
+            get_stored_audit(audit_class)
+
+    def get_stale_pks(self, audit_class):
+        return set(
+            StoredAuditResults.objects.filter(audit_name=get_audit_name(audit_class), is_stale=True).values_list(
+                "subject_pk", flat=True
+            )
+        )
+
+    def test_access_group_added_to_cdsa_group(self):
+        GroupGroupMembershipFactory.create(
+            parent_group=self.cdsa_group, child_group=self.agreement.signed_agreement.anvil_access_group
+        )
+        self.assertEqual(self.get_stale_pks(signed_agreement_audit.SignedAgreementAccessAudit), {self.agreement.pk})
+        self.assertEqual(self.get_stale_pks(workspace_audit.WorkspaceAccessAudit), set())
+
+    def test_cdsa_group_added_to_auth_domain(self):
+        GroupGroupMembershipFactory.create(
+            parent_group=self.workspace.workspace.authorization_domains.get(), child_group=self.cdsa_group
+        )
+        self.assertEqual(self.get_stale_pks(workspace_audit.WorkspaceAccessAudit), {self.workspace.pk})
+        self.assertEqual(self.get_stale_pks(signed_agreement_audit.SignedAgreementAccessAudit), set())
+
+    def test_account_added_to_upload_group(self):
+        GroupAccountMembershipFactory.create(group=self.agreement.anvil_upload_group)
+        self.assertEqual(self.get_stale_pks(uploader_audit.UploaderAudit), {self.agreement.pk})
+        self.assertEqual(self.get_stale_pks(accessor_audit.AccessorAudit), set())
+
+    def test_accessors(self):
+        self.other_agreement.signed_agreement.accessors.add(UserFactory.create())
+        self.assertEqual(self.get_stale_pks(accessor_audit.AccessorAudit), {self.other_agreement.pk})
+
+    def test_signed_agreement_status(self):
+        signed_agreement = self.agreement.signed_agreement
+        signed_agreement.status = models.SignedAgreement.StatusChoices.WITHDRAWN
+        signed_agreement.save()
+        self.assertEqual(self.get_stale_pks(signed_agreement_audit.SignedAgreementAccessAudit), {self.agreement.pk})
+        self.assertEqual(self.get_stale_pks(workspace_audit.WorkspaceAccessAudit), {self.workspace.pk})
+
+    def test_representative_study_sites(self):
+        representative = self.other_agreement.signed_agreement.representative
+        representative.study_sites.add(self.other_agreement.study_site)
+        self.assertEqual(
+            self.get_stale_pks(signed_agreement_audit.SignedAgreementAccessAudit), {self.other_agreement.pk}
+        )
+        StoredAuditResults.objects.update(is_stale=False)
+        self.other_agreement.study_site.user_set.remove(representative)
+        self.assertEqual(
+            self.get_stale_pks(signed_agreement_audit.SignedAgreementAccessAudit), {self.other_agreement.pk}
+        )
+
+    def test_unrelated_user_study_sites(self):
+        UserFactory.create().study_sites.add(self.other_agreement.study_site)
+        self.assertEqual(self.get_stale_pks(signed_agreement_audit.SignedAgreementAccessAudit), set())
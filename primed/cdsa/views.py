@@ -27,6 +27,7 @@ from django.views.generic.detail import SingleObjectMixin
 from django_tables2 import MultiTableMixin, SingleTableMixin, SingleTableView
 
 from primed.primed_anvil.tables import UserAccountSingleGroupMembershipTable
+from primed.primed_anvil.viewmixins import StoredAuditRefreshMixin
 
 from . import forms, helpers, models, tables, viewmixins
 from .audit import accessor_audit, signed_agreement_audit, uploader_audit, workspace_audit
@@ -562,10 +563,12 @@ class NonDataAffiliateAgreementList(AnVILConsortiumManagerStaffViewRequired, Sin
     table_class = tables.NonDataAffiliateAgreementTable
 
 
-class SignedAgreementAudit(AnVILConsortiumManagerStaffViewRequired, TemplateView):
+class SignedAgreementAudit(AnVILConsortiumManagerStaffViewRequired, StoredAuditRefreshMixin, TemplateView):
     """View to show audit results for `SignedAgreements`."""
 
     template_name = "cdsa/signedagreement_audit.html"
+    audit_class = signed_agreement_audit.SignedAgreementAccessAudit
+    audit_title = "Signed Agreement audit"
     ERROR_CDSA_GROUP_DOES_NOT_EXIST = """The CDSA group "{}" does not exist in the app."""
 
     def get(self, request, *args, **kwargs):
@@ -579,8 +582,7 @@ class SignedAgreementAudit(AnVILConsortiumManagerStaffViewRequired, TemplateView
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        audit = signed_agreement_audit.SignedAgreementAccessAudit()
-        audit.run_audit()
+        audit = self.get_audit()
         context["verified_table"] = audit.get_verified_table()
         context["errors_table"] = audit.get_errors_table()
         context["needs_action_table"] = audit.get_needs_action_table()
@@ -670,16 +672,17 @@ class SignedAgreementAuditResolve(AnVILConsortiumManagerStaffEditRequired, Singl
             return super().form_valid(form)
 
 
-class CDSAWorkspaceAudit(AnVILConsortiumManagerStaffViewRequired, TemplateView):
+class CDSAWorkspaceAudit(AnVILConsortiumManagerStaffViewRequired, StoredAuditRefreshMixin, TemplateView):
     """View to show audit results for `CDSAWorkspaces`."""
 
     template_name = "cdsa/cdsaworkspace_audit.html"
+    audit_class = workspace_audit.WorkspaceAccessAudit
+    audit_title = "CDSA workspace audit"
     ERROR_CDSA_GROUP_DOES_NOT_EXIST = """The CDSA group "{}" does not exist in the app."""
 
     def get(self, request, *args, **kwargs):
-        try:
-            self.audit = workspace_audit.WorkspaceAccessAudit()
-        except models.ManagedGroup.DoesNotExist:
+        # Check before the audit is run, since it may be run in the background.
+        if not models.ManagedGroup.objects.filter(name=settings.ANVIL_CDSA_GROUP_NAME).exists():
             messages.error(
                 self.request,
                 self.ERROR_CDSA_GROUP_DOES_NOT_EXIST.format(settings.ANVIL_CDSA_GROUP_NAME),
@@ -689,12 +692,11 @@ class CDSAWorkspaceAudit(AnVILConsortiumManagerStaffViewRequired, TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Run the audit on all SignedAgreements.
-        self.audit.run_audit()
-        context["verified_table"] = self.audit.get_verified_table()
-        context["errors_table"] = self.audit.get_errors_table()
-        context["needs_action_table"] = self.audit.get_needs_action_table()
-        context["audit"] = self.audit
+        audit = self.get_audit()
+        context["verified_table"] = audit.get_verified_table()
+        context["errors_table"] = audit.get_errors_table()
+        context["needs_action_table"] = audit.get_needs_action_table()
+        context["audit"] = audit
         return context
 
 
@@ -784,15 +786,16 @@ class CDSAWorkspaceAuditResolve(AnVILConsortiumManagerStaffEditRequired, SingleO
             return super().form_valid(form)
 
 
-class AccessorAudit(AnVILConsortiumManagerStaffViewRequired, TemplateView):
+class AccessorAudit(AnVILConsortiumManagerStaffViewRequired, StoredAuditRefreshMixin, TemplateView):
     """View to show accessor audit results for `SignedAgreements`."""
 
     template_name = "cdsa/accessor_audit.html"
+    audit_class = accessor_audit.AccessorAudit
+    audit_title = "Signed Agreement accessor audit"
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        audit = accessor_audit.AccessorAudit()
-        audit.run_audit()
+        audit = self.get_audit()
         context["verified_table"] = audit.get_verified_table()
         context["errors_table"] = audit.get_errors_table()
         context["needs_action_table"] = audit.get_needs_action_table()
@@ -897,15 +900,16 @@ class AccessorAuditResolve(AnVILConsortiumManagerStaffEditRequired, FormView):
             return super().form_valid(form)
 
 
-class UploaderAudit(AnVILConsortiumManagerStaffViewRequired, TemplateView):
+class UploaderAudit(AnVILConsortiumManagerStaffViewRequired, StoredAuditRefreshMixin, TemplateView):
     """View to show uploader audit results for `DataAffiliateAgreements`."""
 
     template_name = "cdsa/uploader_audit.html"
+    audit_class = uploader_audit.UploaderAudit
+    audit_title = "Data Affiliate Agreement uploader audit"
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        audit = uploader_audit.UploaderAudit()
-        audit.run_audit()
+        audit = self.get_audit()
         context["verified_table"] = audit.get_verified_table()
         context["errors_table"] = audit.get_errors_table()
         context["needs_action_table"] = audit.get_needs_action_table()
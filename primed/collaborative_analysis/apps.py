@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class CollabAnalysisConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "primed.collaborative_analysis"
+
+    def ready(self):
+        import primed.collaborative_analysis.signals  # noqa F401
@@ -9,9 +9,11 @@ from anvil_consortium_manager.models import (
     ManagedGroup,
 )
 from django.conf import settings
+from django.db.models import QuerySet, prefetch_related_objects
 from django.urls import reverse
 
-from primed.primed_anvil.audit import PRIMEDAudit, PRIMEDAuditResult
+from primed.primed_anvil.audit import GroupMemberIndex, PRIMEDAudit, PRIMEDAuditResult
+from primed.primed_anvil.membership_closure import get_group_membership_closure
 from primed.primed_anvil.tables import BooleanIconColumn
 
 from . import models
@@ -107,6 +109,56 @@ class AccessAuditResultsTable(tables.Table):
         attrs = {"class": "table align-middle"}
 
 
+def get_required_auth_domain_pks(collaborative_analysis_workspace):
+    """Return the pks of source auth domains that an account must be in to access a CollaborativeAnalysisWorkspace.
+
+    Only source auth domains managed by the app are included. This is intended to handle the
+    federal_data_lockdown auth domain. We should have enough controls on who gets access that this is ok.
+    Prefetched source workspaces and auth domains are used if available.
+    """
+    return set(
+        auth_domain.pk
+        for source_workspace in collaborative_analysis_workspace.source_workspaces.all()
+        for auth_domain in source_workspace.authorization_domains.all()
+        if auth_domain.is_managed_by_app
+    )
+
+
+class CollaborativeAnalysisAuditIndex:
+    """Auth domains and group members needed to audit a list of CollaborativeAnalysisWorkspaces.
+
+    This is built once per audit so that the audit does not need to query for each account or source workspace.
+    """
+
+    def __init__(self, workspaces):
+        self.closure = get_group_membership_closure()
+        prefetch_related_objects(
+            workspaces,
+            "workspace__authorization_domains",
+            "source_workspaces__authorization_domains",
+        )
+        self.auth_domain_pks = {}
+        for workspace in workspaces:
+            auth_domains = workspace.workspace.authorization_domains.all()
+            if len(auth_domains) != 1:
+                raise ValueError("Workspace {} must have exactly one auth domain.".format(workspace))
+            self.auth_domain_pks[workspace.pk] = auth_domains[0].pk
+        self.required_auth_domain_pks = {x.pk: get_required_auth_domain_pks(x) for x in workspaces}
+        # CC groups whose members are audited, and CC writer groups that are allowed access.
+        self.cc_group_pks = list(
+            ManagedGroup.objects.filter(name=settings.ANVIL_CC_WRITERS_GROUP_NAME).values_list("pk", flat=True)
+        )
+        self.cc_writer_group_pks = set(
+            ManagedGroup.objects.filter(name__iexact=settings.ANVIL_CC_WRITERS_GROUP_NAME).values_list("pk", flat=True)
+        )
+        self.members = GroupMemberIndex(
+            group_pks=set(
+                [x.analyst_group_id for x in workspaces] + list(self.auth_domain_pks.values()) + self.cc_group_pks
+            ),
+            user_pks=[],
+        )
+
+
 class CollaborativeAnalysisWorkspaceAccessAudit(PRIMEDAudit):
     """Class to audit access to a CollaborativeAnalysisWorkspace."""
 
@@ -122,6 +174,13 @@ class CollaborativeAnalysisWorkspaceAccessAudit(PRIMEDAudit):
     GROUP_NOT_ALLOWED = "Groups should not be in the auth domain."
 
     results_table_class = AccessAuditResultsTable
+    result_subject_model = models.CollaborativeAnalysisWorkspace
+    result_subject_field = "collaborative_analysis_workspace"
+    result_subject_queryset_argument = "queryset"
+    stored_result_select_related = {
+        "collaborative_analysis.CollaborativeAnalysisWorkspace": ("workspace__billing_project",),
+        "anvil_consortium_manager.Account": ("user",),
+    }
 
     def __init__(self, queryset=None):
         """Initialize the audit.
@@ -134,38 +193,32 @@ class CollaborativeAnalysisWorkspaceAccessAudit(PRIMEDAudit):
             queryset = models.CollaborativeAnalysisWorkspace.objects.all()
         self.queryset = queryset
 
-    def _audit_workspace(self, workspace):
+    def _audit_workspace(self, workspace, index=None):
         """Audit access to a single CollaborativeAnalysisWorkspace."""
-        # Loop over analyst accounts for this workspace.
-        # In the loop, run the _audit_workspace_and_account method.
-        # Any remainig accounts in the auth domain that are not in the analyst group should be *errors*.
-        analyst_group = workspace.analyst_group
-        # CC group
-        try:
-            cc_group = ManagedGroup.objects.get(name=settings.ANVIL_CC_WRITERS_GROUP_NAME)
-        except ManagedGroup.DoesNotExist:
-            cc_group = None
-            accounts = Account.objects.filter(groupaccountmembership__group=analyst_group).distinct()
-            # GroupAccountMembership.objects.filter(group=analyst_group)
-        else:
-            accounts = Account.objects.filter(groupaccountmembership__group__in=[analyst_group, cc_group]).distinct()
-
-        # Get a list of accounts in the auth domain.
-        auth_domain_accounts = [
-            x.account
-            for x in GroupAccountMembership.objects.filter(group=workspace.workspace.authorization_domains.get())
-        ]
-
-        for account in accounts:
-            self._audit_workspace_and_account(workspace, account)
-            try:
-                auth_domain_accounts.remove(account)
-            except ValueError:
-                # This is fine - this happens if the account is not in the auth domain.
-                pass
+        if index is None:
+            index = CollaborativeAnalysisAuditIndex([workspace])
+        closure = index.closure
+        auth_domain_pk = index.auth_domain_pks[workspace.pk]
+        required_auth_domain_pks = index.required_auth_domain_pks[workspace.pk]
+        # Loop over analyst and CC writer accounts for this workspace.
+        # Any remaining accounts in the auth domain that are not in these groups should be *errors*.
+        group_pks = [workspace.analyst_group_id] + index.cc_group_pks
+        audited_account_pks = set()
+        for account in index.members.get_member_accounts_in_any_group(group_pks):
+            self._audit_account(
+                workspace,
+                account,
+                closure.get_all_group_pks_for_account(account),
+                bool(closure.get_direct_group_pks_for_account(account) & index.cc_writer_group_pks),
+                auth_domain_pk,
+                required_auth_domain_pks,
+            )
+            audited_account_pks.add(account.pk)
 
         # Loop over remaining accounts in the auth domain.
-        for account in auth_domain_accounts:
+        for account in index.members.get_member_accounts(auth_domain_pk):
+            if account.pk in audited_account_pks:
+                continue
             # Should this be an error, or a needs_action?
             # eg if an analyst is removed on purpose, it should be needs_action.
             self.errors.append(
@@ -177,23 +230,23 @@ class CollaborativeAnalysisWorkspaceAccessAudit(PRIMEDAudit):
             )
 
         # Check group access. Most groups should not have access.
-        group_memberships = GroupGroupMembership.objects.filter(
-            parent_group=workspace.workspace.authorization_domains.get(),
-        ).exclude(
+        for group in index.members.get_member_groups(auth_domain_pk):
             # Ignore cc admins group - it is handled differently because it should have admin privileges.
-            child_group__name=settings.ANVIL_CC_ADMINS_GROUP_NAME,
-        )
-        for membership in group_memberships:
-            self._audit_workspace_and_group(workspace, membership.child_group)
+            if group.name == settings.ANVIL_CC_ADMINS_GROUP_NAME:
+                continue
+            self._audit_group(workspace, group, True)
         # # Audit allowed groups
         # for group in ManagedGroup.objects.filter(name__in=self.ALLOWED_GROUP_NAMES):
         #     self._audit_workspace_and_group(workspace, group)
 
     def _audit_workspace_and_group(self, collaborative_analysis_workspace, group):
         """Audit access for a specific CollaborativeAnalysisWorkspace and group."""
-        in_auth_domain = collaborative_analysis_workspace.workspace.authorization_domains.get()
         auth_domain = collaborative_analysis_workspace.workspace.authorization_domains.get()
         in_auth_domain = GroupGroupMembership.objects.filter(parent_group=auth_domain, child_group=group).exists()
+        self._audit_group(collaborative_analysis_workspace, group, in_auth_domain)
+
+    def _audit_group(self, collaborative_analysis_workspace, group, in_auth_domain):
+        """Audit access for a group given precomputed auth domain membership."""
         if in_auth_domain:
             self.errors.append(
                 RemoveAccess(
@@ -221,34 +274,46 @@ class CollaborativeAnalysisWorkspaceAccessAudit(PRIMEDAudit):
         # - analyst is in some but not all relevant source auth domains, and is not in the workspace auth domain.
         # - analyst is in none of the relevant source auth domains, and is not in the workspace auth domain.
         # - an account is in the workspace auth domain, but is not in the analyst group.
-        # Get all groups for the account.
-        account_groups = account.get_all_groups()
-        # Check whether the account is in the analyst group or any of the allowed CC groups.
-        in_analyst_group = collaborative_analysis_workspace.analyst_group in account_groups
+        closure = get_group_membership_closure()
         in_allowed_cc_group = GroupAccountMembership.objects.filter(
             group__name__iexact=settings.ANVIL_CC_WRITERS_GROUP_NAME, account=account
         ).exists()
+        self._audit_account(
+            collaborative_analysis_workspace,
+            account,
+            closure.get_all_group_pks_for_account(account),
+            in_allowed_cc_group,
+            collaborative_analysis_workspace.workspace.authorization_domains.get().pk,
+            get_required_auth_domain_pks(collaborative_analysis_workspace),
+        )
+
+    def _audit_account(
+        self,
+        collaborative_analysis_workspace,
+        account,
+        account_group_pks,
+        in_allowed_cc_group,
+        auth_domain_pk,
+        required_auth_domain_pks,
+    ):
+        """Audit access for an account given precomputed group memberships.
+
+        Args:
+            collaborative_analysis_workspace: The CollaborativeAnalysisWorkspace to audit.
+            account: The Account to audit.
+            account_group_pks: The pks of all groups that the account is in, directly or indirectly.
+            in_allowed_cc_group: Whether the account is directly in the CC writers group.
+            auth_domain_pk: The pk of the auth domain of the workspace.
+            required_auth_domain_pks: The pks of source auth domains that the account must be in to have access.
+        """
+        # Check whether the account is in the analyst group or any of the allowed CC groups.
+        in_analyst_group = collaborative_analysis_workspace.analyst_group_id in account_group_pks
         in_allowed_group = in_analyst_group or in_allowed_cc_group
         # Check whether the account is in the auth domain of the collab workspace.
-        in_auth_domain = collaborative_analysis_workspace.workspace.authorization_domains.get() in account_groups
+        in_auth_domain = auth_domain_pk in account_group_pks
         if in_allowed_group:
-            # Check whether access is allowed. Start by assuming yes, and then
-            # set to false if the account should not have access.
-            access_allowed = True
-            # Loop over all source workspaces.
-            for source_workspace in collaborative_analysis_workspace.source_workspaces.all():
-                # Loop over all auth domains for that source workspace.
-                # Only include source auth domains that are managed by the app.
-                # This is intended to handle the federal_data_lockdown auth domain.
-                # We should have enough controls on who gets access that this is ok.
-                for source_auth_domain in source_workspace.authorization_domains.filter(is_managed_by_app=True):
-                    # If the user is not in the auth domain, they are not allowed to have access to the workspace.
-                    # If so, break out of the loop - not necessary to check membership of the remaining auth domains.
-                    # Note that this only breaks out of the inner loop.
-                    # It would be more efficient to break out of the outer loop as well.
-                    if source_auth_domain not in account_groups:
-                        access_allowed = False
-                        break
+            # The account must be in all of the source auth domains to be allowed access.
+            access_allowed = required_auth_domain_pks.issubset(account_group_pks)
             if access_allowed and in_auth_domain:
                 self.verified.append(
                     VerifiedAccess(
@@ -301,5 +366,12 @@ class CollaborativeAnalysisWorkspaceAccessAudit(PRIMEDAudit):
 
     def _run_audit(self):
         """Run the audit on the set of workspaces."""
-        for workspace in self.queryset:
-            self._audit_workspace(workspace)
+        if isinstance(self.queryset, QuerySet):
+            workspaces = list(self.queryset.select_related("workspace", "analyst_group"))
+        else:
+            workspaces = list(self.queryset)
+        if not workspaces:
+            return
+        index = CollaborativeAnalysisAuditIndex(workspaces)
+        for workspace in workspaces:
+            self._audit_workspace(workspace, index)
@@ -4,6 +4,8 @@ from django.core.management.base import BaseCommand
 from django.template.loader import render_to_string
 from django.urls import reverse
 
+from primed.primed_anvil.audit_results import run_and_store_audit
+
 from ... import audit
 
 
@@ -20,7 +22,7 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         self.stdout.write("Running Collaborative analysis access audit... ", ending="")
         data_access_audit = audit.CollaborativeAnalysisWorkspaceAccessAudit()
-        data_access_audit.run_audit()
+        run_and_store_audit(data_access_audit)
 
         # Report errors and needs access.
         audit_ok = data_access_audit.ok()
@@ -35,6 +37,7 @@ class Command(BaseCommand):
         self.stdout.write("* Verified: {}".format(len(data_access_audit.verified)))
         self.stdout.write("* Needs action: {}".format(len(data_access_audit.needs_action)))
         self.stdout.write("* Errors: {}".format(len(data_access_audit.errors)))
+        changes = data_access_audit.report_and_save_run(self.stdout)
 
         if not audit_ok:
             self.stdout.write(self.style.ERROR(f"Please visit {url} to resolve these issues."))
@@ -47,6 +50,7 @@ class Command(BaseCommand):
                 context={
                     "title": "Collaborative analysis access audit",
                     "data_access_audit": data_access_audit,
+                    "changes": changes,
                     "url": url,
                 },
             )
@@ -0,0 +1,105 @@
+"""Signal handlers that mark stored collaborative analysis audit results as stale when their inputs change."""
+
+from anvil_consortium_manager.models import (
+    Account,
+    GroupAccountMembership,
+    GroupGroupMembership,
+    ManagedGroup,
+    Workspace,
+)
+from django.conf import settings
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from primed.primed_anvil.audit_results import mark_audit_results_stale
+from primed.primed_anvil.membership_closure import get_group_membership_closure
+
+from . import models
+from .audit import CollaborativeAnalysisWorkspaceAccessAudit
+
+
+def _groups_changed(group_pks):
+    """Mark results stale for workspaces that depend on the membership of any of the given groups."""
+    if ManagedGroup.objects.filter(pk__in=group_pks, name__iexact=settings.ANVIL_CC_WRITERS_GROUP_NAME).exists():
+        # CC writers are audited for every workspace.
+        mark_audit_results_stale(CollaborativeAnalysisWorkspaceAccessAudit)
+        return
+    query = (
+        Q(analyst_group__in=group_pks)
+        | Q(workspace__authorization_domains__in=group_pks)
+        | Q(source_workspaces__authorization_domains__in=group_pks)
+    )
+    mark_audit_results_stale(
+        CollaborativeAnalysisWorkspaceAccessAudit,
+        models.CollaborativeAnalysisWorkspace.objects.filter(query).values_list("pk", flat=True),
+    )
+
+
+def _group_members_changed(group_pk):
+    # The membership of the group and all of the groups that it is in has changed.
+    _groups_changed({group_pk} | get_group_membership_closure().get_all_parent_pks(group_pk))
+
+
+@receiver(post_save, sender=GroupGroupMembership)
+def group_group_membership_saved(sender, instance, created, **kwargs):
+    if created:
+        _group_members_changed(instance.parent_group_id)
+
+
+@receiver(post_delete, sender=GroupGroupMembership)
+def group_group_membership_deleted(sender, instance, **kwargs):
+    _group_members_changed(instance.parent_group_id)
+
+
+@receiver(post_save, sender=GroupAccountMembership)
+def group_account_membership_saved(sender, instance, created, **kwargs):
+    if created:
+        _group_members_changed(instance.group_id)
+
+
+@receiver(post_delete, sender=GroupAccountMembership)
+def group_account_membership_deleted(sender, instance, **kwargs):
+    _group_members_changed(instance.group_id)
+
+
+@receiver(post_save, sender=Account)
+def account_saved(sender, instance, **kwargs):
+    # The account status may have changed.
+    group_pks = get_group_membership_closure().get_all_group_pks_for_account(instance)
+    if group_pks:
+        _groups_changed(group_pks)
+
+
+@receiver(post_save, sender=models.CollaborativeAnalysisWorkspace)
+def collaborative_analysis_workspace_saved(sender, instance, **kwargs):
+    mark_audit_results_stale(CollaborativeAnalysisWorkspaceAccessAudit, [instance.pk])
+
+
+@receiver(m2m_changed, sender=models.CollaborativeAnalysisWorkspace.source_workspaces.through)
+def source_workspaces_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        mark_audit_results_stale(CollaborativeAnalysisWorkspaceAccessAudit, [instance.pk])
+    elif pk_set:
+        mark_audit_results_stale(CollaborativeAnalysisWorkspaceAccessAudit, pk_set)
+    else:
+        # The workspaces a source workspace was removed from are not known after a reverse clear.
+        mark_audit_results_stale(CollaborativeAnalysisWorkspaceAccessAudit)
+
+
+@receiver(m2m_changed, sender=Workspace.authorization_domains.through)
+def workspace_authorization_domains_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        # The workspace may be a collaborative analysis workspace or one of their source workspaces.
+        mark_audit_results_stale(
+            CollaborativeAnalysisWorkspaceAccessAudit,
+            models.CollaborativeAnalysisWorkspace.objects.filter(
+                Q(workspace=instance) | Q(source_workspaces=instance)
+            ).values_list("pk", flat=True),
+        )
+    else:
+        mark_audit_results_stale(CollaborativeAnalysisWorkspaceAccessAudit)
@@ -6,7 +6,9 @@ from anvil_consortium_manager.tests.factories import (
     WorkspaceAuthorizationDomainFactory,
     WorkspaceFactory,
 )
+from django.db import connection
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from primed.cdsa.tests.factories import CDSAWorkspaceFactory
@@ -2116,6 +2118,70 @@ class CollaborativeAnalysisWorkspaceAccessAuditTest(TestCase):
         self.assertEqual(record.member, analyst_2)
         self.assertEqual(record.note, collab_audit_2.IN_SOURCE_AUTH_DOMAINS)
 
+    def test_number_of_queries_does_not_depend_on_number_of_workspaces_and_accounts(self):
+        """run_audit uses the same number of queries regardless of the number of workspaces and accounts."""
+        cc_writer_group = ManagedGroupFactory.create(name="TEST_PRIMED_CC_WRITERS")
+        GroupAccountMembershipFactory.create(group=cc_writer_group)
+
+        def create_workspace():
+            workspace = factories.CollaborativeAnalysisWorkspaceFactory.create()
+            source_workspace_1 = dbGaPWorkspaceFactory.create()
+            workspace.source_workspaces.add(source_workspace_1.workspace)
+            source_workspace_2 = CDSAWorkspaceFactory.create()
+            workspace.source_workspaces.add(source_workspace_2.workspace)
+            # An analyst with access.
+            analyst = AccountFactory.create()
+            GroupAccountMembershipFactory.create(group=workspace.analyst_group, account=analyst)
+            for source_workspace in [source_workspace_1, source_workspace_2]:
+                GroupAccountMembershipFactory.create(
+                    group=source_workspace.workspace.authorization_domains.get(), account=analyst
+                )
+            GroupAccountMembershipFactory.create(group=workspace.workspace.authorization_domains.get(), account=analyst)
+            # An analyst without access to the source workspaces.
+            GroupAccountMembershipFactory.create(group=workspace.analyst_group)
+            # An account in the auth domain that is not an analyst.
+            GroupAccountMembershipFactory.create(group=workspace.workspace.authorization_domains.get())
+            # A group in the auth domain.
+            GroupGroupMembershipFactory.create(parent_group=workspace.workspace.authorization_domains.get())
+
+        create_workspace()
+        # Run once so that the shared group membership closure is cached.
+        audit.CollaborativeAnalysisWorkspaceAccessAudit().run_audit()
+        collab_audit = audit.CollaborativeAnalysisWorkspaceAccessAudit()
+        with CaptureQueriesContext(connection) as one_workspace_queries:
+            collab_audit.run_audit()
+        self.assertEqual(len(collab_audit.get_all_results()), 5)
+        for _ in range(3):
+            create_workspace()
+        collab_audit = audit.CollaborativeAnalysisWorkspaceAccessAudit()
+        with CaptureQueriesContext(connection) as many_workspace_queries:
+            collab_audit.run_audit()
+        self.assertEqual(len(collab_audit.get_all_results()), 20)
+        self.assertEqual(len(many_workspace_queries), len(one_workspace_queries))
+
+    def test_run_audit_matches_audit_workspace_and_account(self):
+        """run_audit gives the same results as auditing each account individually."""
+        workspace = factories.CollaborativeAnalysisWorkspaceFactory.create()
+        source_workspace = dbGaPWorkspaceFactory.create()
+        workspace.source_workspaces.add(source_workspace.workspace)
+        analyst_1 = AccountFactory.create()
+        analyst_2 = AccountFactory.create()
+        GroupAccountMembershipFactory.create(group=workspace.analyst_group, account=analyst_1)
+        GroupAccountMembershipFactory.create(group=workspace.analyst_group, account=analyst_2)
+        GroupAccountMembershipFactory.create(
+            group=source_workspace.workspace.authorization_domains.get(), account=analyst_1
+        )
+        GroupAccountMembershipFactory.create(group=workspace.workspace.authorization_domains.get(), account=analyst_2)
+        collab_audit = audit.CollaborativeAnalysisWorkspaceAccessAudit()
+        collab_audit.run_audit()
+        individual_audit = audit.CollaborativeAnalysisWorkspaceAccessAudit()
+        individual_audit._audit_workspace_and_account(workspace, analyst_1)
+        individual_audit._audit_workspace_and_account(workspace, analyst_2)
+        self.assertEqual(
+            sorted(collab_audit.get_all_results(), key=lambda x: x.member.pk),
+            sorted(individual_audit.verified + individual_audit.needs_action, key=lambda x: x.member.pk),
+        )
+
 
 class AccessAuditResultsTableTest(TestCase):
     """Tests for the `AccessAuditResultsTable` table."""
@@ -0,0 +1,56 @@
+"""Tests for the `signals.py` module."""
+
+from anvil_consortium_manager.tests.factories import (
+    GroupAccountMembershipFactory,
+    GroupGroupMembershipFactory,
+    ManagedGroupFactory,
+)
+from django.test import TestCase
+
+from primed.dbgap.tests.factories import dbGaPWorkspaceFactory
+from primed.primed_anvil.audit_results import get_audit_name, get_stored_audit
+from primed.primed_anvil.models import StoredAuditResults
+
+from ..audit import CollaborativeAnalysisWorkspaceAccessAudit
+from . import factories
+
+
+class StoredAuditResultsSignalsTest(TestCase):
+    """Tests that signal handlers mark stored collaborative analysis audit results as stale."""
+
+    def setUp(self):
+        self.source_workspace = dbGaPWorkspaceFactory.create()
+        self.workspace = factories.CollaborativeAnalysisWorkspaceFactory.create(
+            source_workspaces=[self.source_workspace.workspace]
+        )
+        self.other_workspace = factories.CollaborativeAnalysisWorkspaceFactory.create()
+        get_stored_audit(CollaborativeAnalysisWorkspaceAccessAudit)
+
+    def get_stale_pks(self):
+        return set(
+            StoredAuditResults.objects.filter(
+                audit_name=get_audit_name(CollaborativeAnalysisWorkspaceAccessAudit), is_stale=True
+            ).values_list("subject_pk", flat=True)
+        )
+
+    def test_account_added_to_analyst_group(self):
+        GroupAccountMembershipFactory.create(group=self.workspace.analyst_group)
+        self.assertEqual(self.get_stale_pks(), {self.workspace.pk})
+
+    def test_group_added_to_source_auth_domain(self):
+        GroupGroupMembershipFactory.create(
+            parent_group=self.source_workspace.workspace.authorization_domains.get(),
+            child_group=ManagedGroupFactory.create(),
+        )
+        self.assertEqual(self.get_stale_pks(), {self.workspace.pk})
+
+    def test_account_added_to_nested_group(self):
+        child_group = ManagedGroupFactory.create()
+        GroupGroupMembershipFactory.create(parent_group=self.other_workspace.analyst_group, child_group=child_group)
+        StoredAuditResults.objects.update(is_stale=False)
+        GroupAccountMembershipFactory.create(group=child_group)
+        self.assertEqual(self.get_stale_pks(), {self.other_workspace.pk})
+
+    def test_source_workspaces(self):
+        self.other_workspace.source_workspaces.add(dbGaPWorkspaceFactory.create().workspace)
+        self.assertEqual(self.get_stale_pks(), {self.other_workspace.pk})
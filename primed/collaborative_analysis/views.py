@@ -16,6 +16,8 @@ from django.http import Http404, HttpResponse
 from django.utils.translation import gettext_lazy as _
 from django.views.generic import DetailView, FormView, TemplateView
 
+from primed.primed_anvil.viewmixins import StoredAuditRefreshMixin
+
 from . import audit, models
 
 
@@ -58,18 +60,17 @@ class WorkspaceAudit(AnVILConsortiumManagerStaffViewRequired, DetailView):
         return context
 
 
-class WorkspaceAuditAll(AnVILConsortiumManagerStaffViewRequired, TemplateView):
+class WorkspaceAuditAll(AnVILConsortiumManagerStaffViewRequired, StoredAuditRefreshMixin, TemplateView):
     """View to show audit results for all `CollaborativeAnalysisWorkspace` objects."""
 
     template_name = "collaborative_analysis/collaborativeanalysisworkspace_audit_all.html"
+    audit_class = audit.CollaborativeAnalysisWorkspaceAccessAudit
+    audit_title = "Collaborative analysis workspace audit"
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Run the audit
-        data_access_audit = audit.CollaborativeAnalysisWorkspaceAccessAudit(
-            queryset=models.CollaborativeAnalysisWorkspace.objects.all()
-        )
-        data_access_audit.run_audit()
+        # Load the stored audit results, rerunning the audit for any that are out of date.
+        data_access_audit = self.get_audit()
         context["verified_table"] = data_access_audit.get_verified_table()
         context["errors_table"] = data_access_audit.get_errors_table()
         context["needs_action_table"] = data_access_audit.get_needs_action_table()
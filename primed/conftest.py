@@ -1,5 +1,6 @@
 import pytest
 
+from primed.primed_anvil.membership_closure import clear_group_membership_closure_memo
 from primed.users.models import User
 from primed.users.tests.factories import UserFactory
 
@@ -9,6 +10,14 @@ def media_storage(settings, tmpdir):
     settings.MEDIA_ROOT = tmpdir.strpath
 
 
+@pytest.fixture(autouse=True)
+def group_membership_closure_memo():
+    # Database changes are rolled back after each test, so do not keep a closure memoized between tests.
+    clear_group_membership_closure_memo()
+    yield
+    clear_group_membership_closure_memo()
+
+
 @pytest.fixture
 def user() -> User:
     return UserFactory()
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class DbgapConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "primed.dbgap"
+
+    def ready(self):
+        import primed.dbgap.signals  # noqa F401
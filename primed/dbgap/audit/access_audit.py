@@ -2,11 +2,11 @@ from dataclasses import dataclass
 from typing import Optional
 
 import django_tables2 as tables
-from anvil_consortium_manager.exceptions import WorkspaceAccessAuthorizationDomainUnknownError
-from django.db.models import QuerySet
+from django.db.models import Min, QuerySet
 from django.urls import reverse
 
 from primed.primed_anvil.audit import PRIMEDAudit, PRIMEDAuditResult
+from primed.primed_anvil.membership_closure import get_group_membership_closure
 from primed.primed_anvil.tables import BooleanIconColumn
 
 from ..models import (
@@ -35,6 +35,13 @@ class AccessAuditResult(PRIMEDAuditResult):
         ):
             raise ValueError("data_access_request application and dbgap_application do not match.")
 
+    def get_key(self):
+        key = super().get_key()
+        # DARs are recreated for each snapshot, so use the dbGaP DAR id, which is the same across snapshots.
+        if self.data_access_request:
+            key["data_access_request"] = self.data_access_request.dbgap_dar_id
+        return key
+
     def get_action_url(self):
         """The URL that handles the action needed."""
         return reverse(
@@ -161,6 +168,10 @@ class dbGaPAccessAudit(PRIMEDAudit):
     ERROR_HAS_ACCESS = "Has access for an unknown reason."
 
     results_table_class = dbGaPAccessAuditTable
+    result_subject_model = dbGaPApplication
+    result_subject_field = "dbgap_application"
+    result_subject_queryset_argument = "dbgap_application_queryset"
+    stored_result_select_related = {"dbgap.dbGaPWorkspace": ("workspace__billing_project",)}
 
     def __init__(self, dbgap_application_queryset=None, dbgap_workspace_queryset=None):
         super().__init__()
@@ -178,24 +189,174 @@ class dbGaPAccessAudit(PRIMEDAudit):
         self.dbgap_workspace_queryset = dbgap_workspace_queryset
 
     def _run_audit(self):
-        for dbgap_application in self.dbgap_application_queryset:
-            for dbgap_workspace in self.dbgap_workspace_queryset:
-                self.audit_application_and_workspace(dbgap_application, dbgap_workspace)
+        """Audit access for all pairs of applications and workspaces.
+
+        All data needed for the audit is loaded up front in a fixed number of queries, regardless
+        of the number of applications and workspaces. Each (application, workspace) pair is then
+        audited in memory.
+        """
+        dbgap_applications = list(self.dbgap_application_queryset.select_related("anvil_access_group"))
+        dbgap_workspaces = list(
+            self.dbgap_workspace_queryset.select_related(
+                "workspace__billing_project",
+                "dbgap_study_accession",
+            ).prefetch_related("workspace__authorization_domains")
+        )
+        if not dbgap_applications or not dbgap_workspaces:
+            return
+
+        # Most recent snapshot for each application.
+        applications_by_pk = {x.pk: x for x in dbgap_applications}
+        snapshots_by_application = {}
+        snapshot_qs = dbGaPDataAccessSnapshot.objects.filter(
+            dbgap_application__in=list(applications_by_pk),
+            is_most_recent=True,
+        )
+        for snapshot in snapshot_qs:
+            # Use the already-loaded application to avoid extra queries.
+            snapshot.dbgap_application = applications_by_pk[snapshot.dbgap_application_id]
+            snapshots_by_application[snapshot.dbgap_application_id] = snapshot
+        outdated_cutoff = dbGaPDataAccessSnapshot.get_outdated_cutoff()
+
+        # DARs from the most recent snapshots, keyed by the fields that uniquely identify them within a snapshot.
+        snapshots_by_pk = {x.pk: x for x in snapshots_by_application.values()}
+        dars = {}
+        dar_qs = dbGaPDataAccessRequest.objects.filter(dbgap_data_access_snapshot__in=list(snapshots_by_pk))
+        for dar in dar_qs:
+            dar.dbgap_data_access_snapshot = snapshots_by_pk[dar.dbgap_data_access_snapshot_id]
+            dars[(dar.dbgap_data_access_snapshot_id, dar.dbgap_phs, dar.dbgap_consent_code)] = dar
+
+        # Date that each unapproved DAR was first approved, if ever.
+        first_approved = {}
+        unapproved_dar_ids = set(dar.dbgap_dar_id for dar in dars.values() if not dar.is_approved)
+        if unapproved_dar_ids:
+            first_approved_qs = (
+                dbGaPDataAccessRequest.objects.approved()
+                .filter(dbgap_dar_id__in=unapproved_dar_ids)
+                .values("dbgap_dar_id")
+                .annotate(first_approved=Min("dbgap_data_access_snapshot__created"))
+            )
+            first_approved = {x["dbgap_dar_id"]: x["first_approved"] for x in first_approved_qs}
+
+        # Group memberships for each application's access group.
+        closure = get_group_membership_closure()
+
+        for dbgap_application in dbgap_applications:
+            parent_group_pks = closure.get_all_parent_pks(dbgap_application.anvil_access_group_id)
+            snapshot = snapshots_by_application.get(dbgap_application.pk)
+            snapshot_is_outdated = (
+                snapshot is not None and outdated_cutoff is not None and snapshot.get_last_checked() < outdated_cutoff
+            )
+            for dbgap_workspace in dbgap_workspaces:
+                # Only auth domains managed by the app are considered.
+                auth_domain_pks = set(
+                    x.pk for x in dbgap_workspace.workspace.authorization_domains.all() if x.is_managed_by_app
+                )
+                in_auth_domain = auth_domain_pks.issubset(parent_group_pks)
+                dar = None
+                previously_approved = False
+                if snapshot:
+                    dar = dars.get(
+                        (
+                            snapshot.pk,
+                            dbgap_workspace.dbgap_study_accession.dbgap_phs,
+                            dbgap_workspace.dbgap_consent_code,
+                        )
+                    )
+                    if dar and not self._dar_matches_workspace(dar, dbgap_workspace):
+                        dar = None
+                    if dar and not dar.is_approved:
+                        previously_approved = (
+                            dar.dbgap_dar_id in first_approved and first_approved[dar.dbgap_dar_id] < snapshot.created
+                        )
+                self._audit_application_and_workspace(
+                    dbgap_application,
+                    dbgap_workspace,
+                    in_auth_domain=in_auth_domain,
+                    snapshot=snapshot,
+                    snapshot_is_outdated=snapshot_is_outdated,
+                    dar=dar,
+                    previously_approved=previously_approved,
+                )
+
+    @staticmethod
+    def _dar_matches_workspace(dar, dbgap_workspace):
+        """Check whether the version and participant set of a DAR cover a workspace.
+
+        This mirrors the filters in `dbGaPWorkspace.get_data_access_requests`; phs and consent code
+        are assumed to already match."""
+        return (
+            dar.original_version <= dbgap_workspace.dbgap_version
+            and dar.original_participant_set <= dbgap_workspace.dbgap_participant_set
+        )
 
     def audit_application_and_workspace(self, dbgap_application, dbgap_workspace):
         """Audit access for a specific dbGaP application and a specific workspace."""
-        # We can't call workspace.has_group_in_authorization_domain() because it will raise an exception
-        # if at least one of the auth domains is not managed by the app.
-        parent_groups = dbgap_application.anvil_access_group.get_all_parents()
+        # Only auth domains managed by the app are considered.
+        parent_group_pks = get_group_membership_closure().get_all_parent_pks(dbgap_application.anvil_access_group_id)
+        auth_domain_pks = set(
+            dbgap_workspace.workspace.authorization_domains.filter(is_managed_by_app=True).values_list("pk", flat=True)
+        )
+        in_auth_domain = auth_domain_pks.issubset(parent_group_pks)
+
+        # Get the most recent snapshot.
         try:
-            in_auth_domain = dbgap_workspace.workspace.has_group_in_authorization_domain(
-                dbgap_application.anvil_access_group, all_parent_groups=parent_groups
+            snapshot = dbgap_application.dbgapdataaccesssnapshot_set.get(is_most_recent=True)
+        except dbGaPDataAccessSnapshot.DoesNotExist:
+            snapshot = None
+            snapshot_is_outdated = False
+            dar = None
+        else:
+            snapshot_is_outdated = snapshot.is_outdated()
+            try:
+                # There should only be one DAR from this snapshot associated with a given workspace.
+                dar = dbgap_workspace.get_data_access_requests().get(dbgap_data_access_snapshot=snapshot)
+            except dbGaPDataAccessRequest.DoesNotExist:
+                dar = None
+
+        previously_approved = False
+        if dar and not dar.is_approved:
+            # Check if this dbgap_dar_id was ever approved in the past.
+            previously_approved = (
+                dbGaPDataAccessRequest.objects.approved()
+                .filter(
+                    dbgap_dar_id=dar.dbgap_dar_id,
+                    dbgap_data_access_snapshot__created__lt=dar.dbgap_data_access_snapshot.created,
+                )
+                .exists()
             )
-        except WorkspaceAccessAuthorizationDomainUnknownError:
-            # Just auth domains managed by the app.
-            auth_domains_managed_by_app = dbgap_workspace.workspace.authorization_domains.filter(is_managed_by_app=True)
-            in_auth_domain = set(auth_domains_managed_by_app).issubset(set(parent_groups))
 
+        self._audit_application_and_workspace(
+            dbgap_application,
+            dbgap_workspace,
+            in_auth_domain=in_auth_domain,
+            snapshot=snapshot,
+            snapshot_is_outdated=snapshot_is_outdated,
+            dar=dar,
+            previously_approved=previously_approved,
+        )
+
+    def _audit_application_and_workspace(
+        self,
+        dbgap_application,
+        dbgap_workspace,
+        in_auth_domain,
+        snapshot,
+        snapshot_is_outdated,
+        dar,
+        previously_approved,
+    ):
+        """Store the audit result for a dbGaP application and workspace, using data that has already been looked up.
+
+        Args:
+            dbgap_application: The dbGaPApplication being audited.
+            dbgap_workspace: The dbGaPWorkspace being audited.
+            in_auth_domain: Whether the application's access group is in the workspace auth domains.
+            snapshot: The most recent dbGaPDataAccessSnapshot for the application, or None.
+            snapshot_is_outdated: Whether the snapshot is outdated.
+            dar: The dbGaPDataAccessRequest from the snapshot matching the workspace, or None.
+            previously_approved: Whether a DAR with the same dbgap_dar_id was approved in an earlier snapshot.
+        """
         # Is the application active?
         is_active = dbgap_application.status == dbgap_application.StatusChoices.ACTIVE
         if not is_active:
@@ -219,10 +380,7 @@ class dbGaPAccessAudit(PRIMEDAudit):
                 )
                 return
 
-        # Get the most recent snapshot.
-        try:
-            app_snapshot = dbgap_application.dbgapdataaccesssnapshot_set.get(is_most_recent=True)
-        except dbGaPDataAccessSnapshot.DoesNotExist:
+        if snapshot is None:
             if in_auth_domain:
                 # Error!
                 self.errors.append(
@@ -244,13 +402,7 @@ class dbGaPAccessAudit(PRIMEDAudit):
                 )
             return  # Go to the next workspace.
 
-        # Is snapshot more than 30 days old
-        snapshot_is_prior = app_snapshot.is_outdated()
-
-        try:
-            # There should only be one DAR from this snapshot associated with a given workspace.
-            dar = dbgap_workspace.get_data_access_requests().get(dbgap_data_access_snapshot=app_snapshot)
-        except dbGaPDataAccessRequest.DoesNotExist:
+        if dar is None:
             # No matching DAR exists for this application.
             if in_auth_domain:
                 # Error!
@@ -276,7 +428,7 @@ class dbGaPAccessAudit(PRIMEDAudit):
         # Is the dbGaP access group associated with the DAR in the auth domain of the workspace?
         # We'll need to know this for future checks.
         if dar.is_approved and in_auth_domain:
-            if snapshot_is_prior:
+            if snapshot_is_outdated:
                 self.needs_action.append(
                     RemoveAccess(
                         workspace=dbgap_workspace,
@@ -298,7 +450,7 @@ class dbGaPAccessAudit(PRIMEDAudit):
                 )
 
         elif dar.is_approved and not in_auth_domain:
-            if snapshot_is_prior:
+            if snapshot_is_outdated:
                 self.verified.append(
                     VerifiedNoAccess(
                         workspace=dbgap_workspace,
@@ -331,15 +483,6 @@ class dbGaPAccessAudit(PRIMEDAudit):
             # Group has access that needs to be removed.
             # Make sure it is due to an expected reason. So far, the only reason is because the DAR was approved during
             # the last snapshot, and it no longer is.
-            # Check if this dbgap_dar_id was ever approved in the past.
-            previously_approved = (
-                dbGaPDataAccessRequest.objects.approved()
-                .filter(
-                    dbgap_dar_id=dar.dbgap_dar_id,
-                    dbgap_data_access_snapshot__created__lt=dar.dbgap_data_access_snapshot.created,
-                )
-                .exists()
-            )
             if previously_approved:
                 self.needs_action.append(
                     RemoveAccess(
@@ -359,7 +502,6 @@ class dbGaPAccessAudit(PRIMEDAudit):
                         note=self.ERROR_HAS_ACCESS,
                     )
                 )
-            pass
         else:
             # Verified no access because DAR is not approved.
             self.verified.append(
@@ -7,7 +7,7 @@ from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db.models.query import QuerySet
 
-from primed.primed_anvil.audit import PRIMEDAudit, PRIMEDAuditResult
+from primed.primed_anvil.audit import GroupMemberIndex, PRIMEDAudit, PRIMEDAuditResult
 from primed.primed_anvil.tables import BooleanIconColumn
 
 from ..models import dbGaPApplication
@@ -140,6 +140,10 @@ class dbGaPCollaboratorAudit(PRIMEDAudit):
     ACCOUNT_NOT_LINKED_TO_USER = "Account is not linked to a user."
 
     results_table_class = dbGaPCollaboratorAuditTable
+    result_subject_model = dbGaPApplication
+    result_subject_field = "dbgap_application"
+    result_subject_queryset_argument = "queryset"
+    stored_result_select_related = {"anvil_consortium_manager.Account": ("user",)}
 
     def __init__(self, queryset=None):
         super().__init__()
@@ -150,36 +154,56 @@ class dbGaPCollaboratorAudit(PRIMEDAudit):
         self.queryset = queryset
 
     def _run_audit(self):
-        for dbgap_application in self.queryset:
-            self.audit_application(dbgap_application)
+        dbgap_applications = self.queryset.select_related(
+            "principal_investigator",
+            "anvil_access_group",
+        ).prefetch_related("collaborators")
+        self._audit_applications(list(dbgap_applications))
 
     def audit_application(self, dbgap_application):
         """Audit access for a specific dbGaP application."""
-        # Get a list of everything to audit.
-        pi = dbgap_application.principal_investigator
-        collaborators = list(dbgap_application.collaborators.all())
-        accounts_with_access = list(
-            Account.objects.filter(
-                # They are members of this group.
-                groupaccountmembership__group=dbgap_application.anvil_access_group
-            )
-            .exclude(
-                # Not collaborators.
-                user__in=collaborators
-            )
-            .exclude(
-                # Not the PI.
-                user=pi
+        self._audit_applications([dbgap_application])
+
+    def _audit_applications(self, dbgap_applications):
+        """Audit access for a list of dbGaP applications.
+
+        Collaborators, linked accounts, and access group members for all applications are loaded up front in
+        a fixed number of queries, and then each member is audited in memory."""
+        if not dbgap_applications:
+            return
+        # Users to audit for each application.
+        users_by_application = {}
+        for dbgap_application in dbgap_applications:
+            users_by_application[dbgap_application.pk] = [dbgap_application.principal_investigator] + list(
+                dbgap_application.collaborators.all()
             )
-        )
-        groups_with_access = list(
-            ManagedGroup.objects.filter(parent_memberships__parent_group=dbgap_application.anvil_access_group)
+        index = GroupMemberIndex(
+            group_pks=[x.anvil_access_group_id for x in dbgap_applications],
+            user_pks=[user.pk for users in users_by_application.values() for user in users],
         )
 
-        objs_to_audit = [pi] + collaborators + accounts_with_access + groups_with_access
-
-        for obj in objs_to_audit:
-            self.audit_application_and_object(dbgap_application, obj)
+        for dbgap_application in dbgap_applications:
+            access_group_pk = dbgap_application.anvil_access_group_id
+            users = users_by_application[dbgap_application.pk]
+            collaborator_pks = set(user.pk for user in users[1:])
+            # PI and collaborators.
+            for user in users:
+                account = index.get_account_for_user(user)
+                if account is None:
+                    self._audit_user_without_account(dbgap_application, user, collaborator_pks)
+                else:
+                    is_in_access_group = index.is_account_in_group(account, access_group_pk)
+                    self._audit_account(dbgap_application, account, collaborator_pks, is_in_access_group)
+            # Other accounts in the access group.
+            for account in index.get_member_accounts(access_group_pk):
+                if (
+                    account.user_id not in collaborator_pks
+                    and account.user_id != dbgap_application.principal_investigator_id
+                ):
+                    self._audit_account(dbgap_application, account, collaborator_pks, True)
+            # Groups in the access group.
+            for group in index.get_member_groups(access_group_pk):
+                self._audit_group(dbgap_application, group, True)
 
     def audit_application_and_object(self, dbgap_application, obj):
         """Audit access for a specific dbGaP application and generic object instance.
@@ -213,37 +237,46 @@ class dbGaPCollaboratorAudit(PRIMEDAudit):
 
     def _audit_application_and_user(self, dbgap_application, user):
         """Audit access for a specific dbGaP application and a specific user."""
-        is_pi = user == dbgap_application.principal_investigator
-        is_collaborator = user in dbgap_application.collaborators.all()
-
+        collaborator_pks = set(dbgap_application.collaborators.values_list("pk", flat=True))
         # Check if the user has a linked account.
         try:
             account = Account.objects.get(user=user)
         except Account.DoesNotExist:
-            if is_pi:
-                note = self.PI_NO_ACCOUNT
-            elif is_collaborator:
-                note = self.COLLABORATOR_NO_ACCOUNT
-            else:
-                note = self.NOT_COLLABORATOR
-            self.verified.append(
-                VerifiedNoAccess(
-                    dbgap_application=dbgap_application,
-                    user=user,
-                    member=None,
-                    note=note,
-                )
-            )
+            self._audit_user_without_account(dbgap_application, user, collaborator_pks)
             return
-
-        self._audit_application_and_account(dbgap_application, account)
+        is_in_access_group = GroupAccountMembership.objects.filter(
+            account=account, group=dbgap_application.anvil_access_group
+        ).exists()
+        self._audit_account(dbgap_application, account, collaborator_pks, is_in_access_group)
+
+    def _audit_user_without_account(self, dbgap_application, user, collaborator_pks):
+        """Audit access for a user who has not linked an AnVIL account."""
+        if user.pk == dbgap_application.principal_investigator_id:
+            note = self.PI_NO_ACCOUNT
+        elif user.pk in collaborator_pks:
+            note = self.COLLABORATOR_NO_ACCOUNT
+        else:
+            note = self.NOT_COLLABORATOR
+        self.verified.append(
+            VerifiedNoAccess(
+                dbgap_application=dbgap_application,
+                user=user,
+                member=None,
+                note=note,
+            )
+        )
 
     def _audit_application_and_account(self, dbgap_application, account):
+        """Audit access for a specific dbGaP application and a specific account."""
+        collaborator_pks = set(dbgap_application.collaborators.values_list("pk", flat=True))
         # Check if the account is in the access group.
         is_in_access_group = GroupAccountMembership.objects.filter(
             account=account, group=dbgap_application.anvil_access_group
         ).exists()
+        self._audit_account(dbgap_application, account, collaborator_pks, is_in_access_group)
 
+    def _audit_account(self, dbgap_application, account, collaborator_pks, is_in_access_group):
+        """Audit access for an account given precomputed collaborators and access group membership."""
         # Get the user.
         if hasattr(account, "user") and account.user:
             user = account.user
@@ -268,8 +301,8 @@ class dbGaPCollaboratorAudit(PRIMEDAudit):
                 )
             return
 
-        is_pi = user == dbgap_application.principal_investigator
-        is_collaborator = user in dbgap_application.collaborators.all()
+        is_pi = user.pk == dbgap_application.principal_investigator_id
+        is_collaborator = user.pk in collaborator_pks
         is_active = account.status == account.ACTIVE_STATUS
 
         if is_in_access_group:
@@ -354,6 +387,10 @@ class dbGaPCollaboratorAudit(PRIMEDAudit):
         in_access_group = GroupGroupMembership.objects.filter(
             child_group=group, parent_group=dbgap_application.anvil_access_group
         ).exists()
+        self._audit_group(dbgap_application, group, in_access_group)
+
+    def _audit_group(self, dbgap_application, group, in_access_group):
+        """Audit access for a group given precomputed access group membership."""
         if group.name == settings.ANVIL_CC_ADMINS_GROUP_NAME:
             pass
         else:
@@ -7,7 +7,7 @@ from django import forms
 from django.core.exceptions import ValidationError
 from tree_queries.forms import TreeNodeMultipleChoiceField
 
-from . import constants, models
+from . import helpers, models
 
 
 class dbGaPStudyAccessionForm(Bootstrap5MediaFormMixin, forms.ModelForm):
@@ -131,10 +131,9 @@ class dbGaPDataAccessSnapshotForm(forms.ModelForm):
     def clean_dbgap_dar_data(self):
         data = self.cleaned_data["dbgap_dar_data"]
         try:
-            jsonschema.validate(data, constants.JSON_DAR_SCHEMA)
+            data = helpers.validate_dar_json(data)
         except jsonschema.exceptions.ValidationError as e:
-            # Replace the full json string because it will be very long
-            error_message = e.message.replace(str(e.instance), "JSON array")
+            error_message = helpers.get_json_validation_error_message(e)
             raise ValidationError(self.ERROR_JSON_VALIDATION, params={"error": error_message})
         # Verify that there is only one project in the json.
         if len(data) > 1:
@@ -156,17 +155,16 @@ class dbGaPDataAccessSnapshotMultipleForm(forms.Form):
     def clean_dbgap_dar_data(self):
         data = self.cleaned_data["dbgap_dar_data"]
         try:
-            jsonschema.validate(data, constants.JSON_DAR_SCHEMA)
+            data = helpers.validate_dar_json(data)
         except jsonschema.exceptions.ValidationError as e:
-            # Replace the full json string because it will be very long
-            error_message = e.message.replace(str(e.instance), "JSON array")
+            error_message = helpers.get_json_validation_error_message(e)
             raise ValidationError(self.ERROR_JSON_VALIDATION, params={"error": error_message})
         # Verify that all projects exist.
-        missing_ids = []
-        for project_json in data:
-            project_id = project_json["Project_id"]
-            if not models.dbGaPApplication.objects.filter(dbgap_project_id=project_id).exists():
-                missing_ids.append(str(project_id))
+        project_ids = {project_json["Project_id"] for project_json in data}
+        existing_ids = models.dbGaPApplication.objects.filter(dbgap_project_id__in=project_ids).values_list(
+            "dbgap_project_id", flat=True
+        )
+        missing_ids = project_ids - set(existing_ids)
         if missing_ids:
             raise ValidationError(self.ERROR_PROJECT_ID_DOES_NOT_EXIST)
         return data
@@ -1,7 +1,99 @@
+import hashlib
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlencode
 
+import jsonschema
+import requests
+from django.core.cache import cache
 
-def get_dbgap_dar_json_url(project_ids):
+from . import constants
+
+# The url of the dbGaP project report, which lists DARs for a set of projects.
+DBGAP_DAR_JSON_BASE_URL = "https://dbgap.ncbi.nlm.nih.gov/aa/wga.cgi"
+# Seconds to wait for the dbGaP project report.
+DBGAP_DAR_JSON_TIMEOUT = 5 * 60
+# Seconds for which the current version and participant set of a study are cached.
+STUDY_VERSION_CACHE_TIMEOUT = 60 * 60
+# Maximum number of concurrent requests to dbGaP when looking up study versions.
+STUDY_VERSION_MAX_WORKERS = 8
+
+
+def _get_validator(schema):
+    validator_class = jsonschema.validators.validator_for(schema)
+    validator_class.check_schema(schema)
+    return validator_class(schema)
+
+
+# Build the validators once, instead of each time some json is validated.
+DAR_JSON_VALIDATOR = _get_validator(constants.JSON_DAR_SCHEMA)
+PROJECT_DAR_JSON_VALIDATOR = _get_validator(constants.JSON_PROJECT_DAR_SCHEMA)
+
+
+class ValidatedProjectDARData(dict):
+    """DAR json for a single project that has already been validated against `constants.JSON_PROJECT_DAR_SCHEMA`."""
+
+
+def _validate(validator, data):
+    # Raise the same error as jsonschema.validate.
+    error = jsonschema.exceptions.best_match(validator.iter_errors(data))
+    if error is not None:
+        raise error
+
+
+def validate_dar_json(data):
+    """Validate dbGaP DAR json for one or more projects against `constants.JSON_DAR_SCHEMA`.
+
+    Returns:
+        list: The json for each project, marked as validated.
+
+    Raises:
+        jsonschema.exceptions.ValidationError: If the json is not valid.
+    """
+    _validate(DAR_JSON_VALIDATOR, data)
+    return [ValidatedProjectDARData(project_json) for project_json in data]
+
+
+def validate_project_dar_json(data):
+    """Validate dbGaP DAR json for a single project against `constants.JSON_PROJECT_DAR_SCHEMA`.
+
+    Json that has already been validated is not validated again.
+
+    Returns:
+        ValidatedProjectDARData: The json, marked as validated.
+
+    Raises:
+        jsonschema.exceptions.ValidationError: If the json is not valid.
+    """
+    if isinstance(data, ValidatedProjectDARData):
+        return data
+    _validate(PROJECT_DAR_JSON_VALIDATOR, data)
+    return ValidatedProjectDARData(data)
+
+
+def get_json_validation_error_message(error):
+    """Return a short message for a jsonschema ValidationError.
+
+    jsonschema messages for arrays and objects start with the repr of the entire instance that failed validation,
+    which can be all of the DAR json. Replace it with a short description, without converting the instance to a
+    string again.
+    """
+    message = error.message
+    if isinstance(error.instance, (dict, list)) and message.startswith(("[", "{")):
+        description = "JSON array" if isinstance(error.instance, list) else "JSON object"
+        # The rest of the message follows the last " is ", e.g., "is not of type 'array'" or "is too short".
+        _, sep, rest = message.rpartition(" is ")
+        if sep:
+            message = "{} is {}".format(description, rest)
+        else:
+            message = "{} failed '{}' validation".format(description, error.validator)
+    if error.absolute_path:
+        message = "{} (at {})".format(message, error.json_path)
+    return message
+
+
+def get_dbgap_dar_json_url(project_ids, base_url=DBGAP_DAR_JSON_BASE_URL):
     """Return the dbGaP URL that lists DARs for this application."""
     if not isinstance(project_ids, list):
         project_ids = [project_ids]
@@ -13,6 +105,76 @@ def get_dbgap_dar_json_url(project_ids):
         "filter": ["mode", "project_list"],
         "project_list": ",".join([str(x) for x in project_ids]),
     }
-    url = "https://dbgap.ncbi.nlm.nih.gov/aa/wga.cgi?%s"
     # Doseq means to generate the filter key twice, once for "mode" and once for "project_list"
-    return url % urlencode(url_params, doseq=True)
+    return "{}?{}".format(base_url, urlencode(url_params, doseq=True))
+
+
+def fetch_dbgap_dar_json(project_ids, base_url=DBGAP_DAR_JSON_BASE_URL, session=None):
+    """Fetch and validate the DAR json for a list of projects from dbGaP.
+
+    Args:
+        project_ids: The dbGaP project ids to fetch.
+        base_url: The url of the dbGaP project report. Set this to fetch the report from somewhere else, e.g., a
+            stub server.
+        session: An object with a `get` method like `requests.Session`, used to make the request. Defaults to
+            the `requests` module.
+
+    Returns:
+        list: The json for each project, marked as validated (see `validate_dar_json`).
+    """
+    if session is None:
+        session = requests
+    response = session.get(get_dbgap_dar_json_url(project_ids, base_url=base_url), timeout=DBGAP_DAR_JSON_TIMEOUT)
+    # Raise an error if an error code was returned.
+    response.raise_for_status()
+    return validate_dar_json(response.json())
+
+
+def get_dar_json_hash(project_json):
+    """Return a hash of the DAR json for a project that does not depend on the order of keys."""
+    serialized = json.dumps(project_json, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(serialized.encode()).hexdigest()
+
+
+def get_current_study_version(phs):
+    """Query dbGaP for the current version and participant set of a study.
+
+    This assumes that the study has been released, which should be true for all PRIMED studies.
+    It is not necessarily true for all dbGaP applications, eg TOPMed applying to the EA.
+
+    Returns:
+        tuple: The version and participant set of the study.
+    """
+    # This url should resolve to url for the current version/participant set.
+    response = requests.get(
+        constants.DBGAP_STUDY_URL,
+        params={"study_id": "phs{phs:06d}".format(phs=phs)},
+        allow_redirects=False,
+    )
+    # Raise an error if an error code was returned.
+    response.raise_for_status()
+    full_accession = response.next.url.split("study_id=")[1]
+    match = re.match(constants.FULL_ACCESSION_REGEX, full_accession)
+    return (int(match.group("version")), int(match.group("participant_set")))
+
+
+def get_current_study_versions(phs_list):
+    """Get the current version and participant set for a set of studies.
+
+    Each study is only looked up once. Results are cached for `STUDY_VERSION_CACHE_TIMEOUT` seconds, and studies
+    that are not cached are looked up in dbGaP concurrently.
+
+    Returns:
+        dict: The version and participant set of each study, keyed by phs.
+    """
+    keys = {phs: "dbgap_study_version:{}".format(phs) for phs in set(phs_list)}
+    cached = cache.get_many(keys.values())
+    versions = {phs: tuple(cached[key]) for phs, key in keys.items() if key in cached}
+    missing = sorted(set(keys) - set(versions))
+    if missing:
+        # Only make requests in the worker threads; the cache is updated in this thread.
+        with ThreadPoolExecutor(max_workers=min(len(missing), STUDY_VERSION_MAX_WORKERS)) as executor:
+            new_versions = dict(zip(missing, executor.map(get_current_study_version, missing)))
+        cache.set_many({keys[phs]: version for phs, version in new_versions.items()}, STUDY_VERSION_CACHE_TIMEOUT)
+        versions.update(new_versions)
+    return versions
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ... import helpers, models
+
+
+class Command(BaseCommand):
+    help = """Fetch DARs for all dbGaP applications from dbGaP and add snapshots for applications whose DARs changed.
+
+    Applications whose DAR json is unchanged since their most recent snapshot are skipped, so running this
+    frequently does not add duplicate snapshots and DARs. The most recent snapshot for a skipped application is
+    marked as checked, so that it is not reported as outdated."""
+
+    # An object with a `get` method like `requests.Session`, used to fetch the json. None uses `requests`.
+    session = None
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--base-url",
+            default=helpers.DBGAP_DAR_JSON_BASE_URL,
+            help="""URL of the dbGaP project report to fetch DARs from.""",
+        )
+
+    def handle(self, *args, **options):
+        project_ids = set(models.dbGaPApplication.objects.values_list("dbgap_project_id", flat=True))
+        if not project_ids:
+            self.stdout.write("No dbGaP applications.")
+            return
+        self.stdout.write("Fetching DARs for {} dbGaP application(s)... ".format(len(project_ids)), ending="")
+        dbgap_dar_data = helpers.fetch_dbgap_dar_json(
+            sorted(project_ids), base_url=options["base_url"], session=self.session
+        )
+        self.stdout.write(self.style.SUCCESS("done."))
+        known = []
+        for project_json in dbgap_dar_data:
+            if project_json["Project_id"] not in project_ids:
+                self.stdout.write(
+                    self.style.WARNING("Skipping unknown project id {}.".format(project_json["Project_id"]))
+                )
+            else:
+                known.append(project_json)
+        with transaction.atomic():
+            snapshots = models.dbGaPDataAccessSnapshot.create_from_json(known, skip_unchanged=True)
+        self.stdout.write("* Unchanged: {}".format(len(known) - len(snapshots)))
+        self.stdout.write("* New snapshots: {}".format(len(snapshots)))
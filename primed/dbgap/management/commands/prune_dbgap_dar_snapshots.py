@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from primed.primed_anvil.audit_results import mark_audit_results_stale
+
+from ... import helpers, models
+from ...audit import access_audit
+
+
+class Command(BaseCommand):
+    help = """Delete dbGaP data access snapshots (and their DARs) that are unchanged from the previous snapshot.
+
+    A snapshot is deleted if its DAR json is the same as the json of the previous snapshot for the same application
+    and it is not the most recent snapshot, so the remaining snapshots record each change in an application's DARs.
+
+    Snapshots are only deleted if --confirm is given; otherwise the number of snapshots that would be deleted is
+    reported. Snapshots and their DARs are deleted in batches, recording their history."""
+
+    # Number of snapshots to delete in each query.
+    batch_size = 500
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--confirm",
+            action="store_true",
+            help="""Delete the unchanged snapshots. Without this option, only the number of snapshots that would be
+            deleted is reported.""",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("Finding unchanged snapshots... ", ending="")
+        pks = []
+        application_pks = set()
+        previous_application_pk = None
+        previous_hash = None
+        snapshots = (
+            models.dbGaPDataAccessSnapshot.objects.order_by("dbgap_application", "created", "pk")
+            .values_list("pk", "dbgap_application", "is_most_recent", "dbgap_dar_data")
+            .iterator()
+        )
+        for pk, application_pk, is_most_recent, dbgap_dar_data in snapshots:
+            dar_json_hash = helpers.get_dar_json_hash(dbgap_dar_data)
+            if application_pk == previous_application_pk and dar_json_hash == previous_hash and not is_most_recent:
+                pks.append(pk)
+                application_pks.add(application_pk)
+            else:
+                previous_application_pk = application_pk
+                previous_hash = dar_json_hash
+        self.stdout.write(self.style.SUCCESS("done."))
+        self.stdout.write("* Unchanged snapshots: {}".format(len(pks)))
+        if not pks:
+            return
+        if not options["confirm"]:
+            self.stdout.write("Run with --confirm to delete these snapshots.")
+            return
+        n_dars = 0
+        for i in range(0, len(pks), self.batch_size):
+            batch = pks[i : i + self.batch_size]
+            with transaction.atomic():
+                _, deleted = models.dbGaPDataAccessSnapshot.objects.filter(pk__in=batch).delete()
+            n_dars += deleted.get(models.dbGaPDataAccessRequest._meta.label, 0)
+        mark_audit_results_stale(access_audit.dbGaPAccessAudit, application_pks)
+        self.stdout.write("* Deleted DARs: {}".format(n_dars))
@@ -4,6 +4,8 @@ from django.core.management.base import BaseCommand
 from django.template.loader import render_to_string
 from django.urls import reverse
 
+from primed.primed_anvil.audit_results import run_and_store_audit
+
 from ...audit import access_audit, collaborator_audit
 
 
@@ -20,13 +22,13 @@ class Command(BaseCommand):
     def run_access_audit(self, *args, **options):
         self.stdout.write("Running dbGaP access audit... ", ending="")
         audit = access_audit.dbGaPAccessAudit()
-        audit.run_audit()
+        run_and_store_audit(audit)
         self._handle_audit_results(audit, reverse("dbgap:audit:access:all"), **options)
 
     def run_collaborator_audit(self, *args, **options):
         self.stdout.write("Running dbGaP collaborator audit... ", ending="")
         audit = collaborator_audit.dbGaPCollaboratorAudit()
-        audit.run_audit()
+        run_and_store_audit(audit)
         self._handle_audit_results(audit, reverse("dbgap:audit:collaborators:all"), **options)
 
     def _handle_audit_results(self, audit, url, **options):
@@ -43,6 +45,7 @@ class Command(BaseCommand):
         self.stdout.write("* Verified: {}".format(len(audit.verified)))
         self.stdout.write("* Needs action: {}".format(len(audit.needs_action)))
         self.stdout.write("* Errors: {}".format(len(audit.errors)))
+        changes = audit.report_and_save_run(self.stdout)
 
         if not audit_ok:
             self.stdout.write(self.style.ERROR(f"Please visit {url} to resolve these issues."))
@@ -55,6 +58,7 @@ class Command(BaseCommand):
                 context={
                     "title": "dbGaP collaborator audit",
                     "data_access_audit": audit,
+                    "changes": changes,
                     "url": url,
                 },
             )
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.11 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dbgap', '0014_dbgapapplication_add_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dbgapdataaccesssnapshot',
+            name='last_checked',
+            field=models.DateTimeField(blank=True, help_text='The last time the DARs for this snapshot were fetched from dbGaP and found to be unchanged.', null=True),
+        ),
+        migrations.AddField(
+            model_name='historicaldbgapdataaccesssnapshot',
+            name='last_checked',
+            field=models.DateTimeField(blank=True, help_text='The last time the DARs for this snapshot were fetched from dbGaP and found to be unchanged.', null=True),
+        ),
+    ]
@@ -12,7 +12,6 @@ import re
 from datetime import datetime
 
 import jsonschema
-import requests
 from anvil_consortium_manager.models import BaseWorkspaceData, ManagedGroup
 from constance import config
 from django.conf import settings
@@ -24,6 +23,7 @@ from django.utils import timezone
 from django_extensions.db.models import TimeStampedModel
 from model_utils.models import StatusModel
 from simple_history.models import HistoricalRecords
+from simple_history.utils import bulk_update_with_history
 
 from primed.duo.models import DataUseOntologyModel
 from primed.primed_anvil.models import AvailableData, RequesterModel, Study
@@ -244,6 +244,11 @@ class dbGaPDataAccessSnapshot(TimeStampedModel, models.Model):
     is_most_recent = models.BooleanField(
         help_text="Indicator of whether this is the most recent snapshot for this applicaiton."
     )
+    last_checked = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="The last time the DARs for this snapshot were fetched from dbGaP and found to be unchanged.",
+    )
 
     history = HistoricalRecords()
 
@@ -270,11 +275,10 @@ class dbGaPDataAccessSnapshot(TimeStampedModel, models.Model):
         """
         if self.dbgap_dar_data:
             try:
-                jsonschema.validate(self.dbgap_dar_data, constants.JSON_PROJECT_DAR_SCHEMA)
+                # Mark the json as validated so that it is not validated again in create_dars_from_json.
+                self.dbgap_dar_data = helpers.validate_project_dar_json(self.dbgap_dar_data)
             except jsonschema.exceptions.ValidationError as e:
-                # Replace the full json string because it will be very long
-                error_message = e.message.replace(str(e.instance), "JSON array")
-                raise ValidationError({"dbgap_dar_data": error_message})
+                raise ValidationError({"dbgap_dar_data": helpers.get_json_validation_error_message(e)})
             if self.dbgap_dar_data["Project_id"] != self.dbgap_application.dbgap_project_id:
                 raise ValidationError("Project_id in JSON does not match dbgap_application.dbgap_project_id.")
 
@@ -286,105 +290,215 @@ class dbGaPDataAccessSnapshot(TimeStampedModel, models.Model):
         give us the original version and participant set that the DAR grants access to, we
         need to look that up when adding the first DAR with a specific DAR/dbgap_dar_id.
         For new DARs with the same DAR/dbgap_dar_id, we can look up the original version/
-        participant set from the previous dbGaPDataAccessRequest.
+        participant set from the previous dbGaPDataAccessRequest. Previous DARs are loaded
+        in a single query, and each phs is looked up in dbGaP at most once (see
+        `helpers.get_current_study_versions`).
         """
-        # Validate the json. It should already be validated, but it doesn't hurt to check again.
-        jsonschema.validate(self.dbgap_dar_data, constants.JSON_PROJECT_DAR_SCHEMA)
+        # Validate the json, unless it has already been validated (e.g., by the form or clean).
+        self.dbgap_dar_data = helpers.validate_project_dar_json(self.dbgap_dar_data)
         # Log the json.
         msg = "Creating DARs using snapshot pk {pk}...\n".format(
             pk=self.pk,
         )
         logger.info(msg)
-        project_json = self.dbgap_dar_data
-        # Create a list in which to store DARs to create.
-        dars = []
         # Make sure that the dbgap_project_id matches.
-        project_id = project_json["Project_id"]
-        if project_id != self.dbgap_application.dbgap_project_id:
+        if self.dbgap_dar_data["Project_id"] != self.dbgap_application.dbgap_project_id:
             raise ValueError("project_id does not match dbgap_application.dbgap_project_id.")
-        # Loop over studies and requests to create DARs.
+        dars = self._build_dars_from_json([self])
+        # Create the DARs in bulk - there are usually a lot of them.
+        dars = dbGaPDataAccessRequest.objects.bulk_create(dars)
+        return dars
+
+    @classmethod
+    def get_unchanged_project_ids(cls, dbgap_dar_data):
+        """Return the project ids whose json is the same as the json of the most recent snapshot for the project."""
+        project_ids = [project_json["Project_id"] for project_json in dbgap_dar_data]
+        previous_hashes = {
+            project_id: helpers.get_dar_json_hash(data)
+            for project_id, data in cls.objects.filter(
+                dbgap_application__dbgap_project_id__in=project_ids, is_most_recent=True
+            ).values_list("dbgap_application__dbgap_project_id", "dbgap_dar_data")
+        }
+        return {
+            project_json["Project_id"]
+            for project_json in dbgap_dar_data
+            if previous_hashes.get(project_json["Project_id"]) == helpers.get_dar_json_hash(project_json)
+        }
+
+    @classmethod
+    def create_from_json(cls, dbgap_dar_data, skip_unchanged=False):
+        """Create snapshots and their DARs for all projects in the dbGaP json for multiple projects.
+
+        The json for each project is validated unless it has already been validated, e.g., with
+        `helpers.validate_dar_json`. All applications are loaded in one query, previous snapshots are marked as not
+        most recent in bulk (recording their history), and the DARs for all projects are created together (see
+        `create_dars_from_json`). If a project appears more than once, the last snapshot for it is the most recent.
+
+        If `skip_unchanged` is True, no snapshot is created for projects whose json is unchanged from the most recent
+        snapshot for the project (see `get_unchanged_project_ids`). Instead, `last_checked` is updated for that
+        snapshot, so that it is not reported as outdated.
+
+        This should be called inside a transaction, so that nothing is saved if an error occurs.
+
+        Returns:
+            list: The new dbGaPDataAccessSnapshots, in the order of the projects in the json.
+        """
+        dbgap_dar_data = [helpers.validate_project_dar_json(project_json) for project_json in dbgap_dar_data]
+        project_ids = [project_json["Project_id"] for project_json in dbgap_dar_data]
+        applications = dbGaPApplication.objects.in_bulk(project_ids, field_name="dbgap_project_id")
+        missing_ids = set(project_ids) - set(applications)
+        if missing_ids:
+            raise dbGaPApplication.DoesNotExist(
+                "No dbGaPApplication for project id(s): {}".format(", ".join(str(x) for x in sorted(missing_ids)))
+            )
+        if skip_unchanged:
+            unchanged_ids = cls.get_unchanged_project_ids(dbgap_dar_data)
+            dbgap_dar_data = [x for x in dbgap_dar_data if x["Project_id"] not in unchanged_ids]
+            unchanged_snapshots = list(
+                cls.objects.filter(dbgap_application__dbgap_project_id__in=unchanged_ids, is_most_recent=True)
+            )
+            now = timezone.now()
+            for snapshot in unchanged_snapshots:
+                snapshot.last_checked = now
+            bulk_update_with_history(unchanged_snapshots, cls, ["last_checked"])
+            project_ids = [project_json["Project_id"] for project_json in dbgap_dar_data]
+        logger.info("Creating snapshots for {} projects...".format(len(project_ids)))
+        if not dbgap_dar_data:
+            return []
+        previous_snapshots = list(
+            cls.objects.filter(dbgap_application__in=[applications[x] for x in project_ids], is_most_recent=True)
+        )
+        for previous_snapshot in previous_snapshots:
+            previous_snapshot.is_most_recent = False
+        bulk_update_with_history(previous_snapshots, cls, ["is_most_recent"])
+        # Snapshots are saved individually so that their history is recorded; there is one per project.
+        last_index = {project_id: i for i, project_id in enumerate(project_ids)}
+        snapshots = []
+        for i, project_json in enumerate(dbgap_dar_data):
+            snapshot = cls(
+                dbgap_application=applications[project_json["Project_id"]],
+                dbgap_dar_data=project_json,
+                is_most_recent=last_index[project_json["Project_id"]] == i,
+            )
+            snapshot.save()
+            snapshots.append(snapshot)
+        dbGaPDataAccessRequest.objects.bulk_create(cls._build_dars_from_json(snapshots))
+        return snapshots
+
+    @classmethod
+    def _build_dars_from_json(cls, snapshots):
+        """Return new, validated dbGaPDataAccessRequests for the json of a list of saved snapshots.
+
+        See `create_dars_from_json` for how the original version and participant set are obtained.
+        """
+        # Get the phs and json for each request.
+        requests_json = []
+        for snapshot in snapshots:
+            for study_json in snapshot.dbgap_dar_data["studies"]:
+                phs = int(re.match(constants.PHS_REGEX, study_json["study_accession"]).group("phs"))
+                requests_json.extend((snapshot, phs, request_json) for request_json in study_json["requests"])
+        # dbGaP does not keep track of the original version and participant set associated with a DAR.
+        # Therefore, we need to get it ourselves.
+        # Look up the original version and participant set from the most recent previous DAR with each DAR ID.
+        previous_dars = {}
+        for previous_dar in (
+            dbGaPDataAccessRequest.objects.approved()
+            .filter(dbgap_dar_id__in={request_json["DAR"] for _, _, request_json in requests_json})
+            .exclude(dbgap_data_access_snapshot__in=snapshots)
+            .select_related("dbgap_data_access_snapshot__dbgap_application")
+            .order_by("created", "pk")
+        ):
+            previous_dars[previous_dar.dbgap_dar_id] = previous_dar
+        for snapshot, phs, request_json in requests_json:
+            previous_dar = previous_dars.get(request_json["DAR"])
+            if previous_dar is None:
+                continue
+            # Make sure that excepted values match.
+            # This assumes that a DAR/dbgap_dar_id remains the same for the same phs and consent code.
+            # Is ValueError the best error to raise?
+            try:
+                if previous_dar.dbgap_phs != phs:
+                    raise ValueError(f"dbgap_phs mismatch. previous_dar: {previous_dar}.")
+                if previous_dar.dbgap_consent_code != request_json["consent_code"]:
+                    raise ValueError(f"dbgap_consent_code mismatch. previous_dar: {previous_dar}.")
+                project_id = snapshot.dbgap_dar_data["Project_id"]
+                if previous_dar.dbgap_data_access_snapshot.dbgap_application.dbgap_project_id != project_id:
+                    raise ValueError(f"project_id mismatch. previous_dar: {previous_dar}.")
+            except ValueError as e:
+                # Log an error and re-raise.
+                msg = "DAR ID mismatch for snapshot pk {} and DAR ID {}".format(snapshot.pk, previous_dar.dbgap_dar_id)
+                logger.error(msg)
+                logger.error(str(e))
+                raise
+        # If we don't have info about a DAR from a previous DAR, query dbGaP to get the current version and
+        # participant set numbers for its phs. Each phs is only looked up once.
+        current_versions = helpers.get_current_study_versions(
+            [phs for _, phs, request_json in requests_json if request_json["DAR"] not in previous_dars]
+        )
+        # Check the unique constraints for all DARs at once, instead of with a query for each DAR.
+        existing_dars = dbGaPDataAccessRequest.objects.filter(dbgap_data_access_snapshot__in=snapshots).values_list(
+            "dbgap_data_access_snapshot", "dbgap_dar_id", "dbgap_phs", "dbgap_consent_code"
+        )
+        seen_dar_ids = {(x[0], x[1]) for x in existing_dars}
+        seen_consents = {(x[0], x[2], x[3]) for x in existing_dars}
+        # Create the DARs.
         # Do not save them until everything has been successfully created.
-        for study_json in project_json["studies"]:
-            # Consider making this a model manager method for dbGaPStudyAccession, since it may be common.
-            # Get the dbGaPStudyAccession associated with this phs.
-            phs = int(re.match(constants.PHS_REGEX, study_json["study_accession"]).group("phs"))
-            # Create the DAR.
-            for request_json in study_json["requests"]:
-                # dbGaP does not keep track of the original version and participant set associated with a DAR.
-                # Therefore, we need to get it ourselves.
-                # Try looking up the original version and participant set from a previous DAR.
-                try:
-                    # This assumes that a DAR/dbgap_dar_id remains the same for the same phs and consent code.
-                    previous_dar = (
-                        dbGaPDataAccessRequest.objects.approved()
-                        .filter(
-                            dbgap_dar_id=request_json["DAR"],
-                        )
-                        .latest("created")
-                    )
-                    # Make sure that excepted values match.
-                    # Is ValueError the best error to raise?
-                    if previous_dar.dbgap_phs != phs:
-                        raise ValueError(f"dbgap_phs mismatch. previous_dar: {previous_dar}.")
-                    if previous_dar.dbgap_consent_code != request_json["consent_code"]:
-                        raise ValueError(f"dbgap_consent_code mismatch. previous_dar: {previous_dar}.")
-                    if previous_dar.dbgap_data_access_snapshot.dbgap_application.dbgap_project_id != project_id:
-                        raise ValueError(f"project_id mismatch. previous_dar: {previous_dar}.")
-                    # If everything looks good, pull the original version and participant set from the previous DAR.
-                    original_version = previous_dar.original_version
-                    original_participant_set = previous_dar.original_participant_set
-                except dbGaPDataAccessRequest.DoesNotExist:
-                    # If we don't have info about it from a previous DAR, query dbGaP to get the current
-                    # version and participant set numbers for this phs.
-                    # This url should resolve to url for the current version/participant set.
-                    # This assumes that the study has been released, which should be true for all PRIMED studies.
-                    # It is not necessarily true for all dbGaP applications, eg TOPMed applying to the EA.
-                    response = requests.get(
-                        constants.DBGAP_STUDY_URL,
-                        params={"study_id": "phs{phs:06d}".format(phs=phs)},
-                        allow_redirects=False,
+        dars = []
+        for snapshot, phs, request_json in requests_json:
+            previous_dar = previous_dars.get(request_json["DAR"])
+            if previous_dar is not None:
+                original_version = previous_dar.original_version
+                original_participant_set = previous_dar.original_participant_set
+            else:
+                original_version, original_participant_set = current_versions[phs]
+            dar = dbGaPDataAccessRequest(
+                dbgap_dar_id=request_json["DAR"],
+                dbgap_data_access_snapshot=snapshot,
+                dbgap_phs=phs,
+                original_version=original_version,
+                original_participant_set=original_participant_set,
+                dbgap_consent_code=request_json["consent_code"],
+                dbgap_consent_abbreviation=request_json["consent_abbrev"],
+                dbgap_current_status=request_json["current_DAR_status"],
+                dbgap_dac=request_json["DAC_abbrev"],
+            )
+            # The snapshot is known to exist, and constraints are checked below.
+            dar.full_clean(exclude=["dbgap_data_access_snapshot"], validate_unique=False, validate_constraints=False)
+            dar_id_key = (snapshot.pk, dar.dbgap_dar_id)
+            consent_key = (snapshot.pk, dar.dbgap_phs, dar.dbgap_consent_code)
+            if dar_id_key in seen_dar_ids or consent_key in seen_consents:
+                raise ValidationError(
+                    "Duplicate DAR {} for phs {} consent code {} in snapshot pk {}.".format(
+                        dar.dbgap_dar_id, dar.dbgap_phs, dar.dbgap_consent_code, snapshot.pk
                     )
-                    # Raise an error if an error code was returned.
-                    response.raise_for_status()
-                    full_accession = response.next.url.split("study_id=")[1]
-                    match = re.match(constants.FULL_ACCESSION_REGEX, full_accession)
-                    original_version = int(match.group("version"))
-                    original_participant_set = int(match.group("participant_set"))
-                except ValueError as e:
-                    # Log an error and re-raise.
-                    msg = "DAR ID mismatch for snapshot pk {} and DAR ID {}".format(self.pk, previous_dar.dbgap_dar_id)
-                    logger.error(msg)
-                    logger.error(str(e))
-                    raise
-
-                dar = dbGaPDataAccessRequest(
-                    dbgap_dar_id=request_json["DAR"],
-                    dbgap_data_access_snapshot=self,
-                    dbgap_phs=phs,
-                    original_version=original_version,
-                    original_participant_set=original_participant_set,
-                    dbgap_consent_code=request_json["consent_code"],
-                    dbgap_consent_abbreviation=request_json["consent_abbrev"],
-                    dbgap_current_status=request_json["current_DAR_status"],
-                    dbgap_dac=request_json["DAC_abbrev"],
                 )
-                dar.full_clean()
-                dars.append(dar)
-        # Create the DARs in bulk - there are usually a lot of them.
-        dars = dbGaPDataAccessRequest.objects.bulk_create(dars)
+            seen_dar_ids.add(dar_id_key)
+            seen_consents.add(consent_key)
+            dars.append(dar)
         return dars
 
-    def is_outdated(self):
-        """Determine whether a dbGaPDataAccessSnapshot is outdated."""
+    @classmethod
+    def get_outdated_cutoff(cls):
+        """Return the datetime before which a dbGaPDataAccessSnapshot is considered outdated, or None."""
         x = config.DBGAP_SNAPSHOT_OLD_DATE
         if x is None:
+            return None
+        return timezone.make_aware(
+            datetime(x.year, x.month, x.day),
+            timezone.get_default_timezone(),
+        )
+
+    def get_last_checked(self):
+        """Return the last time the DARs for this snapshot were known to be current in dbGaP."""
+        return self.last_checked or self.created
+
+    def is_outdated(self):
+        """Determine whether a dbGaPDataAccessSnapshot is outdated."""
+        cutoff = self.get_outdated_cutoff()
+        if cutoff is None:
             return False
         else:
-            cutoff = timezone.make_aware(
-                datetime(x.year, x.month, x.day),
-                timezone.get_default_timezone(),
-            )
-            return self.created < cutoff
+            return self.get_last_checked() < cutoff
 
 
 class dbGaPDataAccessRequest(TimeStampedModel, models.Model):
@@ -0,0 +1,128 @@
+"""Signal handlers that mark stored dbGaP audit results as stale when the data they depend on changes."""
+
+from anvil_consortium_manager.models import Account, GroupAccountMembership, GroupGroupMembership, Workspace
+from constance.signals import config_updated
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from primed.primed_anvil.audit_results import mark_audit_results_stale
+from primed.primed_anvil.membership_closure import get_group_membership_closure
+
+from . import models
+from .audit import access_audit, collaborator_audit
+
+
+def _get_application_pks(*args, **kwargs):
+    return models.dbGaPApplication.objects.filter(*args, **kwargs).values_list("pk", flat=True)
+
+
+def _group_membership_changed(parent_group_pk, child_group_pk):
+    # Applications whose access group is the child group, or is in the child group, may have gained or lost
+    # access to a workspace auth domain.
+    child_pks = {child_group_pk} | get_group_membership_closure().get_all_child_pks(child_group_pk)
+    mark_audit_results_stale(access_audit.dbGaPAccessAudit, _get_application_pks(anvil_access_group__in=child_pks))
+    mark_audit_results_stale(
+        collaborator_audit.dbGaPCollaboratorAudit, _get_application_pks(anvil_access_group=parent_group_pk)
+    )
+
+
+@receiver(post_save, sender=GroupGroupMembership)
+def group_group_membership_saved(sender, instance, created, **kwargs):
+    if created:
+        _group_membership_changed(instance.parent_group_id, instance.child_group_id)
+
+
+@receiver(post_delete, sender=GroupGroupMembership)
+def group_group_membership_deleted(sender, instance, **kwargs):
+    _group_membership_changed(instance.parent_group_id, instance.child_group_id)
+
+
+@receiver(post_save, sender=GroupAccountMembership)
+def group_account_membership_saved(sender, instance, created, **kwargs):
+    if created:
+        mark_audit_results_stale(
+            collaborator_audit.dbGaPCollaboratorAudit, _get_application_pks(anvil_access_group=instance.group_id)
+        )
+
+
+@receiver(post_delete, sender=GroupAccountMembership)
+def group_account_membership_deleted(sender, instance, **kwargs):
+    mark_audit_results_stale(
+        collaborator_audit.dbGaPCollaboratorAudit, _get_application_pks(anvil_access_group=instance.group_id)
+    )
+
+
+@receiver(post_save, sender=Account)
+def account_saved(sender, instance, **kwargs):
+    # The account status or linked user may have changed.
+    query = Q(anvil_access_group__in=GroupAccountMembership.objects.filter(account=instance).values("group"))
+    if instance.user_id:
+        query |= Q(principal_investigator=instance.user_id) | Q(collaborators=instance.user_id)
+    mark_audit_results_stale(collaborator_audit.dbGaPCollaboratorAudit, _get_application_pks(query))
+
+
+@receiver(post_save, sender=models.dbGaPApplication)
+def dbgap_application_saved(sender, instance, **kwargs):
+    mark_audit_results_stale(access_audit.dbGaPAccessAudit, [instance.pk])
+    mark_audit_results_stale(collaborator_audit.dbGaPCollaboratorAudit, [instance.pk])
+
+
+@receiver(m2m_changed, sender=models.dbGaPApplication.collaborators.through)
+def dbgap_application_collaborators_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        mark_audit_results_stale(collaborator_audit.dbGaPCollaboratorAudit, [instance.pk])
+    elif pk_set:
+        mark_audit_results_stale(collaborator_audit.dbGaPCollaboratorAudit, pk_set)
+    else:
+        # The applications a user was removed from are not known after a reverse clear.
+        mark_audit_results_stale(collaborator_audit.dbGaPCollaboratorAudit)
+
+
+@receiver(post_save, sender=models.dbGaPWorkspace)
+@receiver(post_delete, sender=models.dbGaPWorkspace)
+def dbgap_workspace_changed(sender, instance, **kwargs):
+    # Every application is audited against every workspace.
+    mark_audit_results_stale(access_audit.dbGaPAccessAudit)
+
+
+@receiver(post_save, sender=models.dbGaPDataAccessSnapshot)
+@receiver(post_delete, sender=models.dbGaPDataAccessSnapshot)
+def dbgap_data_access_snapshot_changed(sender, instance, **kwargs):
+    mark_audit_results_stale(access_audit.dbGaPAccessAudit, [instance.dbgap_application_id])
+
+
+@receiver(post_save, sender=models.dbGaPDataAccessRequest)
+@receiver(post_delete, sender=models.dbGaPDataAccessRequest)
+def dbgap_data_access_request_changed(sender, instance, **kwargs):
+    mark_audit_results_stale(
+        access_audit.dbGaPAccessAudit,
+        models.dbGaPDataAccessSnapshot.objects.filter(pk=instance.dbgap_data_access_snapshot_id).values_list(
+            "dbgap_application", flat=True
+        ),
+    )
+
+
+@receiver(m2m_changed, sender=Workspace.authorization_domains.through)
+def workspace_authorization_domains_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    # Every application is audited against every workspace.
+    if not reverse:
+        changed = models.dbGaPWorkspace.objects.filter(workspace=instance).exists()
+    elif pk_set:
+        changed = models.dbGaPWorkspace.objects.filter(workspace__in=pk_set).exists()
+    else:
+        # The workspaces a group was removed from are not known after a reverse clear.
+        changed = True
+    if changed:
+        mark_audit_results_stale(access_audit.dbGaPAccessAudit)
+
+
+@receiver(config_updated)
+def constance_config_updated(sender, key, old_value, new_value, **kwargs):
+    # Snapshots older than this date are reported as out of date.
+    if key == "DBGAP_SNAPSHOT_OLD_DATE":
+        mark_audit_results_stale(access_audit.dbGaPAccessAudit)
@@ -1,15 +1,20 @@
 """Tables for the `dbgap` app."""
 
+from collections import defaultdict
+
 import django_tables2 as tables
-from anvil_consortium_manager.exceptions import WorkspaceAccessAuthorizationDomainUnknownError
 from anvil_consortium_manager.models import Workspace
-from django.template import Context, Template
+from django.db.models import Case, Count, OuterRef, Q, QuerySet, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.urls import reverse
 from django.utils.html import format_html_join
 from django.utils.safestring import mark_safe
 
+from primed.primed_anvil.membership_closure import get_group_membership_closure
 from primed.primed_anvil.tables import (
     BooleanIconColumn,
     WorkspaceSharedWithConsortiumColumn,
+    WorkspaceSharedWithConsortiumTableMixin,
 )
 
 from . import models
@@ -40,13 +45,49 @@ class dbGaPAccessionColumn(tables.Column):
         return tables.A(self.accessor).resolve(record)
 
 
-class ManyToManyDateTimeColumn(tables.columns.ManyToManyColumn):
-    """A django-tables2 column to render a many-to-many date time column using human-readable date time formatting."""
+def annotate_dbgap_application_dar_counts(queryset):
+    """Annotate a dbGaPApplication queryset with information about the most recent snapshot for each application.
+
+    The annotations are `last_update` and `last_update_pk` (the creation date and pk of the most recent snapshot),
+    and `number_approved_dars` and `number_requested_dars` (the number of DARs in the most recent snapshot). All
+    annotations are None for applications without a snapshot.
+    """
+    most_recent_snapshot = models.dbGaPDataAccessSnapshot.objects.filter(
+        dbgap_application=OuterRef("pk"), is_most_recent=True
+    ).order_by("-created", "-pk")
+    # Count the DARs in the most recent snapshot with correlated subqueries, so that the counts are not multiplied by
+    # the joins to every snapshot and DAR for the application.
+    most_recent_dars = models.dbGaPDataAccessRequest.objects.filter(
+        dbgap_data_access_snapshot__dbgap_application=OuterRef("pk"),
+        dbgap_data_access_snapshot__is_most_recent=True,
+    ).order_by()
+
+    def count_dars(dars):
+        return Coalesce(
+            Subquery(dars.values("dbgap_data_access_snapshot__dbgap_application").annotate(n=Count("pk")).values("n")),
+            0,
+        )
 
-    def transform(self, obj):
-        context = Context()
-        context.update({"value": obj.created, "default": self.default})
-        return Template("""{{ value|date:"DATETIME_FORMAT"|default:default }}""").render(context)
+    return (
+        queryset.select_related("principal_investigator")
+        .prefetch_related("principal_investigator__study_sites")
+        .annotate(
+            last_update=Subquery(most_recent_snapshot.values("created")[:1]),
+            last_update_pk=Subquery(most_recent_snapshot.values("pk")[:1]),
+        )
+        .annotate(
+            number_approved_dars=Case(
+                When(last_update_pk__isnull=True, then=Value(None)),
+                default=count_dars(
+                    most_recent_dars.filter(dbgap_current_status=models.dbGaPDataAccessRequest.APPROVED)
+                ),
+            ),
+            number_requested_dars=Case(
+                When(last_update_pk__isnull=True, then=Value(None)),
+                default=count_dars(most_recent_dars),
+            ),
+        )
+    )
 
 
 class dbGaPStudyAccessionTable(tables.Table):
@@ -72,7 +113,7 @@ class dbGaPStudyAccessionTable(tables.Table):
         return "phs{0:06d}".format(value)
 
 
-class dbGaPWorkspaceUserTable(tables.Table):
+class dbGaPWorkspaceUserTable(WorkspaceSharedWithConsortiumTableMixin, tables.Table):
     """Class to render a table of Workspace objects with dbGaPWorkspace workspace data."""
 
     name = tables.columns.Column(linkify=True)
@@ -126,7 +167,29 @@ class dbGaPWorkspaceStaffTable(dbGaPWorkspaceUserTable):
         )
         order_by = ("name",)
 
+    def __init__(self, data=None, *args, **kwargs):
+        if isinstance(data, QuerySet):
+            # Count approved DARs in the same query as the workspaces; see dbGaPWorkspace.get_data_access_requests.
+            approved_dars = (
+                models.dbGaPDataAccessRequest.objects.filter(
+                    dbgap_phs=OuterRef("dbgapworkspace__dbgap_study_accession__dbgap_phs"),
+                    original_version__lte=OuterRef("dbgapworkspace__dbgap_version"),
+                    original_participant_set__lte=OuterRef("dbgapworkspace__dbgap_participant_set"),
+                    dbgap_consent_code=OuterRef("dbgapworkspace__dbgap_consent_code"),
+                    dbgap_data_access_snapshot__is_most_recent=True,
+                    dbgap_current_status=models.dbGaPDataAccessRequest.APPROVED,
+                )
+                .order_by()
+                .values("dbgap_phs")
+                .annotate(n=Count("pk"))
+                .values("n")
+            )
+            data = data.annotate(number_approved_dars=Coalesce(Subquery(approved_dars), 0))
+        super().__init__(data, *args, **kwargs)
+
     def render_number_approved_dars(self, record):
+        if hasattr(record, "number_approved_dars"):
+            return record.number_approved_dars
         n = (
             record.dbgapworkspace.get_data_access_requests(most_recent=True)
             .filter(dbgap_current_status=models.dbGaPDataAccessRequest.APPROVED)
@@ -148,22 +211,24 @@ class dbGaPApplicationTable(tables.Table):
         verbose_name="Study site(s)",
     )
     status = tables.columns.Column()
-    number_approved_dars = tables.columns.ManyToManyColumn(
-        accessor="dbgapdataaccesssnapshot_set",
-        filter=lambda qs: qs.filter(is_most_recent=True),
+    number_approved_dars = tables.columns.Column(
         verbose_name="Number of approved DARs",
-        transform=lambda obj: obj.dbgapdataaccessrequest_set.approved().count(),
+        orderable=False,
     )
-    number_requested_dars = tables.columns.ManyToManyColumn(
-        accessor="dbgapdataaccesssnapshot_set",
-        filter=lambda qs: qs.filter(is_most_recent=True),
+    number_requested_dars = tables.columns.Column(
         verbose_name="Number of requested DARs",
-        transform=lambda obj: obj.dbgapdataaccessrequest_set.count(),
+        orderable=False,
     )
-    last_update = ManyToManyDateTimeColumn(
-        accessor="dbgapdataaccesssnapshot_set",
-        filter=lambda qs: qs.filter(is_most_recent=True),
-        linkify_item=True,
+    last_update = tables.columns.DateTimeColumn(
+        format="DATETIME_FORMAT",
+        orderable=False,
+        linkify=lambda record: reverse(
+            "dbgap:dbgap_applications:dbgap_data_access_snapshots:detail",
+            kwargs={
+                "dbgap_project_id": record.dbgap_project_id,
+                "dbgap_data_access_snapshot_pk": record.last_update_pk,
+            },
+        ),
     )
 
     class Meta:
@@ -175,6 +240,11 @@ class dbGaPApplicationTable(tables.Table):
         )
         order_by = ("dbgap_project_id",)
 
+    def __init__(self, data=None, *args, **kwargs):
+        if isinstance(data, QuerySet):
+            data = annotate_dbgap_application_dar_counts(data)
+        super().__init__(data, *args, **kwargs)
+
 
 class dbGaPDataAccessSnapshotTable(tables.Table):
     """Class to render a table of dbGaPDataAccessSnapshot objects."""
@@ -188,27 +258,43 @@ class dbGaPDataAccessSnapshotTable(tables.Table):
         order_by = ("-created",)
 
     pk = tables.Column(linkify=True, verbose_name="Details", orderable=False)
+    # Counts are only shown for snapshots that have DARs; n_approved_dars is None for snapshots without DARs.
     number_approved_dars = tables.columns.Column(
         verbose_name="Number of approved DARs",
-        orderable=False,
-        empty_values=(False,),
-        accessor="dbgapdataaccessrequest_set__exists",
+        accessor="n_approved_dars",
     )
     number_requested_dars = tables.columns.Column(
         verbose_name="Number of requested DARs",
-        orderable=False,
-        empty_values=(False,),
-        accessor="dbgapdataaccessrequest_set__exists",
+        empty_values=(0,),
+        accessor="n_requested_dars",
     )
 
+    def __init__(self, data=None, *args, **kwargs):
+        if isinstance(data, QuerySet):
+            data = data.annotate(
+                n_requested_dars=Count("dbgapdataaccessrequest"),
+                n_approved_dars=Case(
+                    When(n_requested_dars=0, then=Value(None)),
+                    default=Count(
+                        "dbgapdataaccessrequest",
+                        filter=Q(dbgapdataaccessrequest__dbgap_current_status=models.dbGaPDataAccessRequest.APPROVED),
+                    ),
+                ),
+            )
+        super().__init__(data, *args, **kwargs)
+
     def render_pk(self, record):
         return "See details"
 
     def render_number_approved_dars(self, record):
+        if hasattr(record, "n_approved_dars"):
+            return record.n_approved_dars
         n_dars = record.dbgapdataaccessrequest_set.approved().count()
         return n_dars
 
     def render_number_requested_dars(self, record):
+        if hasattr(record, "n_requested_dars"):
+            return record.n_requested_dars
         n_dars = record.dbgapdataaccessrequest_set.count()
         return n_dars
 
@@ -270,7 +356,9 @@ class dbGaPDataAccessRequestBySnapshotTable(dbGaPDataAccessRequestTable):
 
     dbgap_data_access_snapshot__dbgap_application__dbgap_project_id = None
     dbgap_data_access_snapshot__created = None
-    matching_workspaces = tables.columns.Column(accessor="get_dbgap_workspaces", orderable=False, default=" ")
+    matching_workspaces = tables.columns.Column(
+        accessor="pk", verbose_name="Matching workspaces", orderable=False, default=" "
+    )
     matching_studies = tables.columns.ManyToManyColumn(
         accessor="get_matching_studies",
         verbose_name="Studies",
@@ -294,22 +382,61 @@ class dbGaPDataAccessRequestBySnapshotTable(dbGaPDataAccessRequestTable):
             "matching_studies",
         )
 
-    def render_matching_workspaces(self, value, record):
-        contexts = []
-        for dbgap_workspace in value:
-            parent_groups = record.dbgap_data_access_snapshot.dbgap_application.anvil_access_group.get_all_parents()
-            try:
-                has_access = dbgap_workspace.workspace.has_group_in_authorization_domain(
-                    record.dbgap_data_access_snapshot.dbgap_application.anvil_access_group,
-                    all_parent_groups=parent_groups,
-                )
-            except WorkspaceAccessAuthorizationDomainUnknownError:
-                # Just auth domains managed by the app.
-                auth_domains_managed_by_app = dbgap_workspace.workspace.authorization_domains.filter(
-                    is_managed_by_app=True
-                )
-                has_access = set(auth_domains_managed_by_app).issubset(set(parent_groups))
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._matching_workspaces = None
 
+    def get_matching_workspaces(self, record):
+        """Return a list of (dbGaPWorkspace, has_access) tuples for the workspaces matching a DAR.
+
+        Matches for all DARs in the table are loaded the first time this method is called."""
+        if self._matching_workspaces is None:
+            self._matching_workspaces = self._load_matching_workspaces(list(self.data.data))
+        return self._matching_workspaces.get(record.pk, [])
+
+    @staticmethod
+    def _load_matching_workspaces(dars):
+        """Match a list of DARs to dbGaPWorkspaces, and check whether each application has access to each workspace.
+
+        Workspaces are matched as in `dbGaPDataAccessRequest.get_dbgap_workspaces`. All data is loaded in a fixed
+        number of queries, regardless of the number of DARs or workspaces.
+        """
+        access_group_pks = dict(
+            models.dbGaPDataAccessSnapshot.objects.filter(
+                pk__in={x.dbgap_data_access_snapshot_id for x in dars}
+            ).values_list("pk", "dbgap_application__anvil_access_group")
+        )
+        dbgap_workspaces = (
+            models.dbGaPWorkspace.objects.filter(
+                dbgap_study_accession__dbgap_phs__in={x.dbgap_phs for x in dars},
+                dbgap_consent_code__in={x.dbgap_consent_code for x in dars},
+            )
+            .select_related("dbgap_study_accession", "workspace__billing_project")
+            .prefetch_related("workspace__authorization_domains")
+            .order_by("dbgap_version")
+        )
+        workspaces_by_consent = defaultdict(list)
+        for dbgap_workspace in dbgap_workspaces:
+            # Just auth domains managed by the app.
+            dbgap_workspace.managed_auth_domain_pks = {
+                x.pk for x in dbgap_workspace.workspace.authorization_domains.all() if x.is_managed_by_app
+            }
+            key = (dbgap_workspace.dbgap_study_accession.dbgap_phs, dbgap_workspace.dbgap_consent_code)
+            workspaces_by_consent[key].append(dbgap_workspace)
+        closure = get_group_membership_closure()
+        matching_workspaces = {}
+        for dar in dars:
+            parent_group_pks = closure.get_all_parent_pks(access_group_pks[dar.dbgap_data_access_snapshot_id])
+            matching_workspaces[dar.pk] = [
+                (x, x.managed_auth_domain_pks.issubset(parent_group_pks))
+                for x in workspaces_by_consent[(dar.dbgap_phs, dar.dbgap_consent_code)]
+                if x.dbgap_version >= dar.original_version and x.dbgap_participant_set >= dar.original_participant_set
+            ]
+        return matching_workspaces
+
+    def render_matching_workspaces(self, record):
+        contexts = []
+        for dbgap_workspace, has_access in self.get_matching_workspaces(record):
             this_context = {
                 "icon": "check-circle-fill" if has_access else "x-square-fill",
                 "color": "green" if has_access else "red",
@@ -373,22 +500,15 @@ class dbGaPApplicationRecordsTable(tables.Table):
     principal_investigator__study_sites = tables.columns.ManyToManyColumn(
         verbose_name="Study site(s)",
     )
-    number_approved_dars = tables.columns.ManyToManyColumn(
-        accessor="dbgapdataaccesssnapshot_set",
-        filter=lambda qs: qs.filter(is_most_recent=True),
+    number_approved_dars = tables.columns.Column(
         verbose_name="Number of approved DARs",
-        transform=lambda obj: obj.dbgapdataaccessrequest_set.approved().count(),
+        orderable=False,
     )
-    number_requested_dars = tables.columns.ManyToManyColumn(
-        accessor="dbgapdataaccesssnapshot_set",
-        filter=lambda qs: qs.filter(is_most_recent=True),
+    number_requested_dars = tables.columns.Column(
         verbose_name="Number of requested DARs",
-        transform=lambda obj: obj.dbgapdataaccessrequest_set.count(),
-    )
-    last_update = ManyToManyDateTimeColumn(
-        accessor="dbgapdataaccesssnapshot_set",
-        filter=lambda qs: qs.filter(is_most_recent=True),
+        orderable=False,
     )
+    last_update = tables.columns.DateTimeColumn(format="DATETIME_FORMAT", orderable=False)
 
     class Meta:
         model = models.dbGaPApplication
@@ -397,3 +517,8 @@ class dbGaPApplicationRecordsTable(tables.Table):
             "principal_investigator",
         )
         order_by = ("dbgap_project_id",)
+
+    def __init__(self, data=None, *args, **kwargs):
+        if isinstance(data, QuerySet):
+            data = annotate_dbgap_application_dar_counts(data)
+        super().__init__(data, *args, **kwargs)
@@ -9,7 +9,9 @@ from anvil_consortium_manager.tests.factories import (
     WorkspaceAuthorizationDomainFactory,
 )
 from constance.test import override_config
+from django.db import connection
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 
@@ -175,6 +177,33 @@ class AccessAuditResultTest(TestCase):
                 has_access=False,
             )
 
+    def test_get_key(self):
+        """The key uses the dbGaP DAR id, so it is the same for a DAR in different snapshots."""
+        dbgap_workspace = factories.dbGaPWorkspaceFactory.create()
+        dar = factories.dbGaPDataAccessRequestFactory.create()
+        dbgap_application = dar.dbgap_data_access_snapshot.dbgap_application
+        new_snapshot = factories.dbGaPDataAccessSnapshotFactory.create(dbgap_application=dbgap_application)
+        new_dar = factories.dbGaPDataAccessRequestFactory.create(
+            dbgap_data_access_snapshot=new_snapshot, dbgap_dar_id=dar.dbgap_dar_id
+        )
+        key = access_audit.GrantAccess(
+            workspace=dbgap_workspace, dbgap_application=dbgap_application, data_access_request=dar, note="foo"
+        ).get_key()
+        new_key = access_audit.GrantAccess(
+            workspace=dbgap_workspace, dbgap_application=dbgap_application, data_access_request=new_dar, note="foo"
+        ).get_key()
+        self.assertEqual(key["data_access_request"], dar.dbgap_dar_id)
+        self.assertEqual(key, new_key)
+
+    def test_get_key_no_dar(self):
+        dbgap_workspace = factories.dbGaPWorkspaceFactory.create()
+        dbgap_application = factories.dbGaPApplicationFactory.create()
+        key = access_audit.GrantAccess(
+            workspace=dbgap_workspace, dbgap_application=dbgap_application, note="foo"
+        ).get_key()
+        self.assertNotIn("data_access_request", key)
+        self.assertEqual(key["dbgap_application"], "dbgap.dbGaPApplication:{}".format(dbgap_application.pk))
+
 
 class dbGaPAccessAuditTest(TestCase):
     """Tests for the dbGaPAccessAudit class."""
@@ -913,6 +942,111 @@ class dbGaPAccessAuditTest(TestCase):
     def test_two_applications_two_workspaces(self):
         pass
 
+    def test_verified_access_nested_group(self):
+        """run_audit with an access group that is in the auth domain via an intermediate group."""
+        dbgap_workspace = factories.dbGaPWorkspaceFactory.create()
+        dar = factories.dbGaPDataAccessRequestForWorkspaceFactory.create(dbgap_workspace=dbgap_workspace)
+        intermediate_group = ManagedGroupFactory.create()
+        GroupGroupMembershipFactory(
+            parent_group=dbgap_workspace.workspace.authorization_domains.get(),
+            child_group=intermediate_group,
+        )
+        GroupGroupMembershipFactory(
+            parent_group=intermediate_group,
+            child_group=dar.dbgap_data_access_snapshot.dbgap_application.anvil_access_group,
+        )
+        dbgap_audit = access_audit.dbGaPAccessAudit()
+        dbgap_audit.run_audit()
+        self.assertEqual(len(dbgap_audit.verified), 1)
+        self.assertEqual(len(dbgap_audit.needs_action), 0)
+        self.assertEqual(len(dbgap_audit.errors), 0)
+        record = dbgap_audit.verified[0]
+        self.assertIsInstance(record, access_audit.VerifiedAccess)
+        self.assertEqual(record.data_access_request, dar)
+
+    def test_verified_no_access_dar_version_greater_than_workspace(self):
+        """run_audit with a DAR for the same phs and consent code but a later version than the workspace."""
+        dbgap_workspace = factories.dbGaPWorkspaceFactory.create(dbgap_version=1)
+        factories.dbGaPDataAccessRequestForWorkspaceFactory.create(dbgap_workspace=dbgap_workspace, original_version=2)
+        dbgap_audit = access_audit.dbGaPAccessAudit()
+        dbgap_audit.run_audit()
+        self.assertEqual(len(dbgap_audit.verified), 1)
+        self.assertEqual(len(dbgap_audit.needs_action), 0)
+        self.assertEqual(len(dbgap_audit.errors), 0)
+        record = dbgap_audit.verified[0]
+        self.assertIsInstance(record, access_audit.VerifiedNoAccess)
+        self.assertIsNone(record.data_access_request)
+        self.assertEqual(record.note, access_audit.dbGaPAccessAudit.NO_DAR)
+
+    def test_audit_application_and_workspace_matches_run_audit(self):
+        """audit_application_and_workspace gives the same result as run_audit for a single pair."""
+        dbgap_workspace = factories.dbGaPWorkspaceFactory.create()
+        dbgap_application = factories.dbGaPApplicationFactory.create()
+        old_dar = factories.dbGaPDataAccessRequestForWorkspaceFactory.create(
+            dbgap_workspace=dbgap_workspace,
+            dbgap_data_access_snapshot__dbgap_application=dbgap_application,
+            dbgap_data_access_snapshot__is_most_recent=False,
+            dbgap_data_access_snapshot__created=timezone.now() - timedelta(weeks=3),
+            dbgap_current_status=models.dbGaPDataAccessRequest.APPROVED,
+        )
+        factories.dbGaPDataAccessRequestForWorkspaceFactory.create(
+            dbgap_dar_id=old_dar.dbgap_dar_id,
+            dbgap_workspace=dbgap_workspace,
+            dbgap_data_access_snapshot__dbgap_application=dbgap_application,
+            dbgap_data_access_snapshot__created=timezone.now() - timedelta(weeks=2),
+            dbgap_current_status=models.dbGaPDataAccessRequest.CLOSED,
+        )
+        GroupGroupMembershipFactory.create(
+            parent_group=dbgap_workspace.workspace.authorization_domains.get(),
+            child_group=dbgap_application.anvil_access_group,
+        )
+        bulk_audit = access_audit.dbGaPAccessAudit()
+        bulk_audit.run_audit()
+        single_audit = access_audit.dbGaPAccessAudit()
+        single_audit.audit_application_and_workspace(dbgap_application, dbgap_workspace)
+        single_audit.completed = True
+        self.assertEqual(len(bulk_audit.get_all_results()), 1)
+        self.assertEqual(len(single_audit.get_all_results()), 1)
+        bulk_result = bulk_audit.get_all_results()[0]
+        single_result = single_audit.get_all_results()[0]
+        self.assertEqual(type(bulk_result), type(single_result))
+        self.assertEqual(bulk_result.note, single_result.note)
+        self.assertEqual(bulk_result.data_access_request, single_result.data_access_request)
+
+    def test_number_of_queries_does_not_depend_on_number_of_applications_and_workspaces(self):
+        """run_audit uses the same number of queries regardless of the number of applications and workspaces."""
+        dbgap_workspace = factories.dbGaPWorkspaceFactory.create()
+        dar = factories.dbGaPDataAccessRequestForWorkspaceFactory.create(
+            dbgap_workspace=dbgap_workspace,
+            dbgap_current_status=models.dbGaPDataAccessRequest.CLOSED,
+        )
+        GroupGroupMembershipFactory.create(
+            parent_group=dbgap_workspace.workspace.authorization_domains.get(),
+            child_group=dar.dbgap_data_access_snapshot.dbgap_application.anvil_access_group,
+        )
+        # Run once so that the shared group membership closure is cached.
+        access_audit.dbGaPAccessAudit().run_audit()
+        dbgap_audit = access_audit.dbGaPAccessAudit()
+        with CaptureQueriesContext(connection) as one_pair_queries:
+            dbgap_audit.run_audit()
+        self.assertEqual(len(dbgap_audit.get_all_results()), 1)
+        # Add more applications and workspaces.
+        for _ in range(3):
+            other_workspace = factories.dbGaPWorkspaceFactory.create()
+            other_dar = factories.dbGaPDataAccessRequestForWorkspaceFactory.create(
+                dbgap_workspace=other_workspace,
+                dbgap_current_status=models.dbGaPDataAccessRequest.CLOSED,
+            )
+            GroupGroupMembershipFactory.create(
+                parent_group=other_workspace.workspace.authorization_domains.get(),
+                child_group=other_dar.dbgap_data_access_snapshot.dbgap_application.anvil_access_group,
+            )
+        dbgap_audit = access_audit.dbGaPAccessAudit()
+        with CaptureQueriesContext(connection) as many_pair_queries:
+            dbgap_audit.run_audit()
+        self.assertEqual(len(dbgap_audit.get_all_results()), 16)
+        self.assertEqual(len(many_pair_queries), len(one_pair_queries))
+
     def test_ok_with_verified_and_needs_action(self):
         # Create a workspace and matching DAR.
         dbgap_workspace = factories.dbGaPWorkspaceFactory.create()
@@ -1715,6 +1849,53 @@ class dbGaPCollaboratorAuditTest(TestCase):
         self.assertEqual(record.member, account_1)
         self.assertEqual(record.note, collaborator_audit.dbGaPCollaboratorAudit.PI_LINKED_ACCOUNT)
 
+    def test_number_of_queries_does_not_depend_on_number_of_members(self):
+        """run_audit uses the same number of queries regardless of the number of applications and members."""
+
+        def create_application():
+            dbgap_application = factories.dbGaPApplicationFactory.create()
+            AccountFactory.create(user=dbgap_application.principal_investigator, verified=True)
+            collaborator_account = AccountFactory.create(verified=True)
+            dbgap_application.collaborators.add(collaborator_account.user)
+            GroupAccountMembershipFactory.create(
+                group=dbgap_application.anvil_access_group, account=collaborator_account
+            )
+            GroupAccountMembershipFactory.create(group=dbgap_application.anvil_access_group)
+            GroupGroupMembershipFactory.create(parent_group=dbgap_application.anvil_access_group)
+
+        create_application()
+        # Run once so that the shared group membership closure is cached.
+        collaborator_audit.dbGaPCollaboratorAudit().run_audit()
+        collab_audit = collaborator_audit.dbGaPCollaboratorAudit()
+        with CaptureQueriesContext(connection) as one_application_queries:
+            collab_audit.run_audit()
+        self.assertEqual(len(collab_audit.get_all_results()), 4)
+        for _ in range(3):
+            create_application()
+        collab_audit = collaborator_audit.dbGaPCollaboratorAudit()
+        with CaptureQueriesContext(connection) as many_application_queries:
+            collab_audit.run_audit()
+        self.assertEqual(len(collab_audit.get_all_results()), 16)
+        self.assertEqual(len(many_application_queries), len(one_application_queries))
+
+    def test_run_audit_matches_audit_application_and_object(self):
+        """run_audit gives the same results as auditing each member individually."""
+        dbgap_application = factories.dbGaPApplicationFactory.create()
+        pi_account = AccountFactory.create(user=dbgap_application.principal_investigator, verified=True)
+        collaborator_account = AccountFactory.create(verified=True)
+        dbgap_application.collaborators.add(collaborator_account.user)
+        other_account = AccountFactory.create(verified=True)
+        GroupAccountMembershipFactory.create(group=dbgap_application.anvil_access_group, account=pi_account)
+        GroupAccountMembershipFactory.create(group=dbgap_application.anvil_access_group, account=other_account)
+        collab_audit = collaborator_audit.dbGaPCollaboratorAudit()
+        collab_audit.run_audit()
+        individual_audit = collaborator_audit.dbGaPCollaboratorAudit()
+        for obj in [dbgap_application.principal_investigator, collaborator_account.user, other_account]:
+            individual_audit.audit_application_and_object(dbgap_application, obj)
+        self.assertEqual(collab_audit.verified, individual_audit.verified)
+        self.assertEqual(collab_audit.needs_action, individual_audit.needs_action)
+        self.assertEqual(collab_audit.errors, individual_audit.errors)
+
     def test_queryset(self):
         """Audit only runs on the specified queryset of dbGaPApplications."""
         dbgap_application_1 = factories.dbGaPApplicationFactory.create()
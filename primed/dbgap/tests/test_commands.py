@@ -1,7 +1,10 @@
 """Tests for management commands in the `dbgap` app."""
 
+from datetime import timedelta
 from io import StringIO
+from unittest.mock import patch
 
+import responses
 from anvil_consortium_manager.tests.factories import (
     AccountFactory,
     GroupGroupMembershipFactory,
@@ -10,7 +13,15 @@ from django.contrib.sites.models import Site
 from django.core import mail
 from django.core.management import call_command
 from django.test import TestCase
+from django.utils import timezone
+from requests.exceptions import HTTPError
 
+from primed.primed_anvil.audit_results import get_audit_name
+from primed.primed_anvil.models import AuditRun, StoredAuditResults
+
+from .. import constants, helpers, models
+from ..audit import access_audit
+from ..management.commands import prune_dbgap_dar_snapshots
 from . import factories
 
 
@@ -174,6 +185,44 @@ class RunDbGaPAuditTest(TestCase):
             self.assertIn("Running dbGaP access audit... problems found.", out.getvalue())
             self.assertIn("https://foobar.com", out.getvalue())
 
+    def test_access_audit_changes_since_last_run(self):
+        """Test command output reporting changes since the last run."""
+        dbgap_workspace = factories.dbGaPWorkspaceFactory.create()
+        factories.dbGaPDataAccessRequestForWorkspaceFactory.create(dbgap_workspace=dbgap_workspace)
+        out = StringIO()
+        call_command("run_dbgap_audit", "--no-color", stdout=out)
+        expected_string = "\n".join(
+            [
+                "* Errors: 0",
+                "* New issues since last run: 1",
+                "* Resolved issues since last run: 0",
+            ]
+        )
+        self.assertIn(expected_string, out.getvalue())
+        # Running again does not report the same issue as new.
+        out = StringIO()
+        call_command("run_dbgap_audit", "--no-color", stdout=out)
+        expected_string = "\n".join(
+            [
+                "* Errors: 0",
+                "* New issues since last run: 0",
+                "* Resolved issues since last run: 0",
+            ]
+        )
+        self.assertIn(expected_string, out.getvalue())
+        self.assertEqual(AuditRun.objects.count(), 4)
+
+    def test_access_audit_changes_since_last_run_email(self):
+        """The email only lists changes since the last run if there are any."""
+        dbgap_workspace = factories.dbGaPWorkspaceFactory.create()
+        factories.dbGaPDataAccessRequestForWorkspaceFactory.create(dbgap_workspace=dbgap_workspace)
+        call_command("run_dbgap_audit", "--no-color", email="test@example.com", stdout=StringIO())
+        call_command("run_dbgap_audit", "--no-color", email="test@example.com", stdout=StringIO())
+        emails = [x for x in mail.outbox if x.subject == "dbGaPAccessAudit - problems found"]
+        self.assertEqual(len(emails), 2)
+        self.assertIn("Changes since last run", emails[0].alternatives[0][0])
+        self.assertNotIn("Changes since last run", emails[1].alternatives[0][0])
+
     def test_collaborator_audit_one_instance_verified(self):
         """Test command output with one verified instance."""
         # Create a workspace and matching DAR.
@@ -297,3 +346,203 @@ class RunDbGaPAuditTest(TestCase):
             call_command("run_dbgap_audit", "--no-color", stdout=out)
             self.assertIn("Running dbGaP collaborator audit... problems found.", out.getvalue())
             self.assertIn("https://foobar.com", out.getvalue())
+
+
+class FetchDbGaPDARSnapshotsTest(TestCase):
+    """Tests for the fetch_dbgap_dar_snapshots command."""
+
+    def add_project_report_response(self, project_jsons):
+        project_ids = sorted(x["Project_id"] for x in project_jsons)
+        responses.add(responses.GET, helpers.get_dbgap_dar_json_url(project_ids), json=project_jsons)
+
+    def add_study_version_response(self, phs):
+        responses.add(
+            responses.GET,
+            constants.DBGAP_STUDY_URL,
+            match=[responses.matchers.query_param_matcher({"study_id": phs})],
+            status=302,
+            headers={"Location": constants.DBGAP_STUDY_URL + "?study_id={}.v1.p1".format(phs)},
+        )
+
+    def test_no_dbgap_applications(self):
+        out = StringIO()
+        call_command("fetch_dbgap_dar_snapshots", "--no-color", stdout=out)
+        self.assertIn("No dbGaP applications.", out.getvalue())
+
+    @responses.activate
+    def test_new_snapshot(self):
+        dbgap_application = factories.dbGaPApplicationFactory.create()
+        project_json = factories.dbGaPJSONProjectFactory(dbgap_application=dbgap_application)
+        self.add_project_report_response([project_json])
+        self.add_study_version_response(project_json["studies"][0]["study_accession"])
+        out = StringIO()
+        call_command("fetch_dbgap_dar_snapshots", "--no-color", stdout=out)
+        self.assertIn("* Unchanged: 0", out.getvalue())
+        self.assertIn("* New snapshots: 1", out.getvalue())
+        snapshot = models.dbGaPDataAccessSnapshot.objects.get()
+        self.assertEqual(snapshot.dbgap_application, dbgap_application)
+        self.assertEqual(snapshot.dbgap_dar_data, project_json)
+        self.assertTrue(snapshot.is_most_recent)
+        self.assertEqual(snapshot.dbgapdataaccessrequest_set.count(), 1)
+
+    @responses.activate
+    def test_unchanged_snapshot(self):
+        """No snapshot is created if the json is the same as the most recent snapshot."""
+        dbgap_application = factories.dbGaPApplicationFactory.create()
+        project_json = factories.dbGaPJSONProjectFactory(dbgap_application=dbgap_application)
+        existing_snapshot = factories.dbGaPDataAccessSnapshotFactory.create(
+            dbgap_application=dbgap_application, dbgap_dar_data=project_json, is_most_recent=True
+        )
+        # Keys in a different order are not a change.
+        self.add_project_report_response([dict(reversed(list(project_json.items())))])
+        out = StringIO()
+        call_command("fetch_dbgap_dar_snapshots", "--no-color", stdout=out)
+        self.assertIn("* Unchanged: 1", out.getvalue())
+        self.assertIn("* New snapshots: 0", out.getvalue())
+        self.assertEqual(models.dbGaPDataAccessSnapshot.objects.get(), existing_snapshot)
+        # The snapshot is marked as checked.
+        existing_snapshot.refresh_from_db()
+        self.assertIsNotNone(existing_snapshot.last_checked)
+
+    @responses.activate
+    def test_changed_snapshot(self):
+        """A snapshot is created if the json has changed since the most recent snapshot."""
+        dbgap_application = factories.dbGaPApplicationFactory.create()
+        project_json = factories.dbGaPJSONProjectFactory(dbgap_application=dbgap_application)
+        existing_snapshot = factories.dbGaPDataAccessSnapshotFactory.create(
+            dbgap_application=dbgap_application, dbgap_dar_data=project_json, is_most_recent=True
+        )
+        new_project_json = factories.dbGaPJSONProjectFactory(dbgap_application=dbgap_application)
+        self.add_project_report_response([new_project_json])
+        self.add_study_version_response(new_project_json["studies"][0]["study_accession"])
+        out = StringIO()
+        call_command("fetch_dbgap_dar_snapshots", "--no-color", stdout=out)
+        self.assertIn("* New snapshots: 1", out.getvalue())
+        existing_snapshot.refresh_from_db()
+        self.assertFalse(existing_snapshot.is_most_recent)
+        new_snapshot = models.dbGaPDataAccessSnapshot.objects.latest("pk")
+        self.assertEqual(new_snapshot.dbgap_dar_data, new_project_json)
+        self.assertTrue(new_snapshot.is_most_recent)
+
+    @responses.activate
+    def test_base_url(self):
+        """The project report can be fetched from a different url."""
+        dbgap_application = factories.dbGaPApplicationFactory.create()
+        project_json = factories.dbGaPJSONProjectFactory(dbgap_application=dbgap_application)
+        factories.dbGaPDataAccessSnapshotFactory.create(
+            dbgap_application=dbgap_application, dbgap_dar_data=project_json, is_most_recent=True
+        )
+        url = helpers.get_dbgap_dar_json_url([dbgap_application.dbgap_project_id], base_url="http://localhost/report")
+        responses.add(responses.GET, url, json=[project_json])
+        out = StringIO()
+        call_command("fetch_dbgap_dar_snapshots", "--no-color", "--base-url", "http://localhost/report", stdout=out)
+        self.assertIn("* Unchanged: 1", out.getvalue())
+
+    @responses.activate
+    def test_http_error(self):
+        """No snapshots are created if the request fails."""
+        dbgap_application = factories.dbGaPApplicationFactory.create()
+        responses.add(responses.GET, helpers.get_dbgap_dar_json_url([dbgap_application.dbgap_project_id]), status=500)
+        with self.assertRaises(HTTPError):
+            call_command("fetch_dbgap_dar_snapshots", "--no-color", stdout=StringIO())
+        self.assertEqual(models.dbGaPDataAccessSnapshot.objects.count(), 0)
+
+
+class PruneDbGaPDARSnapshotsTest(TestCase):
+    """Tests for the prune_dbgap_dar_snapshots command."""
+
+    def setUp(self):
+        super().setUp()
+        self.dbgap_application = factories.dbGaPApplicationFactory.create()
+        self.project_json = factories.dbGaPJSONProjectFactory(dbgap_application=self.dbgap_application)
+
+    def create_snapshot(self, dbgap_dar_data, weeks_ago, is_most_recent=False):
+        snapshot = factories.dbGaPDataAccessSnapshotFactory.create(
+            dbgap_application=self.dbgap_application,
+            dbgap_dar_data=dbgap_dar_data,
+            created=timezone.now() - timedelta(weeks=weeks_ago),
+            is_most_recent=is_most_recent,
+        )
+        factories.dbGaPDataAccessRequestFactory.create(dbgap_data_access_snapshot=snapshot)
+        return snapshot
+
+    def test_no_snapshots(self):
+        out = StringIO()
+        call_command("prune_dbgap_dar_snapshots", "--no-color", "--confirm", stdout=out)
+        self.assertIn("* Unchanged snapshots: 0", out.getvalue())
+
+    def test_unchanged_snapshot(self):
+        """A snapshot that is unchanged from the previous snapshot is deleted, with its DARs."""
+        snapshot_1 = self.create_snapshot(self.project_json, 3)
+        self.create_snapshot(self.project_json, 2)
+        snapshot_3 = self.create_snapshot(self.project_json, 1, is_most_recent=True)
+        out = StringIO()
+        call_command("prune_dbgap_dar_snapshots", "--no-color", "--confirm", stdout=out)
+        self.assertIn("* Unchanged snapshots: 1", out.getvalue())
+        self.assertIn("* Deleted DARs: 1", out.getvalue())
+        self.assertQuerySetEqual(models.dbGaPDataAccessSnapshot.objects.order_by("created"), [snapshot_1, snapshot_3])
+        self.assertEqual(models.dbGaPDataAccessRequest.objects.count(), 2)
+
+    def test_unchanged_snapshot_history(self):
+        """History is recorded for the deleted snapshot and DARs."""
+        self.create_snapshot(self.project_json, 3)
+        snapshot = self.create_snapshot(self.project_json, 2)
+        dar = snapshot.dbgapdataaccessrequest_set.get()
+        call_command("prune_dbgap_dar_snapshots", "--no-color", "--confirm", stdout=StringIO())
+        self.assertTrue(models.dbGaPDataAccessSnapshot.history.filter(id=snapshot.pk, history_type="-").exists())
+        self.assertTrue(models.dbGaPDataAccessRequest.history.filter(id=dar.pk, history_type="-").exists())
+
+    def test_unchanged_snapshot_marks_audit_results_stale(self):
+        """Stored access audit results for the application are marked stale."""
+        self.create_snapshot(self.project_json, 3)
+        self.create_snapshot(self.project_json, 2)
+        stored = StoredAuditResults.objects.create(
+            audit_name=get_audit_name(access_audit.dbGaPAccessAudit),
+            subject_pk=self.dbgap_application.pk,
+            results=[],
+        )
+        call_command("prune_dbgap_dar_snapshots", "--no-color", "--confirm", stdout=StringIO())
+        stored.refresh_from_db()
+        self.assertTrue(stored.is_stale)
+
+    def test_unchanged_snapshots_multiple_batches(self):
+        """Snapshots are deleted in batches."""
+        for weeks_ago in range(5, 0, -1):
+            self.create_snapshot(self.project_json, weeks_ago)
+        out = StringIO()
+        with patch.object(prune_dbgap_dar_snapshots.Command, "batch_size", 2):
+            call_command("prune_dbgap_dar_snapshots", "--no-color", "--confirm", stdout=out)
+        self.assertIn("* Unchanged snapshots: 4", out.getvalue())
+        self.assertIn("* Deleted DARs: 4", out.getvalue())
+        self.assertEqual(models.dbGaPDataAccessSnapshot.objects.count(), 1)
+        self.assertEqual(models.dbGaPDataAccessRequest.objects.count(), 1)
+
+    def test_changed_snapshots(self):
+        """Snapshots are kept when the json changes, even if it changes back."""
+        other_project_json = factories.dbGaPJSONProjectFactory(dbgap_application=self.dbgap_application)
+        self.create_snapshot(self.project_json, 3)
+        self.create_snapshot(other_project_json, 2)
+        self.create_snapshot(self.project_json, 1, is_most_recent=True)
+        out = StringIO()
+        call_command("prune_dbgap_dar_snapshots", "--no-color", "--confirm", stdout=out)
+        self.assertIn("* Unchanged snapshots: 0", out.getvalue())
+        self.assertEqual(models.dbGaPDataAccessSnapshot.objects.count(), 3)
+
+    def test_different_applications(self):
+        """Snapshots for different applications are not compared."""
+        self.create_snapshot(self.project_json, 2)
+        factories.dbGaPDataAccessSnapshotFactory.create(dbgap_dar_data=self.project_json, is_most_recent=False)
+        call_command("prune_dbgap_dar_snapshots", "--no-color", "--confirm", stdout=StringIO())
+        self.assertEqual(models.dbGaPDataAccessSnapshot.objects.count(), 2)
+
+    def test_no_confirm(self):
+        """Snapshots are not deleted without --confirm."""
+        self.create_snapshot(self.project_json, 3)
+        self.create_snapshot(self.project_json, 2)
+        out = StringIO()
+        call_command("prune_dbgap_dar_snapshots", "--no-color", stdout=out)
+        self.assertIn("* Unchanged snapshots: 1", out.getvalue())
+        self.assertIn("Run with --confirm", out.getvalue())
+        self.assertNotIn("* Deleted DARs", out.getvalue())
+        self.assertEqual(models.dbGaPDataAccessSnapshot.objects.count(), 2)
+        self.assertEqual(models.dbGaPDataAccessRequest.objects.count(), 2)
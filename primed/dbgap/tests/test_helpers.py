@@ -1,6 +1,12 @@
+from unittest.mock import patch
+
+import jsonschema
+import responses
 from django.test import TestCase
+from requests.exceptions import HTTPError
 
-from .. import helpers
+from .. import constants, helpers
+from . import factories
 
 
 class TestHelperMethods(TestCase):
@@ -17,3 +23,103 @@ class TestHelperMethods(TestCase):
     def test_get_dbgap_dar_json_url_one_project_not_list(self):
         """get_dbgap_dar_json_url returns a string when one project id is specified but not in a list."""
         self.assertIsInstance(helpers.get_dbgap_dar_json_url(1), str)
+
+
+class GetCurrentStudyVersionsTest(TestCase):
+    """Tests for the get_current_study_versions method."""
+
+    def add_response(self, phs, version, participant_set):
+        return responses.add(
+            responses.GET,
+            constants.DBGAP_STUDY_URL,
+            match=[responses.matchers.query_param_matcher({"study_id": "phs{:06d}".format(phs)})],
+            status=302,
+            headers={
+                "Location": constants.DBGAP_STUDY_URL
+                + "?study_id=phs{:06d}.v{}.p{}".format(phs, version, participant_set)
+            },
+        )
+
+    @responses.activate
+    def test_no_studies(self):
+        self.assertEqual(helpers.get_current_study_versions([]), {})
+
+    @responses.activate
+    def test_two_studies(self):
+        self.add_response(421, 32, 18)
+        self.add_response(896, 2, 1)
+        self.assertEqual(helpers.get_current_study_versions([421, 896]), {421: (32, 18), 896: (2, 1)})
+
+    @responses.activate
+    def test_duplicated_study(self):
+        """Each study is only looked up once."""
+        response = self.add_response(421, 32, 18)
+        self.assertEqual(helpers.get_current_study_versions([421, 421]), {421: (32, 18)})
+        self.assertEqual(response.call_count, 1)
+
+    @responses.activate
+    def test_cached(self):
+        """Studies are not looked up again while they are cached."""
+        response_1 = self.add_response(421, 32, 18)
+        response_2 = self.add_response(896, 2, 1)
+        helpers.get_current_study_versions([421])
+        self.assertEqual(helpers.get_current_study_versions([421, 896]), {421: (32, 18), 896: (2, 1)})
+        self.assertEqual(response_1.call_count, 1)
+        self.assertEqual(response_2.call_count, 1)
+
+    @responses.activate
+    def test_error(self):
+        responses.add(responses.GET, constants.DBGAP_STUDY_URL, status=404)
+        with self.assertRaises(HTTPError):
+            helpers.get_current_study_versions([421])
+
+
+class ValidateDARJSONTest(TestCase):
+    """Tests for the JSON validation helpers."""
+
+    def test_validate_dar_json(self):
+        project_json = factories.dbGaPJSONProjectFactory()
+        data = helpers.validate_dar_json([project_json])
+        self.assertEqual(data, [project_json])
+        self.assertIsInstance(data[0], helpers.ValidatedProjectDARData)
+
+    def test_validate_dar_json_invalid(self):
+        with self.assertRaises(jsonschema.exceptions.ValidationError):
+            helpers.validate_dar_json([])
+
+    def test_validate_project_dar_json(self):
+        project_json = factories.dbGaPJSONProjectFactory()
+        data = helpers.validate_project_dar_json(project_json)
+        self.assertEqual(data, project_json)
+        self.assertIsInstance(data, helpers.ValidatedProjectDARData)
+
+    def test_validate_project_dar_json_invalid(self):
+        project_json = factories.dbGaPJSONProjectFactory()
+        project_json.pop("studies")
+        with self.assertRaises(jsonschema.exceptions.ValidationError):
+            helpers.validate_project_dar_json(project_json)
+
+    def test_validate_project_dar_json_already_validated(self):
+        """Json that is marked as validated is not validated again."""
+        data = helpers.validate_project_dar_json(factories.dbGaPJSONProjectFactory())
+        with patch.object(helpers, "PROJECT_DAR_JSON_VALIDATOR") as mock_validator:
+            self.assertIs(helpers.validate_project_dar_json(data), data)
+        mock_validator.iter_errors.assert_not_called()
+
+    def test_get_json_validation_error_message_array(self):
+        """The repr of an array instance is not included in the message."""
+        project_json = factories.dbGaPJSONProjectFactory()
+        with self.assertRaises(jsonschema.exceptions.ValidationError) as e:
+            helpers.validate_dar_json({"projects": [project_json]})
+        message = helpers.get_json_validation_error_message(e.exception)
+        self.assertIn("JSON object", message)
+        self.assertNotIn(project_json["PI_name"], message)
+
+    def test_get_json_validation_error_message_path(self):
+        """The path to the invalid element is included in the message."""
+        project_json = factories.dbGaPJSONProjectFactory()
+        project_json["studies"] = "foo"
+        with self.assertRaises(jsonschema.exceptions.ValidationError) as e:
+            helpers.validate_dar_json([project_json])
+        message = helpers.get_json_validation_error_message(e.exception)
+        self.assertIn("$[0].studies", message)
@@ -12,9 +12,11 @@ from anvil_consortium_manager.tests.factories import (
 )
 from constance.test import override_config
 from django.core.exceptions import ValidationError
+from django.db import connection
 from django.db.models import ProtectedError
 from django.db.utils import IntegrityError
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from faker import Faker
 
@@ -1095,6 +1097,59 @@ class dbGaPDataAccessSnapshotTest(TestCase):
         self.assertEqual(updated_dar.original_version, 33)
         self.assertEqual(updated_dar.original_participant_set, 19)
 
+    @responses.activate
+    def test_dbgap_create_dars_from_json_one_request_per_phs(self):
+        """dbGaP is only queried once for each phs, even with multiple new DARs."""
+        dbgap_application = factories.dbGaPApplicationFactory.create()
+        study_json_1 = factories.dbGaPJSONStudyFactory(
+            study_accession="phs000421",
+            requests=factories.dbGaPJSONRequestFactory.create_batch(3, current_DAR_status="approved"),
+        )
+        study_json_2 = factories.dbGaPJSONStudyFactory(
+            study_accession="phs000896",
+            requests=factories.dbGaPJSONRequestFactory.create_batch(2, current_DAR_status="approved"),
+        )
+        project_json = factories.dbGaPJSONProjectFactory(
+            Project_id=dbgap_application.dbgap_project_id, studies=[study_json_1, study_json_2]
+        )
+        # One of the DARs has a previous DAR.
+        previous_dar = factories.dbGaPDataAccessRequestFactory.create(
+            dbgap_data_access_snapshot__dbgap_application=dbgap_application,
+            dbgap_dar_id=study_json_1["requests"][0]["DAR"],
+            dbgap_phs=421,
+            dbgap_consent_code=study_json_1["requests"][0]["consent_code"],
+            dbgap_current_status="approved",
+            original_version=30,
+            original_participant_set=17,
+        )
+        dbgap_snapshot = factories.dbGaPDataAccessSnapshotFactory.create(
+            dbgap_application=dbgap_application,
+            dbgap_dar_data=project_json,
+        )
+        response_1 = responses.add(
+            responses.GET,
+            constants.DBGAP_STUDY_URL,
+            match=[responses.matchers.query_param_matcher({"study_id": "phs000421"})],
+            status=302,
+            headers={"Location": constants.DBGAP_STUDY_URL + "?study_id=phs000421.v32.p18"},
+        )
+        response_2 = responses.add(
+            responses.GET,
+            constants.DBGAP_STUDY_URL,
+            match=[responses.matchers.query_param_matcher({"study_id": "phs000896"})],
+            status=302,
+            headers={"Location": constants.DBGAP_STUDY_URL + "?study_id=phs000896.v2.p1"},
+        )
+        dars = dbgap_snapshot.create_dars_from_json()
+        self.assertEqual(len(dars), 5)
+        self.assertEqual(response_1.call_count, 1)
+        self.assertEqual(response_2.call_count, 1)
+        self.assertEqual(
+            [(x.dbgap_phs, x.original_version, x.original_participant_set) for x in dars],
+            [(421, 30, 17), (421, 32, 18), (421, 32, 18), (896, 2, 1), (896, 2, 1)],
+        )
+        self.assertEqual(dars[0].dbgap_dar_id, previous_dar.dbgap_dar_id)
+
     @responses.activate
     def test_created_dars_from_json_assertion_error_phs(self):
         """Test that an AssertionError is raised when phs in updated json is unexpected for DAR ID."""
@@ -1268,6 +1323,15 @@ class dbGaPDataAccessSnapshotTest(TestCase):
             snapshot = factories.dbGaPDataAccessSnapshotFactory.create()
         self.assertFalse(snapshot.is_outdated())
 
+    @override_config(DBGAP_SNAPSHOT_OLD_DATE=date(2026, 5, 30))
+    def test_is_outdated_checked_after_old_date(self):
+        """A snapshot created before the old date is not outdated if it was checked after the old date."""
+        with time_machine.travel(datetime(2026, 5, 29, 12, 0, 0, tzinfo=timezone.get_default_timezone()), tick=False):
+            snapshot = factories.dbGaPDataAccessSnapshotFactory.create()
+        self.assertTrue(snapshot.is_outdated())
+        snapshot.last_checked = datetime(2026, 5, 31, 12, 0, 0, tzinfo=timezone.get_default_timezone())
+        self.assertFalse(snapshot.is_outdated())
+
     @override_config(DBGAP_SNAPSHOT_OLD_DATE=date(2026, 5, 15))
     def test_is_outdated_timezones(self):
         # Invalid snapshot in default timezone but not local timezone.
@@ -1282,6 +1346,196 @@ class dbGaPDataAccessSnapshotTest(TestCase):
         with time_machine.travel(datetime(2026, 5, 14, 23, 59, 59, tzinfo=ZoneInfo("America/Anchorage")), tick=False):
             self.assertFalse(snapshot.is_outdated())
 
+    def add_study_version_response(self, phs, version, participant_set):
+        responses.add(
+            responses.GET,
+            constants.DBGAP_STUDY_URL,
+            match=[responses.matchers.query_param_matcher({"study_id": phs})],
+            status=302,
+            headers={
+                "Location": constants.DBGAP_STUDY_URL + "?study_id={}.v{}.p{}".format(phs, version, participant_set)
+            },
+        )
+
+    @responses.activate
+    def test_create_from_json_two_projects(self):
+        """Can create snapshots and DARs for two projects."""
+        dbgap_application_1 = factories.dbGaPApplicationFactory.create()
+        dbgap_application_2 = factories.dbGaPApplicationFactory.create()
+        project_json_1 = factories.dbGaPJSONProjectFactory(dbgap_application=dbgap_application_1)
+        project_json_2 = factories.dbGaPJSONProjectFactory(dbgap_application=dbgap_application_2)
+        self.add_study_version_response(project_json_1["studies"][0]["study_accession"], 2, 1)
+        self.add_study_version_response(project_json_2["studies"][0]["study_accession"], 3, 2)
+        snapshots = models.dbGaPDataAccessSnapshot.create_from_json([project_json_1, project_json_2])
+        self.assertEqual(len(snapshots), 2)
+        self.assertEqual(snapshots[0].dbgap_application, dbgap_application_1)
+        self.assertEqual(snapshots[0].dbgap_dar_data, project_json_1)
+        self.assertTrue(snapshots[0].is_most_recent)
+        self.assertEqual(snapshots[1].dbgap_application, dbgap_application_2)
+        self.assertEqual(snapshots[1].dbgap_dar_data, project_json_2)
+        self.assertTrue(snapshots[1].is_most_recent)
+        dar = models.dbGaPDataAccessRequest.objects.get(dbgap_data_access_snapshot=snapshots[0])
+        self.assertEqual(dar.dbgap_dar_id, project_json_1["studies"][0]["requests"][0]["DAR"])
+        self.assertEqual((dar.original_version, dar.original_participant_set), (2, 1))
+        dar = models.dbGaPDataAccessRequest.objects.get(dbgap_data_access_snapshot=snapshots[1])
+        self.assertEqual(dar.dbgap_dar_id, project_json_2["studies"][0]["requests"][0]["DAR"])
+        self.assertEqual((dar.original_version, dar.original_participant_set), (3, 2))
+
+    @responses.activate
+    def test_create_from_json_updates_is_most_recent(self):
+        """Previous snapshots for the projects are no longer the most recent."""
+        dbgap_application = factories.dbGaPApplicationFactory.create()
+        previous_snapshot = factories.dbGaPDataAccessSnapshotFactory.create(
+            dbgap_application=dbgap_application, is_most_recent=True
+        )
+        other_snapshot = factories.dbGaPDataAccessSnapshotFactory.create(is_most_recent=True)
+        project_json = factories.dbGaPJSONProjectFactory(dbgap_application=dbgap_application)
+        self.add_study_version_response(project_json["studies"][0]["study_accession"], 2, 1)
+        snapshots = models.dbGaPDataAccessSnapshot.create_from_json([project_json])
+        self.assertTrue(snapshots[0].is_most_recent)
+        previous_snapshot.refresh_from_db()
+        self.assertFalse(previous_snapshot.is_most_recent)
+        other_snapshot.refresh_from_db()
+        self.assertTrue(other_snapshot.is_most_recent)
+
+    @responses.activate
+    def test_create_from_json_updates_is_most_recent_history(self):
+        """History is recorded when previous snapshots are no longer the most recent."""
+        dbgap_application = factories.dbGaPApplicationFactory.create()
+        previous_snapshot = factories.dbGaPDataAccessSnapshotFactory.create(
+            dbgap_application=dbgap_application, is_most_recent=True
+        )
+        project_json = factories.dbGaPJSONProjectFactory(dbgap_application=dbgap_application)
+        self.add_study_version_response(project_json["studies"][0]["study_accession"], 2, 1)
+        models.dbGaPDataAccessSnapshot.create_from_json([project_json])
+        self.assertEqual(previous_snapshot.history.count(), 2)
+        latest = previous_snapshot.history.latest()
+        self.assertEqual(latest.history_type, "~")
+        self.assertFalse(latest.is_most_recent)
+
+    @responses.activate
+    def test_create_from_json_duplicated_project(self):
+        """The last snapshot for a project that appears twice is the most recent."""
+        dbgap_application = factories.dbGaPApplicationFactory.create()
+        project_json = factories.dbGaPJSONProjectFactory(dbgap_application=dbgap_application)
+        self.add_study_version_response(project_json["studies"][0]["study_accession"], 2, 1)
+        snapshots = models.dbGaPDataAccessSnapshot.create_from_json([project_json, project_json])
+        self.assertFalse(snapshots[0].is_most_recent)
+        self.assertTrue(snapshots[1].is_most_recent)
+        self.assertEqual(models.dbGaPDataAccessRequest.objects.count(), 2)
+
+    @responses.activate
+    def test_create_from_json_unchanged_project(self):
+        """A snapshot is created for a project whose json is unchanged, unless skip_unchanged is True."""
+        dbgap_application = factories.dbGaPApplicationFactory.create()
+        project_json = factories.dbGaPJSONProjectFactory(dbgap_application=dbgap_application)
+        previous_snapshot = factories.dbGaPDataAccessSnapshotFactory.create(
+            dbgap_application=dbgap_application, dbgap_dar_data=project_json, is_most_recent=True
+        )
+        self.add_study_version_response(project_json["studies"][0]["study_accession"], 2, 1)
+        snapshots = models.dbGaPDataAccessSnapshot.create_from_json([project_json])
+        self.assertEqual(len(snapshots), 1)
+        previous_snapshot.refresh_from_db()
+        self.assertFalse(previous_snapshot.is_most_recent)
+
+    def test_create_from_json_skip_unchanged(self):
+        """No snapshot is created for a project whose json is unchanged if skip_unchanged is True."""
+        dbgap_application = factories.dbGaPApplicationFactory.create()
+        project_json = factories.dbGaPJSONProjectFactory(dbgap_application=dbgap_application)
+        previous_snapshot = factories.dbGaPDataAccessSnapshotFactory.create(
+            dbgap_application=dbgap_application, dbgap_dar_data=project_json, is_most_recent=True
+        )
+        self.assertIsNone(previous_snapshot.last_checked)
+        # Keys in a different order are not a change.
+        snapshots = models.dbGaPDataAccessSnapshot.create_from_json(
+            [dict(reversed(list(project_json.items())))], skip_unchanged=True
+        )
+        self.assertEqual(snapshots, [])
+        self.assertEqual(models.dbGaPDataAccessSnapshot.objects.get(), previous_snapshot)
+        previous_snapshot.refresh_from_db()
+        self.assertTrue(previous_snapshot.is_most_recent)
+        self.assertIsNotNone(previous_snapshot.last_checked)
+        # The check is recorded in the history.
+        self.assertIsNotNone(previous_snapshot.history.latest().last_checked)
+
+    @responses.activate
+    def test_create_from_json_skip_unchanged_changed_project(self):
+        """A snapshot is created for a project whose json has changed if skip_unchanged is True."""
+        dbgap_application = factories.dbGaPApplicationFactory.create()
+        previous_snapshot = factories.dbGaPDataAccessSnapshotFactory.create(
+            dbgap_application=dbgap_application, is_most_recent=True
+        )
+        project_json = factories.dbGaPJSONProjectFactory(dbgap_application=dbgap_application)
+        self.add_study_version_response(project_json["studies"][0]["study_accession"], 2, 1)
+        snapshots = models.dbGaPDataAccessSnapshot.create_from_json([project_json], skip_unchanged=True)
+        self.assertEqual(len(snapshots), 1)
+        self.assertTrue(snapshots[0].is_most_recent)
+        previous_snapshot.refresh_from_db()
+        self.assertFalse(previous_snapshot.is_most_recent)
+        self.assertIsNone(previous_snapshot.last_checked)
+
+    def test_get_unchanged_project_ids(self):
+        dbgap_application_1 = factories.dbGaPApplicationFactory.create()
+        project_json_1 = factories.dbGaPJSONProjectFactory(dbgap_application=dbgap_application_1)
+        factories.dbGaPDataAccessSnapshotFactory.create(
+            dbgap_application=dbgap_application_1, dbgap_dar_data=project_json_1, is_most_recent=True
+        )
+        dbgap_application_2 = factories.dbGaPApplicationFactory.create()
+        factories.dbGaPDataAccessSnapshotFactory.create(dbgap_application=dbgap_application_2, is_most_recent=True)
+        project_json_2 = factories.dbGaPJSONProjectFactory(dbgap_application=dbgap_application_2)
+        project_json_3 = factories.dbGaPJSONProjectFactory(dbgap_application=factories.dbGaPApplicationFactory.create())
+        self.assertEqual(
+            models.dbGaPDataAccessSnapshot.get_unchanged_project_ids([project_json_1, project_json_2, project_json_3]),
+            {dbgap_application_1.dbgap_project_id},
+        )
+
+    def test_create_from_json_missing_application(self):
+        project_json = factories.dbGaPJSONProjectFactory()
+        with self.assertRaises(models.dbGaPApplication.DoesNotExist):
+            models.dbGaPDataAccessSnapshot.create_from_json([project_json])
+        self.assertEqual(models.dbGaPDataAccessSnapshot.objects.count(), 0)
+
+    @responses.activate
+    def test_create_from_json_duplicate_dar_id(self):
+        """A ValidationError is raised if a DAR ID appears twice in a project."""
+        dbgap_application = factories.dbGaPApplicationFactory.create()
+        study_json = factories.dbGaPJSONStudyFactory(
+            study_accession="phs000421",
+            requests=[factories.dbGaPJSONRequestFactory(DAR=1234), factories.dbGaPJSONRequestFactory(DAR=1234)],
+        )
+        project_json = factories.dbGaPJSONProjectFactory(dbgap_application=dbgap_application, studies=[study_json])
+        self.add_study_version_response("phs000421", 2, 1)
+        with self.assertRaises(ValidationError):
+            models.dbGaPDataAccessSnapshot.create_from_json([project_json])
+        self.assertEqual(models.dbGaPDataAccessRequest.objects.count(), 0)
+
+    @responses.activate
+    def test_create_from_json_number_of_dar_queries(self):
+        """DARs for all projects are created with a single insert."""
+        project_jsons = [
+            factories.dbGaPJSONProjectFactory(
+                dbgap_application=factories.dbGaPApplicationFactory.create(),
+                studies=[
+                    factories.dbGaPJSONStudyFactory(
+                        study_accession="phs000421",
+                        requests=[factories.dbGaPJSONRequestFactory(consent_code=i + 1) for i in range(3)],
+                    )
+                ],
+            )
+            for _ in range(3)
+        ]
+        self.add_study_version_response("phs000421", 2, 1)
+        with CaptureQueriesContext(connection) as context:
+            models.dbGaPDataAccessSnapshot.create_from_json(project_jsons)
+        dar_table = models.dbGaPDataAccessRequest._meta.db_table
+        dar_inserts = [
+            x
+            for x in context.captured_queries
+            if x["sql"].startswith("INSERT") and x["sql"].split()[2].strip('"`') == dar_table
+        ]
+        self.assertEqual(len(dar_inserts), 1)
+        self.assertEqual(models.dbGaPDataAccessRequest.objects.count(), 9)
+
 
 class dbGaPDataAccessRequestTest(TestCase):
     """Tests for the dbGaPDataAccessRequest model."""
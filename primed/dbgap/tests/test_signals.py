@@ -0,0 +1,84 @@
+"""Tests for the `signals.py` module."""
+
+from anvil_consortium_manager.tests.factories import (
+    GroupAccountMembershipFactory,
+    GroupGroupMembershipFactory,
+    ManagedGroupFactory,
+)
+from constance.signals import config_updated
+from django.test import TestCase
+
+from primed.primed_anvil.audit_results import get_audit_name, get_stored_audit
+from primed.primed_anvil.models import StoredAuditResults
+from primed.users.tests.factories import UserFactory
+
+from ..audit import access_audit, collaborator_audit
+from . import factories
+
+
+class StoredAuditResultsSignalsTest(TestCase):
+    """Tests that signal handlers mark stored dbGaP audit results as stale."""
+
+    def setUp(self):
+        self.dbgap_application = factories.dbGaPApplicationFactory.create()
+        self.other_application = factories.dbGaPApplicationFactory.create()
+        self.dbgap_workspace = factories.dbGaPWorkspaceFactory.create()
+        get_stored_audit(access_audit.dbGaPAccessAudit)
+        get_stored_audit(collaborator_audit.dbGaPCollaboratorAudit)
+
+    def get_stale_pks(self, audit_class):
+        return set(
+            StoredAuditResults.objects.filter(audit_name=get_audit_name(audit_class), is_stale=True).values_list(
+                "subject_pk", flat=True
+            )
+        )
+
+    def test_group_account_membership(self):
+        GroupAccountMembershipFactory.create(group=self.dbgap_application.anvil_access_group)
+        self.assertEqual(self.get_stale_pks(collaborator_audit.dbGaPCollaboratorAudit), {self.dbgap_application.pk})
+        self.assertEqual(self.get_stale_pks(access_audit.dbGaPAccessAudit), set())
+
+    def test_group_group_membership(self):
+        auth_domain = ManagedGroupFactory.create()
+        membership = GroupGroupMembershipFactory.create(
+            parent_group=auth_domain, child_group=self.dbgap_application.anvil_access_group
+        )
+        self.assertEqual(self.get_stale_pks(access_audit.dbGaPAccessAudit), {self.dbgap_application.pk})
+        StoredAuditResults.objects.update(is_stale=False)
+        membership.delete()
+        self.assertEqual(self.get_stale_pks(access_audit.dbGaPAccessAudit), {self.dbgap_application.pk})
+
+    def test_unrelated_group_membership(self):
+        GroupAccountMembershipFactory.create(group=ManagedGroupFactory.create())
+        GroupGroupMembershipFactory.create()
+        self.assertFalse(StoredAuditResults.objects.filter(is_stale=True).exists())
+
+    def test_collaborators(self):
+        self.dbgap_application.collaborators.add(UserFactory.create())
+        self.assertEqual(self.get_stale_pks(collaborator_audit.dbGaPCollaboratorAudit), {self.dbgap_application.pk})
+
+    def test_snapshot(self):
+        factories.dbGaPDataAccessSnapshotFactory.create(dbgap_application=self.dbgap_application)
+        self.assertEqual(self.get_stale_pks(access_audit.dbGaPAccessAudit), {self.dbgap_application.pk})
+
+    def test_workspace(self):
+        factories.dbGaPWorkspaceFactory.create()
+        self.assertEqual(
+            self.get_stale_pks(access_audit.dbGaPAccessAudit),
+            {self.dbgap_application.pk, self.other_application.pk},
+        )
+
+    def test_workspace_authorization_domains(self):
+        self.dbgap_workspace.workspace.authorization_domains.add(ManagedGroupFactory.create())
+        self.assertEqual(
+            self.get_stale_pks(access_audit.dbGaPAccessAudit),
+            {self.dbgap_application.pk, self.other_application.pk},
+        )
+
+    def test_snapshot_old_date_updated(self):
+        config_updated.send(sender=None, key="DBGAP_SNAPSHOT_OLD_DATE", old_value=None, new_value=None)
+        self.assertEqual(
+            self.get_stale_pks(access_audit.dbGaPAccessAudit),
+            {self.dbgap_application.pk, self.other_application.pk},
+        )
+        self.assertEqual(self.get_stale_pks(collaborator_audit.dbGaPCollaboratorAudit), set())
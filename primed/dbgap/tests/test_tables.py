@@ -4,8 +4,10 @@ from datetime import timedelta
 
 from anvil_consortium_manager import models as acm_models
 from anvil_consortium_manager.tests.factories import GroupGroupMembershipFactory, WorkspaceAuthorizationDomainFactory
+from django.db import connection
 from django.db.models import Count
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from freezegun import freeze_time
 
@@ -13,6 +15,15 @@ from .. import models, tables
 from . import factories
 
 
+def count_queries_to_render(table, column_names):
+    """Return the number of queries needed to render the given columns for all rows of a table."""
+    with CaptureQueriesContext(connection) as context:
+        for row in table.rows:
+            for column_name in column_names:
+                row.get_cell(column_name)
+    return len(context.captured_queries)
+
+
 class dbGaPAccessionColumnTest(TestCase):
     """Tests for the dbGaPAccessionColumn class."""
 
@@ -172,6 +183,32 @@ class dbGaPWorkspaceStaffTableTest(TestCase):
         table = self.table_class(self.model.objects.all())
         self.assertEqual(table.render_number_approved_dars(instance.workspace), 0)
 
+    def test_number_approved_dars_annotated(self):
+        """The number of approved DARs is annotated on the table data."""
+        instance_1 = self.model_factory.create()
+        factories.dbGaPDataAccessRequestForWorkspaceFactory.create_batch(2, dbgap_workspace=instance_1)
+        factories.dbGaPDataAccessRequestForWorkspaceFactory.create(
+            dbgap_workspace=instance_1,
+            dbgap_current_status=models.dbGaPDataAccessRequest.REJECTED,
+        )
+        factories.dbGaPDataAccessRequestForWorkspaceFactory.create(
+            dbgap_workspace=instance_1, dbgap_data_access_snapshot__is_most_recent=False
+        )
+        instance_2 = self.model_factory.create()
+        table = self.table_class(self.model.objects.filter(pk__in=[instance_1.pk, instance_2.pk]).order_by("pk"))
+        self.assertEqual(table.rows[0].get_cell_value("number_approved_dars"), "2")
+        self.assertEqual(table.rows[1].get_cell_value("number_approved_dars"), "0")
+
+    def test_number_approved_dars_number_of_queries(self):
+        """The number of queries to render approved DAR counts does not depend on the number of workspaces."""
+        instance = self.model_factory.create()
+        factories.dbGaPDataAccessRequestForWorkspaceFactory.create(dbgap_workspace=instance)
+        n_queries = count_queries_to_render(self.table_class(self.model.objects.all()), ["number_approved_dars"])
+        for instance in self.model_factory.create_batch(3):
+            factories.dbGaPDataAccessRequestForWorkspaceFactory.create(dbgap_workspace=instance)
+        table = self.table_class(self.model.objects.all())
+        self.assertEqual(count_queries_to_render(table, ["number_approved_dars"]), n_queries)
+
     # def test_render_is_shared_not_shared(self):
     #     """render_is_shared works correctly when the workspace is not shared with anyone."""
     #     factories.ManagedGroupFactory.create(name="PRIMED_ALL")
@@ -393,6 +430,33 @@ class dbGaPApplicationTableTest(TestCase):
         self.assertEqual(table.rows[0].get_cell_value("number_requested_dars"), "2")
         self.assertEqual(table.rows[1].get_cell_value("number_requested_dars"), "1")
 
+    def test_number_dars_only_most_recent_snapshot(self):
+        """DAR counts only include DARs in the most recent snapshot."""
+        dbgap_application = self.model_factory.create()
+        old_snapshot = factories.dbGaPDataAccessSnapshotFactory.create(
+            dbgap_application=dbgap_application,
+            created=timezone.now() - timedelta(weeks=4),
+            is_most_recent=False,
+        )
+        factories.dbGaPDataAccessRequestFactory.create_batch(
+            3,
+            dbgap_data_access_snapshot=old_snapshot,
+            dbgap_current_status=models.dbGaPDataAccessRequest.APPROVED,
+        )
+        snapshot = factories.dbGaPDataAccessSnapshotFactory.create(dbgap_application=dbgap_application)
+        factories.dbGaPDataAccessRequestFactory.create(
+            dbgap_data_access_snapshot=snapshot,
+            dbgap_current_status=models.dbGaPDataAccessRequest.APPROVED,
+        )
+        factories.dbGaPDataAccessRequestFactory.create(
+            dbgap_data_access_snapshot=snapshot,
+            dbgap_current_status=models.dbGaPDataAccessRequest.REJECTED,
+        )
+        table = self.table_class(self.model.objects.all())
+        self.assertEqual(table.rows[0].get_cell_value("number_approved_dars"), "1")
+        self.assertEqual(table.rows[0].get_cell_value("number_requested_dars"), "2")
+        self.assertIn(snapshot.get_absolute_url(), table.rows[0].get_cell("last_update"))
+
     def test_last_update_no_snapshot(self):
         """Last update is --- with no snapshot."""
         self.model_factory.create()
@@ -418,6 +482,29 @@ class dbGaPApplicationTableTest(TestCase):
         table = self.table_class(self.model.objects.all())
         self.assertIn(latest_snapshot.get_absolute_url(), table.rows[0].get_cell("last_update"))
 
+    def test_number_of_queries(self):
+        """The number of queries to render the table does not depend on the number of applications."""
+
+        def create_application():
+            dbgap_application = self.model_factory.create()
+            snapshot = factories.dbGaPDataAccessSnapshotFactory.create(dbgap_application=dbgap_application)
+            factories.dbGaPDataAccessRequestFactory.create_batch(2, dbgap_data_access_snapshot=snapshot)
+
+        column_names = [
+            "dbgap_project_id",
+            "principal_investigator",
+            "principal_investigator__study_sites",
+            "number_approved_dars",
+            "number_requested_dars",
+            "last_update",
+        ]
+        create_application()
+        n_queries = count_queries_to_render(self.table_class(self.model.objects.all()), column_names)
+        for _ in range(3):
+            create_application()
+        table = self.table_class(self.model.objects.all())
+        self.assertEqual(count_queries_to_render(table, column_names), n_queries)
+
     def test_ordering(self):
         """Instances are ordered alphabetically by dbgap_project_id."""
         instance_1 = self.model_factory.create(dbgap_project_id=2)
@@ -518,6 +605,84 @@ class dbGaPDataAccessSnapshotTableTest(TestCase):
         self.assertEqual(table.render_number_requested_dars(snapshot_1), 9)
         self.assertEqual(table.render_number_requested_dars(snapshot_2), 2)
 
+    def test_dar_counts_annotated(self):
+        """DAR counts are annotated on the table data, and not shown for snapshots without DARs."""
+        with freeze_time("2020-01-01"):
+            snapshot_1 = self.model_factory.create()
+        factories.dbGaPDataAccessRequestFactory.create(
+            dbgap_data_access_snapshot=snapshot_1,
+            dbgap_current_status=models.dbGaPDataAccessRequest.APPROVED,
+        )
+        factories.dbGaPDataAccessRequestFactory.create_batch(
+            2,
+            dbgap_data_access_snapshot=snapshot_1,
+            dbgap_current_status=models.dbGaPDataAccessRequest.CLOSED,
+        )
+        with freeze_time("2021-12-12"):
+            self.model_factory.create()
+        table = self.table_class(self.model.objects.all())
+        self.assertIsNone(table.rows[0].get_cell_value("number_approved_dars"))
+        self.assertIsNone(table.rows[0].get_cell_value("number_requested_dars"))
+        self.assertEqual(table.rows[1].get_cell_value("number_approved_dars"), "1")
+        self.assertEqual(table.rows[1].get_cell_value("number_requested_dars"), "3")
+
+    def test_dar_counts_no_approved_dars(self):
+        """The number of approved DARs is shown as 0 for snapshots with DARs but no approved DARs."""
+        snapshot = self.model_factory.create()
+        factories.dbGaPDataAccessRequestFactory.create(
+            dbgap_data_access_snapshot=snapshot,
+            dbgap_current_status=models.dbGaPDataAccessRequest.CLOSED,
+        )
+        table = self.table_class(self.model.objects.all())
+        self.assertEqual(table.rows[0].get_cell_value("number_approved_dars"), "0")
+        self.assertEqual(table.rows[0].get_cell_value("number_requested_dars"), "1")
+
+    def test_order_by_number_approved_dars(self):
+        """The table can be ordered by the number of approved DARs, not the number of requested DARs."""
+        snapshot_1 = self.model_factory.create()
+        factories.dbGaPDataAccessRequestFactory.create_batch(
+            3,
+            dbgap_data_access_snapshot=snapshot_1,
+            dbgap_current_status=models.dbGaPDataAccessRequest.CLOSED,
+        )
+        snapshot_2 = self.model_factory.create()
+        factories.dbGaPDataAccessRequestFactory.create_batch(
+            2,
+            dbgap_data_access_snapshot=snapshot_2,
+            dbgap_current_status=models.dbGaPDataAccessRequest.APPROVED,
+        )
+        table = self.table_class(self.model.objects.all(), order_by="-number_approved_dars")
+        self.assertEqual(list(table.data), [snapshot_2, snapshot_1])
+        table = self.table_class(self.model.objects.all(), order_by="-number_requested_dars")
+        self.assertEqual(list(table.data), [snapshot_1, snapshot_2])
+
+    def test_export_dar_counts(self):
+        """Exported DAR counts are the counts for each snapshot."""
+        snapshot = self.model_factory.create()
+        factories.dbGaPDataAccessRequestFactory.create(
+            dbgap_data_access_snapshot=snapshot,
+            dbgap_current_status=models.dbGaPDataAccessRequest.APPROVED,
+        )
+        factories.dbGaPDataAccessRequestFactory.create(
+            dbgap_data_access_snapshot=snapshot,
+            dbgap_current_status=models.dbGaPDataAccessRequest.CLOSED,
+        )
+        table = self.table_class(self.model.objects.all())
+        header, row = table.as_values()
+        self.assertEqual(row[header.index("Number of approved DARs")], "1")
+        self.assertEqual(row[header.index("Number of requested DARs")], "2")
+
+    def test_number_of_queries(self):
+        """The number of queries to render DAR counts does not depend on the number of snapshots."""
+        column_names = ["number_approved_dars", "number_requested_dars"]
+        snapshot = self.model_factory.create()
+        factories.dbGaPDataAccessRequestFactory.create_batch(2, dbgap_data_access_snapshot=snapshot)
+        n_queries = count_queries_to_render(self.table_class(self.model.objects.all()), column_names)
+        for snapshot in self.model_factory.create_batch(3):
+            factories.dbGaPDataAccessRequestFactory.create_batch(2, dbgap_data_access_snapshot=snapshot)
+        table = self.table_class(self.model.objects.all())
+        self.assertEqual(count_queries_to_render(table, column_names), n_queries)
+
     def test_ordering(self):
         """Instances are ordered by decreasing snapshot date."""
         with freeze_time("2020-01-01"):
@@ -646,7 +811,7 @@ class dbGaPDataAccessRequestBySnapshotTableTest(TestCase):
             child_group=dar.dbgap_data_access_snapshot.dbgap_application.anvil_access_group,
         )
         table = self.table_class([dar])
-        value = table.render_matching_workspaces(dar.get_dbgap_workspaces(), dar)
+        value = table.render_matching_workspaces(dar)
         self.assertIn(workspace.workspace.name, value)
         self.assertIn("circle-fill", value)
 
@@ -660,7 +825,7 @@ class dbGaPDataAccessRequestBySnapshotTableTest(TestCase):
             child_group=dar.dbgap_data_access_snapshot.dbgap_application.anvil_access_group,
         )
         table = self.table_class([dar])
-        value = table.render_matching_workspaces(dar.get_dbgap_workspaces(), dar)
+        value = table.render_matching_workspaces(dar)
         self.assertIn(workspace.workspace.name, value)
         self.assertIn("circle-fill", value)
 
@@ -669,7 +834,7 @@ class dbGaPDataAccessRequestBySnapshotTableTest(TestCase):
         workspace = factories.dbGaPWorkspaceFactory.create()
         dar = factories.dbGaPDataAccessRequestForWorkspaceFactory(dbgap_workspace=workspace)
         table = self.table_class([dar])
-        value = table.render_matching_workspaces(dar.get_dbgap_workspaces(), dar)
+        value = table.render_matching_workspaces(dar)
         self.assertIn(workspace.workspace.name, value)
         self.assertIn("square-fill", value)
 
@@ -679,7 +844,7 @@ class dbGaPDataAccessRequestBySnapshotTableTest(TestCase):
         workspace = factories.dbGaPWorkspaceFactory.create(workspace=auth_domain.workspace)
         dar = factories.dbGaPDataAccessRequestForWorkspaceFactory(dbgap_workspace=workspace)
         table = self.table_class([dar])
-        value = table.render_matching_workspaces(dar.get_dbgap_workspaces(), dar)
+        value = table.render_matching_workspaces(dar)
         self.assertIn(workspace.workspace.name, value)
         self.assertIn("square-fill", value)
 
@@ -705,10 +870,72 @@ class dbGaPDataAccessRequestBySnapshotTableTest(TestCase):
             dbgap_consent_code=1,
         )
         table = self.table_class([dar])
-        value = table.render_matching_workspaces(dar.get_dbgap_workspaces(), dar)
+        value = table.render_matching_workspaces(dar)
         self.assertIn(workspace_1.workspace.name, value)
         self.assertIn(workspace_2.workspace.name, value)
 
+    def test_matching_workspaces_version_participant_set_and_consent(self):
+        """Workspaces with an older version or participant set or a different consent code do not match."""
+        study_accession = factories.dbGaPStudyAccessionFactory.create()
+        dar = factories.dbGaPDataAccessRequestFactory.create(
+            dbgap_phs=study_accession.dbgap_phs,
+            original_version=2,
+            original_participant_set=2,
+            dbgap_consent_code=1,
+        )
+        matching_workspace = factories.dbGaPWorkspaceFactory.create(
+            dbgap_study_accession=study_accession,
+            dbgap_version=3,
+            dbgap_participant_set=2,
+            dbgap_consent_code=1,
+        )
+        old_version_workspace = factories.dbGaPWorkspaceFactory.create(
+            dbgap_study_accession=study_accession,
+            dbgap_version=1,
+            dbgap_participant_set=2,
+            dbgap_consent_code=1,
+        )
+        old_participant_set_workspace = factories.dbGaPWorkspaceFactory.create(
+            dbgap_study_accession=study_accession,
+            dbgap_version=2,
+            dbgap_participant_set=1,
+            dbgap_consent_code=1,
+        )
+        other_consent_workspace = factories.dbGaPWorkspaceFactory.create(
+            dbgap_study_accession=study_accession,
+            dbgap_version=2,
+            dbgap_participant_set=2,
+            dbgap_consent_code=2,
+        )
+        table = self.table_class(self.model.objects.all())
+        self.assertEqual([x for x, _ in table.get_matching_workspaces(dar)], [matching_workspace])
+        value = table.rows[0].get_cell("matching_workspaces")
+        self.assertIn(matching_workspace.workspace.name, value)
+        self.assertNotIn(old_version_workspace.workspace.name, value)
+        self.assertNotIn(old_participant_set_workspace.workspace.name, value)
+        self.assertNotIn(other_consent_workspace.workspace.name, value)
+
+    def test_matching_workspaces_number_of_queries(self):
+        """The number of queries to render matching workspaces does not depend on the number of DARs."""
+        snapshot = factories.dbGaPDataAccessSnapshotFactory.create()
+
+        def create_dar():
+            workspace = factories.dbGaPWorkspaceFactory.create()
+            WorkspaceAuthorizationDomainFactory.create(workspace=workspace.workspace)
+            factories.dbGaPDataAccessRequestForWorkspaceFactory(
+                dbgap_workspace=workspace, dbgap_data_access_snapshot=snapshot
+            )
+
+        create_dar()
+        # Render once so that the group membership closure is cached.
+        count_queries_to_render(self.table_class(self.model.objects.all()), ["matching_workspaces"])
+        n_queries = count_queries_to_render(self.table_class(self.model.objects.all()), ["matching_workspaces"])
+        for _ in range(3):
+            create_dar()
+        count_queries_to_render(self.table_class(self.model.objects.all()), ["matching_workspaces"])
+        table = self.table_class(self.model.objects.all())
+        self.assertEqual(count_queries_to_render(table, ["matching_workspaces"]), n_queries)
+
     def test_ordering(self):
         """Instances are ordered alphabetically by dbgap_dar_id."""
         instance_1 = self.model_factory.create(dbgap_dar_id=2)
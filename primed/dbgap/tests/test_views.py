@@ -2,6 +2,7 @@
 
 import json
 from datetime import date, datetime, timedelta
+from unittest.mock import patch
 
 import responses
 import time_machine
@@ -3288,10 +3289,39 @@ class dbGaPDataAccessSnapshotCreateMultipleTest(dbGaPResponseTestMixin, TestCase
         messages = list(response.context["messages"])
         self.assertEqual(len(messages), 1)
         self.assertEqual(
-            views.dbGaPDataAccessSnapshotCreateMultiple.success_message,
+            views.dbGaPDataAccessSnapshotCreateMultiple.success_message % {"n_added": 1, "n_unchanged": 0},
             str(messages[0]),
         )
 
+    def test_success_message_unchanged(self):
+        """The success message reports projects whose json is unchanged since the previous snapshot."""
+        dbgap_application = factories.dbGaPApplicationFactory.create()
+        project_json = factories.dbGaPJSONProjectFactory(dbgap_application=dbgap_application)
+        phs = project_json["studies"][0]["study_accession"]
+        factories.dbGaPDataAccessSnapshotFactory.create(
+            dbgap_application=dbgap_application,
+            dbgap_dar_data=project_json,
+            created=timezone.now() - timedelta(weeks=4),
+            is_most_recent=True,
+        )
+        self.dbgap_response_mock.add(
+            responses.GET,
+            constants.DBGAP_STUDY_URL,
+            match=[responses.matchers.query_param_matcher({"study_id": phs})],
+            status=302,
+            headers={"Location": constants.DBGAP_STUDY_URL + "?study_id=" + phs + ".v1.p1"},
+        )
+        self.client.force_login(self.user)
+        response = self.client.post(self.get_url(), {"dbgap_dar_data": json.dumps([project_json])}, follow=True)
+        messages = list(response.context["messages"])
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(
+            views.dbGaPDataAccessSnapshotCreateMultiple.success_message % {"n_added": 1, "n_unchanged": 1},
+            str(messages[0]),
+        )
+        # A new snapshot is still added, recording when the DARs were checked.
+        self.assertEqual(models.dbGaPDataAccessSnapshot.objects.count(), 2)
+
     def test_error_blank_dbgap_dar_data(self):
         """Form shows an error when study is missing."""
         self.client.force_login(self.user)
@@ -3589,6 +3619,74 @@ class dbGaPDataAccessSnapshotCreateMultipleTest(dbGaPResponseTestMixin, TestCase
         existing_snapshot.refresh_from_db()
         self.assertTrue(existing_snapshot.is_most_recent)
 
+    def test_snapshot_not_created_if_dar_mismatch(self):
+        """The dbGaPDataAccessSnapshot is not created if a DAR does not match a previous DAR with the same id."""
+        dbgap_application = factories.dbGaPApplicationFactory.create()
+        previous_dar = factories.dbGaPDataAccessRequestFactory.create(
+            dbgap_data_access_snapshot__dbgap_application=dbgap_application,
+            dbgap_current_status=models.dbGaPDataAccessRequest.APPROVED,
+            dbgap_consent_code=1,
+        )
+        request_json = factories.dbGaPJSONRequestFactory(DAR=previous_dar.dbgap_dar_id, consent_code=2)
+        study_json = factories.dbGaPJSONStudyFactory(
+            study_accession="phs{:06d}".format(previous_dar.dbgap_phs), requests=[request_json]
+        )
+        project_json = factories.dbGaPJSONProjectFactory(dbgap_application=dbgap_application, studies=[study_json])
+        self.client.force_login(self.user)
+        response = self.client.post(
+            self.get_url(),
+            {
+                "dbgap_dar_data": json.dumps([project_json]),
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+        # The error is shown in the form.
+        self.assertIn("form", response.context_data)
+        form = response.context_data["form"]
+        self.assertFalse(form.is_valid())
+        self.assertIn("dbgap_consent_code mismatch", form.non_field_errors()[0])
+        # There is an error message.
+        messages = list(response.context["messages"])
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(
+            views.dbGaPDataAccessSnapshotCreateMultiple.ERROR_CREATING_DARS,
+            str(messages[0]),
+        )
+        # No objects were created.
+        self.assertEqual(models.dbGaPDataAccessSnapshot.objects.count(), 1)
+        self.assertEqual(models.dbGaPDataAccessRequest.objects.count(), 1)
+        previous_dar.dbgap_data_access_snapshot.refresh_from_db()
+        self.assertTrue(previous_dar.dbgap_data_access_snapshot.is_most_recent)
+
+    def test_snapshot_not_created_if_application_deleted(self):
+        """The dbGaPDataAccessSnapshot is not created if an application no longer exists."""
+        dbgap_application = factories.dbGaPApplicationFactory.create()
+        project_json = factories.dbGaPJSONProjectFactory(dbgap_application=dbgap_application)
+        self.client.force_login(self.user)
+        # Simulate the application being deleted after the form was validated.
+        with patch.object(
+            models.dbGaPDataAccessSnapshot,
+            "create_from_json",
+            side_effect=models.dbGaPApplication.DoesNotExist("No dbGaPApplication for project id(s): 1"),
+        ):
+            response = self.client.post(
+                self.get_url(),
+                {
+                    "dbgap_dar_data": json.dumps([project_json]),
+                },
+            )
+        self.assertEqual(response.status_code, 200)
+        form = response.context_data["form"]
+        self.assertFalse(form.is_valid())
+        self.assertIn("No dbGaPApplication for project id(s)", form.non_field_errors()[0])
+        messages = list(response.context["messages"])
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(
+            views.dbGaPDataAccessSnapshotCreateMultiple.ERROR_CREATING_DARS,
+            str(messages[0]),
+        )
+        self.assertEqual(models.dbGaPDataAccessSnapshot.objects.count(), 0)
+
 
 class dbGaPDataAccessSnapshotDetailTest(TestCase):
     """Tests for the dbGaPDataAccessRequestAudit view."""
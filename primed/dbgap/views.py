@@ -37,6 +37,7 @@ from django_tables2 import MultiTableMixin, SingleTableMixin, SingleTableView
 from django_tables2.export.views import ExportMixin
 
 from primed.primed_anvil.tables import UserAccountSingleGroupMembershipTable
+from primed.primed_anvil.viewmixins import StoredAuditRefreshMixin
 
 from . import forms, helpers, models, tables, viewmixins
 from .audit import access_audit, collaborator_audit
@@ -352,7 +353,10 @@ class dbGaPDataAccessSnapshotCreateMultiple(AnVILConsortiumManagerStaffEditRequi
     # )
     # ERROR_STUDY_ACCESSION_NOT_FOUND = "Study accession(s) not found in app."
     ERROR_CREATING_DARS = "Error creating Data Access Requests."
-    success_message = "Successfully added Data Access Requests."
+    success_message = (
+        "Successfully added Data Access Requests: %(n_added)s snapshot(s) added, "
+        "%(n_unchanged)s unchanged since the previous snapshot."
+    )
 
     def get_context_data(self, **kwargs):
         """Add to the context data."""
@@ -365,6 +369,9 @@ class dbGaPDataAccessSnapshotCreateMultiple(AnVILConsortiumManagerStaffEditRequi
     def get_success_url(self):
         return reverse("dbgap:dbgap_applications:list")
 
+    def get_success_message(self, cleaned_data):
+        return self.success_message % {"n_added": self.n_added, "n_unchanged": self.n_unchanged}
+
     def form_valid(self, form):
         """Create dbGaPDataAccessSnapshots and associated dbGaPDataAccessRequests for all projects in the JSON."""
         dbgap_dar_data = form.cleaned_data["dbgap_dar_data"]
@@ -372,28 +379,9 @@ class dbGaPDataAccessSnapshotCreateMultiple(AnVILConsortiumManagerStaffEditRequi
             # Use a transaction because we don't want either the snapshot or the requests
             # to be saved upon failure.
             with transaction.atomic():
-                # Loop over projects.
-                for project_json in dbgap_dar_data:
-                    dbgap_project_id = project_json["Project_id"]
-                    dbgap_application = models.dbGaPApplication.objects.get(dbgap_project_id=dbgap_project_id)
-                    try:
-                        previous_snapshot = models.dbGaPDataAccessSnapshot.objects.get(
-                            dbgap_application=dbgap_application,
-                            is_most_recent=True,
-                        )
-                        previous_snapshot.is_most_recent = False
-                        previous_snapshot.save()
-                    except models.dbGaPDataAccessSnapshot.DoesNotExist:
-                        pass
-                    # Now save the new object.
-                    snapshot = models.dbGaPDataAccessSnapshot(
-                        dbgap_application=dbgap_application,
-                        dbgap_dar_data=project_json,
-                        is_most_recent=True,
-                    )
-                    snapshot.full_clean()
-                    snapshot.save()
-                    snapshot.create_dars_from_json()
+                # Snapshots are added even if the json is unchanged, so that they record when DARs were checked.
+                unchanged_ids = models.dbGaPDataAccessSnapshot.get_unchanged_project_ids(dbgap_dar_data)
+                snapshots = models.dbGaPDataAccessSnapshot.create_from_json(dbgap_dar_data)
         except (ValidationError, IntegrityError):
             # Log the JSON as an error.
             msg = "JSON: {}".format(form.cleaned_data["dbgap_dar_data"])
@@ -407,6 +395,14 @@ class dbGaPDataAccessSnapshotCreateMultiple(AnVILConsortiumManagerStaffEditRequi
             # Add an error message.
             messages.error(self.request, self.ERROR_CREATING_DARS)
             return self.render_to_response(self.get_context_data(form=form))
+        except (models.dbGaPApplication.DoesNotExist, ValueError) as e:
+            # An application was deleted after the form was validated, or the DARs do not match previous DARs.
+            logger.error(str(e))
+            form.add_error(None, str(e))
+            messages.error(self.request, self.ERROR_CREATING_DARS)
+            return self.render_to_response(self.get_context_data(form=form))
+        self.n_added = len(snapshots)
+        self.n_unchanged = len(unchanged_ids)
 
         # try:
         #     # Use a transaction because we don't want either the snapshot or the requests
@@ -548,16 +544,17 @@ class dbGaPDataAccessRequestHistory(viewmixins.dbGaPApplicationViewPermissionMix
         return context
 
 
-class dbGaPAccessAudit(AnVILConsortiumManagerStaffViewRequired, TemplateView):
+class dbGaPAccessAudit(AnVILConsortiumManagerStaffViewRequired, StoredAuditRefreshMixin, TemplateView):
     """View to audit access for all dbGaPApplications and dbGaPWorkspaces."""
 
     template_name = "dbgap/dbgap_access_audit.html"
+    audit_class = access_audit.dbGaPAccessAudit
+    audit_title = "dbGaP access audit"
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Run the audit.
-        data_access_audit = access_audit.dbGaPAccessAudit()
-        data_access_audit.run_audit()
+        # Load the stored audit results, rerunning the audit for any that are out of date.
+        data_access_audit = self.get_audit()
         context["verified_table"] = data_access_audit.get_verified_table()
         context["errors_table"] = data_access_audit.get_errors_table()
         context["needs_action_table"] = data_access_audit.get_needs_action_table()
@@ -753,16 +750,17 @@ class dbGaPAccessAuditResolve(AnVILConsortiumManagerStaffEditRequired, FormView)
             return super().form_valid(form)
 
 
-class dbGaPCollaboratorAudit(AnVILConsortiumManagerStaffViewRequired, TemplateView):
+class dbGaPCollaboratorAudit(AnVILConsortiumManagerStaffViewRequired, StoredAuditRefreshMixin, TemplateView):
     """View to audit collaborators for all dbGaPApplications."""
 
     template_name = "dbgap/collaborator_audit.html"
+    audit_class = collaborator_audit.dbGaPCollaboratorAudit
+    audit_title = "dbGaP collaborator audit"
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Run the audit.
-        audit = collaborator_audit.dbGaPCollaboratorAudit()
-        audit.run_audit()
+        # Load the stored audit results, rerunning the audit for any that are out of date.
+        audit = self.get_audit()
         context["verified_table"] = audit.get_verified_table()
         context["errors_table"] = audit.get_errors_table()
         context["needs_action_table"] = audit.get_needs_action_table()
@@ -0,0 +1,177 @@
+"""A shared client for requests to the Drupal site.
+
+Requests are made with pooled `requests.Session`s, so that connections to the Drupal site are kept alive and reused
+across logins and API calls. Client credentials tokens are cached in memory until shortly before they expire, and the
+JSON Web Key Set used to verify login tokens is cached in the default cache.
+"""
+
+import threading
+import time
+
+import jsonapi_requests
+import requests
+from django.core.cache import cache
+from jsonapi_requests.request_factory import ApiConnectionError, ApiRequestFactory
+from oauthlib.oauth2 import BackendApplicationClient
+from requests.adapters import HTTPAdapter
+from requests.auth import AuthBase
+from requests_oauthlib import OAuth2Session
+from urllib3.util.retry import Retry
+
+# Number of times to retry a request that failed to connect or returned a server error.
+REQUEST_RETRIES = 3
+# Seconds to wait for a response from the Drupal site.
+REQUEST_TIMEOUT = 10
+# Maximum number of connections to keep open to the Drupal site.
+POOL_MAXSIZE = 10
+# Seconds before a client credentials token expires at which a new token is fetched. `ClientCredentialsAuth` looks up
+# the token for every request, so this only needs to cover a single request and its retries.
+TOKEN_REFRESH_MARGIN = 60
+# Seconds for which the JSON Web Key Set is cached.
+JWKS_CACHE_TIMEOUT = 60 * 60
+
+
+def _mount_adapter(session, retries=REQUEST_RETRIES, status_forcelist=(502, 503, 504)):
+    retry = Retry(
+        total=retries,
+        backoff_factor=0.5,
+        status_forcelist=status_forcelist,
+    )
+    adapter = HTTPAdapter(max_retries=retry, pool_maxsize=POOL_MAXSIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+session = _mount_adapter(requests.Session())
+# jsonapi_requests retries connection errors and server errors itself (`RETRIES` in its configuration), so the session
+# used for JSON:API requests does not retry; otherwise each of its attempts would be retried again by urllib3.
+api_session = _mount_adapter(requests.Session(), retries=0, status_forcelist=())
+
+_tokens = {}
+_tokens_lock = threading.Lock()
+
+
+def get(url, **kwargs):
+    """Make a GET request with the shared session and raise an exception if it was not successful."""
+    kwargs.setdefault("timeout", REQUEST_TIMEOUT)
+    response = session.get(url, **kwargs)
+    response.raise_for_status()
+    return response
+
+
+def get_client_credentials_token(token_url, client_id, client_secret):
+    """Return a client credentials token for the Drupal API.
+
+    A cached token is returned unless it expires within `TOKEN_REFRESH_MARGIN` seconds, in which case a new token
+    is fetched.
+    """
+    key = (token_url, client_id)
+    with _tokens_lock:
+        token = _tokens.get(key)
+        if token is None or token.get("expires_at", 0) - TOKEN_REFRESH_MARGIN < time.time():
+            oauth = _mount_adapter(OAuth2Session(client=BackendApplicationClient(client_id=client_id)))
+            token = oauth.fetch_token(
+                token_url=token_url,
+                client_id=client_id,
+                client_secret=client_secret,
+                timeout=REQUEST_TIMEOUT,
+            )
+            _tokens[key] = token
+        return token
+
+
+def clear_client_credentials_token(token_url, client_id):
+    """Remove the cached client credentials token, e.g. if the Drupal site has rejected it."""
+    with _tokens_lock:
+        _tokens.pop((token_url, client_id), None)
+
+
+def clear_client_credentials_tokens():
+    """Remove all cached client credentials tokens."""
+    with _tokens_lock:
+        _tokens.clear()
+
+
+class ClientCredentialsAuth(AuthBase):
+    """Authenticate requests to the Drupal API with a client credentials token.
+
+    The token is looked up with `get_client_credentials_token` for each request, so a new token is used once the
+    previous one is about to expire, however long a sync takes. A request that is rejected with a 401 response is
+    sent once more with a new token, in case the token was revoked or expired early.
+    """
+
+    def __init__(self, token_url, client_id, client_secret):
+        self.token_url = token_url
+        self.client_id = client_id
+        self.client_secret = client_secret
+
+    def _get_authorization(self):
+        token = get_client_credentials_token(self.token_url, self.client_id, self.client_secret)
+        return "Bearer {}".format(token["access_token"])
+
+    def __call__(self, request):
+        request.headers["Authorization"] = self._get_authorization()
+        request.register_hook("response", self.handle_401)
+        return request
+
+    def handle_401(self, response, **kwargs):
+        if response.status_code != 401:
+            return response
+        clear_client_credentials_token(self.token_url, self.client_id)
+        # Consume the content so that the connection can be reused.
+        response.content
+        response.close()
+        request = response.request.copy()
+        request.headers["Authorization"] = self._get_authorization()
+        # Sending with the adapter does not call the response hooks again, so the request is only retried once.
+        new_response = response.connection.send(request, **kwargs)
+        new_response.history.append(response)
+        new_response.request = request
+        return new_response
+
+
+def _get_jwks_cache_key(url):
+    return "drupal_oauth_provider:jwks:{}".format(url)
+
+
+def get_jwks(url, headers=None):
+    """Return the JSON Web Key Set at `url`, which is cached for `JWKS_CACHE_TIMEOUT` seconds."""
+    cache_key = _get_jwks_cache_key(url)
+    jwks = cache.get(cache_key)
+    if jwks is None:
+        jwks = get(url, headers=headers).json()
+        cache.set(cache_key, jwks, JWKS_CACHE_TIMEOUT)
+    return jwks
+
+
+def clear_jwks(url):
+    """Remove the cached JSON Web Key Set at `url`, e.g. if its keys are invalid or have been rotated."""
+    cache.delete(_get_jwks_cache_key(url))
+
+
+class SessionApiRequestFactory(ApiRequestFactory):
+    """A jsonapi_requests request factory that makes requests with the shared JSON:API session.
+
+    jsonapi_requests has no supported way to use a session, so this overrides its private `_request` method, which is
+    otherwise the same as in jsonapi_requests 0.8.0. jsonapi-requests is pinned to that version in
+    requirements/requirements.in; check this method against the new version before upgrading it.
+    """
+
+    def _request(self, absolute_url, method, **kwargs):
+        options = self.default_options
+        options.update(self.configured_options)
+        options.update(kwargs)
+        try:
+            response = api_session.request(method, absolute_url, **options)
+        except (requests.ConnectionError, requests.Timeout):
+            raise ApiConnectionError
+        else:
+            return self._parse_response(response)
+
+
+def get_json_api(config):
+    """Return a `jsonapi_requests.Api` for the configuration in `config` that uses the shared session."""
+    json_api = jsonapi_requests.Api.config(config)
+    json_api.requests = SessionApiRequestFactory(json_api.requests.config)
+    return json_api
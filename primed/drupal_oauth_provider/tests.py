@@ -1,9 +1,11 @@
 import datetime
 import json
+from importlib.metadata import version
 from unittest.mock import Mock, patch
 from urllib.parse import parse_qs, urlparse
 
 import jwt
+import requests
 import responses
 from allauth.socialaccount.adapter import get_adapter
 from allauth.socialaccount.models import SocialAccount, SocialApp
@@ -15,7 +17,9 @@ from django.core.exceptions import ImproperlyConfigured
 from django.test import Client, RequestFactory, TestCase
 from django.test.utils import override_settings
 from django.urls import reverse
+from jsonapi_requests.request_factory import ApiConnectionError, ApiInternalServerError
 
+from . import client as drupal_client
 from .provider import CustomProvider
 from .views import CustomAdapter
 
@@ -174,6 +178,18 @@ class CustomProviderLoginTest(TestCase):
         with self.assertRaises(OAuth2Error):
             adapter.get_public_key(headers={"HTTP_HOST": "foo"})
 
+    @responses.activate
+    def test_invalid_public_key_not_cached(self):
+        """An invalid key set is fetched again the next time the key is needed."""
+        responses.add(responses.GET, CustomAdapter.public_key_url, json=INVALID_KEY_RESP_JSON, status=200)
+        responses.add(responses.GET, CustomAdapter.public_key_url, json=KEY_SERVER_RESP_JSON, status=200)
+        rf = RequestFactory()
+        request = rf.get("/fake-url/", HTTP_HOST="testserver")
+        adapter = CustomAdapter(request)
+        with self.assertRaises(OAuth2Error):
+            adapter.get_public_key(headers={"HTTP_HOST": "foo"})
+        self.assertIsNotNone(adapter.get_public_key(headers={"HTTP_HOST": "foo"}))
+
     @responses.activate
     def test_complete_oauth_login_flow(self):
         """Test the complete OAuth login flow with mocked responses"""
@@ -390,3 +406,117 @@ class TestProviderConfig(TestCase):
         ]
         with override_settings(SOCIALACCOUNT_PROVIDERS=custom_provider_settings):
             CustomProvider(request, app=self.app).get_provider_managed_scope_status(scopes_granted=["X"])
+
+
+class DrupalClientTest(TestCase):
+    """Tests for the shared drupal client."""
+
+    token_url = "https://example.com/oauth/token"
+
+    def setUp(self):
+        super().setUp()
+        drupal_client.clear_client_credentials_tokens()
+
+    def add_token_response(self, token_url, expires_in):
+        responses.add(
+            responses.POST,
+            token_url,
+            json={"access_token": "test_access_token", "token_type": "Bearer", "expires_in": expires_in},
+            status=200,
+        )
+
+    @responses.activate
+    def test_get_jwks_is_cached(self):
+        responses.add(responses.GET, CustomAdapter.public_key_url, json=KEY_SERVER_RESP_JSON, status=200)
+        self.assertEqual(drupal_client.get_jwks(CustomAdapter.public_key_url), KEY_SERVER_RESP_JSON)
+        self.assertEqual(drupal_client.get_jwks(CustomAdapter.public_key_url), KEY_SERVER_RESP_JSON)
+        self.assertEqual(len(responses.calls), 1)
+
+    @responses.activate
+    def test_clear_jwks(self):
+        responses.add(responses.GET, CustomAdapter.public_key_url, json=KEY_SERVER_RESP_JSON, status=200)
+        drupal_client.get_jwks(CustomAdapter.public_key_url)
+        drupal_client.clear_jwks(CustomAdapter.public_key_url)
+        drupal_client.get_jwks(CustomAdapter.public_key_url)
+        self.assertEqual(len(responses.calls), 2)
+
+    @responses.activate
+    def test_get_client_credentials_token_is_cached(self):
+        self.add_token_response(self.token_url, expires_in=3600)
+        token = drupal_client.get_client_credentials_token(self.token_url, "client_id", "client_secret")
+        self.assertEqual(token["access_token"], "test_access_token")
+        self.assertEqual(
+            drupal_client.get_client_credentials_token(self.token_url, "client_id", "client_secret"), token
+        )
+        self.assertEqual(len(responses.calls), 1)
+
+    @responses.activate
+    def test_get_client_credentials_token_refreshed_before_expiry(self):
+        self.add_token_response(self.token_url, expires_in=drupal_client.TOKEN_REFRESH_MARGIN - 1)
+        drupal_client.get_client_credentials_token(self.token_url, "client_id", "client_secret")
+        drupal_client.get_client_credentials_token(self.token_url, "client_id", "client_secret")
+        self.assertEqual(len(responses.calls), 2)
+
+    @responses.activate
+    def test_client_credentials_auth(self):
+        self.add_token_response(self.token_url, expires_in=3600)
+        responses.add(responses.GET, "https://example.com/api/test", json={}, status=200)
+        auth = drupal_client.ClientCredentialsAuth(self.token_url, "client_id", "client_secret")
+        drupal_client.api_session.get("https://example.com/api/test", auth=auth)
+        drupal_client.api_session.get("https://example.com/api/test", auth=auth)
+        # The token is only fetched once.
+        self.assertEqual(len(responses.calls), 3)
+        self.assertEqual(responses.calls[1].request.headers["Authorization"], "Bearer test_access_token")
+
+    @responses.activate
+    def test_client_credentials_auth_refreshed_on_401(self):
+        """A request that is rejected with a 401 response is sent once more with a new token."""
+        self.add_token_response(self.token_url, expires_in=3600)
+        responses.add(responses.GET, "https://example.com/api/test", status=401)
+        responses.add(responses.GET, "https://example.com/api/test", json={}, status=200)
+        auth = drupal_client.ClientCredentialsAuth(self.token_url, "client_id", "client_secret")
+        response = drupal_client.api_session.get("https://example.com/api/test", auth=auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.history), 1)
+        # Token, rejected request, new token, retried request.
+        self.assertEqual(len(responses.calls), 4)
+
+    @responses.activate
+    def test_client_credentials_auth_401_only_retried_once(self):
+        self.add_token_response(self.token_url, expires_in=3600)
+        responses.add(responses.GET, "https://example.com/api/test", status=401)
+        auth = drupal_client.ClientCredentialsAuth(self.token_url, "client_id", "client_secret")
+        response = drupal_client.api_session.get("https://example.com/api/test", auth=auth)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(len(responses.calls), 4)
+
+    @responses.activate
+    def test_json_api_server_error(self):
+        """Server errors from the JSON:API are raised by jsonapi_requests rather than retried by the session."""
+        responses.add(responses.GET, "https://example.com/api/test/", status=503)
+        json_api = drupal_client.get_json_api({"API_ROOT": "https://example.com/api/", "RETRIES": 2})
+        with self.assertRaises(ApiInternalServerError):
+            json_api.endpoint("test").get()
+        self.assertEqual(len(responses.calls), 2)
+
+    @responses.activate
+    def test_json_api_connection_error(self):
+        """Connection errors from the JSON:API are only retried by jsonapi_requests."""
+        responses.add(responses.GET, "https://example.com/api/test/", body=requests.ConnectionError())
+        json_api = drupal_client.get_json_api({"API_ROOT": "https://example.com/api/", "RETRIES": 2})
+        with self.assertRaises(ApiConnectionError):
+            json_api.endpoint("test").get()
+        self.assertEqual(len(responses.calls), 2)
+        self.assertEqual(drupal_client.api_session.get_adapter("https://example.com").max_retries.total, 0)
+
+    def test_jsonapi_requests_version(self):
+        """SessionApiRequestFactory overrides a private method, so check it again when jsonapi-requests is upgraded."""
+        self.assertEqual(version("jsonapi-requests"), "0.8.0")
+
+    @responses.activate
+    def test_clear_client_credentials_tokens(self):
+        self.add_token_response(self.token_url, expires_in=3600)
+        drupal_client.get_client_credentials_token(self.token_url, "client_id", "client_secret")
+        drupal_client.clear_client_credentials_tokens()
+        drupal_client.get_client_credentials_token(self.token_url, "client_id", "client_secret")
+        self.assertEqual(len(responses.calls), 2)
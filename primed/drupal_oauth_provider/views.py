@@ -2,7 +2,6 @@ import json
 import logging
 
 import jwt
-import requests
 from allauth.socialaccount import app_settings
 from allauth.socialaccount.adapter import get_adapter
 from allauth.socialaccount.providers.oauth2.client import OAuth2Error
@@ -12,6 +11,8 @@ from allauth.socialaccount.providers.oauth2.views import (
     OAuth2LoginView,
 )
 
+from . import client as drupal_client
+
 logger = logging.getLogger(__name__)
 
 
@@ -36,11 +37,9 @@ class CustomAdapter(OAuth2Adapter):
     debug_url = "{}/oauth/debug?_format=json".format(api_url)
 
     def _get_public_key_jwk(self, headers):
-        response = requests.get(self.public_key_url, headers=headers)
-        response.raise_for_status()
-
+        # The key set is cached by the shared drupal client.
         try:
-            data = response.json()
+            data = drupal_client.get_jwks(self.public_key_url, headers=headers)
         except json.JSONDecodeError as e:
             raise OAuth2Error("Error retrieving drupal public key.") from e
         else:
@@ -58,6 +57,8 @@ class CustomAdapter(OAuth2Adapter):
         try:
             public_key = jwt.algorithms.RSAAlgorithm.from_jwk(json.dumps(public_key_jwk))
         except Exception as e:
+            # Do not keep using an invalid key set.
+            drupal_client.clear_jwks(self.public_key_url)
             logger.error(f"[get_public_key] failed to convert jwk {public_key_jwk} to public key {e}")
             raise OAuth2Error(f"[get_public_key] failed to convert jwk {public_key_jwk} to public key {e}")
         else:
@@ -67,19 +68,26 @@ class CustomAdapter(OAuth2Adapter):
         app = get_adapter().get_app(request=None, provider=self.provider_id)
         return app.client_id
 
+    def _decode_id_token(self, id_token, headers, allowed_audience):
+        return jwt.decode(
+            id_token.token,
+            self.get_public_key(headers),
+            algorithms=["RS256"],
+            leeway=5,  # allow for times to be slightly out of sync pyjwt._verify_nbf
+            audience=allowed_audience,
+        )
+
     def get_scopes_from_token(self, id_token, headers):
         allowed_audience = self.get_client_id()
-        public_key = self.get_public_key(headers)
         scopes = None
 
         try:
-            token_payload = jwt.decode(
-                id_token.token,
-                public_key,
-                algorithms=["RS256"],
-                leeway=5,  # allow for times to be slightly out of sync pyjwt._verify_nbf
-                audience=allowed_audience,
-            )
+            try:
+                token_payload = self._decode_id_token(id_token, headers, allowed_audience)
+            except jwt.InvalidSignatureError:
+                # The signing key may have been rotated since the key set was cached.
+                drupal_client.clear_jwks(self.public_key_url)
+                token_payload = self._decode_id_token(id_token, headers, allowed_audience)
         except jwt.PyJWTError as e:
             logger.error(f"Invalid id_token {e} {id_token.token}")
             raise OAuth2Error("Invalid id_token") from e
@@ -94,8 +102,7 @@ class CustomAdapter(OAuth2Adapter):
         scopes_granted = self.get_scopes_from_token(token, headers)
         managed_scope_status = self.get_provider().get_provider_managed_scope_status(scopes_granted)
 
-        resp = requests.get(self.profile_url, headers=headers)
-        resp.raise_for_status()
+        resp = drupal_client.get(self.profile_url, headers=headers)
         extra_data = resp.json()
         logger.debug(
             f"[drupal_oauth_provider:complete_login] extra profile data {resp} "
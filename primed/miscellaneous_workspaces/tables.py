@@ -6,10 +6,11 @@ from anvil_consortium_manager.models import Workspace
 from primed.primed_anvil.tables import (
     BooleanIconColumn,
     WorkspaceSharedWithConsortiumColumn,
+    WorkspaceSharedWithConsortiumTableMixin,
 )
 
 
-class OpenAccessWorkspaceUserTable(tables.Table):
+class OpenAccessWorkspaceUserTable(WorkspaceSharedWithConsortiumTableMixin, tables.Table):
     """Class to render a table of Workspace objects with OpenAccessWorkspace workspace data."""
 
     name = tables.columns.Column(linkify=True)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class PrimedAnvilConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "primed.primed_anvil"
+
+    def ready(self):
+        import primed.primed_anvil.signals  # noqa F401
@@ -1,5 +1,15 @@
+import dataclasses
+import json
 from abc import ABC, abstractmethod, abstractproperty
 
+from anvil_consortium_manager.models import Account, ManagedGroup
+from django.db import models
+from django.db.models import Q
+
+from .audit_results import RESULT_LISTS, get_audit_name
+from .membership_closure import clear_group_membership_closure_memo, get_group_membership_closure
+from .models import AuditRun
+
 
 class PRIMEDAuditResult(ABC):
     """Abstract base class to hold an audit result for a single check.
@@ -26,6 +36,33 @@ class PRIMEDAuditResult(ABC):
         """Return a dictionary representation of the result."""
         ...  # pragma: no cover
 
+    def get_key(self):
+        """Return a dictionary identifying the objects that this result is about.
+
+        This is used to match results between audit runs. By default, it contains a "<model label>:<pk>" string
+        for each field that holds a model instance.
+        """
+        key = {}
+        for field in dataclasses.fields(self):
+            value = getattr(self, field.name)
+            if isinstance(value, models.Model):
+                key[field.name] = "{}:{}".format(value._meta.label, value.pk)
+        return key
+
+
+@dataclasses.dataclass
+class AuditRunChanges:
+    """Issues (results that need action or are errors) that are new or resolved since a previous audit run.
+
+    Each issue is a result summary, as returned by `PRIMEDAudit.get_run_summary`.
+    """
+
+    new_issues: list
+    resolved_issues: list
+
+    def has_changes(self):
+        return bool(self.new_issues or self.resolved_issues)
+
 
 class PRIMEDAudit(ABC):
     """Abstract base class for PRIMED audit classes.
@@ -51,6 +88,19 @@ class PRIMEDAudit(ABC):
     def results_table_class(self):
         return ...  # pragma: no cover
 
+    # Set the following attributes in subclasses to allow results to be stored by subject with
+    # `primed.primed_anvil.audit_results`.
+    # The model whose instances the audit results are grouped by, e.g., dbGaPApplication.
+    result_subject_model = None
+    # The name of the result field that holds the subject.
+    result_subject_field = None
+    # The name of the __init__ argument used to restrict the audit to a queryset of subjects.
+    result_subject_queryset_argument = None
+    # Arguments to select_related when loading objects referenced by stored results, keyed by model label.
+    stored_result_select_related = {}
+    # The number of saved runs to keep for this audit. Older runs are deleted by `save_run`.
+    n_saved_runs = 30
+
     def __init__(self):
         self.completed = False
         # Set up lists to hold audit results.
@@ -76,6 +126,8 @@ class PRIMEDAudit(ABC):
 
     def run_audit(self):
         """Run the audit and mark it as completed."""
+        # Use a membership closure that is up to date at the start of this audit.
+        clear_group_membership_closure_memo()
         self._run_audit()
         self.completed = True
 
@@ -133,3 +185,166 @@ class PRIMEDAudit(ABC):
         """
         self._check_completed()
         return len(self.errors) + len(self.needs_action) == 0
+
+    @classmethod
+    def for_subjects(cls, queryset):
+        """Return an audit instance that is restricted to a queryset of `result_subject_model` instances."""
+        if cls.result_subject_model is None:
+            raise NotImplementedError("{} does not support stored results.".format(cls.__name__))
+        return cls(**{cls.result_subject_queryset_argument: queryset})
+
+    def get_result_subject_pk(self, result):
+        """Return the pk of the subject that a result belongs to."""
+        return getattr(result, self.result_subject_field).pk
+
+    def get_run_summary(self):
+        """Return a compact, JSON-serializable summary of the results that need action or are errors.
+
+        Verified results are not included, since only issues are compared between runs.
+
+        Returns:
+            list: A dictionary with the result type, list, key, and note for each result.
+        """
+        self._check_completed()
+        return [
+            {
+                "type": type(result).__name__,
+                "list": result_list,
+                "key": result.get_key(),
+                "note": getattr(result, "note", None),
+            }
+            for result_list in RESULT_LISTS
+            if result_list != "verified"
+            for result in getattr(self, result_list)
+        ]
+
+    def save_run(self):
+        """Save a summary of the results of this audit as an AuditRun.
+
+        Only the most recent `n_saved_runs` runs for this audit are kept; older runs are deleted.
+
+        Returns:
+            AuditRun: The saved run.
+        """
+        audit_name = get_audit_name(type(self))
+        run = AuditRun.objects.create(
+            audit_name=audit_name,
+            results=self.get_run_summary(),
+            n_verified=len(self.verified),
+            n_needs_action=len(self.needs_action),
+            n_errors=len(self.errors),
+        )
+        old_pks = list(
+            AuditRun.objects.filter(audit_name=audit_name)
+            .order_by("-created", "-pk")
+            .values_list("pk", flat=True)[self.n_saved_runs :]
+        )
+        if old_pks:
+            AuditRun.objects.filter(pk__in=old_pks).delete()
+        return run
+
+    @classmethod
+    def get_last_run(cls):
+        """Return the most recently saved AuditRun for this audit, or None if no runs have been saved."""
+        return AuditRun.objects.filter(audit_name=get_audit_name(cls)).order_by("-created", "-pk").first()
+
+    def get_changes_since(self, run):
+        """Return the issues that are new or resolved since a previous run.
+
+        Issues are matched by result type and key; changes in the note alone are not reported.
+
+        Args:
+            run: A previous AuditRun for this audit, or None to treat all current issues as new.
+
+        Returns:
+            AuditRunChanges: The new and resolved issues.
+        """
+
+        def get_identifier(summary):
+            return (summary["type"], json.dumps(summary["key"], sort_keys=True))
+
+        current_issues = self.get_run_summary()
+        previous_issues = run.get_issues() if run else []
+        current_identifiers = {get_identifier(x) for x in current_issues}
+        previous_identifiers = {get_identifier(x) for x in previous_issues}
+        return AuditRunChanges(
+            new_issues=[x for x in current_issues if get_identifier(x) not in previous_identifiers],
+            resolved_issues=[x for x in previous_issues if get_identifier(x) not in current_identifiers],
+        )
+
+    def report_and_save_run(self, stdout):
+        """Report the issues that are new or resolved since the last saved run, and save this run.
+
+        Args:
+            stdout: The output of a management command, to which the number of new and resolved issues are written.
+
+        Returns:
+            AuditRunChanges: The new and resolved issues.
+        """
+        changes = self.get_changes_since(self.get_last_run())
+        self.save_run()
+        stdout.write("* New issues since last run: {}".format(len(changes.new_issues)))
+        stdout.write("* Resolved issues since last run: {}".format(len(changes.resolved_issues)))
+        return changes
+
+
+class GroupMemberIndex:
+    """Batched lookup of the direct members of a set of groups and the accounts linked to a set of users.
+
+    Audits that check membership of many groups (e.g., access groups for each agreement or application) can use
+    this class to load all of the members and linked accounts they need in a fixed number of queries, instead of
+    querying for each account, user, or group separately.
+
+    Typical usage:
+        index = GroupMemberIndex(
+            group_pks=[x.anvil_access_group_id for x in agreements],
+            user_pks=[user.pk for x in agreements for user in x.accessors.all()],
+        )
+        account = index.get_account_for_user(user)
+        is_member = index.is_account_in_group(account, agreement.anvil_access_group_id)
+    """
+
+    def __init__(self, group_pks, user_pks):
+        closure = get_group_membership_closure()
+        self._member_account_pks = {pk: closure.get_direct_account_pks(pk) for pk in group_pks}
+        self._member_group_pks = {pk: closure.get_direct_child_pks(pk) for pk in group_pks}
+        all_account_pks = set().union(*self._member_account_pks.values())
+        all_group_pks = set().union(*self._member_group_pks.values())
+        # Keep the default ordering of each model so that results are in a consistent order.
+        self._accounts = {
+            x.pk: x
+            for x in Account.objects.filter(Q(user__in=set(user_pks)) | Q(pk__in=all_account_pks)).select_related(
+                "user"
+            )
+        }
+        self._account_order = {pk: i for i, pk in enumerate(self._accounts)}
+        self._accounts_by_user = {x.user_id: x for x in self._accounts.values() if x.user_id}
+        self._groups = {x.pk: x for x in ManagedGroup.objects.filter(pk__in=all_group_pks)}
+        self._group_order = {pk: i for i, pk in enumerate(self._groups)}
+
+    def _get_accounts(self, account_pks):
+        account_pks = sorted((pk for pk in account_pks if pk in self._accounts), key=self._account_order.__getitem__)
+        return [self._accounts[pk] for pk in account_pks]
+
+    def get_account_for_user(self, user):
+        """Return the Account linked to a user, or None if the user has not linked an account."""
+        return self._accounts_by_user.get(user.pk)
+
+    def get_member_accounts(self, group_pk):
+        """Return a list of Accounts that are direct members of a group."""
+        return self._get_accounts(self._member_account_pks[group_pk])
+
+    def get_member_accounts_in_any_group(self, group_pks):
+        """Return a list of Accounts that are direct members of any of the given groups."""
+        return self._get_accounts(set().union(*[self._member_account_pks[pk] for pk in group_pks]))
+
+    def get_member_groups(self, group_pk):
+        """Return a list of ManagedGroups that are direct members of a group."""
+        group_pks = sorted(
+            (pk for pk in self._member_group_pks[group_pk] if pk in self._groups), key=self._group_order.__getitem__
+        )
+        return [self._groups[pk] for pk in group_pks]
+
+    def is_account_in_group(self, account, group_pk):
+        """Check whether an account is a direct member of a group."""
+        return account.pk in self._member_account_pks[group_pk]
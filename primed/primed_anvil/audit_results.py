@@ -0,0 +1,310 @@
+"""Stored audit results that are updated incrementally.
+
+Running an audit from scratch loads every subject (e.g., every dbGaPApplication) and all of the data needed to audit
+it, even though usually only a handful of subjects have changed since the audit was last run. This module stores the
+results of an audit for each subject in the `StoredAuditResults` model. Signal handlers in each app mark the stored
+results for a subject as stale when data that the audit depends on changes, and `get_stored_audit` only reruns the
+audit for subjects whose results are stale or missing.
+
+Changes that do not send signals (e.g., `bulk_create` or `QuerySet.update`) are not detected. The audit management
+commands store the results of their full runs with `run_and_store_audit`, so stored results are never more out of
+date than the last scheduled audit.
+
+PRIMEDAudit subclasses opt in by setting `result_subject_model`, `result_subject_field`, and
+`result_subject_queryset_argument`.
+"""
+
+import dataclasses
+from collections import defaultdict
+
+from django.apps import apps
+from django.db import models, transaction
+from django.db.models import F, QuerySet
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import StoredAuditResults
+
+RESULT_LISTS = ("verified", "needs_action", "errors")
+
+
+def get_audit_name(audit_class):
+    """Return the name used to store results for a PRIMEDAudit subclass."""
+    return "{}.{}".format(audit_class.__module__, audit_class.__qualname__)
+
+
+def _is_model_reference(value):
+    return isinstance(value, dict) and value.keys() == {"model", "pk"}
+
+
+def serialize_result(result, result_list):
+    """Return a JSON-serializable representation of a PRIMEDAuditResult.
+
+    Model instances are stored as references by model label and pk; all other fields are stored as is.
+
+    Args:
+        result: A PRIMEDAuditResult dataclass instance.
+        result_list: The name of the audit list the result is stored in, e.g. "verified".
+    """
+    fields = {}
+    for field in dataclasses.fields(result):
+        value = getattr(result, field.name)
+        if isinstance(value, models.Model):
+            value = {"model": value._meta.label, "pk": value.pk}
+        fields[field.name] = value
+    return {
+        "class": "{}.{}".format(type(result).__module__, type(result).__qualname__),
+        "list": result_list,
+        "fields": fields,
+    }
+
+
+def get_referenced_objects(serialized_results, select_related=None):
+    """Load all model instances referenced by a set of serialized results, with one query per model.
+
+    Args:
+        serialized_results: An iterable of serialized results, as returned by `serialize_result`.
+        select_related: A dictionary of arguments to `select_related`, keyed by model label.
+
+    Returns:
+        dict: A dictionary mapping model labels to a dictionary of instances keyed by pk.
+    """
+    select_related = select_related or {}
+    pks_by_model = defaultdict(set)
+    for serialized in serialized_results:
+        for value in serialized["fields"].values():
+            if _is_model_reference(value):
+                pks_by_model[value["model"]].add(value["pk"])
+    objects = {}
+    for label, pks in pks_by_model.items():
+        queryset = apps.get_model(label)._default_manager.all()
+        if select_related.get(label):
+            queryset = queryset.select_related(*select_related[label])
+        objects[label] = queryset.in_bulk(pks)
+    return objects
+
+
+def deserialize_result(serialized, objects):
+    """Return the PRIMEDAuditResult for a serialized result.
+
+    The dataclass `__init__` and `__post_init__` methods are not called, since the result was already validated
+    when it was created.
+
+    Args:
+        serialized: A serialized result, as returned by `serialize_result`.
+        objects: Referenced model instances, as returned by `get_referenced_objects`.
+
+    Raises:
+        LookupError: If a referenced object no longer exists.
+        ImportError: If the result class no longer exists.
+    """
+    result_class = import_string(serialized["class"])
+    result = result_class.__new__(result_class)
+    for name, value in serialized["fields"].items():
+        if _is_model_reference(value):
+            value = objects[value["model"]][value["pk"]]
+        setattr(result, name, value)
+    return result
+
+
+def mark_audit_results_stale(audit_class, subject_pks=None):
+    """Mark stored results for an audit as stale so that they are recomputed the next time they are requested.
+
+    Args:
+        audit_class: The PRIMEDAudit subclass whose results should be marked stale.
+        subject_pks: The pks of subjects to mark stale, as an iterable or a `values_list` queryset. If None, all
+            stored results for the audit are marked stale.
+    """
+    queryset = StoredAuditResults.objects.filter(audit_name=get_audit_name(audit_class))
+    if subject_pks is not None:
+        if not isinstance(subject_pks, QuerySet):
+            subject_pks = list(subject_pks)
+        queryset = queryset.filter(subject_pk__in=subject_pks)
+    queryset.update(is_stale=True, version=F("version") + 1)
+
+
+def _get_versions(audit_class, subject_pks, versions=None):
+    """Return the versions of the stored results for a set of subjects, before the audit is run for them.
+
+    Stale rows are created for subjects that do not have stored results, so that `mark_audit_results_stale` can
+    record changes made while the audit is running.
+
+    Args:
+        audit_class: A PRIMEDAudit subclass that supports stored results.
+        subject_pks: The pks of the subjects that the audit will be run on.
+        versions: A dictionary of versions that have already been read, keyed by subject pk.
+
+    Returns:
+        dict: A dictionary mapping each subject pk to the version of its stored results.
+    """
+    audit_name = get_audit_name(audit_class)
+    versions = {pk: versions[pk] for pk in subject_pks if versions and versions.get(pk) is not None}
+    missing_pks = set(subject_pks) - set(versions)
+    if missing_pks:
+        StoredAuditResults.objects.bulk_create(
+            [StoredAuditResults(audit_name=audit_name, subject_pk=pk, is_stale=True) for pk in missing_pks],
+            ignore_conflicts=True,
+        )
+        versions.update(
+            StoredAuditResults.objects.filter(audit_name=audit_name, subject_pk__in=missing_pks).values_list(
+                "subject_pk", "version"
+            )
+        )
+    return versions
+
+
+def _save_results(audit, subject_pks, versions):
+    """Store the results of a completed audit for a set of subjects.
+
+    Rows are only updated if they have not been marked stale again since `versions` was read, so that changes made
+    while the audit was running are not lost.
+
+    Args:
+        audit: A completed PRIMEDAudit instance.
+        subject_pks: The pks of all subjects that the audit was run on.
+        versions: A dictionary mapping subject pks to the version of their stored results, as returned by
+            `_get_versions` before the audit was run.
+
+    Returns:
+        dict: A dictionary mapping subject pks to a list of (result_list, result) tuples.
+    """
+    audit_name = get_audit_name(type(audit))
+    results_by_subject = {pk: [] for pk in subject_pks}
+    serialized_by_subject = {pk: [] for pk in subject_pks}
+    for result_list in RESULT_LISTS:
+        for result in getattr(audit, result_list):
+            subject_pk = audit.get_result_subject_pk(result)
+            results_by_subject[subject_pk].append((result_list, result))
+            serialized_by_subject[subject_pk].append(serialize_result(result, result_list))
+    with transaction.atomic():
+        for subject_pk, serialized in serialized_by_subject.items():
+            StoredAuditResults.objects.filter(
+                audit_name=audit_name, subject_pk=subject_pk, version=versions.get(subject_pk)
+            ).update(results=serialized, is_stale=False, modified=timezone.now())
+    return results_by_subject
+
+
+def _get_subject_pks(audit):
+    subjects = getattr(audit, audit.result_subject_queryset_argument)
+    if isinstance(subjects, QuerySet):
+        return set(subjects.values_list("pk", flat=True))
+    return {x.pk for x in subjects}
+
+
+def run_and_store_audit(audit):
+    """Run an audit and store its results, replacing any stored results for the subjects it is run on.
+
+    The audit should only be restricted to a set of subjects, since the stored results for each subject replace all
+    previously stored results for that subject. The versions of the stored results are read before the audit is run,
+    so results for subjects that are marked stale while it is running are not stored as up to date.
+    """
+    subject_pks = _get_subject_pks(audit)
+    versions = _get_versions(type(audit), subject_pks)
+    audit.run_audit()
+    _save_results(audit, subject_pks, versions)
+
+
+def get_outdated_subject_pks(audit_class):
+    """Return the pks of subjects whose stored results for an audit are stale or missing.
+
+    Args:
+        audit_class: A PRIMEDAudit subclass that supports stored results.
+
+    Returns:
+        dict: A dictionary mapping the pk of each outdated subject to the version of its stored results, or None if
+            it has no stored results.
+    """
+    subject_model = audit_class.result_subject_model
+    outdated = {pk: None for pk in subject_model._default_manager.values_list("pk", flat=True)}
+    rows = StoredAuditResults.objects.filter(audit_name=get_audit_name(audit_class)).values_list(
+        "subject_pk", "version", "is_stale"
+    )
+    for subject_pk, version, is_stale in rows:
+        if subject_pk not in outdated:
+            continue
+        if is_stale:
+            outdated[subject_pk] = version
+        else:
+            del outdated[subject_pk]
+    return outdated
+
+
+def refresh_stored_audit_results(audit_class, batch_size=100, progress_callback=None):
+    """Rerun an audit for subjects whose stored results are stale or missing, in batches.
+
+    The results for each batch are stored as soon as it has finished, so that they are available before the whole
+    refresh is complete.
+
+    Args:
+        audit_class: A PRIMEDAudit subclass that supports stored results.
+        batch_size: The number of subjects to audit at a time.
+        progress_callback: A function called as `progress_callback(n_done, n_total)` after each batch.
+    """
+    subject_model = audit_class.result_subject_model
+    outdated = get_outdated_subject_pks(audit_class)
+    versions = {pk: version for pk, version in outdated.items() if version is not None}
+    subject_pks = sorted(outdated)
+    for start in range(0, len(subject_pks), batch_size):
+        batch_pks = subject_pks[start : start + batch_size]
+        batch_versions = _get_versions(audit_class, batch_pks, versions)
+        audit = audit_class.for_subjects(subject_model._default_manager.filter(pk__in=batch_pks))
+        audit.run_audit()
+        _save_results(audit, batch_pks, batch_versions)
+        if progress_callback:
+            progress_callback(start + len(batch_pks), len(subject_pks))
+
+
+def get_stored_audit(audit_class, refresh=True):
+    """Return a completed audit of all subjects, rerunning it only for subjects without up-to-date stored results.
+
+    Stored results for subjects that no longer exist are deleted.
+
+    Args:
+        audit_class: A PRIMEDAudit subclass that supports stored results.
+        refresh: If False, stale stored results are returned as they are and subjects without stored results are
+            left out, instead of rerunning the audit for them.
+
+    Returns:
+        A completed instance of `audit_class` whose results are loaded from the stored results.
+    """
+    subject_model = audit_class.result_subject_model
+    audit = audit_class.for_subjects(subject_model._default_manager.all())
+    subject_pks = set(subject_model._default_manager.values_list("pk", flat=True))
+    versions = {}
+    stored = {}
+    removed = []
+    for row in StoredAuditResults.objects.filter(audit_name=get_audit_name(audit_class)):
+        if row.subject_pk not in subject_pks:
+            removed.append(row.pk)
+            continue
+        versions[row.subject_pk] = row.version
+        if not row.is_stale or not refresh:
+            stored[row.subject_pk] = row.results
+    if removed:
+        StoredAuditResults.objects.filter(pk__in=removed).delete()
+
+    # Load results that are up to date.
+    objects = get_referenced_objects(
+        [x for serialized in stored.values() for x in serialized], audit.stored_result_select_related
+    )
+    results_by_subject = {}
+    for subject_pk, serialized in stored.items():
+        try:
+            results_by_subject[subject_pk] = [(x["list"], deserialize_result(x, objects)) for x in serialized]
+        except (LookupError, ImportError):
+            # Something that the results refer to has been deleted or renamed; rerun the audit for this subject.
+            pass
+
+    # Rerun the audit for any remaining subjects.
+    dirty_pks = subject_pks - set(results_by_subject)
+    if dirty_pks and refresh:
+        versions = _get_versions(audit_class, dirty_pks, versions)
+        dirty_audit = audit_class.for_subjects(subject_model._default_manager.filter(pk__in=dirty_pks))
+        dirty_audit.run_audit()
+        results_by_subject.update(_save_results(dirty_audit, dirty_pks, versions))
+
+    for subject_pk in sorted(results_by_subject):
+        for result_list, result in results_by_subject[subject_pk]:
+            getattr(audit, result_list).append(result)
+    audit.completed = True
+    return audit
@@ -0,0 +1,117 @@
+"""Refresh stored audit results in a background thread.
+
+Audit pages use this module so that a request does not have to wait while a large audit runs. The status of each
+refresh is stored in the default cache, so that all viewers of an audit share a single in-flight refresh and can poll
+for its progress. The status records the host and process running the refresh, so that a refresh whose process has
+exited (e.g., a recycled web worker) is detected and restarted.
+"""
+
+import logging
+import os
+import socket
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .audit_results import get_audit_name, refresh_stored_audit_results
+
+logger = logging.getLogger(__name__)
+
+STATUS_RUNNING = "running"
+STATUS_FAILED = "failed"
+
+# Seconds without a progress update after which an in-flight refresh is assumed to have died.
+RUNNING_TIMEOUT = 10 * 60
+# Seconds for which a failed refresh is reported, and the stored results are shown as they are, before another
+# refresh can be started.
+FAILED_TIMEOUT = 60 * 60
+# Number of subjects to audit between progress updates.
+BATCH_SIZE = 50
+
+executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="audit_refresh")
+
+
+def _get_cache_key(audit_class):
+    return "audit_refresh:{}".format(get_audit_name(audit_class))
+
+
+def _is_process_alive(status):
+    """Return whether the process running a refresh may still be alive.
+
+    Only processes on this host can be checked; refreshes on other hosts are assumed to be alive until their status
+    expires after `RUNNING_TIMEOUT` seconds without a progress update.
+    """
+    if status.get("host") != socket.gethostname() or status.get("pid") == os.getpid():
+        return True
+    try:
+        os.kill(status["pid"], 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # The process exists but belongs to another user.
+        return True
+    return True
+
+
+def get_refresh_status(audit_class):
+    """Return the status of the in-flight or recently failed refresh of an audit, or None if there is none.
+
+    The status is a dictionary with keys "status", "started", "n_done", "n_total", "host", and "pid". None is
+    returned if the process running an in-flight refresh has exited, so that another refresh can be started.
+    """
+    key = _get_cache_key(audit_class)
+    status = cache.get(key)
+    if status is not None and status["status"] == STATUS_RUNNING and not _is_process_alive(status):
+        logger.warning("Refresh of stored results for {} is no longer running.".format(audit_class.__name__))
+        cache.delete(key)
+        return None
+    return status
+
+
+def start_refresh(audit_class):
+    """Start refreshing the stored results of an audit in the background, unless a refresh is already in progress.
+
+    The refresh is started after the current transaction is committed, so that it sees any changes made in the
+    request that started it.
+
+    Returns:
+        dict: The status of the refresh.
+    """
+    status = {
+        "status": STATUS_RUNNING,
+        "started": timezone.now(),
+        "n_done": 0,
+        "n_total": None,
+        "host": socket.gethostname(),
+        "pid": os.getpid(),
+    }
+    # cache.add is atomic, so only one request starts a refresh.
+    if cache.add(_get_cache_key(audit_class), status, RUNNING_TIMEOUT):
+        transaction.on_commit(lambda: executor.submit(_refresh_in_thread, audit_class, status))
+        return status
+    return get_refresh_status(audit_class) or status
+
+
+def _refresh(audit_class, status):
+    key = _get_cache_key(audit_class)
+
+    def update_progress(n_done, n_total):
+        cache.set(key, dict(status, n_done=n_done, n_total=n_total), RUNNING_TIMEOUT)
+
+    try:
+        refresh_stored_audit_results(audit_class, batch_size=BATCH_SIZE, progress_callback=update_progress)
+    except Exception:
+        logger.exception("Error refreshing stored results for {}.".format(audit_class.__name__))
+        cache.set(key, dict(status, status=STATUS_FAILED), FAILED_TIMEOUT)
+    else:
+        cache.delete(key)
+
+
+def _refresh_in_thread(audit_class, status):
+    try:
+        _refresh(audit_class, status)
+    finally:
+        # Threads do not get the connection cleanup that Django does at the end of each request.
+        connection.close()
@@ -1,7 +1,10 @@
-from itertools import groupby
+from collections import defaultdict
+from itertools import chain, groupby
+from uuid import uuid4
 
-import pandas as pd
 from anvil_consortium_manager.models import ManagedGroup, WorkspaceGroupSharing
+from django.core.cache import cache
+from django.db import transaction
 from django.db.models import CharField, Exists, F, OuterRef, Value
 from django.db.models.functions import Concat
 
@@ -11,12 +14,38 @@ from primed.miscellaneous_workspaces.models import OpenAccessWorkspace, Simulate
 
 from .models import AvailableData
 
+SUMMARY_TABLE_VERSION_CACHE_KEY = "primed_anvil:data_summary_version"
+# Seconds to keep the summary table data for a version; old versions are not used again once the version changes.
+SUMMARY_TABLE_CACHE_TIMEOUT = 60 * 60 * 24
+INVENTORY_VERSION_CACHE_KEY = "primed_anvil:inventory_version"
+# Seconds to keep the inventory for a version; old versions are not used again once the version changes.
+INVENTORY_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def _get_cache_version(version_key):
+    """Return the current version stored at `version_key`, creating a new version if there is none."""
+    version = cache.get(version_key)
+    if version is None:
+        version = uuid4().hex
+        # cache.add is atomic, so concurrent requests agree on the new version.
+        if not cache.add(version_key, version, None):
+            version = cache.get(version_key) or version
+    return version
+
+
+def _clear_cache_version(version_key):
+    """Clear the version stored at `version_key`, so that data cached for the old version is no longer used."""
+    cache.delete(version_key)
+    # Clear it again after the transaction is committed, in case another request created a new version and cached
+    # data from the database state before the commit.
+    transaction.on_commit(lambda: cache.delete(version_key))
+
 
 def get_summary_table_data():
     """Get data for the summary table."""
 
     # If no available data objects exist, raise ???.
-    available_data_types = AvailableData.objects.values_list("name", flat=True)
+    available_data_types = list(AvailableData.objects.values_list("name", flat=True))
     if not len(available_data_types):
         raise RuntimeError("get_summary_table_data requires at least one AvailableData object to exist.")
 
@@ -39,7 +68,6 @@ def get_summary_table_data():
         study_name=F("dbgap_study_accession__studies__short_name"),
         data=F("available_data__name"),
     )
-    df_dbgap = pd.DataFrame.from_dict(dbgap)
 
     # Query for OpenAccessWorkspaces.
     open = OpenAccessWorkspace.objects.annotate(
@@ -53,7 +81,6 @@ def get_summary_table_data():
         study_name=F("studies__short_name"),
         data=F("available_data__name"),
     )
-    df_open = pd.DataFrame.from_dict(open)
 
     # Query for CDSAWorkspaces.
     cdsa = CDSAWorkspace.objects.annotate(
@@ -67,69 +94,66 @@ def get_summary_table_data():
         study_name=F("study__short_name"),
         data=F("available_data__name"),
     )
-    df_cdsa = pd.DataFrame.from_dict(cdsa)
 
     # This union may not work with MySQL < 10.3:
     # https://code.djangoproject.com/ticket/31445
-    # qs = dbgap.union(open)
-    #
-    # # If there are no workspaces, return an empty list.
-    # if not qs.exists():
-    #     return []
-    #
-    # # Otherwise, start making the summary table.
-    # df = pd.DataFrame.from_dict(qs)
-
-    # Instead combine in pandas.
-    df = pd.concat([df_cdsa, df_dbgap, df_open])
-
-    # If there are no workspaces, return an empty list.
-    if df.empty:
-        return []
-
-    # Sort by specific columns
-    df = df.sort_values(by=["study_name", "access_mechanism"])
-    # Concatenate multiple studies into a single comma-delimited string.
-    df = (
-        df.groupby(
-            ["workspace_name", "data", "is_shared", "access_mechanism"],
-            dropna=False,
-        )["study_name"]
-        .apply(lambda x: ", ".join(x))
-        .reset_index()
-        .drop("workspace_name", axis=1)
-    )
-    # Replace None/NaNs with a dummy column for pivoting.
-    # If we don't do this, data can sometimes get dropped.
-    df["data"] = df["data"].fillna("no_data")
-    # Pivot so that the available data types are their own columns.
-    data = (
-        pd.pivot_table(
-            df,
-            index=["study_name", "is_shared", "access_mechanism"],
-            columns=["data"],
-            # set this to len to count the number of workspaces instead of returning a boolean value.
-            aggfunc=lambda x: len(x) > 0,
-            fill_value=False,
-            # aggfunc=len,
-            # fill_value=0,
+    # Instead, combine the results in Python.
+    # Each row has one study and one data type for a workspace; collect the studies for each workspace and data type.
+    # Workspaces without any studies are not included in the summary.
+    studies_by_workspace = defaultdict(set)
+    for row in chain(cdsa, dbgap, open):
+        if row["study_name"] is not None:
+            key = (row["workspace_name"], row["data"], row["is_shared"], row["access_mechanism"])
+            studies_by_workspace[key].add(row["study_name"])
+
+    # Combine workspaces with the same set of studies, sharing status, and access mechanism into one row, with a
+    # boolean column for each available data type.
+    rows = {}
+    for (workspace_name, data, is_shared, access_mechanism), study_names in studies_by_workspace.items():
+        # Concatenate multiple studies into a single comma-delimited string.
+        study = ", ".join(sorted(study_names))
+        row = rows.setdefault(
+            (study, is_shared, access_mechanism),
+            {
+                "study": study,
+                "is_shared": is_shared,
+                "access_mechanism": access_mechanism,
+                **{x: False for x in available_data_types},
+            },
         )
-        .rename_axis(columns=None)
-        .reset_index()
-        .rename(columns={"study_name": "study", "B": "c"})
-    )
-    # Remove the dummy "no_data" column if it exists.
-    if "no_data" in data:
-        data = data.drop("no_data", axis=1)
-    # Add columns for data types that have no workspaces in this list.
-    for available_data in available_data_types:
-        if available_data not in data:
-            data[available_data] = False
-    # Convert to a list of dictionaries for passing to the django-tables2 table.
-    data = data.to_dict(orient="records")
+        if data is not None:
+            row[data] = True
+    # Sort rows by study, sharing status, and access mechanism.
+    return [rows[key] for key in sorted(rows)]
+
+
+def get_summary_table_version():
+    """Return a stamp that changes whenever the data in the summary table could change.
+
+    The stamp is cleared by signal handlers (see `clear_cached_summary_table_data`).
+    """
+    return _get_cache_version(SUMMARY_TABLE_VERSION_CACHE_KEY)
+
+
+def get_cached_summary_table_data():
+    """Get data for the summary table, using the cached copy for the current version if it exists.
+
+    The data is cached under a key that includes the version, so data computed from the database state before a
+    change is never used after the version is cleared.
+    """
+    key = "primed_anvil:data_summary:{}".format(get_summary_table_version())
+    data = cache.get(key)
+    if data is None:
+        data = get_summary_table_data()
+        cache.set(key, data, SUMMARY_TABLE_CACHE_TIMEOUT)
     return data
 
 
+def clear_cached_summary_table_data():
+    """Clear the summary table version, so that the summary table is recomputed with a new version."""
+    _clear_cache_version(SUMMARY_TABLE_VERSION_CACHE_KEY)
+
+
 def get_workspaces_for_inventory():
     """Get input to the primed-phenotype-inventory workflow.
 
@@ -242,3 +266,31 @@ def get_workspaces_for_inventory():
         json[key] = ", ".join(sorted(study_names))
 
     return json
+
+
+def get_inventory_version():
+    """Return a stamp that changes whenever the input to the primed-phenotype-inventory workflow could change.
+
+    The stamp is cleared by signal handlers when workspace sharing with PRIMED_ALL or study links change.
+    """
+    return _get_cache_version(INVENTORY_VERSION_CACHE_KEY)
+
+
+def get_cached_workspaces_for_inventory():
+    """Get input to the primed-phenotype-inventory workflow, using the cached copy for the current version.
+
+    Returns:
+        tuple: The inventory version (see `get_inventory_version`) and the output of `get_workspaces_for_inventory`.
+    """
+    version = get_inventory_version()
+    key = "primed_anvil:inventory:{}".format(version)
+    workspaces = cache.get(key)
+    if workspaces is None:
+        workspaces = get_workspaces_for_inventory()
+        cache.set(key, workspaces, INVENTORY_CACHE_TIMEOUT)
+    return version, workspaces
+
+
+def clear_inventory_version():
+    """Clear the inventory version, so that the inventory is recomputed with a new version."""
+    _clear_cache_version(INVENTORY_VERSION_CACHE_KEY)
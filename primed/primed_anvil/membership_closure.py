@@ -0,0 +1,229 @@
+"""Transitive closure of AnVIL group membership.
+
+Audits and tables frequently need to know whether a group or account is (directly or indirectly) a member of
+another group. Computing this with `ManagedGroup.get_all_parents` or `Account.get_all_groups` issues queries for
+every check. The `GroupMembershipClosure` class instead loads all `GroupGroupMembership` and
+`GroupAccountMembership` records in two queries and materializes the ancestor and descendant sets for every group,
+so that membership checks are set lookups.
+
+A shared closure is stored in the default cache, and is memoized in each thread for the duration of a request or an
+audit run so that repeated lookups do not load it from the cache again. Use `get_group_membership_closure` to
+retrieve it. The signal handlers in `primed.primed_anvil.signals` update the memoized closure and discard the cached
+closure when memberships are added or deleted. Changes that do not send signals (e.g., `bulk_create`) are not
+detected.
+"""
+
+import threading
+from collections import defaultdict
+
+from anvil_consortium_manager.models import GroupAccountMembership, GroupGroupMembership
+from django.core.cache import cache
+from django.db import transaction
+
+CACHE_KEY = "primed_anvil_group_membership_closure"
+
+_memo = threading.local()
+
+
+def _get_pk(obj):
+    """Return the pk of a model instance, or the object itself if it is already a pk."""
+    return getattr(obj, "pk", obj)
+
+
+class GroupMembershipClosure:
+    """Materialized ancestor and descendant relationships for ManagedGroups and Accounts.
+
+    All methods accept either model instances or pks, and all sets that are returned contain pks.
+    Returned sets should be treated as read-only.
+    """
+
+    def __init__(self):
+        # Direct memberships.
+        self._parents = defaultdict(set)
+        self._children = defaultdict(set)
+        self._account_groups = defaultdict(set)
+        self._group_accounts = defaultdict(set)
+        # Materialized transitive memberships.
+        self._ancestors = defaultdict(set)
+        self._descendants = defaultdict(set)
+        # Lazily computed transitive groups for each account.
+        self._account_all_groups = {}
+
+    @classmethod
+    def from_database(cls):
+        """Build the closure from all group and account memberships in the database."""
+        closure = cls()
+        for parent_pk, child_pk in GroupGroupMembership.objects.values_list("parent_group", "child_group"):
+            closure._parents[child_pk].add(parent_pk)
+            closure._children[parent_pk].add(child_pk)
+        for group_pk, account_pk in GroupAccountMembership.objects.values_list("group", "account"):
+            closure._account_groups[account_pk].add(group_pk)
+            closure._group_accounts[group_pk].add(account_pk)
+        for group_pk in set(closure._parents) | set(closure._children):
+            closure._ancestors[group_pk] = closure._traverse(group_pk, closure._parents)
+            closure._descendants[group_pk] = closure._traverse(group_pk, closure._children)
+        return closure
+
+    @staticmethod
+    def _traverse(group_pk, edges):
+        """Return all groups reachable from a group by following the given direct edges."""
+        reached = set()
+        to_visit = list(edges.get(group_pk, ()))
+        while to_visit:
+            pk = to_visit.pop()
+            if pk not in reached:
+                reached.add(pk)
+                to_visit.extend(edges.get(pk, ()))
+        return reached
+
+    def get_all_parent_pks(self, group):
+        """Return the pks of all groups that this group is a member of, directly or indirectly."""
+        return self._ancestors.get(_get_pk(group), set())
+
+    def get_all_child_pks(self, group):
+        """Return the pks of all groups that are members of this group, directly or indirectly."""
+        return self._descendants.get(_get_pk(group), set())
+
+    def get_direct_parent_pks(self, group):
+        """Return the pks of groups that this group is a direct member of."""
+        return self._parents.get(_get_pk(group), set())
+
+    def get_direct_child_pks(self, group):
+        """Return the pks of groups that are direct members of this group."""
+        return self._children.get(_get_pk(group), set())
+
+    def get_direct_account_pks(self, group):
+        """Return the pks of accounts that are direct members of this group."""
+        return self._group_accounts.get(_get_pk(group), set())
+
+    def get_all_account_pks(self, group):
+        """Return the pks of all accounts that are members of this group, directly or indirectly."""
+        group_pk = _get_pk(group)
+        account_pks = set(self._group_accounts.get(group_pk, ()))
+        for child_pk in self._descendants.get(group_pk, ()):
+            account_pks.update(self._group_accounts.get(child_pk, ()))
+        return account_pks
+
+    def get_direct_group_pks_for_account(self, account):
+        """Return the pks of groups that this account is a direct member of."""
+        return self._account_groups.get(_get_pk(account), set())
+
+    def get_all_group_pks_for_account(self, account):
+        """Return the pks of all groups that this account is a member of, directly or indirectly."""
+        account_pk = _get_pk(account)
+        if account_pk not in self._account_all_groups:
+            group_pks = set(self._account_groups.get(account_pk, ()))
+            for group_pk in self._account_groups.get(account_pk, ()):
+                group_pks.update(self._ancestors.get(group_pk, ()))
+            self._account_all_groups[account_pk] = group_pks
+        return self._account_all_groups[account_pk]
+
+    def is_group_in_group(self, child, parent, direct=False):
+        """Check whether a group is a member of another group.
+
+        Args:
+            child: The group that may be a member.
+            parent: The group that may contain `child`.
+            direct: If True, only consider direct membership.
+        """
+        if direct:
+            return _get_pk(parent) in self.get_direct_parent_pks(child)
+        return _get_pk(parent) in self.get_all_parent_pks(child)
+
+    def is_account_in_group(self, account, group, direct=False):
+        """Check whether an account is a member of a group.
+
+        Args:
+            account: The account that may be a member.
+            group: The group that may contain `account`.
+            direct: If True, only consider direct membership.
+        """
+        if direct:
+            return _get_pk(group) in self.get_direct_group_pks_for_account(account)
+        return _get_pk(group) in self.get_all_group_pks_for_account(account)
+
+    def add_group_membership(self, parent, child):
+        """Update the closure for a new GroupGroupMembership."""
+        parent_pk = _get_pk(parent)
+        child_pk = _get_pk(child)
+        self._parents[child_pk].add(parent_pk)
+        self._children[parent_pk].add(child_pk)
+        # Every ancestor of the parent (and the parent) is now an ancestor of the child and its descendants.
+        new_ancestors = self._ancestors[parent_pk] | {parent_pk}
+        new_descendants = self._descendants[child_pk] | {child_pk}
+        for pk in new_descendants:
+            self._ancestors[pk] |= new_ancestors
+        for pk in new_ancestors:
+            self._descendants[pk] |= new_descendants
+        self._account_all_groups.clear()
+
+    def remove_group_membership(self, parent, child):
+        """Update the closure for a deleted GroupGroupMembership."""
+        parent_pk = _get_pk(parent)
+        child_pk = _get_pk(child)
+        self._parents[child_pk].discard(parent_pk)
+        self._children[parent_pk].discard(child_pk)
+        # Only the child and its descendants can lose ancestors, and only the parent and its ancestors
+        # can lose descendants. Recompute those from the remaining direct memberships.
+        for pk in self._descendants[child_pk] | {child_pk}:
+            self._ancestors[pk] = self._traverse(pk, self._parents)
+        for pk in self._ancestors[parent_pk] | {parent_pk}:
+            self._descendants[pk] = self._traverse(pk, self._children)
+        self._account_all_groups.clear()
+
+    def add_account_membership(self, group, account):
+        """Update the closure for a new GroupAccountMembership."""
+        group_pk = _get_pk(group)
+        account_pk = _get_pk(account)
+        self._account_groups[account_pk].add(group_pk)
+        self._group_accounts[group_pk].add(account_pk)
+        self._account_all_groups.pop(account_pk, None)
+
+    def remove_account_membership(self, group, account):
+        """Update the closure for a deleted GroupAccountMembership."""
+        group_pk = _get_pk(group)
+        account_pk = _get_pk(account)
+        self._account_groups[account_pk].discard(group_pk)
+        self._group_accounts[group_pk].discard(account_pk)
+        self._account_all_groups.pop(account_pk, None)
+
+
+def get_group_membership_closure():
+    """Return the shared GroupMembershipClosure.
+
+    The closure is memoized in the current thread until `clear_group_membership_closure_memo` is called, which is
+    done at the start and end of each request and at the start of each audit run. Otherwise, it is loaded from the
+    cache, or built from the database if it is not cached.
+    """
+    closure = getattr(_memo, "closure", None)
+    if closure is None:
+        closure = cache.get(CACHE_KEY)
+        if closure is None:
+            closure = GroupMembershipClosure.from_database()
+            cache.set(CACHE_KEY, closure, None)
+        _memo.closure = closure
+    return closure
+
+
+def clear_group_membership_closure_memo():
+    """Clear the closure memoized in the current thread, so that it is loaded again when it is next requested."""
+    _memo.closure = None
+
+
+def update_group_membership_closure(method_name, *args):
+    """Update the shared GroupMembershipClosure for an added or deleted membership.
+
+    The closure memoized in the current thread, if any, is updated in place so that later lookups in the same request
+    or audit see the change. The cached closure is discarded and rebuilt when it is next requested.
+
+    Args:
+        method_name: The name of the `GroupMembershipClosure` update method to call, e.g. "add_group_membership".
+        *args: Arguments to pass to the update method.
+    """
+    closure = getattr(_memo, "closure", None)
+    if closure is not None:
+        getattr(closure, method_name)(*args)
+    cache.delete(CACHE_KEY)
+    # Discard it again after the transaction is committed, in case another request cached a closure built from the
+    # database state before the commit.
+    transaction.on_commit(lambda: cache.delete(CACHE_KEY))
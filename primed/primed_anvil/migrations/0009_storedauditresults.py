@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-17 12:00
+
+from django.db import migrations, models
+import django_extensions.db.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('primed_anvil', '0008_alter_studysite_member_group'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredAuditResults',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True, verbose_name='created')),
+                ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True, verbose_name='modified')),
+                ('audit_name', models.CharField(help_text='The dotted path of the PRIMEDAudit subclass.', max_length=255)),
+                ('subject_pk', models.PositiveBigIntegerField(help_text='The pk of the subject that the results are for.')),
+                ('results', models.JSONField(default=list, help_text='Serialized audit results for this subject.')),
+                ('is_stale', models.BooleanField(default=False, help_text='Whether the results need to be recomputed.')),
+                ('version', models.PositiveIntegerField(default=0, help_text='Incremented every time the results are marked stale.')),
+            ],
+            options={
+                'verbose_name_plural': 'stored audit results',
+                'constraints': [models.UniqueConstraint(fields=('audit_name', 'subject_pk'), name='unique_stored_audit_results')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-17 12:30
+
+from django.db import migrations, models
+import django_extensions.db.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('primed_anvil', '0009_storedauditresults'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True, verbose_name='created')),
+                ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True, verbose_name='modified')),
+                ('audit_name', models.CharField(help_text='The dotted path of the PRIMEDAudit subclass.', max_length=255)),
+                ('results', models.JSONField(default=list, help_text='Summaries of the results of this run.')),
+                ('n_verified', models.PositiveIntegerField(help_text='The number of verified results.')),
+                ('n_needs_action', models.PositiveIntegerField(help_text='The number of results that need action.')),
+                ('n_errors', models.PositiveIntegerField(help_text='The number of errors.')),
+            ],
+            options={
+                'get_latest_by': 'created',
+                'indexes': [models.Index(fields=['audit_name', 'created'], name='primed_anvil_auditrun_name')],
+            },
+        ),
+    ]
@@ -89,3 +89,54 @@ class RequesterModel(models.Model):
 
     class Meta:
         abstract = True
+
+
+class StoredAuditResults(TimeStampedModel, models.Model):
+    """A model to store the results of an audit for a single subject (e.g., a dbGaPApplication).
+
+    Rows are marked stale by signal handlers when the data that an audit depends on changes, and are
+    recomputed the next time the audit results are requested. See `primed.primed_anvil.audit_results`.
+    """
+
+    audit_name = models.CharField(max_length=255, help_text="The dotted path of the PRIMEDAudit subclass.")
+    subject_pk = models.PositiveBigIntegerField(help_text="The pk of the subject that the results are for.")
+    results = models.JSONField(default=list, help_text="Serialized audit results for this subject.")
+    is_stale = models.BooleanField(default=False, help_text="Whether the results need to be recomputed.")
+    version = models.PositiveIntegerField(default=0, help_text="Incremented every time the results are marked stale.")
+
+    class Meta:
+        verbose_name_plural = "stored audit results"
+        constraints = [
+            models.UniqueConstraint(fields=["audit_name", "subject_pk"], name="unique_stored_audit_results"),
+        ]
+
+    def __str__(self):
+        return "{} {}".format(self.audit_name, self.subject_pk)
+
+
+class AuditRun(TimeStampedModel, models.Model):
+    """A model to store a compact summary of a completed audit run.
+
+    Only the result type, the keys of the objects the result refers to, and the note are stored for each result that
+    needs action or is an error, so that runs can be compared to find new and resolved issues. Verified results are
+    only counted. See `PRIMEDAudit.save_run`.
+    """
+
+    audit_name = models.CharField(max_length=255, help_text="The dotted path of the PRIMEDAudit subclass.")
+    results = models.JSONField(default=list, help_text="Summaries of the results of this run.")
+    n_verified = models.PositiveIntegerField(help_text="The number of verified results.")
+    n_needs_action = models.PositiveIntegerField(help_text="The number of results that need action.")
+    n_errors = models.PositiveIntegerField(help_text="The number of errors.")
+
+    class Meta:
+        get_latest_by = "created"
+        indexes = [
+            models.Index(fields=["audit_name", "created"], name="primed_anvil_auditrun_name"),
+        ]
+
+    def __str__(self):
+        return "{} {}".format(self.audit_name, self.created)
+
+    def get_issues(self):
+        """Return the summaries of results that need action or are errors."""
+        return [x for x in self.results if x["list"] != "verified"]
@@ -0,0 +1,85 @@
+from anvil_consortium_manager.models import GroupAccountMembership, GroupGroupMembership, WorkspaceGroupSharing
+from django.core.signals import request_finished, request_started
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from primed.cdsa.models import CDSAWorkspace
+from primed.dbgap.models import dbGaPStudyAccession, dbGaPWorkspace
+from primed.miscellaneous_workspaces.models import OpenAccessWorkspace, SimulatedDataWorkspace
+
+from .helpers import clear_cached_summary_table_data, clear_inventory_version
+from .membership_closure import clear_group_membership_closure_memo, update_group_membership_closure
+from .models import AvailableData, Study
+
+
+@receiver(request_started)
+@receiver(request_finished)
+def request_boundary(sender, **kwargs):
+    # The membership closure is only memoized for the duration of a request.
+    clear_group_membership_closure_memo()
+
+
+@receiver(post_save, sender=GroupGroupMembership)
+def group_group_membership_saved(sender, instance, created, **kwargs):
+    # Only new memberships change the closure; updates only change the role.
+    if created:
+        update_group_membership_closure("add_group_membership", instance.parent_group_id, instance.child_group_id)
+
+
+@receiver(post_delete, sender=GroupGroupMembership)
+def group_group_membership_deleted(sender, instance, **kwargs):
+    update_group_membership_closure("remove_group_membership", instance.parent_group_id, instance.child_group_id)
+
+
+@receiver(post_save, sender=GroupAccountMembership)
+def group_account_membership_saved(sender, instance, created, **kwargs):
+    if created:
+        update_group_membership_closure("add_account_membership", instance.group_id, instance.account_id)
+
+
+@receiver(post_delete, sender=GroupAccountMembership)
+def group_account_membership_deleted(sender, instance, **kwargs):
+    update_group_membership_closure("remove_account_membership", instance.group_id, instance.account_id)
+
+
+@receiver([post_save, post_delete], sender=AvailableData)
+@receiver([post_save, post_delete], sender=Study)
+@receiver([post_save, post_delete], sender=dbGaPWorkspace)
+@receiver([post_save, post_delete], sender=CDSAWorkspace)
+@receiver([post_save, post_delete], sender=OpenAccessWorkspace)
+def data_summary_object_changed(sender, **kwargs):
+    clear_cached_summary_table_data()
+
+
+@receiver(m2m_changed, sender=dbGaPStudyAccession.studies.through)
+@receiver(m2m_changed, sender=dbGaPWorkspace.available_data.through)
+@receiver(m2m_changed, sender=CDSAWorkspace.available_data.through)
+@receiver(m2m_changed, sender=OpenAccessWorkspace.studies.through)
+@receiver(m2m_changed, sender=OpenAccessWorkspace.available_data.through)
+def data_summary_relation_changed(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        clear_cached_summary_table_data()
+
+
+@receiver([post_save, post_delete], sender=Study)
+@receiver([post_save, post_delete], sender=dbGaPWorkspace)
+@receiver([post_save, post_delete], sender=CDSAWorkspace)
+@receiver([post_save, post_delete], sender=OpenAccessWorkspace)
+@receiver([post_save, post_delete], sender=SimulatedDataWorkspace)
+def inventory_object_changed(sender, **kwargs):
+    clear_inventory_version()
+
+
+@receiver(m2m_changed, sender=dbGaPStudyAccession.studies.through)
+@receiver(m2m_changed, sender=OpenAccessWorkspace.studies.through)
+def inventory_relation_changed(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        clear_inventory_version()
+
+
+@receiver([post_save, post_delete], sender=WorkspaceGroupSharing)
+def workspace_group_sharing_changed(sender, instance, **kwargs):
+    # Only sharing with the consortium is shown in the data summary and the inventory.
+    if instance.group.name == "PRIMED_ALL":
+        clear_cached_summary_table_data()
+        clear_inventory_version()
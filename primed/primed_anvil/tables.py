@@ -1,7 +1,8 @@
 import django_tables2 as tables
-from anvil_consortium_manager.models import Account, ManagedGroup, Workspace
+from anvil_consortium_manager.models import Account, ManagedGroup, Workspace, WorkspaceGroupSharing
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Exists, OuterRef, QuerySet
 from django.utils.html import format_html
 from django.utils.safestring import mark_safe
 
@@ -50,8 +51,18 @@ class BooleanIconColumn(tables.BooleanColumn):
         return rendered_value
 
 
+def annotate_is_shared_with_consortium(queryset):
+    """Annotate a Workspace queryset with `is_shared_with_consortium`, indicating if it is shared with PRIMED_ALL."""
+    shared = WorkspaceGroupSharing.objects.filter(group__name="PRIMED_ALL", workspace=OuterRef("pk"))
+    return queryset.annotate(is_shared_with_consortium=Exists(shared))
+
+
 class WorkspaceSharedWithConsortiumColumn(BooleanIconColumn):
-    """Column that adds a check box if the workspace is shared with PRIMED_ALL."""
+    """Column that adds a check box if the workspace is shared with PRIMED_ALL.
+
+    Tables using this column should also inherit from `WorkspaceSharedWithConsortiumTableMixin`, so that sharing is
+    loaded in the same query as the workspaces. Otherwise, sharing is checked with a separate query for each row.
+    """
 
     def __init__(self, verbose_name="Shared with PRIMED?", orderable=False, **kwargs):
         super().__init__(verbose_name=verbose_name, orderable=orderable, **kwargs)
@@ -60,11 +71,22 @@ class WorkspaceSharedWithConsortiumColumn(BooleanIconColumn):
         # Check if it is a workspace
         if not isinstance(record, Workspace):
             raise ImproperlyConfigured("record must be a Workspace")
+        if hasattr(record, "is_shared_with_consortium"):
+            return record.is_shared_with_consortium
         is_shared = record.workspacegroupsharing_set.filter(group__name="PRIMED_ALL").exists()
         return is_shared
 
 
-class DefaultWorkspaceUserTable(tables.Table):
+class WorkspaceSharedWithConsortiumTableMixin:
+    """Table mixin that annotates Workspace querysets for use with `WorkspaceSharedWithConsortiumColumn`."""
+
+    def __init__(self, data=None, *args, **kwargs):
+        if isinstance(data, QuerySet) and data.model is Workspace:
+            data = annotate_is_shared_with_consortium(data)
+        super().__init__(data, *args, **kwargs)
+
+
+class DefaultWorkspaceUserTable(WorkspaceSharedWithConsortiumTableMixin, tables.Table):
     """Class to use for default workspace tables in PRIMED."""
 
     name = tables.Column(linkify=True, verbose_name="Workspace")
@@ -1,11 +1,23 @@
 """Tests for the `audit.py` module."""
 
 from dataclasses import dataclass
+from io import StringIO
 from unittest import TestCase
+from unittest.mock import patch
 
 import django_tables2 as tables
+from anvil_consortium_manager.models import Account, ManagedGroup
+from anvil_consortium_manager.tests.factories import (
+    AccountFactory,
+    GroupAccountMembershipFactory,
+    GroupGroupMembershipFactory,
+    ManagedGroupFactory,
+)
+from django.test import TestCase as DjangoTestCase
 
-from .. import audit
+from primed.users.tests.factories import UserFactory
+
+from .. import audit, models
 
 
 @dataclass
@@ -16,6 +28,15 @@ class TempAuditResult(audit.PRIMEDAuditResult):
         return {"value": self.value}
 
 
+@dataclass
+class TempGroupAuditResult(audit.PRIMEDAuditResult):
+    group: ManagedGroup
+    note: str
+
+    def get_table_dictionary(self):
+        return {"value": self.note}
+
+
 class TempResultsTable(tables.Table):
     """A dummy class to use as the results_table_class attribute of PRIMEDAudit."""
 
@@ -148,3 +169,211 @@ class PRIMEDAuditTest(TestCase):
         self.assertIsInstance(table, TempResultsTable)
         self.assertEqual(len(table.rows), 1)
         self.assertEqual(table.rows[0].get_cell("value"), "c")
+
+
+class PRIMEDAuditRunTest(DjangoTestCase):
+    """Tests for saving and comparing PRIMEDAudit runs."""
+
+    def test_get_key(self):
+        group = ManagedGroupFactory.create()
+        result = TempGroupAuditResult(group=group, note="foo")
+        self.assertEqual(result.get_key(), {"group": "anvil_consortium_manager.ManagedGroup:{}".format(group.pk)})
+
+    def test_get_key_no_models(self):
+        self.assertEqual(TempAuditResult(value="foo").get_key(), {})
+
+    def test_save_run(self):
+        group = ManagedGroupFactory.create()
+        temp_audit = TempAudit()
+        temp_audit.run_audit()
+        temp_audit.verified.append(TempAuditResult(value="foo"))
+        temp_audit.errors.append(TempGroupAuditResult(group=group, note="bar"))
+        run = temp_audit.save_run()
+        self.assertEqual(run.n_verified, 1)
+        self.assertEqual(run.n_needs_action, 0)
+        self.assertEqual(run.n_errors, 1)
+        # Only issues are stored.
+        self.assertEqual(len(run.results), 1)
+        self.assertEqual(
+            run.get_issues(),
+            [
+                {
+                    "type": "TempGroupAuditResult",
+                    "list": "errors",
+                    "key": TempGroupAuditResult(group, "").get_key(),
+                    "note": "bar",
+                }
+            ],
+        )
+
+    def test_save_run_not_completed(self):
+        with self.assertRaises(ValueError):
+            TempAudit().save_run()
+
+    def test_get_last_run(self):
+        self.assertIsNone(TempAudit.get_last_run())
+        temp_audit = TempAudit()
+        temp_audit.run_audit()
+        temp_audit.save_run()
+        run = temp_audit.save_run()
+        self.assertEqual(TempAudit.get_last_run(), run)
+        self.assertEqual(models.AuditRun.objects.count(), 2)
+
+    def test_save_run_deletes_old_runs(self):
+        temp_audit = TempAudit()
+        temp_audit.run_audit()
+        with patch.object(TempAudit, "n_saved_runs", 2):
+            temp_audit.save_run()
+            second_run = temp_audit.save_run()
+            third_run = temp_audit.save_run()
+        self.assertQuerySetEqual(models.AuditRun.objects.order_by("pk"), [second_run, third_run])
+
+    def test_save_run_keeps_runs_for_other_audits(self):
+        other_run = models.AuditRun.objects.create(
+            audit_name="other.Audit", results=[], n_verified=0, n_needs_action=0, n_errors=0
+        )
+        temp_audit = TempAudit()
+        temp_audit.run_audit()
+        with patch.object(TempAudit, "n_saved_runs", 1):
+            temp_audit.save_run()
+            temp_audit.save_run()
+        self.assertTrue(models.AuditRun.objects.filter(pk=other_run.pk).exists())
+        self.assertEqual(models.AuditRun.objects.count(), 2)
+
+    def test_changes_since_no_run(self):
+        group = ManagedGroupFactory.create()
+        temp_audit = TempAudit()
+        temp_audit.run_audit()
+        temp_audit.needs_action.append(TempGroupAuditResult(group=group, note="foo"))
+        changes = temp_audit.get_changes_since(None)
+        self.assertTrue(changes.has_changes())
+        self.assertEqual(len(changes.new_issues), 1)
+        self.assertEqual(changes.resolved_issues, [])
+
+    def test_changes_since_run(self):
+        unchanged_group = ManagedGroupFactory.create()
+        resolved_group = ManagedGroupFactory.create()
+        new_group = ManagedGroupFactory.create()
+        previous_audit = TempAudit()
+        previous_audit.run_audit()
+        previous_audit.needs_action.append(TempGroupAuditResult(group=unchanged_group, note="foo"))
+        previous_audit.errors.append(TempGroupAuditResult(group=resolved_group, note="foo"))
+        run = previous_audit.save_run()
+        temp_audit = TempAudit()
+        temp_audit.run_audit()
+        # A different note is not a new issue.
+        temp_audit.needs_action.append(TempGroupAuditResult(group=unchanged_group, note="bar"))
+        temp_audit.needs_action.append(TempGroupAuditResult(group=new_group, note="foo"))
+        temp_audit.verified.append(TempGroupAuditResult(group=resolved_group, note="foo"))
+        changes = temp_audit.get_changes_since(run)
+        self.assertEqual([x["key"] for x in changes.new_issues], [TempGroupAuditResult(new_group, "").get_key()])
+        self.assertEqual(
+            [x["key"] for x in changes.resolved_issues], [TempGroupAuditResult(resolved_group, "").get_key()]
+        )
+
+    def test_no_changes(self):
+        temp_audit = TempAudit()
+        temp_audit.run_audit()
+        temp_audit.errors.append(TempGroupAuditResult(group=ManagedGroupFactory.create(), note="foo"))
+        run = temp_audit.save_run()
+        self.assertFalse(temp_audit.get_changes_since(run).has_changes())
+
+    def test_report_and_save_run(self):
+        previous_audit = TempAudit()
+        previous_audit.run_audit()
+        previous_audit.errors.append(TempGroupAuditResult(group=ManagedGroupFactory.create(), note="foo"))
+        previous_audit.save_run()
+        temp_audit = TempAudit()
+        temp_audit.run_audit()
+        temp_audit.needs_action.append(TempGroupAuditResult(group=ManagedGroupFactory.create(), note="foo"))
+        out = StringIO()
+        changes = temp_audit.report_and_save_run(out)
+        self.assertEqual(len(changes.new_issues), 1)
+        self.assertEqual(len(changes.resolved_issues), 1)
+        self.assertIn("* New issues since last run: 1", out.getvalue())
+        self.assertIn("* Resolved issues since last run: 1", out.getvalue())
+        self.assertEqual(models.AuditRun.objects.count(), 2)
+        self.assertEqual(TempAudit.get_last_run().n_needs_action, 1)
+
+
+class GroupMemberIndexTest(DjangoTestCase):
+    """Tests for the `GroupMemberIndex` class."""
+
+    def test_no_groups_or_users(self):
+        index = audit.GroupMemberIndex(group_pks=[], user_pks=[])
+        user = UserFactory.create()
+        self.assertIsNone(index.get_account_for_user(user))
+
+    def test_group_with_no_members(self):
+        group = ManagedGroupFactory.create()
+        index = audit.GroupMemberIndex(group_pks=[group.pk], user_pks=[])
+        self.assertEqual(index.get_member_accounts(group.pk), [])
+        self.assertEqual(index.get_member_groups(group.pk), [])
+
+    def test_account_for_user(self):
+        account = AccountFactory.create(verified=True)
+        other_user = UserFactory.create()
+        index = audit.GroupMemberIndex(group_pks=[], user_pks=[account.user.pk, other_user.pk])
+        self.assertEqual(index.get_account_for_user(account.user), account)
+        self.assertIsNone(index.get_account_for_user(other_user))
+
+    def test_members(self):
+        group = ManagedGroupFactory.create()
+        other_group = ManagedGroupFactory.create()
+        account = AccountFactory.create()
+        other_account = AccountFactory.create()
+        child_group = ManagedGroupFactory.create()
+        GroupAccountMembershipFactory.create(group=group, account=account)
+        GroupAccountMembershipFactory.create(group=other_group, account=other_account)
+        GroupGroupMembershipFactory.create(parent_group=group, child_group=child_group)
+        index = audit.GroupMemberIndex(group_pks=[group.pk, other_group.pk], user_pks=[])
+        self.assertEqual(index.get_member_accounts(group.pk), [account])
+        self.assertEqual(index.get_member_accounts(other_group.pk), [other_account])
+        self.assertEqual(index.get_member_groups(group.pk), [child_group])
+        self.assertEqual(index.get_member_groups(other_group.pk), [])
+        self.assertTrue(index.is_account_in_group(account, group.pk))
+        self.assertFalse(index.is_account_in_group(account, other_group.pk))
+
+    def test_member_accounts_in_any_group(self):
+        group_1 = ManagedGroupFactory.create()
+        group_2 = ManagedGroupFactory.create()
+        account_1 = AccountFactory.create()
+        account_2 = AccountFactory.create()
+        GroupAccountMembershipFactory.create(group=group_1, account=account_1)
+        GroupAccountMembershipFactory.create(group=group_2, account=account_1)
+        GroupAccountMembershipFactory.create(group=group_2, account=account_2)
+        index = audit.GroupMemberIndex(group_pks=[group_1.pk, group_2.pk], user_pks=[])
+        self.assertEqual(index.get_member_accounts_in_any_group([group_1.pk]), [account_1])
+        accounts = index.get_member_accounts_in_any_group([group_1.pk, group_2.pk])
+        self.assertEqual(len(accounts), 2)
+        self.assertIn(account_1, accounts)
+        self.assertIn(account_2, accounts)
+        self.assertEqual(index.get_member_accounts_in_any_group([]), [])
+
+    def test_indirect_members_not_included(self):
+        """Only direct members of the group are included."""
+        group = ManagedGroupFactory.create()
+        child_group = ManagedGroupFactory.create()
+        account = AccountFactory.create()
+        GroupGroupMembershipFactory.create(parent_group=group, child_group=child_group)
+        GroupAccountMembershipFactory.create(group=child_group, account=account)
+        index = audit.GroupMemberIndex(group_pks=[group.pk], user_pks=[])
+        self.assertEqual(index.get_member_accounts(group.pk), [])
+        self.assertFalse(index.is_account_in_group(account, group.pk))
+
+    def test_members_default_ordering(self):
+        """Members are returned in the default ordering of their model."""
+        group = ManagedGroupFactory.create()
+        accounts = [AccountFactory.create() for _ in range(3)]
+        child_groups = [ManagedGroupFactory.create() for _ in range(3)]
+        for account in reversed(accounts):
+            GroupAccountMembershipFactory.create(group=group, account=account)
+        for child_group in reversed(child_groups):
+            GroupGroupMembershipFactory.create(parent_group=group, child_group=child_group)
+        index = audit.GroupMemberIndex(group_pks=[group.pk], user_pks=[])
+        self.assertEqual(
+            index.get_member_accounts(group.pk), list(Account.objects.filter(pk__in=[x.pk for x in accounts]))
+        )
+        self.assertEqual(
+            index.get_member_groups(group.pk), list(ManagedGroup.objects.filter(pk__in=[x.pk for x in child_groups]))
+        )
@@ -0,0 +1,255 @@
+"""Tests for the `audit_results.py` module."""
+
+from anvil_consortium_manager.tests.factories import GroupAccountMembershipFactory
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from primed.dbgap.audit import collaborator_audit
+from primed.dbgap.tests.factories import dbGaPApplicationFactory
+from primed.users.tests.factories import UserFactory
+
+from .. import audit_results, models
+
+
+class SerializeResultTest(TestCase):
+    """Tests for serializing and deserializing audit results."""
+
+    def test_round_trip(self):
+        dbgap_application = dbGaPApplicationFactory.create()
+        user = UserFactory.create()
+        result = collaborator_audit.VerifiedNoAccess(
+            dbgap_application=dbgap_application,
+            user=user,
+            member=None,
+            note="test note",
+        )
+        serialized = audit_results.serialize_result(result, "verified")
+        self.assertEqual(serialized["list"], "verified")
+        self.assertEqual(serialized["fields"]["user"], {"model": user._meta.label, "pk": user.pk})
+        self.assertEqual(serialized["fields"]["note"], "test note")
+        objects = audit_results.get_referenced_objects([serialized])
+        self.assertEqual(audit_results.deserialize_result(serialized, objects), result)
+
+    def test_deleted_object(self):
+        user = UserFactory.create()
+        result = collaborator_audit.VerifiedNoAccess(
+            dbgap_application=dbGaPApplicationFactory.create(),
+            user=user,
+            member=None,
+            note="test note",
+        )
+        serialized = audit_results.serialize_result(result, "verified")
+        serialized["fields"]["user"]["pk"] = user.pk + 1
+        objects = audit_results.get_referenced_objects([serialized])
+        with self.assertRaises(LookupError):
+            audit_results.deserialize_result(serialized, objects)
+
+
+class GetStoredAuditTest(TestCase):
+    """Tests for the get_stored_audit function."""
+
+    audit_class = collaborator_audit.dbGaPCollaboratorAudit
+
+    def get_stored_rows(self):
+        return models.StoredAuditResults.objects.filter(audit_name=audit_results.get_audit_name(self.audit_class))
+
+    def assert_matches_live_audit(self, audit):
+        live_audit = self.audit_class()
+        live_audit.run_audit()
+        self.assertTrue(audit.completed)
+        self.assertCountEqual(audit.verified, live_audit.verified)
+        self.assertCountEqual(audit.needs_action, live_audit.needs_action)
+        self.assertCountEqual(audit.errors, live_audit.errors)
+
+    def test_no_subjects(self):
+        audit = audit_results.get_stored_audit(self.audit_class)
+        self.assertTrue(audit.completed)
+        self.assertEqual(audit.get_all_results(), [])
+        self.assertEqual(self.get_stored_rows().count(), 0)
+
+    def test_stores_results(self):
+        dbgap_application = dbGaPApplicationFactory.create()
+        audit = audit_results.get_stored_audit(self.audit_class)
+        self.assert_matches_live_audit(audit)
+        row = self.get_stored_rows().get()
+        self.assertEqual(row.subject_pk, dbgap_application.pk)
+        self.assertFalse(row.is_stale)
+        self.assertEqual(len(row.results), len(audit.get_all_results()))
+
+    def test_uses_stored_results(self):
+        dbgap_application = dbGaPApplicationFactory.create()
+        audit_results.get_stored_audit(self.audit_class)
+        self.get_stored_rows().update(results=[])
+        audit = audit_results.get_stored_audit(self.audit_class)
+        self.assertEqual(audit.get_all_results(), [])
+        # Marking the results stale reruns the audit.
+        audit_results.mark_audit_results_stale(self.audit_class, [dbgap_application.pk])
+        audit = audit_results.get_stored_audit(self.audit_class)
+        self.assert_matches_live_audit(audit)
+        self.assertFalse(self.get_stored_rows().get().is_stale)
+
+    def test_only_stale_subjects_are_rerun(self):
+        dbGaPApplicationFactory.create()
+        dbgap_application_2 = dbGaPApplicationFactory.create()
+        audit_results.get_stored_audit(self.audit_class)
+        self.get_stored_rows().update(results=[])
+        audit_results.mark_audit_results_stale(self.audit_class, [dbgap_application_2.pk])
+        audit = audit_results.get_stored_audit(self.audit_class)
+        self.assertEqual(
+            {x.dbgap_application for x in audit.get_all_results()},
+            {dbgap_application_2},
+        )
+
+    def test_without_refresh(self):
+        """Stale results are returned as they are and subjects without stored results are left out."""
+        dbgap_application = dbGaPApplicationFactory.create()
+        audit_results.get_stored_audit(self.audit_class)
+        audit_results.mark_audit_results_stale(self.audit_class, [dbgap_application.pk])
+        dbGaPApplicationFactory.create()
+        audit = audit_results.get_stored_audit(self.audit_class, refresh=False)
+        self.assertTrue(audit.completed)
+        self.assertEqual({x.dbgap_application for x in audit.get_all_results()}, {dbgap_application})
+        self.assertEqual(self.get_stored_rows().count(), 1)
+        self.assertTrue(self.get_stored_rows().get().is_stale)
+
+    def test_new_subject(self):
+        audit_results.get_stored_audit(self.audit_class)
+        dbGaPApplicationFactory.create()
+        audit = audit_results.get_stored_audit(self.audit_class)
+        self.assert_matches_live_audit(audit)
+        self.assertEqual(self.get_stored_rows().count(), 1)
+
+    def test_deleted_subject(self):
+        dbgap_application = dbGaPApplicationFactory.create()
+        audit_results.get_stored_audit(self.audit_class)
+        dbgap_application.delete()
+        audit = audit_results.get_stored_audit(self.audit_class)
+        self.assertEqual(audit.get_all_results(), [])
+        self.assertEqual(self.get_stored_rows().count(), 0)
+
+    def test_marked_stale_while_running(self):
+        """Results are not marked up to date if they were marked stale while the audit was running."""
+        dbgap_application = dbGaPApplicationFactory.create()
+        audit_results.get_stored_audit(self.audit_class)
+        audit = self.audit_class()
+        audit.run_audit()
+        audit_results.mark_audit_results_stale(self.audit_class, [dbgap_application.pk])
+        audit_results._save_results(audit, {dbgap_application.pk}, {dbgap_application.pk: 0})
+        self.assertTrue(self.get_stored_rows().get().is_stale)
+
+    def test_new_subject_marked_stale_while_running(self):
+        """Results for a subject without stored results are not stored as up to date if it was marked stale."""
+        dbgap_application = dbGaPApplicationFactory.create()
+        versions = audit_results._get_versions(self.audit_class, [dbgap_application.pk])
+        self.assertTrue(self.get_stored_rows().get().is_stale)
+        audit = self.audit_class()
+        audit.run_audit()
+        audit_results.mark_audit_results_stale(self.audit_class, [dbgap_application.pk])
+        audit_results._save_results(audit, {dbgap_application.pk}, versions)
+        self.assertTrue(self.get_stored_rows().get().is_stale)
+
+    def test_run_and_store_audit(self):
+        dbgap_application = dbGaPApplicationFactory.create()
+        audit_results.get_stored_audit(self.audit_class)
+        audit_results.mark_audit_results_stale(self.audit_class)
+        audit = self.audit_class()
+        audit_results.run_and_store_audit(audit)
+        self.assertTrue(audit.completed)
+        row = self.get_stored_rows().get()
+        self.assertEqual(row.subject_pk, dbgap_application.pk)
+        self.assertFalse(row.is_stale)
+
+    def test_run_and_store_audit_marked_stale_while_running(self):
+        """Results are not stored as up to date for subjects that are marked stale while the audit is running."""
+        dbgap_application = dbGaPApplicationFactory.create()
+        audit_results.get_stored_audit(self.audit_class)
+        audit = self.audit_class()
+        run_audit = audit.run_audit
+
+        def run_audit_and_mark_stale():
+            run_audit()
+            audit_results.mark_audit_results_stale(self.audit_class, [dbgap_application.pk])
+
+        audit.run_audit = run_audit_and_mark_stale
+        audit_results.run_and_store_audit(audit)
+        self.assertTrue(self.get_stored_rows().get().is_stale)
+
+    def test_number_of_queries_with_stored_results(self):
+        """The number of queries to load stored results does not depend on the number of subjects."""
+
+        def count_queries():
+            with CaptureQueriesContext(connection) as context:
+                audit_results.get_stored_audit(self.audit_class)
+            return len(context.captured_queries)
+
+        def create_application():
+            dbgap_application = dbGaPApplicationFactory.create()
+            GroupAccountMembershipFactory.create(group=dbgap_application.anvil_access_group)
+            dbgap_application.collaborators.add(UserFactory.create())
+
+        create_application()
+        audit_results.get_stored_audit(self.audit_class)
+        n_queries_small = count_queries()
+        for _ in range(3):
+            create_application()
+        audit_results.get_stored_audit(self.audit_class)
+        self.assertEqual(count_queries(), n_queries_small)
+
+
+class RefreshStoredAuditResultsTest(TestCase):
+    """Tests for the refresh_stored_audit_results function."""
+
+    audit_class = collaborator_audit.dbGaPCollaboratorAudit
+
+    def get_stored_rows(self):
+        return models.StoredAuditResults.objects.filter(audit_name=audit_results.get_audit_name(self.audit_class))
+
+    def test_get_outdated_subject_pks(self):
+        dbgap_application_1 = dbGaPApplicationFactory.create()
+        self.assertEqual(audit_results.get_outdated_subject_pks(self.audit_class), {dbgap_application_1.pk: None})
+        audit_results.get_stored_audit(self.audit_class)
+        self.assertEqual(audit_results.get_outdated_subject_pks(self.audit_class), {})
+        dbgap_application_2 = dbGaPApplicationFactory.create()
+        audit_results.mark_audit_results_stale(self.audit_class, [dbgap_application_1.pk])
+        self.assertEqual(
+            audit_results.get_outdated_subject_pks(self.audit_class),
+            {dbgap_application_1.pk: 1, dbgap_application_2.pk: None},
+        )
+
+    def test_refreshes_in_batches(self):
+        dbgap_applications = dbGaPApplicationFactory.create_batch(3)
+        progress = []
+        audit_results.refresh_stored_audit_results(
+            self.audit_class, batch_size=2, progress_callback=lambda *args: progress.append(args)
+        )
+        self.assertEqual(progress, [(2, 3), (3, 3)])
+        self.assertEqual(
+            set(self.get_stored_rows().values_list("subject_pk", flat=True)),
+            {x.pk for x in dbgap_applications},
+        )
+        self.assertFalse(self.get_stored_rows().filter(is_stale=True).exists())
+
+    def test_only_outdated_subjects_are_refreshed(self):
+        dbGaPApplicationFactory.create()
+        dbgap_application_2 = dbGaPApplicationFactory.create()
+        audit_results.get_stored_audit(self.audit_class)
+        self.get_stored_rows().update(results=[])
+        audit_results.mark_audit_results_stale(self.audit_class, [dbgap_application_2.pk])
+        progress = []
+        audit_results.refresh_stored_audit_results(
+            self.audit_class, progress_callback=lambda *args: progress.append(args)
+        )
+        self.assertEqual(progress, [(1, 1)])
+        audit = audit_results.get_stored_audit(self.audit_class)
+        self.assertEqual(
+            {x.dbgap_application for x in audit.get_all_results()},
+            {dbgap_application_2},
+        )
+
+    def test_nothing_to_refresh(self):
+        progress = []
+        audit_results.refresh_stored_audit_results(
+            self.audit_class, progress_callback=lambda *args: progress.append(args)
+        )
+        self.assertEqual(progress, [])
@@ -0,0 +1,199 @@
+"""Tests for the `audit_tasks.py` module and the StoredAuditRefreshMixin."""
+
+import subprocess
+import sys
+from unittest.mock import patch
+
+from anvil_consortium_manager.models import AnVILProjectManagerAccess
+from django.contrib.auth.models import Permission
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from primed.dbgap.audit import collaborator_audit
+from primed.dbgap.tests.factories import dbGaPApplicationFactory
+from primed.users.tests.factories import UserFactory
+
+from .. import audit_results, audit_tasks, models
+
+
+class AuditTasksTest(TestCase):
+    """Tests for starting and running background refreshes."""
+
+    audit_class = collaborator_audit.dbGaPCollaboratorAudit
+
+    def test_no_refresh_status(self):
+        self.assertIsNone(audit_tasks.get_refresh_status(self.audit_class))
+
+    def test_start_refresh(self):
+        with patch.object(audit_tasks.executor, "submit") as submit:
+            with self.captureOnCommitCallbacks(execute=True):
+                status = audit_tasks.start_refresh(self.audit_class)
+        submit.assert_called_once_with(audit_tasks._refresh_in_thread, self.audit_class, status)
+        self.assertEqual(status["status"], audit_tasks.STATUS_RUNNING)
+        self.assertEqual(audit_tasks.get_refresh_status(self.audit_class), status)
+
+    def test_start_refresh_records_process(self):
+        with patch.object(audit_tasks.executor, "submit"):
+            status = audit_tasks.start_refresh(self.audit_class)
+        self.assertIsNotNone(status["host"])
+        self.assertIsNotNone(status["pid"])
+
+    def test_refresh_in_exited_process(self):
+        """A refresh whose process has exited is no longer reported, so that another refresh can be started."""
+        with patch.object(audit_tasks.executor, "submit"):
+            status = audit_tasks.start_refresh(self.audit_class)
+        process = subprocess.Popen([sys.executable, "-c", ""])
+        process.wait()
+        cache.set(audit_tasks._get_cache_key(self.audit_class), dict(status, pid=process.pid))
+        with self.assertLogs(audit_tasks.logger, level="WARNING"):
+            self.assertIsNone(audit_tasks.get_refresh_status(self.audit_class))
+        with patch.object(audit_tasks.executor, "submit") as submit:
+            with self.captureOnCommitCallbacks(execute=True):
+                audit_tasks.start_refresh(self.audit_class)
+        submit.assert_called_once()
+
+    def test_refresh_on_other_host(self):
+        """A refresh on another host is reported until its status expires."""
+        with patch.object(audit_tasks.executor, "submit"):
+            status = audit_tasks.start_refresh(self.audit_class)
+        status = dict(status, host="other-host", pid=-1)
+        cache.set(audit_tasks._get_cache_key(self.audit_class), status)
+        self.assertEqual(audit_tasks.get_refresh_status(self.audit_class), status)
+
+    def test_concurrent_starts_share_one_refresh(self):
+        with patch.object(audit_tasks.executor, "submit") as submit:
+            with self.captureOnCommitCallbacks(execute=True):
+                status_1 = audit_tasks.start_refresh(self.audit_class)
+                status_2 = audit_tasks.start_refresh(self.audit_class)
+        submit.assert_called_once()
+        self.assertEqual(status_1, status_2)
+
+    def test_refresh_stores_results(self):
+        dbgap_application = dbGaPApplicationFactory.create()
+        with patch.object(audit_tasks.executor, "submit"):
+            status = audit_tasks.start_refresh(self.audit_class)
+        audit_tasks._refresh(self.audit_class, status)
+        self.assertIsNone(audit_tasks.get_refresh_status(self.audit_class))
+        row = models.StoredAuditResults.objects.get(audit_name=audit_results.get_audit_name(self.audit_class))
+        self.assertEqual(row.subject_pk, dbgap_application.pk)
+        self.assertFalse(row.is_stale)
+
+    def test_refresh_error(self):
+        with patch.object(audit_tasks.executor, "submit"):
+            status = audit_tasks.start_refresh(self.audit_class)
+        with patch.object(audit_tasks, "refresh_stored_audit_results", side_effect=Exception("test error")):
+            with self.assertLogs(audit_tasks.logger, level="ERROR"):
+                audit_tasks._refresh(self.audit_class, status)
+        self.assertEqual(audit_tasks.get_refresh_status(self.audit_class)["status"], audit_tasks.STATUS_FAILED)
+
+
+@override_settings(AUDIT_BACKGROUND_REFRESH=True)
+class StoredAuditRefreshMixinTest(TestCase):
+    """Tests for the StoredAuditRefreshMixin, using the dbGaPCollaboratorAudit view."""
+
+    audit_class = collaborator_audit.dbGaPCollaboratorAudit
+
+    def setUp(self):
+        """Set up test class."""
+        self.user = UserFactory.create()
+        self.user.user_permissions.add(
+            Permission.objects.get(codename=AnVILProjectManagerAccess.STAFF_VIEW_PERMISSION_CODENAME)
+        )
+        self.client.force_login(self.user)
+
+    def get_url(self):
+        """Get the url for the view being tested."""
+        return reverse("dbgap:audit:collaborators:all")
+
+    def get_progress_poll(self):
+        header = {"HTTP_HX-Request": "true", "HTTP_HX-Target": "audit-refresh-progress"}
+        return self.client.get(self.get_url(), **header)
+
+    def test_up_to_date_results(self):
+        """The audit results are shown if the stored results are up to date."""
+        dbGaPApplicationFactory.create()
+        audit_results.get_stored_audit(self.audit_class)
+        with patch.object(audit_tasks.executor, "submit") as submit:
+            response = self.client.get(self.get_url())
+        submit.assert_not_called()
+        self.assertTemplateUsed(response, "dbgap/collaborator_audit.html")
+        self.assertIn("verified_table", response.context_data)
+
+    def test_outdated_results(self):
+        """A refresh is started and a progress page is shown if the stored results are out of date."""
+        dbGaPApplicationFactory.create()
+        with patch.object(audit_tasks.executor, "submit") as submit:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.get(self.get_url())
+        submit.assert_called_once()
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, "primed_anvil/audit_refresh.html")
+        self.assertEqual(response.context["status"]["status"], audit_tasks.STATUS_RUNNING)
+
+    def test_refresh_in_progress(self):
+        """A second viewer joins the refresh that is already in progress."""
+        with patch.object(audit_tasks.executor, "submit") as submit:
+            with self.captureOnCommitCallbacks(execute=True):
+                audit_tasks.start_refresh(self.audit_class)
+                response = self.client.get(self.get_url())
+        submit.assert_called_once()
+        self.assertTemplateUsed(response, "primed_anvil/audit_refresh.html")
+
+    def test_progress_poll_in_progress(self):
+        """Progress polls return the progress snippet while the refresh is running."""
+        with patch.object(audit_tasks.executor, "submit"):
+            audit_tasks.start_refresh(self.audit_class)
+        response = self.get_progress_poll()
+        self.assertTemplateUsed(response, "primed_anvil/snippets/audit_refresh_progress.html")
+        self.assertTemplateNotUsed(response, "primed_anvil/audit_refresh.html")
+        self.assertNotIn("HX-Refresh", response.headers)
+
+    def test_progress_poll_finished(self):
+        """Progress polls tell htmx to reload the page when the refresh has finished."""
+        dbGaPApplicationFactory.create()
+        with patch.object(audit_tasks.executor, "submit"):
+            status = audit_tasks.start_refresh(self.audit_class)
+        audit_tasks._refresh(self.audit_class, status)
+        response = self.get_progress_poll()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["HX-Refresh"], "true")
+
+    def test_failed_refresh_shows_stored_results(self):
+        """Stored results are shown as they are, with a warning, if the last refresh failed."""
+        dbgap_application = dbGaPApplicationFactory.create()
+        audit_results.get_stored_audit(self.audit_class)
+        audit_results.mark_audit_results_stale(self.audit_class)
+        with patch.object(audit_tasks.executor, "submit"):
+            status = audit_tasks.start_refresh(self.audit_class)
+        cache.set(audit_tasks._get_cache_key(self.audit_class), dict(status, status=audit_tasks.STATUS_FAILED))
+        with patch.object(audit_tasks.executor, "submit") as submit:
+            response = self.client.get(self.get_url())
+        submit.assert_not_called()
+        self.assertTemplateUsed(response, "dbgap/collaborator_audit.html")
+        messages = [str(message) for message in get_messages(response.wsgi_request)]
+        self.assertEqual(messages, [response.context_data["view"].refresh_failed_message])
+        # The stale results were not refreshed within the request.
+        row = models.StoredAuditResults.objects.get(audit_name=audit_results.get_audit_name(self.audit_class))
+        self.assertEqual(row.subject_pk, dbgap_application.pk)
+        self.assertTrue(row.is_stale)
+
+    def test_progress_poll_failed(self):
+        """Progress polls tell htmx to reload the page if the refresh failed."""
+        with patch.object(audit_tasks.executor, "submit"):
+            status = audit_tasks.start_refresh(self.audit_class)
+        cache.set(audit_tasks._get_cache_key(self.audit_class), dict(status, status=audit_tasks.STATUS_FAILED))
+        response = self.get_progress_poll()
+        self.assertEqual(response.headers["HX-Refresh"], "true")
+
+    @override_settings(AUDIT_BACKGROUND_REFRESH=False)
+    def test_background_refresh_disabled(self):
+        """Out of date results are refreshed within the request if background refreshes are disabled."""
+        dbGaPApplicationFactory.create()
+        with patch.object(audit_tasks.executor, "submit") as submit:
+            response = self.client.get(self.get_url())
+        submit.assert_not_called()
+        self.assertTemplateUsed(response, "dbgap/collaborator_audit.html")
+        self.assertIn("verified_table", response.context_data)
+        self.assertFalse(models.StoredAuditResults.objects.filter(is_stale=True).exists())
@@ -4,6 +4,7 @@ from anvil_consortium_manager.tests.factories import (
     ManagedGroupFactory,
     WorkspaceGroupSharingFactory,
 )
+from django.core.cache import cache
 from django.test import TestCase
 
 from primed.cdsa.tests.factories import CDSAWorkspaceFactory
@@ -540,6 +541,93 @@ class GetSummaryTableDataTest(TestCase):
         )
 
 
+class GetCachedSummaryTableDataTest(TestCase):
+    """Tests for the helpers.get_cached_summary_table_data method."""
+
+    def setUp(self):
+        super().setUp()
+        self.available_data = AvailableDataFactory.create(name="Foo")
+        self.study = StudyFactory.create(short_name="TEST")
+
+    def assert_cleared(self, func):
+        """Check that calling func changes the summary table version and updates the cached data."""
+        helpers.get_cached_summary_table_data()
+        version = helpers.get_summary_table_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            func()
+        self.assertNotEqual(helpers.get_summary_table_version(), version)
+        self.assertEqual(helpers.get_cached_summary_table_data(), helpers.get_summary_table_data())
+
+    def test_matches_uncached(self):
+        workspace = dbGaPWorkspaceFactory.create(dbgap_study_accession__studies=[self.study])
+        workspace.available_data.add(self.available_data)
+        self.assertEqual(helpers.get_cached_summary_table_data(), helpers.get_summary_table_data())
+
+    def test_uses_cached_data(self):
+        helpers.get_cached_summary_table_data()
+        with self.assertNumQueries(2):
+            helpers.get_cached_summary_table_data()
+
+    def test_no_available_data(self):
+        self.available_data.delete()
+        with self.assertRaises(RuntimeError):
+            helpers.get_cached_summary_table_data()
+        self.assertIsNone(cache.get("primed_anvil:data_summary:{}".format(helpers.get_summary_table_version())))
+
+    def test_cleared_when_dbgap_workspace_created(self):
+        self.assert_cleared(lambda: dbGaPWorkspaceFactory.create(dbgap_study_accession__studies=[self.study]))
+
+    def test_cleared_when_cdsa_workspace_created(self):
+        self.assert_cleared(lambda: CDSAWorkspaceFactory.create(study=self.study))
+
+    def test_cleared_when_open_access_workspace_studies_changed(self):
+        workspace = OpenAccessWorkspaceFactory.create()
+        self.assert_cleared(lambda: workspace.studies.add(self.study))
+
+    def test_cleared_when_available_data_changed(self):
+        workspace = dbGaPWorkspaceFactory.create(dbgap_study_accession__studies=[self.study])
+        self.assert_cleared(lambda: workspace.available_data.add(self.available_data))
+        self.assert_cleared(lambda: AvailableDataFactory.create(name="Bar"))
+
+    def test_cleared_when_dbgap_study_accession_studies_changed(self):
+        study_accession = dbGaPStudyAccessionFactory.create()
+        dbGaPWorkspaceFactory.create(dbgap_study_accession=study_accession)
+        self.assert_cleared(lambda: study_accession.studies.add(self.study))
+
+    def test_cleared_when_study_renamed(self):
+        dbGaPWorkspaceFactory.create(dbgap_study_accession__studies=[self.study])
+        self.study.short_name = "NEW"
+        self.assert_cleared(self.study.save)
+        self.assertEqual(helpers.get_cached_summary_table_data()[0]["study"], "NEW")
+
+    def test_cleared_when_shared_with_consortium(self):
+        workspace = dbGaPWorkspaceFactory.create(dbgap_study_accession__studies=[self.study])
+        self.assert_cleared(
+            lambda: WorkspaceGroupSharingFactory.create(workspace=workspace.workspace, group__name="PRIMED_ALL")
+        )
+        self.assertTrue(helpers.get_cached_summary_table_data()[0]["is_shared"])
+
+    def test_not_cleared_when_shared_with_other_group(self):
+        workspace = dbGaPWorkspaceFactory.create(dbgap_study_accession__studies=[self.study])
+        helpers.get_cached_summary_table_data()
+        version = helpers.get_summary_table_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            WorkspaceGroupSharingFactory.create(workspace=workspace.workspace)
+        self.assertEqual(helpers.get_summary_table_version(), version)
+
+    def test_stale_data_not_used_after_commit(self):
+        """Data cached from the database state before a change is committed is not used after the commit."""
+        with self.captureOnCommitCallbacks(execute=True):
+            dbGaPWorkspaceFactory.create(dbgap_study_accession__studies=[self.study])
+            # Simulate another request caching the summary table before the commit.
+            cache.set(
+                "primed_anvil:data_summary:{}".format(helpers.get_summary_table_version()),
+                [],
+                helpers.SUMMARY_TABLE_CACHE_TIMEOUT,
+            )
+        self.assertEqual(helpers.get_cached_summary_table_data(), helpers.get_summary_table_data())
+
+
 class GetWorkspacesForPhenotypeInventoryTest(TestCase):
     """Tests for the helpers.get_workspaces_for_inventory method."""
 
@@ -989,3 +1077,57 @@ class GetWorkspacesForPhenotypeInventoryTest(TestCase):
         self.assertEqual(list(res)[0], "test-bp-1/test-ws-2")
         self.assertEqual(list(res)[1], "test-bp-2/test-ws-1")
         self.assertEqual(list(res)[2], "test-bp-2/test-ws-3")
+
+
+class GetCachedWorkspacesForInventoryTest(TestCase):
+    """Tests for the helpers.get_cached_workspaces_for_inventory method."""
+
+    def setUp(self):
+        """Set up the test case."""
+        super().setUp()
+        self.primed_all_group = ManagedGroupFactory.create(name="PRIMED_ALL")
+        self.study = StudyFactory.create(short_name="TEST")
+        self.workspace = OpenAccessWorkspaceFactory.create()
+        WorkspaceGroupSharingFactory.create(workspace=self.workspace.workspace, group=self.primed_all_group)
+
+    def assert_version_changed(self, func):
+        """Check that calling func changes the inventory version and updates the cached inventory."""
+        version, _ = helpers.get_cached_workspaces_for_inventory()
+        with self.captureOnCommitCallbacks(execute=True):
+            func()
+        new_version, workspaces = helpers.get_cached_workspaces_for_inventory()
+        self.assertNotEqual(new_version, version)
+        self.assertEqual(workspaces, helpers.get_workspaces_for_inventory())
+
+    def test_matches_uncached(self):
+        version, workspaces = helpers.get_cached_workspaces_for_inventory()
+        self.assertEqual(version, helpers.get_inventory_version())
+        self.assertEqual(workspaces, helpers.get_workspaces_for_inventory())
+
+    def test_uses_cached_data(self):
+        helpers.get_cached_workspaces_for_inventory()
+        with self.assertNumQueries(2):
+            helpers.get_cached_workspaces_for_inventory()
+
+    def test_version_unchanged_for_unrelated_changes(self):
+        version, _ = helpers.get_cached_workspaces_for_inventory()
+        WorkspaceGroupSharingFactory.create(workspace=self.workspace.workspace)
+        AvailableDataFactory.create()
+        self.assertEqual(helpers.get_inventory_version(), version)
+
+    def test_version_changed_when_studies_changed(self):
+        self.assert_version_changed(lambda: self.workspace.studies.add(self.study))
+
+    def test_version_changed_when_dbgap_study_accession_studies_changed(self):
+        workspace = dbGaPWorkspaceFactory.create()
+        WorkspaceGroupSharingFactory.create(workspace=workspace.workspace, group=self.primed_all_group)
+        self.assert_version_changed(lambda: workspace.dbgap_study_accession.studies.add(self.study))
+
+    def test_version_changed_when_shared(self):
+        workspace = SimulatedDataWorkspaceFactory.create()
+        self.assert_version_changed(
+            lambda: WorkspaceGroupSharingFactory.create(workspace=workspace.workspace, group=self.primed_all_group)
+        )
+
+    def test_version_changed_when_unshared(self):
+        self.assert_version_changed(lambda: self.workspace.workspace.workspacegroupsharing_set.all().delete())
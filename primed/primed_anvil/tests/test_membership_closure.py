@@ -0,0 +1,211 @@
+"""Tests for the `membership_closure.py` module."""
+
+from anvil_consortium_manager.models import GroupGroupMembership
+from anvil_consortium_manager.tests.factories import (
+    AccountFactory,
+    GroupAccountMembershipFactory,
+    GroupGroupMembershipFactory,
+    ManagedGroupFactory,
+)
+from django.core.cache import cache
+from django.test import TestCase
+
+from primed.dbgap.audit.access_audit import dbGaPAccessAudit
+
+from .. import membership_closure
+
+
+class GroupMembershipClosureTest(TestCase):
+    """Tests for the GroupMembershipClosure class."""
+
+    def test_no_memberships(self):
+        group = ManagedGroupFactory.create()
+        account = AccountFactory.create()
+        closure = membership_closure.GroupMembershipClosure.from_database()
+        self.assertEqual(closure.get_all_parent_pks(group), set())
+        self.assertEqual(closure.get_all_child_pks(group), set())
+        self.assertEqual(closure.get_all_account_pks(group), set())
+        self.assertEqual(closure.get_all_group_pks_for_account(account), set())
+
+    def test_nested_groups(self):
+        grandparent = ManagedGroupFactory.create()
+        parent = ManagedGroupFactory.create()
+        child = ManagedGroupFactory.create()
+        GroupGroupMembershipFactory.create(parent_group=grandparent, child_group=parent)
+        GroupGroupMembershipFactory.create(parent_group=parent, child_group=child)
+        closure = membership_closure.GroupMembershipClosure.from_database()
+        self.assertEqual(closure.get_all_parent_pks(child), {parent.pk, grandparent.pk})
+        self.assertEqual(closure.get_direct_parent_pks(child), {parent.pk})
+        self.assertEqual(closure.get_all_child_pks(grandparent), {parent.pk, child.pk})
+        self.assertEqual(closure.get_direct_child_pks(grandparent), {parent.pk})
+        self.assertTrue(closure.is_group_in_group(child, grandparent))
+        self.assertFalse(closure.is_group_in_group(child, grandparent, direct=True))
+        self.assertTrue(closure.is_group_in_group(child, parent, direct=True))
+        self.assertFalse(closure.is_group_in_group(grandparent, child))
+
+    def test_accepts_pks(self):
+        parent = ManagedGroupFactory.create()
+        child = ManagedGroupFactory.create()
+        GroupGroupMembershipFactory.create(parent_group=parent, child_group=child)
+        closure = membership_closure.GroupMembershipClosure.from_database()
+        self.assertTrue(closure.is_group_in_group(child.pk, parent.pk))
+        self.assertEqual(closure.get_all_parent_pks(child.pk), {parent.pk})
+
+    def test_account_in_nested_group(self):
+        parent = ManagedGroupFactory.create()
+        child = ManagedGroupFactory.create()
+        account = AccountFactory.create()
+        GroupGroupMembershipFactory.create(parent_group=parent, child_group=child)
+        GroupAccountMembershipFactory.create(group=child, account=account)
+        closure = membership_closure.GroupMembershipClosure.from_database()
+        self.assertEqual(closure.get_all_group_pks_for_account(account), {parent.pk, child.pk})
+        self.assertEqual(closure.get_direct_group_pks_for_account(account), {child.pk})
+        self.assertEqual(closure.get_all_account_pks(parent), {account.pk})
+        self.assertEqual(closure.get_direct_account_pks(parent), set())
+        self.assertTrue(closure.is_account_in_group(account, parent))
+        self.assertFalse(closure.is_account_in_group(account, parent, direct=True))
+        self.assertTrue(closure.is_account_in_group(account, child, direct=True))
+
+    def test_add_group_membership(self):
+        grandparent = ManagedGroupFactory.create()
+        parent = ManagedGroupFactory.create()
+        child = ManagedGroupFactory.create()
+        grandchild = ManagedGroupFactory.create()
+        account = AccountFactory.create()
+        GroupGroupMembershipFactory.create(parent_group=grandparent, child_group=parent)
+        GroupGroupMembershipFactory.create(parent_group=child, child_group=grandchild)
+        GroupAccountMembershipFactory.create(group=grandchild, account=account)
+        closure = membership_closure.GroupMembershipClosure.from_database()
+        # Check the account groups so they are cached.
+        self.assertEqual(closure.get_all_group_pks_for_account(account), {child.pk, grandchild.pk})
+        closure.add_group_membership(parent, child)
+        self.assertEqual(closure.get_all_parent_pks(grandchild), {child.pk, parent.pk, grandparent.pk})
+        self.assertEqual(closure.get_all_child_pks(grandparent), {parent.pk, child.pk, grandchild.pk})
+        self.assertEqual(
+            closure.get_all_group_pks_for_account(account), {grandchild.pk, child.pk, parent.pk, grandparent.pk}
+        )
+
+    def test_remove_group_membership(self):
+        grandparent = ManagedGroupFactory.create()
+        parent = ManagedGroupFactory.create()
+        child = ManagedGroupFactory.create()
+        GroupGroupMembershipFactory.create(parent_group=grandparent, child_group=parent)
+        GroupGroupMembershipFactory.create(parent_group=parent, child_group=child)
+        closure = membership_closure.GroupMembershipClosure.from_database()
+        closure.remove_group_membership(grandparent, parent)
+        self.assertEqual(closure.get_all_parent_pks(child), {parent.pk})
+        self.assertEqual(closure.get_all_child_pks(grandparent), set())
+        self.assertEqual(closure.get_all_child_pks(parent), {child.pk})
+
+    def test_remove_group_membership_other_path(self):
+        """A group remains an ancestor if there is another path to it."""
+        grandparent = ManagedGroupFactory.create()
+        parent_1 = ManagedGroupFactory.create()
+        parent_2 = ManagedGroupFactory.create()
+        child = ManagedGroupFactory.create()
+        GroupGroupMembershipFactory.create(parent_group=grandparent, child_group=parent_1)
+        GroupGroupMembershipFactory.create(parent_group=grandparent, child_group=parent_2)
+        GroupGroupMembershipFactory.create(parent_group=parent_1, child_group=child)
+        GroupGroupMembershipFactory.create(parent_group=parent_2, child_group=child)
+        closure = membership_closure.GroupMembershipClosure.from_database()
+        closure.remove_group_membership(parent_1, child)
+        self.assertEqual(closure.get_all_parent_pks(child), {parent_2.pk, grandparent.pk})
+        self.assertEqual(closure.get_all_child_pks(grandparent), {parent_1.pk, parent_2.pk, child.pk})
+
+    def test_add_and_remove_account_membership(self):
+        parent = ManagedGroupFactory.create()
+        child = ManagedGroupFactory.create()
+        account = AccountFactory.create()
+        GroupGroupMembershipFactory.create(parent_group=parent, child_group=child)
+        closure = membership_closure.GroupMembershipClosure.from_database()
+        closure.add_account_membership(child, account)
+        self.assertEqual(closure.get_all_group_pks_for_account(account), {parent.pk, child.pk})
+        closure.remove_account_membership(child, account)
+        self.assertEqual(closure.get_all_group_pks_for_account(account), set())
+
+
+class GetGroupMembershipClosureTest(TestCase):
+    """Tests for the get_group_membership_closure function and the signals that keep it up to date."""
+
+    def test_builds_closure(self):
+        parent = ManagedGroupFactory.create()
+        child = ManagedGroupFactory.create()
+        GroupGroupMembershipFactory.create(parent_group=parent, child_group=child)
+        closure = membership_closure.get_group_membership_closure()
+        self.assertEqual(closure.get_all_parent_pks(child), {parent.pk})
+        self.assertIsNotNone(cache.get(membership_closure.CACHE_KEY))
+
+    def test_memoized_closure(self):
+        closure = membership_closure.get_group_membership_closure()
+        with self.assertNumQueries(0):
+            self.assertIs(membership_closure.get_group_membership_closure(), closure)
+
+    def test_uses_cached_closure(self):
+        membership_closure.get_group_membership_closure()
+        membership_closure.clear_group_membership_closure_memo()
+        with self.assertNumQueries(1):
+            # One query for the cache.
+            membership_closure.get_group_membership_closure()
+
+    def test_request_clears_memo(self):
+        closure = membership_closure.get_group_membership_closure()
+        self.client.get("/")
+        self.assertIsNot(membership_closure.get_group_membership_closure(), closure)
+
+    def test_run_audit_clears_memo(self):
+        closure = membership_closure.get_group_membership_closure()
+        dbGaPAccessAudit().run_audit()
+        self.assertIsNot(membership_closure.get_group_membership_closure(), closure)
+
+    def test_signals_add_group_membership(self):
+        parent = ManagedGroupFactory.create()
+        child = ManagedGroupFactory.create()
+        closure = membership_closure.get_group_membership_closure()
+        GroupGroupMembershipFactory.create(parent_group=parent, child_group=child)
+        # The memoized closure is updated and the cached closure is discarded.
+        self.assertEqual(closure.get_all_parent_pks(child), {parent.pk})
+        self.assertIsNone(cache.get(membership_closure.CACHE_KEY))
+        membership_closure.clear_group_membership_closure_memo()
+        self.assertEqual(membership_closure.get_group_membership_closure().get_all_parent_pks(child), {parent.pk})
+
+    def test_signals_remove_group_membership(self):
+        parent = ManagedGroupFactory.create()
+        child = ManagedGroupFactory.create()
+        membership = GroupGroupMembershipFactory.create(parent_group=parent, child_group=child)
+        closure = membership_closure.get_group_membership_closure()
+        membership.delete()
+        self.assertEqual(closure.get_all_parent_pks(child), set())
+        self.assertIsNone(cache.get(membership_closure.CACHE_KEY))
+        membership_closure.clear_group_membership_closure_memo()
+        self.assertEqual(membership_closure.get_group_membership_closure().get_all_parent_pks(child), set())
+
+    def test_signals_add_and_remove_account_membership(self):
+        group = ManagedGroupFactory.create()
+        account = AccountFactory.create()
+        membership_closure.get_group_membership_closure()
+        membership = GroupAccountMembershipFactory.create(group=group, account=account)
+        self.assertEqual(membership_closure.get_group_membership_closure().get_all_account_pks(group), {account.pk})
+        membership.delete()
+        self.assertEqual(membership_closure.get_group_membership_closure().get_all_account_pks(group), set())
+
+    def test_signals_without_memoized_closure(self):
+        """The cached closure is discarded when the current thread has not memoized a closure."""
+        group = ManagedGroupFactory.create()
+        account = AccountFactory.create()
+        membership_closure.get_group_membership_closure()
+        membership_closure.clear_group_membership_closure_memo()
+        GroupAccountMembershipFactory.create(group=group, account=account)
+        self.assertIsNone(cache.get(membership_closure.CACHE_KEY))
+        self.assertEqual(membership_closure.get_group_membership_closure().get_all_account_pks(group), {account.pk})
+
+    def test_queryset_delete(self):
+        """Deleting several memberships at once updates the closure for each of them."""
+        parent = ManagedGroupFactory.create()
+        child_1 = ManagedGroupFactory.create()
+        child_2 = ManagedGroupFactory.create()
+        GroupGroupMembershipFactory.create(parent_group=parent, child_group=child_1)
+        GroupGroupMembershipFactory.create(parent_group=parent, child_group=child_2)
+        membership_closure.get_group_membership_closure()
+        GroupGroupMembership.objects.all().delete()
+        closure = membership_closure.get_group_membership_closure()
+        self.assertEqual(closure.get_all_child_pks(parent), set())
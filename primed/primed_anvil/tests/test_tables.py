@@ -1,4 +1,4 @@
-from anvil_consortium_manager.models import Account
+from anvil_consortium_manager.models import Account, Workspace
 from anvil_consortium_manager.tests.factories import (
     AccountFactory,
     GroupAccountMembershipFactory,
@@ -8,7 +8,9 @@ from anvil_consortium_manager.tests.factories import (
 )
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
 from primed.users.tests.factories import UserFactory
 
@@ -254,6 +256,67 @@ class WorkspaceSharedWithConsortiumColumnTest(TestCase):
         with self.assertRaises(ImproperlyConfigured):
             column.render(None, "foo", None)
 
+    def test_render_annotated(self):
+        """The column uses the is_shared_with_consortium annotation if it is present."""
+        workspace = WorkspaceFactory.create()
+        WorkspaceGroupSharingFactory.create(workspace=workspace, group__name="PRIMED_ALL")
+        workspace.is_shared_with_consortium = False
+        column = tables.WorkspaceSharedWithConsortiumColumn()
+        with self.assertNumQueries(0):
+            value = column.render(None, workspace, None)
+        self.assertEqual("", value)
+
+
+class WorkspaceSharedWithConsortiumTableMixinTest(TestCase):
+    """Tests for the WorkspaceSharedWithConsortiumTableMixin class, using the DefaultWorkspaceUserTable."""
+
+    table_class = tables.DefaultWorkspaceUserTable
+
+    def test_annotate_is_shared_with_consortium(self):
+        workspace_1 = WorkspaceFactory.create(name="a")
+        WorkspaceGroupSharingFactory.create(workspace=workspace_1, group__name="PRIMED_ALL")
+        workspace_2 = WorkspaceFactory.create(name="b")
+        WorkspaceGroupSharingFactory.create(workspace=workspace_2, group__name="other")
+        workspace_3 = WorkspaceFactory.create(name="c")
+        qs = tables.annotate_is_shared_with_consortium(Workspace.objects.order_by("name"))
+        self.assertEqual(
+            [(x, x.is_shared_with_consortium) for x in qs],
+            [(workspace_1, True), (workspace_2, False), (workspace_3, False)],
+        )
+
+    def test_table_rows(self):
+        workspace_1 = WorkspaceFactory.create(name="a")
+        WorkspaceGroupSharingFactory.create(workspace=workspace_1, group__name="PRIMED_ALL")
+        WorkspaceFactory.create(name="b")
+        table = self.table_class(Workspace.objects.all())
+        self.assertIn("bi-check-circle-fill", table.rows[0].get_cell("is_shared"))
+        self.assertEqual("", table.rows[1].get_cell("is_shared"))
+
+    def test_number_of_queries(self):
+        """The number of queries to render the column does not depend on the number of workspaces."""
+        group = ManagedGroupFactory.create(name="PRIMED_ALL")
+
+        def count_queries():
+            table = self.table_class(Workspace.objects.all())
+            with CaptureQueriesContext(connection) as context:
+                for row in table.rows:
+                    row.get_cell("is_shared")
+            return len(context.captured_queries)
+
+        WorkspaceGroupSharingFactory.create(group=group)
+        WorkspaceFactory.create()
+        n_queries = count_queries()
+        WorkspaceGroupSharingFactory.create_batch(2, group=group)
+        WorkspaceFactory.create_batch(2)
+        self.assertEqual(count_queries(), n_queries)
+
+    def test_list_data(self):
+        """Tables can still be created from lists of workspaces."""
+        workspace = WorkspaceFactory.create()
+        WorkspaceGroupSharingFactory.create(workspace=workspace, group__name="PRIMED_ALL")
+        table = self.table_class([workspace])
+        self.assertIn("bi-check-circle-fill", table.rows[0].get_cell("is_shared"))
+
 
 class UserAccountTableTest(TestCase):
     """Tests for the UserAccountTable class."""
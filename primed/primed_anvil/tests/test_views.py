@@ -1317,6 +1317,94 @@ class InventoryInputsViewTest(TestCase):
         )
 
 
+class InventoryInputsJSONViewTest(TestCase):
+    """Tests for the InventoryInputsJSONView view."""
+
+    def setUp(self):
+        """Set up test class."""
+        self.factory = RequestFactory()
+        # Create a user with staff view permission.
+        self.user = User.objects.create_user(username="test", password="test")
+        self.user.user_permissions.add(
+            Permission.objects.get(codename=acm_models.AnVILProjectManagerAccess.STAFF_VIEW_PERMISSION_CODENAME)
+        )
+        self.primed_all = ManagedGroupFactory.create(name="PRIMED_ALL")
+
+    def get_url(self, *args):
+        """Get the url for the view being tested."""
+        return reverse("primed_anvil:utilities:inventory_inputs_json", args=args)
+
+    def get_view(self):
+        """Return the view being tested."""
+        return views.InventoryInputsJSONView.as_view()
+
+    def get_content(self, response):
+        return json.loads(b"".join(response.streaming_content))
+
+    def test_view_redirect_not_logged_in(self):
+        "View redirects to login view when user is not logged in."
+        # Need a client for redirects.
+        response = self.client.get(self.get_url())
+        self.assertRedirects(response, resolve_url(settings.LOGIN_URL) + "?next=" + self.get_url())
+
+    def test_status_code_with_view_user(self):
+        """Raises PermissionDenied when user has view perm."""
+        user = User.objects.create_user(username="test-none", password="test-none")
+        user.user_permissions.add(
+            Permission.objects.get(codename=acm_models.AnVILProjectManagerAccess.VIEW_PERMISSION_CODENAME)
+        )
+        request = self.factory.get(self.get_url())
+        request.user = user
+        with self.assertRaises(PermissionDenied):
+            self.get_view()(request)
+
+    def test_no_workspaces(self):
+        self.client.force_login(self.user)
+        response = self.client.get(self.get_url())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(self.get_content(response), {})
+
+    def test_two_workspaces(self):
+        study = StudyFactory.create(short_name="TEST")
+        workspace_1 = OpenAccessWorkspaceFactory.create(
+            workspace__billing_project__name="test-bp", workspace__name="test-ws-1"
+        )
+        workspace_1.studies.add(study)
+        WorkspaceGroupSharingFactory.create(workspace=workspace_1.workspace, group=self.primed_all)
+        workspace_2 = OpenAccessWorkspaceFactory.create(
+            workspace__billing_project__name="test-bp", workspace__name="test-ws-2"
+        )
+        WorkspaceGroupSharingFactory.create(workspace=workspace_2.workspace, group=self.primed_all)
+        self.client.force_login(self.user)
+        response = self.client.get(self.get_url())
+        self.assertEqual(
+            self.get_content(response),
+            {"test-bp/test-ws-1": "TEST", "test-bp/test-ws-2": ""},
+        )
+
+    def test_not_modified(self):
+        """Returns 304 if the If-None-Match header matches the current ETag."""
+        self.client.force_login(self.user)
+        response = self.client.get(self.get_url())
+        self.assertIn("ETag", response)
+        response = self.client.get(self.get_url(), headers={"if-none-match": response["ETag"]})
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_changes_when_shared(self):
+        self.client.force_login(self.user)
+        etag = self.client.get(self.get_url())["ETag"]
+        workspace = OpenAccessWorkspaceFactory.create(
+            workspace__billing_project__name="test-bp", workspace__name="test-ws"
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            WorkspaceGroupSharingFactory.create(workspace=workspace.workspace, group=self.primed_all)
+        response = self.client.get(self.get_url(), headers={"if-none-match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(self.get_content(response), {"test-bp/test-ws": ""})
+
+
 class ManagedGroupCreateTest(AnVILAPIMockTestMixin, TestCase):
     """Tests for custom ManagedGroup behavior."""
 
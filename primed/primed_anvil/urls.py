@@ -44,6 +44,11 @@ utilities_patterns = (
             views.InventoryInputsView.as_view(),
             name="inventory_inputs",
         ),
+        path(
+            "inventory_inputs/json/",
+            views.InventoryInputsJSONView.as_view(),
+            name="inventory_inputs_json",
+        ),
     ],
     "utilities",
 )
@@ -0,0 +1,63 @@
+from django.conf import settings
+from django.contrib import messages
+from django.http import HttpResponse
+from django.shortcuts import render
+
+from . import audit_tasks
+from .audit_results import get_outdated_subject_pks, get_stored_audit
+
+
+class StoredAuditRefreshMixin:
+    """Mixin to show a progress page while stored audit results are refreshed in the background.
+
+    If any stored results for `audit_class` are out of date, the view starts a background refresh (or joins one that
+    is already running) and shows a progress page instead of the audit results. The progress page polls the same url
+    with htmx until the refresh has finished, and then reloads the page to show the stored results.
+
+    If the last refresh failed, the stored results are shown as they are, with a warning, until
+    `audit_tasks.FAILED_TIMEOUT` has passed and another refresh can be started.
+
+    If `settings.AUDIT_BACKGROUND_REFRESH` is False, out of date results are refreshed within the request instead.
+    """
+
+    audit_class = None
+    audit_title = "Audit"
+    refresh_template_name = "primed_anvil/audit_refresh.html"
+    refresh_progress_template_name = "primed_anvil/snippets/audit_refresh_progress.html"
+    # The id of the element that polls for progress.
+    refresh_progress_target = "audit-refresh-progress"
+    refresh_failed_message = (
+        "Error updating audit results. Some results shown below may be out of date or missing; the update will be "
+        "retried later."
+    )
+    # Whether the last refresh failed, in which case the stored results are shown without refreshing them.
+    refresh_failed = False
+
+    def get_audit(self):
+        """Return a completed audit, loaded from the stored results."""
+        return get_stored_audit(self.audit_class, refresh=not self.refresh_failed)
+
+    def get(self, request, *args, **kwargs):
+        is_progress_poll = request.htmx and request.htmx.target == self.refresh_progress_target
+        if settings.AUDIT_BACKGROUND_REFRESH:
+            status = audit_tasks.get_refresh_status(self.audit_class)
+            if status is None and get_outdated_subject_pks(self.audit_class):
+                status = audit_tasks.start_refresh(self.audit_class)
+            if status is not None and status["status"] == audit_tasks.STATUS_FAILED:
+                # Show the stored results as they are; progress polls reload the page below.
+                if not is_progress_poll:
+                    self.refresh_failed = True
+                    messages.warning(request, self.refresh_failed_message)
+            elif status is not None:
+                context = {
+                    "status": status,
+                    "refresh_progress_target": self.refresh_progress_target,
+                    "audit_title": self.audit_title,
+                }
+                if is_progress_poll:
+                    return render(request, self.refresh_progress_template_name, context)
+                return render(request, self.refresh_template_name, context)
+        if is_progress_poll:
+            # The refresh has finished or failed; reload the page to show the results.
+            return HttpResponse(headers={"HX-Refresh": "true"})
+        return super().get(request, *args, **kwargs)
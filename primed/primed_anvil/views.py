@@ -12,7 +12,10 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.messages.views import SuccessMessageMixin
 from django.db.models import Q
-from django.views.generic import CreateView, DetailView, TemplateView
+from django.http import StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from django.views.generic import CreateView, DetailView, TemplateView, View
 from django_filters.views import FilterView
 from django_tables2 import MultiTableMixin, SingleTableMixin, SingleTableView
 
@@ -176,7 +179,7 @@ class DataSummaryView(LoginRequiredMixin, TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        table_data = helpers.get_summary_table_data()
+        table_data = helpers.get_cached_summary_table_data()
         context["summary_table"] = tables.DataSummaryTable(table_data)
         return context
 
@@ -186,5 +189,29 @@ class InventoryInputsView(AnVILConsortiumManagerStaffViewRequired, TemplateView)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["workspaces_input"] = json.dumps(helpers.get_workspaces_for_inventory(), indent=2)
+        context["workspaces_input"] = json.dumps(helpers.get_cached_workspaces_for_inventory()[1], indent=2)
         return context
+
+
+def _get_inventory_etag(request, *args, **kwargs):
+    return helpers.get_inventory_version()
+
+
+class InventoryInputsJSONView(AnVILConsortiumManagerStaffViewRequired, View):
+    """Return the input to the primed-phenotype-inventory workflow as JSON.
+
+    The response has an ETag that only changes when the input could change, so clients can make conditional
+    requests with If-None-Match to avoid downloading an unchanged input.
+    """
+
+    @method_decorator(condition(etag_func=_get_inventory_etag))
+    def get(self, request, *args, **kwargs):
+        workspaces = helpers.get_cached_workspaces_for_inventory()[1]
+        return StreamingHttpResponse(self._stream_json(workspaces), content_type="application/json")
+
+    def _stream_json(self, workspaces):
+        """Yield the JSON representation of the workspaces dictionary one workspace at a time."""
+        yield "{"
+        for i, (workspace_name, study_names) in enumerate(workspaces.items()):
+            yield "{}{}: {}".format(", " if i else "", json.dumps(workspace_name), json.dumps(study_names))
+        yield "}"
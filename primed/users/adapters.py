@@ -5,7 +5,7 @@ from allauth.account.adapter import DefaultAccountAdapter
 from allauth.socialaccount.adapter import DefaultSocialAccountAdapter
 from django.conf import settings
 from django.contrib.auth.models import Group
-from django.core.exceptions import ImproperlyConfigured, ObjectDoesNotExist
+from django.core.exceptions import ImproperlyConfigured
 from django.core.mail import mail_admins
 from django.http import HttpRequest
 
@@ -63,10 +63,9 @@ class SocialAccountAdapter(DefaultSocialAccountAdapter):
         if research_center_or_site:
             if not isinstance(research_center_or_site, list):
                 raise ImproperlyConfigured("sociallogin.extra_data.study_site_or_center should be a list")
+            study_sites = StudySite.objects.in_bulk(research_center_or_site, field_name="short_name")
             for rc_name in research_center_or_site:
-                try:
-                    rc = StudySite.objects.get(short_name=rc_name)
-                except ObjectDoesNotExist:
+                if rc_name not in study_sites:
                     logger.debug(
                         f"[SocialAccountAdatpter:update_user_study_sites] Ignoring drupal "
                         f"study_site_or_center {rc_name} - not in StudySite domain"
@@ -75,54 +74,61 @@ class SocialAccountAdapter(DefaultSocialAccountAdapter):
                         subject="Missing StudySite",
                         message=f"Missing study site {rc_name} passed from drupal for user {user}",
                     )
-                    continue
-                else:
-                    if not user.study_sites.filter(pk=rc.pk):
-                        user_sites_updated = True
-                        if apply_update is True:
-                            user.study_sites.add(rc)
-                            logger.info(
-                                f"[SocialAccountAdatpter:update_user_study_sites] adding user "
-                                f"study_sites user: {user} rc: {rc}"
-                            )
-
-            for existing_rc in user.study_sites.all():
-                if existing_rc.short_name not in research_center_or_site:
-                    user_sites_updated = True
-                    if apply_update:
-                        user.study_sites.remove(existing_rc)
-                        logger.info(
-                            "[SocialAccountAdatpter:update_user_study_sites] "
-                            f"removing study_site {existing_rc} for user {user}"
-                        )
+
+            existing_rcs = set(user.study_sites.all())
+            added_rcs = set(study_sites.values()) - existing_rcs
+            removed_rcs = {rc for rc in existing_rcs if rc.short_name not in research_center_or_site}
+            if added_rcs or removed_rcs:
+                user_sites_updated = True
+                if apply_update is True:
+                    # add and remove each make a single bulk query on the through table.
+                    if added_rcs:
+                        user.study_sites.add(*added_rcs)
+                    if removed_rcs:
+                        user.study_sites.remove(*removed_rcs)
+                    logger.info(
+                        f"[SocialAccountAdatpter:update_user_study_sites] user: {user} updated study_sites: "
+                        f"added {sorted(rc.short_name for rc in added_rcs)} "
+                        f"removed {sorted(rc.short_name for rc in removed_rcs)}"
+                    )
             return user_sites_updated
 
     def update_user_groups(self, user, extra_data: Dict):
         managed_scope_status = extra_data.get("managed_scope_status")
         if managed_scope_status:
-            added_groups = []
-            removed_groups = []
             if not isinstance(managed_scope_status, dict):
                 raise ImproperlyConfigured("sociallogin.extra_data.managed_scope_status should be a dict")
-            else:
-                for group_name, user_has_group in managed_scope_status.items():
-                    user_group, was_created = Group.objects.get_or_create(name=group_name)
-                    if was_created:
-                        logger.debug(
-                            f"[SocialAccountAdatpter:update_user_data] created mapped user group: {group_name}"
-                        )
-                    if user_has_group is True:
-                        if user_group not in user.groups.all():
-                            user.groups.add(user_group)
-                            added_groups.append(user_group.name)
-                    else:
-                        if user_group in user.groups.all():
-                            user.groups.remove(user_group)
-                            removed_groups.append(user_group.name)
+            user_groups = Group.objects.in_bulk(managed_scope_status, field_name="name")
+            missing_group_names = [group_name for group_name in managed_scope_status if group_name not in user_groups]
+            if missing_group_names:
+                Group.objects.bulk_create(
+                    [Group(name=group_name) for group_name in missing_group_names], ignore_conflicts=True
+                )
+                # Look the new groups up, because bulk_create does not set their primary keys on all databases.
+                user_groups.update(Group.objects.in_bulk(missing_group_names, field_name="name"))
+                logger.debug(
+                    f"[SocialAccountAdatpter:update_user_data] created mapped user groups: {missing_group_names}"
+                )
+            existing_groups = set(user.groups.all())
+            added_groups = []
+            removed_groups = []
+            for group_name, user_has_group in managed_scope_status.items():
+                user_group = user_groups[group_name]
+                if user_has_group is True:
+                    if user_group not in existing_groups:
+                        added_groups.append(user_group)
+                else:
+                    if user_group in existing_groups:
+                        removed_groups.append(user_group)
+            if added_groups:
+                user.groups.add(*added_groups)
+            if removed_groups:
+                user.groups.remove(*removed_groups)
             if added_groups or removed_groups:
                 logger.info(
                     f"[SocialAccountAdatpter:update_user_data] user: {user} updated groups: "
-                    f"added {added_groups} removed: {removed_groups} "
+                    f"added {[group.name for group in added_groups]} "
+                    f"removed: {[group.name for group in removed_groups]} "
                     f"managed_scope_status: {managed_scope_status}"
                 )
 
@@ -1,4 +1,6 @@
 import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 
 import django_tables2 as tables
@@ -8,20 +10,30 @@ from anvil_consortium_manager.models import Account
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.sites.models import Site
-from django.core.exceptions import ObjectDoesNotExist
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Prefetch, Q
+from django.db.models.signals import m2m_changed
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.utils.safestring import mark_safe
 from django_tables2.export import TableExport
-from oauthlib.oauth2 import BackendApplicationClient
-from requests_oauthlib import OAuth2, OAuth2Session
 
+from primed.drupal_oauth_provider import client as drupal_client
 from primed.drupal_oauth_provider.provider import CustomProvider
 from primed.primed_anvil.audit import PRIMEDAudit, PRIMEDAuditResult
 from primed.primed_anvil.models import StudySite
+from primed.users.models import DrupalSyncState
 
 logger = logging.getLogger(__name__)
 
+DRUPAL_USER_RESOURCE = "user/user"
+DRUPAL_STUDY_SITE_RESOURCE = "node/study_site_or_center"
+# Number of users requested per page from the Drupal JSON:API. Drupal does not return more than 50 per page.
+DRUPAL_USER_PAGE_SIZE = 50
+# Maximum number of pages of users requested from Drupal at the same time.
+DRUPAL_USER_PAGE_MAX_WORKERS = 4
+
 
 class TextTable(object):
     def render_to_text(self):
@@ -61,6 +73,12 @@ class UserAuditResult(PRIMEDAuditResult):
     changes: dict = None
     anvil_groups: list = None
 
+    def get_key(self):
+        key = super().get_key()
+        if self.remote_user_data:
+            key["remote_user_id"] = self.remote_user_data.attributes.get("drupal_internal__uid")
+        return key
+
     def get_table_dictionary(self):
         """Return a dictionary that can be used to populate an instance of `SiteAuditResultsTable`."""
 
@@ -136,157 +154,181 @@ class UserAudit(PRIMEDAudit):
     USER_DEACTIVATE_THRESHOLD = 3
     results_table_class = UserAuditResultsTable
 
-    def __init__(self, apply_changes=False, ignore_deactivate_threshold=False):
+    def __init__(self, apply_changes=False, ignore_deactivate_threshold=False, incremental=False):
         """Initialize the audit.
 
         Args:
             apply_changes: Whether to make changes to align the audit
+            incremental: Whether to only audit users that have changed in drupal since the last sync. Users
+                that are no longer in drupal are only found by a full audit.
         """
         super().__init__()
         self.apply_changes = apply_changes
         self.ignore_deactivate_threshold = ignore_deactivate_threshold
+        self.incremental = incremental
 
     def _run_audit(self):
         """Run the audit on local and remote users."""
-        user_endpoint_url = "user/user"
         drupal_uids = set()
         json_api = get_drupal_json_api()
         study_sites = get_study_sites(json_api)
+        # An incremental audit is a full audit if the users have not been synced before.
+        changed_since = get_drupal_changed_since(DRUPAL_USER_RESOURCE) if self.incremental else None
+        drupal_users = get_drupal_users(json_api, changed_since=changed_since)
+        # Changes to apply, which are saved together after all users have been audited.
+        new_social_accounts = []
+        updated_users = []
+        added_study_sites = []
+        removed_study_sites = []
+
+        # Load local data up front so that the remote users can be compared without a query per user.
+        local_study_sites = {study_site.short_name: study_site for study_site in StudySite.objects.all()}
+        social_accounts = SocialAccount.objects.filter(provider=CustomProvider.id)
+        if changed_since is not None:
+            social_accounts = social_accounts.filter(
+                uid__in=[str(user.attributes.get("drupal_internal__uid")) for user in drupal_users]
+            )
+        social_accounts = {
+            sa.uid: sa for sa in social_accounts.select_related("user").prefetch_related("user__study_sites")
+        }
 
-        user_count = 0
-        while user_endpoint_url is not None:
-            users_endpoint = json_api.endpoint(user_endpoint_url)
-            users_endpoint_response = users_endpoint.get()
-
-            # If there are more, there will be a 'next' link
-
-            user_endpoint_url = users_endpoint_response.content.links.get("next", {}).get("href")
-
-            for user in users_endpoint_response.data:
-                drupal_uid = user.attributes.get("drupal_internal__uid")
-                drupal_username = user.attributes.get("name")
-                drupal_email = user.attributes.get("mail")
-                drupal_firstname = user.attributes.get("field_given_first_name_s_")
-                drupal_lastname = user.attributes.get("field_examples_family_last_name_")
-                drupal_full_name = " ".join(part for part in (drupal_firstname, drupal_lastname) if part)
-                drupal_study_sites_rel = user.relationships.get("field_study_site_or_center")
-                drupal_user_study_site_shortnames = []
-                if drupal_study_sites_rel:
-                    for dss in drupal_study_sites_rel.data:
-                        study_site_uuid = dss.id
-                        study_site_info = study_sites[study_site_uuid]
-
-                        drupal_user_study_site_shortnames.append(study_site_info["short_name"])
-                new_user_sites = StudySite.objects.filter(short_name__in=drupal_user_study_site_shortnames)
-                # no uid is blocked or anonymous
-                if not drupal_uid:
-                    # potential blocked user, but will no longer have a drupal uid
-                    # so we cover these below
-                    continue
-                sa = None
-                try:
-                    sa = SocialAccount.objects.get(
+        for user in drupal_users:
+            drupal_uid = user.attributes.get("drupal_internal__uid")
+            drupal_username = user.attributes.get("name")
+            drupal_email = user.attributes.get("mail")
+            drupal_firstname = user.attributes.get("field_given_first_name_s_")
+            drupal_lastname = user.attributes.get("field_examples_family_last_name_")
+            drupal_full_name = " ".join(part for part in (drupal_firstname, drupal_lastname) if part)
+            drupal_study_sites_rel = user.relationships.get("field_study_site_or_center")
+            drupal_user_study_site_shortnames = []
+            if drupal_study_sites_rel:
+                for dss in drupal_study_sites_rel.data:
+                    study_site_uuid = dss.id
+                    study_site_info = study_sites[study_site_uuid]
+
+                    drupal_user_study_site_shortnames.append(study_site_info["short_name"])
+            new_user_sites = [
+                local_study_sites[short_name]
+                for short_name in set(drupal_user_study_site_shortnames)
+                if short_name in local_study_sites
+            ]
+            # no uid is blocked or anonymous
+            if not drupal_uid:
+                # potential blocked user, but will no longer have a drupal uid
+                # so we cover these below
+                continue
+            sa = social_accounts.get(str(drupal_uid))
+            if sa is None:
+                drupal_user = get_user_model()()
+                drupal_user.username = drupal_username
+                drupal_user.name = drupal_full_name
+                drupal_user.email = drupal_email
+                if self.apply_changes is True:
+                    sa = SocialAccount(
+                        user=drupal_user,
                         uid=user.attributes["drupal_internal__uid"],
                         provider=CustomProvider.id,
                     )
-                except ObjectDoesNotExist:
-                    drupal_user = get_user_model()()
-                    drupal_user.username = drupal_username
-                    drupal_user.name = drupal_full_name
-                    drupal_user.email = drupal_email
-                    if self.apply_changes is True:
-                        drupal_user.save()
-                        drupal_user.study_sites.set(new_user_sites)
-                    if self.apply_changes is True:
-                        sa = SocialAccount.objects.create(
-                            user=drupal_user,
-                            uid=user.attributes["drupal_internal__uid"],
-                            provider=CustomProvider.id,
-                        )
-                    self.needs_action.append(NewUser(local_user=sa, remote_user_data=user))
-
-                if sa:
-                    user_updates = {}
-                    if sa.user.name != drupal_full_name:
-                        user_updates.update({"name": {"old": sa.user.name, "new": drupal_full_name}})
-                        sa.user.name = drupal_full_name
-                    if sa.user.username != drupal_username:
-                        user_updates.update(
-                            {
-                                "username": {
-                                    "old": sa.user.username,
-                                    "new": drupal_username,
-                                }
+                    new_social_accounts.append(sa)
+                    added_study_sites.extend((drupal_user, study_site) for study_site in new_user_sites)
+                self.needs_action.append(NewUser(local_user=sa, remote_user_data=user))
+            else:
+                user_updates = {}
+                if sa.user.name != drupal_full_name:
+                    user_updates.update({"name": {"old": sa.user.name, "new": drupal_full_name}})
+                    sa.user.name = drupal_full_name
+                if sa.user.username != drupal_username:
+                    user_updates.update(
+                        {
+                            "username": {
+                                "old": sa.user.username,
+                                "new": drupal_username,
                             }
-                        )
-                        sa.user.username = drupal_username
-                    if sa.user.email != drupal_email:
-                        user_updates.update({"email": {"old": sa.user.email, "new": drupal_email}})
-                        sa.user.email = drupal_email
-
-                    if sa.user.is_active is False:
-                        user_updates.update({"is_active": {"old": False, "new": True}})
-                        sa.user.is_active = True
-
-                    prev_user_site_names = set(sa.user.study_sites.all().values_list("short_name", flat=True))
-                    new_user_site_names = set(drupal_user_study_site_shortnames)
-                    if prev_user_site_names != new_user_site_names:
-                        user_updates.update(
-                            {
-                                "sites": {
-                                    "old": prev_user_site_names,
-                                    "new": new_user_site_names,
-                                }
+                        }
+                    )
+                    sa.user.username = drupal_username
+                if sa.user.email != drupal_email:
+                    user_updates.update({"email": {"old": sa.user.email, "new": drupal_email}})
+                    sa.user.email = drupal_email
+
+                if sa.user.is_active is False:
+                    user_updates.update({"is_active": {"old": False, "new": True}})
+                    sa.user.is_active = True
+
+                # Uses the prefetched study sites.
+                prev_user_sites = list(sa.user.study_sites.all())
+                prev_user_site_names = {study_site.short_name for study_site in prev_user_sites}
+                new_user_site_names = set(drupal_user_study_site_shortnames)
+                if prev_user_site_names != new_user_site_names:
+                    user_updates.update(
+                        {
+                            "sites": {
+                                "old": prev_user_site_names,
+                                "new": new_user_site_names,
                             }
-                        )
-                        # do not remove from sites by default
-                        removed_sites = prev_user_site_names.difference(new_user_site_names)
-                        new_sites = new_user_site_names.difference(prev_user_site_names)
-
-                        if settings.DRUPAL_DATA_AUDIT_REMOVE_USER_SITES is True:
-                            if self.apply_changes is True:
-                                sa.user.study_sites.set(new_user_sites)
-                        else:
-                            if removed_sites:
-                                self.errors.append(
-                                    UpdateUser(
-                                        local_user=sa,
-                                        remote_user_data=user,
-                                        changes=user_updates,
-                                    )
-                                )
-                            if new_sites:
-                                for new_site in new_user_sites:
-                                    if new_site.short_name in new_user_site_names:
-                                        if self.apply_changes is True:
-                                            sa.user.study_sites.add(new_site)
+                        }
+                    )
+                    # do not remove from sites by default
+                    removed_sites = prev_user_site_names.difference(new_user_site_names)
+                    new_sites = new_user_site_names.difference(prev_user_site_names)
 
-                    if user_updates:
+                    if settings.DRUPAL_DATA_AUDIT_REMOVE_USER_SITES is True:
                         if self.apply_changes is True:
-                            sa.user.save()
-
-                        self.needs_action.append(
-                            UpdateUser(
-                                local_user=sa,
-                                remote_user_data=user,
-                                changes=user_updates,
+                            removed_study_sites.extend(
+                                (sa.user, study_site)
+                                for study_site in prev_user_sites
+                                if study_site.short_name in removed_sites
+                            )
+                            added_study_sites.extend(
+                                (sa.user, study_site)
+                                for study_site in new_user_sites
+                                if study_site.short_name in new_sites
                             )
-                        )
                     else:
-                        self.verified.append(VerifiedUser(local_user=sa, remote_user_data=user))
+                        if removed_sites:
+                            self.errors.append(
+                                UpdateUser(
+                                    local_user=sa,
+                                    remote_user_data=user,
+                                    changes=user_updates,
+                                )
+                            )
+                        if new_sites:
+                            for new_site in new_user_sites:
+                                if new_site.short_name in new_sites:
+                                    if self.apply_changes is True:
+                                        added_study_sites.append((sa.user, new_site))
 
-                drupal_uids.add(drupal_uid)
-                user_count += 1
+                if user_updates:
+                    if self.apply_changes is True:
+                        updated_users.append(sa.user)
+
+                    self.needs_action.append(
+                        UpdateUser(
+                            local_user=sa,
+                            remote_user_data=user,
+                            changes=user_updates,
+                        )
+                    )
+                else:
+                    self.verified.append(VerifiedUser(local_user=sa, remote_user_data=user))
+
+            drupal_uids.add(drupal_uid)
 
         # find active django accounts that are drupal based
         # users that we did not get from drupal
         # these may include blocked users
-
-        unaudited_drupal_accounts = SocialAccount.objects.filter(
-            provider=CustomProvider.id, user__is_active=True
-        ).exclude(uid__in=drupal_uids)
+        # an incremental audit only gets users that have changed, so these are only found by a full audit
+
+        unaudited_drupal_accounts = []
+        if changed_since is None:
+            unaudited_drupal_accounts = list(
+                SocialAccount.objects.filter(provider=CustomProvider.id, user__is_active=True)
+                .exclude(uid__in=drupal_uids)
+                .select_related("user")
+            )
         user_ids_to_check = []
-        count_inactive = unaudited_drupal_accounts.count()
+        count_inactive = len(unaudited_drupal_accounts)
         over_threshold = False
         if self.ignore_deactivate_threshold is False:
             if count_inactive > self.USER_DEACTIVATE_THRESHOLD:
@@ -299,33 +341,104 @@ class UserAudit(PRIMEDAudit):
                 uda.user.is_active = False
                 if over_threshold is False:
                     if self.apply_changes is True:
-                        uda.user.save()
+                        updated_users.append(uda.user)
                     handled = True
                     self.needs_action.append(RemoveUser(local_user=uda))
             if handled is False:
                 self.errors.append(RemoveUser(local_user=uda, note=f"Over Threshold {over_threshold}"))
 
+        if self.apply_changes is True:
+            self._apply_changes(new_social_accounts, updated_users, added_study_sites, removed_study_sites)
+            update_drupal_changed_since(DRUPAL_USER_RESOURCE, [user.attributes.get("changed") for user in drupal_users])
+
         # Use distinct so this returns one row per Account
         # instead of row per groupaccountmembership
-        inactive_anvil_users = Account.objects.filter(
-            Q(user__is_active=False) | Q(user__id__in=user_ids_to_check),
-            groupaccountmembership__isnull=False,
-        ).distinct()
+        inactive_anvil_users = (
+            Account.objects.filter(
+                Q(user__is_active=False) | Q(user__id__in=user_ids_to_check),
+                groupaccountmembership__isnull=False,
+            )
+            .distinct()
+            .select_related("user")
+            .prefetch_related(
+                Prefetch(
+                    "user__socialaccount_set",
+                    queryset=SocialAccount.objects.filter(provider=CustomProvider.id).order_by("pk"),
+                    to_attr="drupal_social_accounts",
+                ),
+                "groupaccountmembership_set__group",
+            )
+        )
 
         for inactive_anvil_user in inactive_anvil_users:
-            drupal_social_account = inactive_anvil_user.user.socialaccount_set.filter(
-                provider=CustomProvider.id
-            ).first()
+            drupal_social_accounts = inactive_anvil_user.user.drupal_social_accounts
             self.errors.append(
                 InactiveAnvilUser(
-                    local_user=drupal_social_account,
+                    local_user=drupal_social_accounts[0] if drupal_social_accounts else None,
                     anvil_account=inactive_anvil_user,
-                    anvil_groups=list(
-                        inactive_anvil_user.groupaccountmembership_set.all().values_list("group__name", flat=True)
-                    ),
+                    anvil_groups=[
+                        membership.group.name for membership in inactive_anvil_user.groupaccountmembership_set.all()
+                    ],
                 )
             )
 
+    def _apply_changes(self, new_social_accounts, updated_users, added_study_sites, removed_study_sites):
+        """Save the changes found by the audit in a single transaction, using bulk queries.
+
+        Args:
+            new_social_accounts: Unsaved social accounts to create, along with their unsaved users.
+            updated_users: Existing users whose fields have been modified.
+            added_study_sites: (user, study site) pairs to add to `User.study_sites`.
+            removed_study_sites: (user, study site) pairs to remove from `User.study_sites`.
+        """
+        User = get_user_model()
+        StudySiteThrough = User.study_sites.through
+        with transaction.atomic():
+            new_users = User.objects.bulk_create([sa.user for sa in new_social_accounts])
+            # Some databases (e.g., MySQL) do not set the primary key of objects created with bulk_create.
+            users_without_pk = {user.username: user for user in new_users if user.pk is None}
+            if users_without_pk:
+                for username, pk in User.objects.filter(username__in=users_without_pk).values_list("username", "pk"):
+                    users_without_pk[username].pk = pk
+            SocialAccount.objects.bulk_create(new_social_accounts)
+            User.objects.bulk_update(updated_users, ["username", "name", "email", "is_active"])
+            if removed_study_sites:
+                removed_pairs = {(user.pk, study_site.pk) for user, study_site in removed_study_sites}
+                through_pks = [
+                    pk
+                    for pk, user_pk, study_site_pk in StudySiteThrough.objects.filter(
+                        user__in={user_pk for user_pk, _ in removed_pairs}
+                    ).values_list("pk", "user", "studysite")
+                    if (user_pk, study_site_pk) in removed_pairs
+                ]
+                StudySiteThrough.objects.filter(pk__in=through_pks).delete()
+            StudySiteThrough.objects.bulk_create(
+                [
+                    StudySiteThrough(user_id=user.pk, studysite_id=study_site.pk)
+                    for user, study_site in added_study_sites
+                ],
+                ignore_conflicts=True,
+            )
+            # The bulk queries on the through table do not send m2m_changed signals, so send them here for each study
+            # site, so that receivers (e.g., for stored audit results) are notified of the changes.
+            for action, changed_study_sites in (
+                ("post_remove", removed_study_sites),
+                ("post_add", added_study_sites),
+            ):
+                user_pks_by_study_site = defaultdict(set)
+                for user, study_site in changed_study_sites:
+                    user_pks_by_study_site[study_site].add(user.pk)
+                for study_site, user_pks in user_pks_by_study_site.items():
+                    m2m_changed.send(
+                        sender=StudySiteThrough,
+                        instance=study_site,
+                        action=action,
+                        reverse=True,
+                        model=User,
+                        pk_set=user_pks,
+                        using=StudySiteThrough.objects.db,
+                    )
+
 
 class SiteAuditResultsTable(tables.Table, TextTable):
     """A table to show results from a SiteAudit instance."""
@@ -350,6 +463,12 @@ class SiteAuditResult(PRIMEDAuditResult):
     changes: dict = None
     note: str = None
 
+    def get_key(self):
+        key = super().get_key()
+        if self.remote_site_data:
+            key["remote_site_name"] = self.remote_site_data.get("short_name")
+        return key
+
     def get_table_dictionary(self):
         """Return a dictionary that can be used to populate an instance of `SiteAuditResultsTable`."""
         row = {
@@ -396,36 +515,47 @@ class SiteAudit(PRIMEDAudit):
     ISSUE_TYPE_LOCAL_SITE_INVALID = "Local site is invalid"
     results_table_class = SiteAuditResultsTable
 
-    def __init__(self, apply_changes=False):
+    def __init__(self, apply_changes=False, incremental=False):
         """Initialize the audit.
 
         Args:
             apply_changes: Whether to make changes to align the audit
+            incremental: Whether to only audit sites that have changed in drupal since the last sync. Sites
+                that are no longer in drupal are only found by a full audit.
         """
         super().__init__()
         self.apply_changes = apply_changes
+        self.incremental = incremental
 
     def _run_audit(self):
         """Run the audit on local and remote users."""
         valid_nodes = set()
         json_api = get_drupal_json_api()
-        study_sites = get_study_sites(json_api=json_api)
+        # An incremental audit is a full audit if the sites have not been synced before.
+        changed_since = get_drupal_changed_since(DRUPAL_STUDY_SITE_RESOURCE) if self.incremental else None
+        study_sites = get_study_sites(json_api=json_api, changed_since=changed_since)
+        local_study_sites = {
+            study_site.drupal_node_id: study_site
+            for study_site in StudySite.objects.filter(drupal_node_id__isnull=False)
+        }
+        # Changes to apply, which are saved together after all sites have been audited.
+        new_study_sites = []
+        updated_study_sites = []
         for study_site_info in study_sites.values():
             short_name = study_site_info["short_name"]
             full_name = study_site_info["full_name"]
             node_id = study_site_info["node_id"]
             valid_nodes.add(node_id)
 
-            try:
-                study_site = StudySite.objects.get(drupal_node_id=node_id)
-            except ObjectDoesNotExist:
-                study_site = None
+            study_site = local_study_sites.get(int(node_id))
+            if study_site is None:
                 if self.apply_changes is True:
-                    study_site = StudySite.objects.create(
+                    study_site = StudySite(
                         drupal_node_id=node_id,
                         short_name=short_name,
                         full_name=full_name,
                     )
+                    new_study_sites.append(study_site)
                 self.needs_action.append(NewSite(remote_site_data=study_site_info, local_site=study_site))
             else:
                 study_site_updates = {}
@@ -447,7 +577,7 @@ class SiteAudit(PRIMEDAudit):
 
                 if study_site_updates:
                     if self.apply_changes is True:
-                        study_site.save()
+                        updated_study_sites.append(study_site)
                     self.needs_action.append(
                         UpdateSite(
                             local_site=study_site,
@@ -458,10 +588,24 @@ class SiteAudit(PRIMEDAudit):
                 else:
                     self.verified.append(VerifiedSite(local_site=study_site, remote_site_data=study_site_info))
 
-        invalid_study_sites = StudySite.objects.exclude(drupal_node_id__in=valid_nodes)
+        if self.apply_changes is True:
+            with transaction.atomic():
+                StudySite.objects.bulk_create(new_study_sites)
+                # bulk_update does not set the modification time like save does.
+                now = timezone.now()
+                for study_site in updated_study_sites:
+                    study_site.modified = now
+                StudySite.objects.bulk_update(updated_study_sites, ["short_name", "full_name", "modified"])
+            update_drupal_changed_since(
+                DRUPAL_STUDY_SITE_RESOURCE, [study_site_info["changed"] for study_site_info in study_sites.values()]
+            )
+
+        # An incremental audit only gets sites that have changed, so invalid sites are only found by a full audit.
+        if changed_since is None:
+            invalid_study_sites = StudySite.objects.exclude(drupal_node_id__in=valid_nodes)
 
-        for iss in invalid_study_sites:
-            self.errors.append(RemoveSite(local_site=iss, note=self.ISSUE_TYPE_LOCAL_SITE_INVALID))
+            for iss in invalid_study_sites:
+                self.errors.append(RemoveSite(local_site=iss, note=self.ISSUE_TYPE_LOCAL_SITE_INVALID))
 
 
 def get_drupal_json_api():
@@ -469,29 +613,27 @@ def get_drupal_json_api():
     json_api_client_secret = settings.DRUPAL_API_CLIENT_SECRET
 
     token_url = f"{settings.DRUPAL_SITE_URL}/oauth/token"
-    client = BackendApplicationClient(client_id=json_api_client_id)
-    oauth = OAuth2Session(client=client)
     api_root = f"{settings.DRUPAL_SITE_URL}/{settings.DRUPAL_API_REL_PATH}"
 
-    token = oauth.fetch_token(
-        token_url=token_url,
-        client_id=json_api_client_id,
-        client_secret=json_api_client_secret,
-    )
-
-    drupal_api = jsonapi_requests.Api.config(
+    drupal_api = drupal_client.get_json_api(
         {
             "API_ROOT": api_root,
-            "AUTH": OAuth2(client=client, client_id=json_api_client_id, token=token),
+            # The token is fetched when the first request is made, and cached by the shared drupal client.
+            "AUTH": drupal_client.ClientCredentialsAuth(
+                token_url=token_url,
+                client_id=json_api_client_id,
+                client_secret=json_api_client_secret,
+            ),
             "VALIDATE_SSL": True,
+            "TIMEOUT": drupal_client.REQUEST_TIMEOUT,
         }
     )
     return drupal_api
 
 
-def get_study_sites(json_api):
-    study_sites_endpoint = json_api.endpoint("node/study_site_or_center")
-    study_sites_response = study_sites_endpoint.get()
+def get_study_sites(json_api, changed_since=None):
+    study_sites_endpoint = json_api.endpoint(DRUPAL_STUDY_SITE_RESOURCE)
+    study_sites_response = study_sites_endpoint.get(params=get_changed_filter_params(changed_since))
     study_sites_info = dict()
 
     for ss in study_sites_response.data:
@@ -503,5 +645,70 @@ def get_study_sites(json_api):
             "node_id": node_id,
             "short_name": short_name,
             "full_name": full_name,
+            "changed": ss.attributes.get("changed"),
         }
     return study_sites_info
+
+
+def get_drupal_users(
+    json_api, changed_since=None, page_size=DRUPAL_USER_PAGE_SIZE, max_workers=DRUPAL_USER_PAGE_MAX_WORKERS
+):
+    """Return a list of all users, or all users changed since `changed_since`, from the Drupal JSON:API.
+
+    The first page is requested on its own. If there are more pages, they are requested by offset in batches of
+    `max_workers` concurrent requests, until a page without a `next` link is returned."""
+    users_endpoint = json_api.endpoint(DRUPAL_USER_RESOURCE)
+    filter_params = get_changed_filter_params(changed_since)
+
+    def get_page(offset):
+        # Sort so that offsets refer to the same users in every request.
+        params = {"sort": "drupal_internal__uid", "page[offset]": offset, "page[limit]": page_size}
+        return users_endpoint.get(params=dict(filter_params, **params))
+
+    response = get_page(0)
+    users = list(response.data)
+    offset = page_size
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # If there are more, there will be a 'next' link
+        while response.content.links.get("next"):
+            offsets = [offset + i * page_size for i in range(max_workers)]
+            offset += max_workers * page_size
+            for response in executor.map(get_page, offsets):
+                users.extend(response.data)
+                if not response.content.links.get("next"):
+                    break
+    return users
+
+
+def get_changed_filter_params(changed_since):
+    """Return JSON:API query parameters to only request entities changed at or after `changed_since`."""
+    if changed_since is None:
+        return {}
+    return {
+        "filter[changed][condition][path]": "changed",
+        "filter[changed][condition][operator]": ">=",
+        # Drupal compares the filter value to the stored unix timestamp.
+        "filter[changed][condition][value]": int(changed_since.timestamp()),
+    }
+
+
+def get_drupal_changed_since(resource):
+    """Return the most recent changed time of the synced entities of a Drupal resource, or None if not synced."""
+    return DrupalSyncState.objects.filter(resource=resource).values_list("changed", flat=True).first()
+
+
+def update_drupal_changed_since(resource, changed_times):
+    """Record the most recent of `changed_times` for a Drupal resource, if it is later than the recorded time.
+
+    Args:
+        resource: The Drupal JSON:API resource, e.g., user/user.
+        changed_times: The `changed` attributes of the synced entities, as returned by the JSON:API.
+    """
+    changed_times = [parse_datetime(changed) for changed in changed_times if changed]
+    if not changed_times:
+        return
+    changed = max(changed_times)
+    sync_state, created = DrupalSyncState.objects.get_or_create(resource=resource, defaults={"changed": changed})
+    if not created and changed > sync_state.changed:
+        sync_state.changed = changed
+        sync_state.save()
@@ -29,6 +29,14 @@ class Command(BaseCommand):
             default=False,
             help="Ignore user deactivation threshold",
         )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            dest="incremental",
+            default=False,
+            help="Only sync users and sites that have changed in drupal since the last sync. "
+            "Users and sites that have been removed from drupal are only found without this option.",
+        )
 
         parser.add_argument(
             "--email",
@@ -80,12 +88,14 @@ class Command(BaseCommand):
         self.email = options["email"]
         self.error_email = options["error_email"]
         self.ignore_threshold = options["ignore_threshold"]
+        self.incremental = options["incremental"]
 
         notification_content = (
             f"[sync-drupal-data] start: Applying Changes: {self.apply_changes} "
-            f"Ignoring Threshold: {self.ignore_threshold} Start time: {localtime()}\n"
+            f"Ignoring Threshold: {self.ignore_threshold} Incremental: {self.incremental} "
+            f"Start time: {localtime()}\n"
         )
-        site_audit = audit.SiteAudit(apply_changes=self.apply_changes)
+        site_audit = audit.SiteAudit(apply_changes=self.apply_changes, incremental=self.incremental)
         site_audit.run_audit()
 
         notification_content += (
@@ -102,6 +112,7 @@ class Command(BaseCommand):
         user_audit = audit.UserAudit(
             apply_changes=self.apply_changes,
             ignore_deactivate_threshold=self.ignore_threshold,
+            incremental=self.incremental,
         )
         user_audit.run_audit()
         notification_content += (
@@ -0,0 +1,21 @@
+# Generated by Django 5.2 on 2026-10-17 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_auto_20221130_0856'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DrupalSyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resource', models.CharField(help_text='The Drupal JSON:API resource, e.g., user/user.', max_length=255, unique=True)),
+                ('changed', models.DateTimeField(help_text='The most recent Drupal changed time of the synced entities of this resource.')),
+            ],
+        ),
+    ]
@@ -1,5 +1,5 @@
 from django.contrib.auth.models import AbstractUser
-from django.db.models import CharField, ManyToManyField
+from django.db.models import CharField, DateTimeField, ManyToManyField, Model
 from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
 
@@ -23,3 +23,17 @@ class User(AbstractUser):
 
         """
         return reverse("users:detail", kwargs={"username": self.username})
+
+
+class DrupalSyncState(Model):
+    """The sync state of a Drupal JSON:API resource.
+
+    Incremental runs of the Drupal data audits request only the entities of a resource that have changed since
+    `changed`, the most recent `changed` time of the entities of that resource that have been synced.
+    """
+
+    resource = CharField(max_length=255, unique=True, help_text="The Drupal JSON:API resource, e.g., user/user.")
+    changed = DateTimeField(help_text="The most recent Drupal changed time of the synced entities of this resource.")
+
+    def __str__(self):
+        return self.resource
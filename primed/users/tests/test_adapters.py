@@ -10,9 +10,10 @@ from django.contrib.sessions.middleware import SessionMiddleware
 from django.contrib.sites.models import Site
 from django.core import mail
 from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
 from django.test import TestCase
 from django.test.client import RequestFactory
-from django.test.utils import override_settings
+from django.test.utils import CaptureQueriesContext, override_settings
 
 from primed.drupal_oauth_provider.provider import CustomProvider
 from primed.primed_anvil.tests.factories import StudySiteFactory
@@ -180,6 +181,21 @@ class SocialAccountAdapterTest(TestCase):
         assert user.study_sites.filter(pk=rc1.pk).exists()
         assert user.study_sites.all().count() == 1
 
+    def test_update_user_study_sites_number_of_queries(self):
+        """The number of queries does not depend on the number of study sites."""
+        adapter = SocialAccountAdapter()
+
+        def count_queries(n_sites):
+            user = UserFactory()
+            user.study_sites.add(*StudySiteFactory.create_batch(n_sites))
+            short_names = [study_site.short_name for study_site in StudySiteFactory.create_batch(n_sites)]
+            with CaptureQueriesContext(connection) as context:
+                adapter.update_user_study_sites(user, dict(study_site_or_center=short_names))
+            assert set(user.study_sites.values_list("short_name", flat=True)) == set(short_names)
+            return len(context.captured_queries)
+
+        assert count_queries(3) == count_queries(1)
+
     @override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend")
     def test_update_user_study_sites_unknown(self):
         adapter = SocialAccountAdapter()
@@ -247,6 +263,25 @@ class SocialAccountAdapterTest(TestCase):
         assert not user.groups.filter(pk=rc2.pk).exists()
         assert user.groups.all().count() == 1
 
+    def test_update_user_groups_number_of_queries(self):
+        """The number of queries does not depend on the number of managed scopes."""
+        adapter = SocialAccountAdapter()
+
+        def count_queries(n_groups):
+            user = UserFactory()
+            removed_groups = GroupFactory.create_batch(n_groups)
+            user.groups.add(*removed_groups)
+            managed_scope_status = {group.name: False for group in removed_groups}
+            managed_scope_status.update({group.name: True for group in GroupFactory.create_batch(n_groups)})
+            with CaptureQueriesContext(connection) as context:
+                adapter.update_user_groups(user, extra_data=dict(managed_scope_status=managed_scope_status))
+            assert set(user.groups.values_list("name", flat=True)) == {
+                name for name, user_has_group in managed_scope_status.items() if user_has_group
+            }
+            return len(context.captured_queries)
+
+        assert count_queries(3) == count_queries(1)
+
     def test_update_user_groups_malformed(self):
         adapter = SocialAccountAdapter()
         user = UserFactory()
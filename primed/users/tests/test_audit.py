@@ -1,3 +1,5 @@
+import copy
+import datetime
 import json
 import time
 from io import StringIO
@@ -13,12 +15,19 @@ from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core import mail
 from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from marshmallow_jsonapi import Schema, fields
 
+from primed.cdsa.audit.signed_agreement_audit import SignedAgreementAccessAudit
+from primed.cdsa.tests.factories import MemberAgreementFactory
+from primed.drupal_oauth_provider import client as drupal_client
 from primed.drupal_oauth_provider.provider import CustomProvider
+from primed.primed_anvil.audit_results import get_audit_name, get_stored_audit
+from primed.primed_anvil.models import StoredAuditResults
 from primed.users import audit
-from primed.users.models import StudySite
+from primed.users.models import DrupalSyncState, StudySite
 
 
 class StudySiteMockObject:
@@ -40,6 +49,7 @@ class UserMockObject:
         field_given_first_name_s_,
         field_examples_family_last_name_,
         field_study_site_or_center,
+        changed=None,
     ) -> None:
         self.id = id
         self.display_name = display_name
@@ -49,6 +59,7 @@ class UserMockObject:
         self.field_given_first_name_s_ = field_given_first_name_s_
         self.field_examples_family_last_name_ = field_examples_family_last_name_
         self.field_study_site_or_center = field_study_site_or_center
+        self.changed = changed
 
 
 class StudySiteSchema(Schema):
@@ -70,6 +81,7 @@ class UserSchema(Schema):
     mail = fields.Str()
     field_given_first_name_s_ = fields.Str()
     field_examples_family_last_name_ = fields.Str()
+    changed = fields.Str()
     field_study_site_or_center = fields.Relationship(
         many=True, schema="StudySiteSchema", type_="node--study_site_or_center"
     )
@@ -145,6 +157,8 @@ class TestUserDataAudit(TestCase):
     def setUp(self):
         # debug_requests_on()
         super().setUp()
+        # Client credentials tokens are cached in memory by the shared drupal client.
+        drupal_client.clear_client_credentials_tokens()
         fake_time = time.time()
         self.token = {
             "token_type": "Bearer",
@@ -182,7 +196,10 @@ class TestUserDataAudit(TestCase):
     @responses.activate
     def test_get_json_api(self):
         json_api = self.get_fake_json_api()
-        assert json_api.requests.config.AUTH._client.token["access_token"] == self.token["access_token"]
+        self.add_fake_study_sites_response()
+        audit.get_study_sites(json_api=json_api)
+        assert isinstance(json_api.requests.config.AUTH, drupal_client.ClientCredentialsAuth)
+        assert responses.calls[-1].request.headers["Authorization"] == "Bearer " + self.token["access_token"]
 
     @responses.activate
     def test_get_study_sites(self):
@@ -195,6 +212,49 @@ class TestUserDataAudit(TestCase):
             assert test_study_site.title == study_sites[test_study_site.drupal_internal__nid]["short_name"]
             assert test_study_site.drupal_internal__nid == study_sites[test_study_site.drupal_internal__nid]["node_id"]
 
+    @responses.activate
+    def test_get_drupal_users_multiple_pages(self):
+        json_api = self.get_fake_json_api()
+        url_path = f"{settings.DRUPAL_SITE_URL}/{settings.DRUPAL_API_REL_PATH}/user/user/"
+        pages = [TEST_USER_DATA[:1], TEST_USER_DATA[1:], []]
+        for i, page in enumerate(pages):
+            user_data = UserSchema(many=True).dump(page)
+            if i < len(pages) - 1:
+                user_data["links"] = {"next": {"href": f"{url_path}?page[offset]={i + 1}"}}
+            responses.get(
+                url=url_path,
+                body=json.dumps(user_data),
+                match=[
+                    responses.matchers.query_param_matcher(
+                        {"sort": "drupal_internal__uid", "page[offset]": str(i), "page[limit]": "1"}
+                    )
+                ],
+            )
+        users = audit.get_drupal_users(json_api, page_size=1, max_workers=2)
+        self.assertEqual([user.id for user in users], ["usr1", "usr2"])
+
+    @responses.activate
+    def test_get_drupal_users_changed_since(self):
+        json_api = self.get_fake_json_api()
+        url_path = f"{settings.DRUPAL_SITE_URL}/{settings.DRUPAL_API_REL_PATH}/user/user/"
+        changed_since = datetime.datetime(2024, 1, 2, tzinfo=datetime.timezone.utc)
+        responses.get(
+            url=url_path,
+            body=json.dumps(UserSchema(many=True).dump(TEST_USER_DATA[:1])),
+            match=[
+                responses.matchers.query_param_matcher(
+                    {
+                        "filter[changed][condition][path]": "changed",
+                        "filter[changed][condition][operator]": ">=",
+                        "filter[changed][condition][value]": str(int(changed_since.timestamp())),
+                    },
+                    strict_match=False,
+                )
+            ],
+        )
+        users = audit.get_drupal_users(json_api, changed_since=changed_since)
+        self.assertEqual([user.id for user in users], ["usr1"])
+
     @responses.activate
     def test_audit_study_sites_no_update(self):
         self.get_fake_json_api()
@@ -289,6 +349,74 @@ class TestUserDataAudit(TestCase):
         assert users.first().username == TEST_USER_DATA[0].name
         assert users.first().study_sites.count() == 1
         assert users.first().study_sites.first().short_name == TEST_STUDY_SITE_DATA[0].title
+        social_account = SocialAccount.objects.get(user=users.first())
+        self.assertEqual(social_account.uid, TEST_USER_DATA[0].drupal_internal__uid)
+        self.assertEqual(social_account.provider, CustomProvider.id)
+        self.assertEqual(user_audit.needs_action[0].local_user.user, users.first())
+
+    @responses.activate
+    def test_user_audit_number_of_queries(self):
+        """The number of queries does not depend on the number of users."""
+        self.add_fake_token_response()
+        self.add_fake_study_sites_response()
+        self.add_fake_users_response()
+        study_site = StudySite.objects.create(
+            drupal_node_id=TEST_STUDY_SITE_DATA[0].drupal_internal__nid,
+            short_name=TEST_STUDY_SITE_DATA[0].title,
+            full_name=TEST_STUDY_SITE_DATA[0].field_long_name,
+        )
+
+        def count_queries():
+            with CaptureQueriesContext(connection) as context:
+                audit.UserAudit(apply_changes=False).run_audit()
+            return len(context.captured_queries)
+
+        user = get_user_model().objects.create(
+            username=TEST_USER_DATA[0].name, email=TEST_USER_DATA[0].mail, name="test1 user1"
+        )
+        user.study_sites.add(study_site)
+        SocialAccount.objects.create(user=user, uid=TEST_USER_DATA[0].drupal_internal__uid, provider=CustomProvider.id)
+        n_queries_small = count_queries()
+        for i in range(3):
+            user = get_user_model().objects.create(username=f"user{i}", email=f"user{i}@example.com", name=f"u {i}")
+            user.study_sites.add(study_site)
+            SocialAccount.objects.create(user=user, uid=f"removed{i}", provider=CustomProvider.id)
+        self.assertEqual(count_queries(), n_queries_small)
+
+    @responses.activate
+    def test_user_audit_apply_number_of_queries(self):
+        """The number of queries to apply changes does not depend on the number of changed users."""
+        self.add_fake_token_response()
+        self.add_fake_study_sites_response()
+        self.add_fake_users_response()
+        study_site = StudySite.objects.create(
+            drupal_node_id=TEST_STUDY_SITE_DATA[0].drupal_internal__nid,
+            short_name=TEST_STUDY_SITE_DATA[0].title,
+            full_name=TEST_STUDY_SITE_DATA[0].field_long_name,
+        )
+        user = get_user_model().objects.create(
+            username=TEST_USER_DATA[0].name, email=TEST_USER_DATA[0].mail, name="test1 user1"
+        )
+        user.study_sites.add(study_site)
+        SocialAccount.objects.create(user=user, uid=TEST_USER_DATA[0].drupal_internal__uid, provider=CustomProvider.id)
+
+        def count_queries():
+            with CaptureQueriesContext(connection) as context:
+                audit.UserAudit(apply_changes=True, ignore_deactivate_threshold=True).run_audit()
+            return len(context.captured_queries)
+
+        def create_removed_user(i):
+            user = get_user_model().objects.create(username=f"user{i}", email=f"user{i}@example.com", name=f"u {i}")
+            SocialAccount.objects.create(user=user, uid=f"removed{i}", provider=CustomProvider.id)
+
+        with self.settings(DRUPAL_DATA_AUDIT_DEACTIVATE_USERS=True):
+            create_removed_user(0)
+            n_queries_small = count_queries()
+            for i in range(1, 4):
+                create_removed_user(i)
+            get_user_model().objects.filter(username="user0").update(is_active=True)
+            self.assertEqual(count_queries(), n_queries_small)
+        self.assertEqual(get_user_model().objects.filter(is_active=False).count(), 4)
 
     @responses.activate
     def test_full_user_audit_check_only(self):
@@ -415,6 +543,33 @@ class TestUserDataAudit(TestCase):
         self.assertEqual(new_user.name, drupal_fullname)
         self.assertEqual(len(user_audit.needs_action), 1)
 
+    @responses.activate
+    def test_user_audit_site_change_marks_cdsa_audit_results_stale(self):
+        self.add_fake_token_response()
+        self.add_fake_study_sites_response()
+        self.add_fake_users_response()
+        study_site = StudySite.objects.create(
+            drupal_node_id=TEST_STUDY_SITE_DATA[0].drupal_internal__nid,
+            short_name=TEST_STUDY_SITE_DATA[0].title,
+            full_name=TEST_STUDY_SITE_DATA[0].field_long_name,
+        )
+        user = get_user_model().objects.create(username="username", email="useremail", name="user fullname")
+        SocialAccount.objects.create(user=user, uid=TEST_USER_DATA[0].drupal_internal__uid, provider=CustomProvider.id)
+        member_agreement = MemberAgreementFactory.create(signed_agreement__representative=user, study_site=study_site)
+        # Agreements for other study sites or representatives are not affected.
+        MemberAgreementFactory.create(signed_agreement__representative=user)
+        MemberAgreementFactory.create(study_site=study_site)
+        get_stored_audit(SignedAgreementAccessAudit)
+        audit.UserAudit(apply_changes=True).run_audit()
+        self.assertEqual(
+            set(
+                StoredAuditResults.objects.filter(
+                    audit_name=get_audit_name(SignedAgreementAccessAudit), is_stale=True
+                ).values_list("subject_pk", flat=True)
+            ),
+            {member_agreement.pk},
+        )
+
     # test user removal
     @responses.activate
     def test_user_audit_remove_user_only_inform(self):
@@ -531,6 +686,77 @@ class TestUserDataAudit(TestCase):
             self.assertEqual(len(user_audit.errors), 0)
             self.assertEqual(len(user_audit.needs_action), 5)
 
+    @responses.activate
+    def test_user_audit_updates_sync_state(self):
+        self.add_fake_token_response()
+        self.add_fake_study_sites_response()
+        users = [copy.copy(user) for user in TEST_USER_DATA]
+        users[0].changed = "2024-01-02T03:04:05+00:00"
+        users[1].changed = "2024-01-01T00:00:00+00:00"
+        responses.get(
+            url=f"{settings.DRUPAL_SITE_URL}/{settings.DRUPAL_API_REL_PATH}/user/user/",
+            body=json.dumps(UserSchema(many=True).dump(users)),
+        )
+        audit.UserAudit(apply_changes=False).run_audit()
+        self.assertFalse(DrupalSyncState.objects.exists())
+        audit.UserAudit(apply_changes=True).run_audit()
+        sync_state = DrupalSyncState.objects.get(resource=audit.DRUPAL_USER_RESOURCE)
+        self.assertEqual(sync_state.changed, datetime.datetime(2024, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc))
+        # The recorded time does not go backwards.
+        sync_state.changed = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+        sync_state.save()
+        audit.UserAudit(apply_changes=True).run_audit()
+        sync_state.refresh_from_db()
+        self.assertEqual(sync_state.changed, datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc))
+
+    @responses.activate
+    def test_incremental_user_audit_does_not_remove_users(self):
+        self.add_fake_token_response()
+        self.add_fake_study_sites_response()
+        self.add_fake_users_response()
+        DrupalSyncState.objects.create(
+            resource=audit.DRUPAL_USER_RESOURCE, changed=datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+        )
+        new_user = get_user_model().objects.create(username="username2", email="useremail2", name="user fullname2")
+        SocialAccount.objects.create(user=new_user, uid=999, provider=CustomProvider.id)
+        with self.settings(DRUPAL_DATA_AUDIT_DEACTIVATE_USERS=True):
+            user_audit = audit.UserAudit(apply_changes=True, incremental=True)
+            user_audit.run_audit()
+        self.assertEqual(len(user_audit.needs_action), 1)
+        self.assertIsInstance(user_audit.needs_action[0], audit.NewUser)
+        self.assertEqual(len(user_audit.errors), 0)
+        new_user.refresh_from_db()
+        self.assertTrue(new_user.is_active)
+
+    @responses.activate
+    def test_incremental_user_audit_without_sync_state(self):
+        """An incremental audit is a full audit if users have not been synced before."""
+        self.add_fake_token_response()
+        self.add_fake_study_sites_response()
+        self.add_fake_users_response()
+        new_user = get_user_model().objects.create(username="username2", email="useremail2", name="user fullname2")
+        SocialAccount.objects.create(user=new_user, uid=999, provider=CustomProvider.id)
+        with self.settings(DRUPAL_DATA_AUDIT_DEACTIVATE_USERS=True):
+            user_audit = audit.UserAudit(apply_changes=True, incremental=True)
+            user_audit.run_audit()
+        self.assertIn(audit.RemoveUser, [type(result) for result in user_audit.needs_action])
+        new_user.refresh_from_db()
+        self.assertFalse(new_user.is_active)
+
+    @responses.activate
+    def test_incremental_site_audit_does_not_find_invalid_sites(self):
+        StudySite.objects.create(drupal_node_id=99, short_name="ExtraSite", full_name="ExtraSiteLong")
+        DrupalSyncState.objects.create(
+            resource=audit.DRUPAL_STUDY_SITE_RESOURCE,
+            changed=datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc),
+        )
+        self.get_fake_json_api()
+        self.add_fake_study_sites_response()
+        site_audit = audit.SiteAudit(apply_changes=True, incremental=True)
+        site_audit.run_audit()
+        self.assertEqual(len(site_audit.errors), 0)
+        self.assertEqual(len(site_audit.needs_action), 2)
+
     @responses.activate
     def test_sync_drupal_data_command(self):
         self.add_fake_token_response()
@@ -543,6 +769,15 @@ class TestUserDataAudit(TestCase):
             out.getvalue(),
         )
 
+    @responses.activate
+    def test_sync_drupal_data_command_incremental(self):
+        self.add_fake_token_response()
+        self.add_fake_study_sites_response()
+        self.add_fake_users_response()
+        out = StringIO()
+        call_command("sync-drupal-data", "--incremental", stdout=out)
+        self.assertIn("Incremental: True", out.getvalue())
+
     @responses.activate
     def test_sync_drupal_data_command_with_issues(self):
         StudySite.objects.create(